@@ -604,22 +604,14 @@ class AIActionSystem:
             - message: Thông báo
         """
         try:
-            conn = sqlite3.connect("fapp.db")
-            cursor = conn.cursor()
+            import user_directory
 
-            # Query users có số dư dương = nợ (table name is Users with capital U)
+            # Users có số dư dương = nợ, đọc từ danh bạ user dùng chung với GUI
             # Logic: so_du > 0 means user owes money (debt)
-            cursor.execute(
-                """
-                SELECT id, username, phone, so_du
-                FROM Users
-                WHERE so_du > 0
-                ORDER BY so_du DESC
-            """
-            )
-
-            results = cursor.fetchall()
-            conn.close()
+            results = [
+                (u["id"], u["username"], u["phone"], u["so_du"])
+                for u in user_directory.lay_user_co_so_du(lambda sd: sd > 0)
+            ]
 
             if not results:
                 return {
@@ -11,8 +11,11 @@ import re
 import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Dict, Any, List
-import requests
+from typing import Optional, Dict, Any, List, Callable
+
+
+class CauHoiDaHuy(Exception):
+    """Câu hỏi bị hủy giữa chừng (da_huy được bật trong lúc nhận token)"""
 
 
 class HybridAI:
@@ -43,16 +46,9 @@ class HybridAI:
         if not self.app_knowledge:
             self.app_knowledge = self._load_json("ai/app_knowledge.json", {})
 
-        # LangChain Memory System
-        try:
-            from .langchain_memory import EnhancedMemory
-
-            self.enhanced_memory = EnhancedMemory(
-                user_id=str(self.current_user_id), user_role=self.current_user_role
-            )
-        except Exception as e:
-            print(f"⚠️ LangChain memory disabled: {e}")
-            self.enhanced_memory = None
+        # LangChain Memory System (import langchain ở lần dùng đầu, xem enhanced_memory)
+        self._enhanced_memory = None
+        self._da_tao_enhanced_memory = False
 
         # Smart Prompt System
         try:
@@ -63,6 +59,12 @@ class HybridAI:
             print(f"⚠️ Prompt manager disabled: {e}")
             self.prompt_manager = None
 
+        # Hàm đưa thao tác widget (chuyển tab) về luồng GUI khi ask() chạy ở
+        # luồng nền; None = gọi trực tiếp
+        self.goi_gui: Optional[Callable] = None
+        self._groq_client = None
+        self._tab_descriptions = None
+
         # Conversation history (legacy - for fallback)
         self.conversation_history = []
         self.max_history = 10  # Keep last 10 Q&A pairs
@@ -97,6 +99,22 @@ class HybridAI:
         except:
             self.action_system = None
 
+    @property
+    def enhanced_memory(self):
+        """EnhancedMemory (LangChain), tạo ở lần dùng đầu; None nếu không dùng được."""
+        if not self._da_tao_enhanced_memory:
+            self._da_tao_enhanced_memory = True
+            try:
+                from .langchain_memory import EnhancedMemory
+
+                self._enhanced_memory = EnhancedMemory(
+                    user_id=str(self.current_user_id),
+                    user_role=self.current_user_role,
+                )
+            except Exception as e:
+                print(f"⚠️ LangChain memory disabled: {e}")
+        return self._enhanced_memory
+
     def _load_config(self) -> dict:
         """Load config (Groq API key, etc.)"""
         config_path = "ai/config.json"
@@ -150,12 +168,25 @@ class HybridAI:
         except:
             return False
 
-    def _ask_groq(self, question: str, context: str = "") -> str:
-        """Ask Groq API (Llama 3.3 70B) with conversation history"""
+    def _ask_groq(
+        self,
+        question: str,
+        context: str = "",
+        khi_co_token: Optional[Callable[[str], None]] = None,
+        da_huy=None,
+    ) -> str:
+        """Ask Groq API (Llama 3.3 70B) with conversation history
+
+        Câu trả lời được stream; mỗi đoạn mới được đưa vào khi_co_token ngay
+        khi nhận. da_huy (threading.Event) được kiểm tra giữa các đoạn.
+        """
+        phan_da_nhan = []
         try:
-            from groq import Groq
+            if self._groq_client is None:
+                from groq import Groq
 
-            client = Groq(api_key=self.groq_api_key)
+                self._groq_client = Groq(api_key=self.groq_api_key)
+            client = self._groq_client
 
             # Build prompt with context
             if not context:
@@ -172,14 +203,30 @@ class HybridAI:
             # Add current question
             messages.append({"role": "user", "content": question})
 
-            response = client.chat.completions.create(
+            stream = client.chat.completions.create(
                 model="llama-3.3-70b-versatile",
                 messages=messages,
                 max_tokens=800,  # Increased from 500 for longer answers
                 temperature=0.5,
+                stream=True,
             )
-
-            answer = response.choices[0].message.content.strip()
+            try:
+                for chunk in stream:
+                    if da_huy is not None and da_huy.is_set():
+                        raise CauHoiDaHuy()
+                    if not chunk.choices:
+                        continue
+                    doan = chunk.choices[0].delta.content
+                    if doan:
+                        phan_da_nhan.append(doan)
+                        if khi_co_token:
+                            khi_co_token(doan)
+            finally:
+                dong = getattr(stream, "close", None)
+                if dong:
+                    dong()
+
+            answer = "".join(phan_da_nhan).strip()
 
             # Save to history
             self.conversation_history.append({"question": question, "answer": answer})
@@ -192,14 +239,21 @@ class HybridAI:
 
             return answer
 
+        except CauHoiDaHuy:
+            raise
         except Exception as e:
+            if phan_da_nhan:
+                # Đã hiện một phần câu trả lời, giữ phần đó thay vì hỏi lại
+                print(f"⚠️ Groq API error giữa chừng: {e}")
+                return "".join(phan_da_nhan).strip()
+
             # Fallback to offline if error
             print(f"⚠️ Groq API error: {e}. Switching to offline mode...")
             self.use_groq = False
             self.ai_mode = "offline"
 
             # Try offline mode first
-            offline_answer = self._ask_offline(question, context)
+            offline_answer = self._ask_offline(question, context, khi_co_token, da_huy)
             if offline_answer:
                 return offline_answer
 
@@ -224,30 +278,79 @@ class HybridAI:
             # Return empty to continue normal flow
             return ""
 
-    def _ask_offline(self, question: str, context: str = "") -> str:
-        """Ask Ollama Phi3:mini (offline)"""
+    def _ask_offline(
+        self,
+        question: str,
+        context: str = "",
+        khi_co_token: Optional[Callable[[str], None]] = None,
+        da_huy=None,
+    ) -> str:
+        """Ask Ollama Phi3:mini (offline)
+
+        Ollama trả về từng dòng JSON ("stream": true); mỗi đoạn "response"
+        được đưa vào khi_co_token ngay khi nhận.
+        """
+        phan_da_nhan = []
         try:
             if not context:
                 context = self._build_context()
 
             full_prompt = f"{context}\n\nCâu hỏi: {question}\nTrả lời:"
 
+            import requests
+
             response = requests.post(
                 self.ollama_url,
                 json={
                     "model": self.model_name,
                     "prompt": full_prompt,
-                    "stream": False,
+                    "stream": True,
                     "options": {"temperature": 0.5, "num_predict": 200},
                 },
                 timeout=15,
+                stream=True,
             )
 
-            if response.status_code == 200:
-                return response.json().get("response", "").strip()
+            with response:
+                if response.status_code != 200:
+                    return ""
+                for dong in response.iter_lines():
+                    if da_huy is not None and da_huy.is_set():
+                        raise CauHoiDaHuy()
+                    if not dong:
+                        continue
+                    goi = json.loads(dong)
+                    doan = goi.get("response", "")
+                    if doan:
+                        phan_da_nhan.append(doan)
+                        if khi_co_token:
+                            khi_co_token(doan)
+                    if goi.get("done"):
+                        break
+        except CauHoiDaHuy:
+            raise
         except:
             pass
-        return ""
+        return "".join(phan_da_nhan).strip()
+
+    def _extract_tab_descriptions(self) -> List[str]:
+        """Đọc tên các tab từ main_gui.py (chỉ tên, không code)"""
+        tab_descriptions = []
+        try:
+            # Đọc file main_gui.py để lấy tên tab và mô tả chức năng
+            main_gui_path = Path(__file__).parent.parent / "main_gui.py"
+            if main_gui_path.exists():
+                with open(main_gui_path, "r", encoding="utf-8") as f:
+                    code = f.read()
+                # Tìm các dòng addTab/_them_tab_tre (tab tạo khi mở lần đầu)
+                tab_matches = re.findall(
+                    r'(?:addTab|_them_tab_tre)\([^,()]*,\s*"([^"]+)"', code
+                )
+                for tab in tab_matches:
+                    tab_descriptions.append(f"- {tab}")
+        except Exception as e:
+            tab_descriptions.append(f"(Không thể tự động đọc tab: {e})")
+        return tab_descriptions
 
     def _build_context(self) -> str:
         """
@@ -272,21 +375,10 @@ class HybridAI:
             user_context = self.enhanced_memory.get_context()
 
         # Auto extract tab/workflow/database info (chỉ mô tả, không code)
-        tab_descriptions = []
-        try:
-            from pathlib import Path
-            import re
-            # Đọc file main_gui.py để lấy tên tab và mô tả chức năng
-            main_gui_path = Path(__file__).parent.parent / "main_gui.py"
-            if main_gui_path.exists():
-                with open(main_gui_path, "r", encoding="utf-8") as f:
-                    code = f.read()
-                # Tìm các dòng addTab và mô tả
-                tab_matches = re.findall(r'addTab\(.*?,\s*"([^"]+)"\)', code)
-                for tab in tab_matches:
-                    tab_descriptions.append(f"- {tab}")
-        except Exception as e:
-            tab_descriptions.append(f"(Không thể tự động đọc tab: {e})")
+        # Danh sách tab không đổi khi app đang chạy: chỉ đọc main_gui.py một lần
+        if self._tab_descriptions is None:
+            self._tab_descriptions = self._extract_tab_descriptions()
+        tab_descriptions = self._tab_descriptions
 
         # Auto extract database table names (chỉ tên bảng, không schema)
         db_tables = []
@@ -331,10 +423,19 @@ Nếu hỏi về model AI: Trả lời thật {"🚀 Groq API - Llama 3.3 70B" i
 """
         return context
 
-    def ask(self, question: str) -> tuple[str, str]:
+    def ask(
+        self,
+        question: str,
+        khi_co_token: Optional[Callable[[str], None]] = None,
+        da_huy=None,
+    ) -> tuple[str, str]:
         """
         Main method - Route to online or offline
         Returns: (answer, conversation_id) for feedback
+
+        Args:
+            khi_co_token: Nhận từng đoạn câu trả lời của Groq/Ollama khi đang stream
+            da_huy: threading.Event; bật lên để hủy câu hỏi (raise CauHoiDaHuy)
         """
         # Generate conversation ID for feedback tracking
         conversation_id = str(uuid.uuid4())
@@ -418,12 +519,12 @@ Nếu hỏi về model AI: Trả lời thật {"🚀 Groq API - Llama 3.3 70B" i
                         func = tab_info.get("chức năng", "Chưa có mô tả chức năng.")
                         app_answer = f"✅ Đã chuyển đến tab **{tab_name}**\n\n🔹 Chức năng: {func}"
                         found = True
-                        self._auto_switch_tab(question)
+                        self._tren_gui(lambda: self._auto_switch_tab(question))
                         self._save_conversation(question, app_answer, conversation_id)
                         return app_answer, conversation_id
                 # Nếu không khớp alias, fallback app_knowledge như cũ
                 if app_answer:
-                    self._auto_switch_tab(question)
+                    self._tren_gui(lambda: self._auto_switch_tab(question))
                     self._save_conversation(question, app_answer, conversation_id)
                     return app_answer, conversation_id
 
@@ -431,13 +532,13 @@ Nếu hỏi về model AI: Trả lời thật {"🚀 Groq API - Llama 3.3 70B" i
         context = self._build_context()
 
         if self.use_groq:
-            answer = self._ask_groq(question, context)
+            answer = self._ask_groq(question, context, khi_co_token, da_huy)
         else:
-            answer = self._ask_offline(question, context)
+            answer = self._ask_offline(question, context, khi_co_token, da_huy)
 
         if answer:
             # ✅ BƯỚC 4: AUTO SWITCH TAB for AI answers too
-            self._auto_switch_tab(question)
+            self._tren_gui(lambda: self._auto_switch_tab(question))
             self._save_conversation(question, answer, conversation_id)
             return answer, conversation_id
 
@@ -878,6 +979,8 @@ Nếu hỏi về model AI: Trả lời thật {"🚀 Groq API - Llama 3.3 70B" i
             return self._check_groq_available()
         else:
             try:
+                import requests
+
                 response = requests.get("http://localhost:11434/api/tags", timeout=2)
                 return response.status_code == 200
             except:
@@ -1160,6 +1263,13 @@ Nếu hỏi về model AI: Trả lời thật {"🚀 Groq API - Llama 3.3 70B" i
 
         return any(kw in q_lower for kw in dangerous_keywords)
 
+    def _tren_gui(self, ham: Callable[[], None]):
+        """Chạy thao tác widget ở luồng GUI (qua goi_gui nếu ask() chạy ở luồng nền)"""
+        if self.goi_gui is not None:
+            self.goi_gui(ham)
+        else:
+            ham()
+
     def _auto_switch_tab(self, question: str):
         """
         Tự động chuyển đến tab tương ứng khi AI trả lời về tab đó.
@@ -0,0 +1,255 @@
+"""
+Pivot sản phẩm x kỳ bằng NumPy (biểu đồ sản lượng, tab Trang chủ, xuất Excel)
+
+Đọc dữ liệu đã gom theo ngày từ bảng tổng hợp DoanhSoNgay (xem sales_rollup),
+mã hóa sản phẩm/kỳ thành chỉ số nguyên (factorize bằng np.unique) rồi cộng dồn
+vào ma trận dày bằng np.bincount, không có vòng lặp Python theo từng dòng.
+
+Sử dụng:
+    from analytics import pivot_doanh_so
+
+    pv = pivot_doanh_so("2025-01-01", "2025-12-31", ky="thang", top_n=10)
+    pv.ten        # tên sản phẩm (hàng)
+    pv.ky         # nhãn kỳ (cột), vd: '2025-01'
+    pv.ma_tran    # np.ndarray (số sản phẩm x số kỳ)
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from utils.db_helpers import execute_query
+from utils.report_cache import cache_bao_cao
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+KY_NGAY = "ngay"
+KY_TUAN = "tuan"
+KY_THANG = "thang"
+KY_NAM = "nam"
+
+KY_HIEN_THI = {
+    KY_NGAY: "Ngày",
+    KY_TUAN: "Tuần",
+    KY_THANG: "Tháng",
+    KY_NAM: "Năm",
+}
+
+# Cột giá trị được phép đọc từ DoanhSoNgay
+_COT_GIA_TRI = {
+    "so_luong": "SUM(d.so_luong)",
+    "thanh_tien": "SUM(d.thanh_tien)",
+    "doanh_thu": "SUM(d.thanh_tien - d.giam)",
+}
+
+PivotResult = namedtuple(
+    "PivotResult",
+    [
+        "sanpham_id",  # np.ndarray id sản phẩm theo hàng
+        "ten",  # list tên sản phẩm theo hàng
+        "ky",  # list nhãn kỳ theo cột (tăng dần)
+        "ma_tran",  # np.ndarray float64 (hàng x cột)
+        "tong_theo_sp",  # np.ndarray tổng mỗi hàng
+        "tong_theo_ky",  # np.ndarray tổng mỗi cột
+    ],
+)
+
+
+def _nhan_ky(ngay, ky):
+    """
+    Đưa mảng ngày 'YYYY-MM-DD' về nhãn kỳ tương ứng (vector hóa).
+
+    Tuần tính từ thứ Hai, nhãn là ngày thứ Hai đầu tuần.
+    """
+    if ky == KY_NGAY:
+        return ngay
+    d = ngay.astype("datetime64[D]")
+    if ky == KY_TUAN:
+        # 1970-01-01 là thứ Năm: (số ngày + 3) % 7 = 0 ứng với thứ Hai
+        d = d - ((d.astype(np.int64) + 3) % 7)
+        return d.astype(str)
+    if ky == KY_THANG:
+        return d.astype("datetime64[M]").astype(str)
+    if ky == KY_NAM:
+        return d.astype("datetime64[Y]").astype(str)
+    raise ValueError(f"Kỳ không hợp lệ: {ky}")
+
+
+def _factorize(values):
+    """Giá trị duy nhất đã sắp xếp và chỉ số của từng phần tử trong đó."""
+    uniques, codes = np.unique(values, return_inverse=True)
+    return uniques, codes.reshape(-1)
+
+
+def pivot(sanpham_id, ten, ngay, gia_tri, ky=KY_THANG, top_n=None):
+    """
+    Pivot các dòng (sản phẩm, ngày, giá trị) thành ma trận sản phẩm x kỳ.
+
+    Args:
+        sanpham_id: Dãy id sản phẩm
+        ten: Dãy tên sản phẩm cùng thứ tự
+        ngay: Dãy ngày 'YYYY-MM-DD'
+        gia_tri: Dãy số lượng / số tiền
+        ky: KY_NGAY, KY_TUAN, KY_THANG hoặc KY_NAM
+        top_n: Chỉ giữ N sản phẩm có tổng lớn nhất (None = tất cả)
+
+    Returns:
+        PivotResult (hàng sắp theo tổng giảm dần nếu có top_n, ngược lại theo tên)
+    """
+    sanpham_id = np.asarray(sanpham_id, dtype=np.int64)
+    ten = np.asarray(ten, dtype=object)
+    gia_tri = np.asarray(gia_tri, dtype=np.float64)
+    if sanpham_id.size == 0:
+        rong = np.zeros((0, 0))
+        return PivotResult(np.zeros(0, np.int64), [], [], rong, np.zeros(0), np.zeros(0))
+
+    # Factorize bằng np.unique (chỉ số theo thứ tự tăng dần).
+    # Số ngày khác nhau nhỏ hơn nhiều số dòng nên chỉ đổi nhãn kỳ trên ngày duy nhất.
+    sp_duy_nhat, hang = _factorize(sanpham_id)
+    ngay_duy_nhat, chi_so_ngay = _factorize(np.asarray(ngay, dtype=object))
+    ky_duy_nhat, ky_cua_ngay = np.unique(
+        _nhan_ky(ngay_duy_nhat.astype("U10"), ky), return_inverse=True
+    )
+    cot = ky_cua_ngay[chi_so_ngay]
+    so_hang, so_cot = len(sp_duy_nhat), len(ky_duy_nhat)
+    ma_tran = np.bincount(
+        hang * so_cot + cot, weights=gia_tri, minlength=so_hang * so_cot
+    ).reshape(so_hang, so_cot)
+    ten_hang = np.empty(so_hang, dtype=object)
+    ten_hang[hang] = ten
+    tong_theo_sp = ma_tran.sum(axis=1)
+
+    if top_n:
+        thu_tu = np.argsort(-tong_theo_sp, kind="stable")[: int(top_n)]
+    else:
+        thu_tu = np.argsort(ten_hang.astype(str), kind="stable")
+    ma_tran = ma_tran[thu_tu]
+
+    return PivotResult(
+        sp_duy_nhat[thu_tu],
+        ten_hang[thu_tu].tolist(),
+        ky_duy_nhat.tolist(),
+        ma_tran,
+        tong_theo_sp[thu_tu],
+        ma_tran.sum(axis=0),
+    )
+
+
+def tai_du_lieu(tu_ngay=None, den_ngay=None, gia_tri="so_luong", xuat_hoa_don=None):
+    """
+    Đọc (sanpham_id, ten, ngay, gia_tri) đã gom theo ngày từ DoanhSoNgay.
+
+    Args:
+        tu_ngay, den_ngay: 'YYYY-MM-DD' (bao gồm cả hai đầu)
+        gia_tri: 'so_luong', 'thanh_tien' hoặc 'doanh_thu'
+        xuat_hoa_don: 1/0 để lọc theo XHĐ, None = tất cả
+
+    Returns:
+        tuple 4 list: (sanpham_id, ten, ngay, gia_tri)
+    """
+    if gia_tri not in _COT_GIA_TRI:
+        raise ValueError(f"Giá trị không hợp lệ: {gia_tri}")
+    sql = f"""
+        SELECT d.sanpham_id, s.ten, d.ngay, {_COT_GIA_TRI[gia_tri]}
+        FROM DoanhSoNgay d JOIN SanPham s ON d.sanpham_id = s.id
+        WHERE 1=1
+    """
+    params = []
+    if tu_ngay:
+        sql += " AND d.ngay >= ?"
+        params.append(str(tu_ngay)[:10])
+    if den_ngay:
+        sql += " AND d.ngay < date(?, '+1 day')"
+        params.append(str(den_ngay)[:10])
+    if xuat_hoa_don is not None:
+        sql += " AND d.xuat_hoa_don = ?"
+        params.append(int(xuat_hoa_don))
+    sql += " GROUP BY d.ngay, d.sanpham_id"
+    rows = execute_query(sql, tuple(params), fetch_all=True) or []
+    if not rows:
+        return [], [], [], []
+    return tuple(list(cot) for cot in zip(*rows))
+
+
+@cache_bao_cao
+def pivot_doanh_so(
+    tu_ngay=None,
+    den_ngay=None,
+    ky=KY_THANG,
+    gia_tri="so_luong",
+    top_n=None,
+    xuat_hoa_don=None,
+):
+    """
+    Ma trận sản phẩm x kỳ trong khoảng ngày (đọc bảng tổng hợp + pivot NumPy).
+
+    Returns:
+        PivotResult
+    """
+    sp_ids, ten, ngay, gt = tai_du_lieu(tu_ngay, den_ngay, gia_tri, xuat_hoa_don)
+    return pivot(sp_ids, ten, ngay, gt, ky=ky, top_n=top_n)
+
+
+def gop_nhom_khac(pv, so_hang, nhan_khac="Khác"):
+    """
+    Giữ `so_hang` sản phẩm có tổng lớn nhất, gộp phần còn lại vào một hàng "Khác".
+
+    Args:
+        pv: PivotResult
+        so_hang: Số sản phẩm được giữ riêng
+        nhan_khac: Tên hàng gộp (sanpham_id = -1)
+
+    Returns:
+        PivotResult (hàng theo tổng giảm dần, hàng gộp ở cuối); pv nếu không cần gộp
+    """
+    if len(pv.ten) <= so_hang:
+        return pv
+    thu_tu = np.argsort(-pv.tong_theo_sp, kind="stable")
+    giu, gop = thu_tu[:so_hang], thu_tu[so_hang:]
+    ma_tran = np.vstack([pv.ma_tran[giu], pv.ma_tran[gop].sum(axis=0)])
+    return PivotResult(
+        np.append(pv.sanpham_id[giu], -1),
+        [pv.ten[i] for i in giu] + [nhan_khac],
+        pv.ky,
+        ma_tran,
+        ma_tran.sum(axis=1),
+        pv.tong_theo_ky,
+    )
+
+
+def tong_theo_san_pham(tu_ngay=None, den_ngay=None, gia_tri="so_luong", xuat_hoa_don=None):
+    """
+    Tổng theo sản phẩm trong khoảng ngày.
+
+    Returns:
+        dict {sanpham_id: tổng}
+    """
+    pv = pivot_doanh_so(tu_ngay, den_ngay, KY_NAM, gia_tri, None, xuat_hoa_don)
+    return dict(zip(pv.sanpham_id.tolist(), pv.tong_theo_sp.tolist()))
+
+
+def xuat_excel_pivot(pv, file_path, tieu_de_hang="Sản phẩm"):
+    """
+    Ghi ma trận pivot ra file Excel (kèm cột/dòng tổng).
+
+    Args:
+        pv: PivotResult
+        file_path: Đường dẫn .xlsx
+        tieu_de_hang: Tiêu đề cột tên sản phẩm
+
+    Returns:
+        bool: True nếu ghi thành công
+    """
+    try:
+        import pandas as pd
+
+        df = pd.DataFrame(pv.ma_tran, index=pv.ten, columns=pv.ky)
+        df["Tổng"] = pv.tong_theo_sp
+        df.loc["Tổng"] = list(pv.tong_theo_ky) + [float(pv.tong_theo_sp.sum())]
+        df.index.name = tieu_de_hang
+        df.to_excel(file_path)
+        return True
+    except Exception as e:
+        logger.error(f"Lỗi xuất Excel pivot: {e}")
+        return False
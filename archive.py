@@ -0,0 +1,425 @@
+"""
+Lưu trữ dữ liệu cũ sang file fapp_archive_YYYY.db (archival of closed periods)
+
+Các bản ghi đã chốt, cũ hơn mốc cắt được chuyển sang file lưu trữ theo năm để
+fapp.db luôn nhỏ và các truy vấn quét toàn bảng không chậm dần theo thời gian:
+
+- HoaDon đã xuất hết (trang_thai 'Da_xuat', không còn dòng chi tiết XHĐ = 0)
+  cùng ChiTietHoaDon và GiaoDichQuy gắn với hóa đơn đó
+- LogKho, GiaoDichQuy (không gắn hóa đơn), SoCaiSoDu, AI_Feedback trước mốc cắt
+
+Để số liệu hiện tại không đổi, các dòng kết chuyển ở lại DB chính:
+- KetChuyenKho: tổng LogKho / xuất bổ / đã XHĐ đã chuyển đi theo sản phẩm,
+  được cộng vào báo cáo kho và tồn kho tab Trang chủ
+- SoDuSnapshot: số dư mỗi user tại mốc cắt (mốc cho so_du_tai_thoi_diem)
+- DoanhSoNgay / DoanhThuNgay giữ nguyên (không trừ phần đã lưu trữ); không
+  dựng lại bảng tổng hợp cho khoảng ngày đã lưu trữ
+
+Báo cáo lịch sử đọc cả dữ liệu lưu trữ qua ATTACH khi cần:
+    with ket_noi_lich_su("2023-01-01", "2024-12-31") as (conn, c):
+        c.execute("SELECT ... FROM LogKho_TatCa WHERE ngay >= ?", ...)
+
+Chạy định kỳ (mặc định giữ lại SO_THANG_GIU_LAI tháng gần nhất):
+    python archive.py [truoc_ngay]
+"""
+
+import glob
+import os
+import re
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+from db import DB_NAME, ket_noi
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Giữ lại trong DB chính dữ liệu của bấy nhiêu tháng gần nhất
+SO_THANG_GIU_LAI = 24
+
+# Các bảng có bản lưu trữ và cột thời gian dùng để chia theo năm
+BANG_LUU_TRU = {
+    "HoaDon": "ngay",
+    "ChiTietHoaDon": None,  # theo năm của hóa đơn cha
+    "LogKho": "ngay",
+    "GiaoDichQuy": "ngay",
+    "SoCaiSoDu": "ngay",
+    "AI_Feedback": "timestamp",
+}
+
+# SQLite mặc định cho ATTACH tối đa 10 DB
+SO_FILE_ATTACH_TOI_DA = 9
+
+
+def tao_bang_luu_tru(c):
+    """
+    Tạo bảng kết chuyển tồn kho (gọi từ khoi_tao_db).
+
+    Args:
+        c: Cursor sqlite3
+    """
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS KetChuyenKho (
+            sanpham_id INTEGER PRIMARY KEY,
+            sl_log_kho REAL DEFAULT 0,
+            sl_xuat_bo REAL DEFAULT 0,
+            sl_xhd REAL DEFAULT 0,
+            den_ngay TEXT,
+            FOREIGN KEY(sanpham_id) REFERENCES SanPham(id)
+        )
+        """
+    )
+
+
+def duong_dan_luu_tru(nam):
+    """Đường dẫn file lưu trữ của một năm, cạnh file DB chính."""
+    goc = os.path.splitext(os.path.abspath(DB_NAME))[0]
+    return f"{goc}_archive_{int(nam)}.db"
+
+
+def danh_sach_nam_luu_tru():
+    """
+    Các năm đã có file lưu trữ.
+
+    Returns:
+        list of int (tăng dần)
+    """
+    goc = os.path.splitext(os.path.abspath(DB_NAME))[0]
+    nam_list = []
+    for path in glob.glob(f"{glob.escape(goc)}_archive_*.db"):
+        m = re.search(r"_archive_(\d{4})\.db$", path)
+        if m:
+            nam_list.append(int(m.group(1)))
+    return sorted(nam_list)
+
+
+def _moc_mac_dinh():
+    hom_nay = datetime.now()
+    thang = hom_nay.year * 12 + hom_nay.month - 1 - SO_THANG_GIU_LAI
+    return f"{thang // 12:04d}-{thang % 12 + 1:02d}-01"
+
+
+def _cot(c, schema, bang):
+    c.execute(f'PRAGMA "{schema}".table_info("{bang}")')
+    return [r[1] for r in c.fetchall()]
+
+
+def _tao_bang_trong_file(c, schema, bang):
+    """Tạo bảng trong file lưu trữ theo đúng CREATE của DB chính, bổ sung cột mới."""
+    c.execute("SELECT sql FROM main.sqlite_master WHERE type='table' AND name=?", (bang,))
+    sql = c.fetchone()[0]
+    than = sql[sql.index("(") :]
+    c.execute(f'CREATE TABLE IF NOT EXISTS "{schema}"."{bang}" {than}')
+    cot_luu_tru = set(_cot(c, schema, bang))
+    for cot in _cot(c, "main", bang):
+        if cot not in cot_luu_tru:
+            c.execute(f'ALTER TABLE "{schema}"."{bang}" ADD COLUMN "{cot}"')
+
+
+def _chuyen(c, schema, bang, dieu_kien, params=()):
+    """Chép các dòng thỏa điều kiện sang file lưu trữ rồi xóa khỏi DB chính."""
+    cot = ", ".join(f'"{x}"' for x in _cot(c, "main", bang))
+    c.execute(
+        f'INSERT OR REPLACE INTO "{schema}"."{bang}" ({cot}) '
+        f"SELECT {cot} FROM main.{bang} WHERE {dieu_kien}",
+        params,
+    )
+    c.execute(f"DELETE FROM main.{bang} WHERE {dieu_kien}", params)
+    return c.rowcount
+
+
+def _ket_chuyen_kho(c, moc):
+    """Cộng phần LogKho / ChiTietHoaDon sắp chuyển đi vào KetChuyenKho."""
+    c.execute(
+        """
+        INSERT INTO KetChuyenKho (sanpham_id, sl_log_kho, sl_xuat_bo, sl_xhd, den_ngay)
+        SELECT sanpham_id, SUM(sl_log_kho), SUM(sl_xuat_bo), SUM(sl_xhd), ?
+        FROM (
+            SELECT sanpham_id, COALESCE(so_luong, 0) AS sl_log_kho,
+                   CASE WHEN hanh_dong IN ('xuatbo', 'xuat_bo')
+                        THEN COALESCE(so_luong, 0) ELSE 0 END AS sl_xuat_bo,
+                   0 AS sl_xhd
+            FROM main.LogKho WHERE ngay < ?
+            UNION ALL
+            SELECT ct.sanpham_id, 0, 0, COALESCE(ct.so_luong, 0)
+            FROM main.ChiTietHoaDon ct
+            JOIN temp._hoadon_luu_tru t ON t.id = ct.hoadon_id
+            WHERE ct.xuat_hoa_don = 1
+        )
+        WHERE sanpham_id IS NOT NULL
+        GROUP BY sanpham_id
+        ON CONFLICT(sanpham_id) DO UPDATE SET
+            sl_log_kho = sl_log_kho + excluded.sl_log_kho,
+            sl_xuat_bo = sl_xuat_bo + excluded.sl_xuat_bo,
+            sl_xhd = sl_xhd + excluded.sl_xhd,
+            den_ngay = excluded.den_ngay
+        """,
+        (moc, moc),
+    )
+
+
+def _ket_chuyen_so_du(c, moc):
+    """Snapshot số dư tại mốc cắt cho user có dòng sổ cái sắp chuyển đi."""
+    c.execute(
+        """
+        INSERT INTO SoDuSnapshot (user_id, ngay, so_du)
+        SELECT l.user_id, ?, l.so_du_sau
+        FROM main.SoCaiSoDu l
+        WHERE l.ngay < ?
+          AND l.id = (
+              SELECT l2.id FROM main.SoCaiSoDu l2
+              WHERE l2.user_id = l.user_id AND l2.ngay < ?
+              ORDER BY l2.ngay DESC, l2.id DESC LIMIT 1
+          )
+          AND NOT EXISTS (
+              SELECT 1 FROM SoDuSnapshot s WHERE s.user_id = l.user_id AND s.ngay = ?
+          )
+        """,
+        (moc + " 00:00:00", moc, moc, moc + " 00:00:00"),
+    )
+
+
+def luu_tru(truoc_ngay=None, vacuum=True):
+    """
+    Chuyển dữ liệu đã chốt trước mốc cắt sang các file fapp_archive_YYYY.db.
+
+    Mọi file năm được ATTACH trước rồi chuyển trong MỘT transaction, nên DB
+    chính và các file lưu trữ cùng commit hoặc cùng rollback. Mỗi lần chạy xử lý
+    tối đa SO_FILE_ATTACH_TOI_DA năm cũ nhất; chạy lại để xử lý tiếp.
+
+    Args:
+        truoc_ngay: Mốc cắt 'YYYY-MM-DD' (không gồm ngày này); mặc định giữ lại
+            SO_THANG_GIU_LAI tháng gần nhất
+        vacuum: Thu nhỏ file DB chính sau khi chuyển
+
+    Returns:
+        dict {ten_bang: số dòng đã chuyển}
+    """
+    moc = str(truoc_ngay or _moc_mac_dinh())[:10]
+    ket_qua = {bang: 0 for bang in BANG_LUU_TRU}
+    bang_theo_ngay = [(bang, cot) for bang, cot in BANG_LUU_TRU.items() if cot]
+    conn = ket_noi()
+    try:
+        c = conn.cursor()
+        c.execute(
+            "SELECT DISTINCT substr(ngay, 1, 4) FROM ("
+            + " UNION ".join(
+                f"SELECT {cot} AS ngay FROM {bang} WHERE {cot} < ?"
+                for bang, cot in bang_theo_ngay
+            )
+            + ")",
+            (moc,) * len(bang_theo_ngay),
+        )
+        nam_list = sorted(int(r[0]) for r in c.fetchall() if r[0] and r[0].isdigit())
+        nam_list = nam_list[:SO_FILE_ATTACH_TOI_DA]
+        if not nam_list:
+            logger.info(f"Không có dữ liệu trước {moc} để lưu trữ")
+            return ket_qua
+        # Lần này chỉ chuyển tới hết năm cuối được ATTACH
+        moc = min(moc, f"{nam_list[-1] + 1}-01-01")
+
+        for nam in nam_list:
+            c.execute(f"ATTACH DATABASE ? AS luu_tru_{nam}", (duong_dan_luu_tru(nam),))
+
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            # Hóa đơn đã chốt: xuất hết, mọi dòng chi tiết đã XHĐ
+            c.execute(
+                """
+                CREATE TEMP TABLE _hoadon_luu_tru AS
+                SELECT hd.id, substr(hd.ngay, 1, 4) AS nam FROM main.HoaDon hd
+                WHERE hd.ngay < ? AND hd.trang_thai = 'Da_xuat'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM main.ChiTietHoaDon ct
+                      WHERE ct.hoadon_id = hd.id AND COALESCE(ct.xuat_hoa_don, 0) = 0
+                  )
+                """,
+                (moc,),
+            )
+            _ket_chuyen_kho(c, moc)
+            _ket_chuyen_so_du(c, moc)
+            # Bảng tổng hợp doanh số giữ nguyên: trigger xóa sẽ trừ đi, khôi phục sau
+            c.execute(
+                "CREATE TEMP TABLE _doanhso_giu AS "
+                "SELECT * FROM main.DoanhSoNgay WHERE ngay < ?",
+                (moc,),
+            )
+            c.execute(
+                "CREATE TEMP TABLE _doanhthu_giu AS "
+                "SELECT * FROM main.DoanhThuNgay WHERE ngay < ?",
+                (moc,),
+            )
+
+            for nam in nam_list:
+                schema = f"luu_tru_{nam}"
+                for bang in BANG_LUU_TRU:
+                    _tao_bang_trong_file(c, schema, bang)
+
+                hd_nam = f"SELECT id FROM temp._hoadon_luu_tru WHERE nam = '{nam}'"
+                ket_qua["ChiTietHoaDon"] += _chuyen(
+                    c, schema, "ChiTietHoaDon", f"hoadon_id IN ({hd_nam})"
+                )
+                ket_qua["GiaoDichQuy"] += _chuyen(
+                    c, schema, "GiaoDichQuy", f"hoadon_id IN ({hd_nam})"
+                )
+                ket_qua["HoaDon"] += _chuyen(c, schema, "HoaDon", f"id IN ({hd_nam})")
+
+                khoang = (f"{nam}-01-01", f"{nam + 1}-01-01", moc)
+                for bang, cot in bang_theo_ngay:
+                    if bang == "HoaDon":
+                        continue
+                    dieu_kien = f"{cot} >= ? AND {cot} < ? AND {cot} < ?"
+                    if bang == "GiaoDichQuy":
+                        dieu_kien = "hoadon_id IS NULL AND " + dieu_kien
+                    ket_qua[bang] += _chuyen(c, schema, bang, dieu_kien, khoang)
+
+            c.execute("INSERT OR REPLACE INTO main.DoanhSoNgay SELECT * FROM temp._doanhso_giu")
+            c.execute("INSERT OR REPLACE INTO main.DoanhThuNgay SELECT * FROM temp._doanhthu_giu")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            for bang in ("_hoadon_luu_tru", "_doanhso_giu", "_doanhthu_giu"):
+                c.execute(f"DROP TABLE IF EXISTS temp.{bang}")
+            for nam in nam_list:
+                c.execute(f"DETACH DATABASE luu_tru_{nam}")
+
+        if vacuum:
+            c.execute("VACUUM")
+        logger.info(f"Đã lưu trữ dữ liệu trước {moc}: {ket_qua}")
+        return ket_qua
+    except Exception as e:
+        logger.error(f"Lỗi lưu trữ dữ liệu trước {moc}: {e}", exc_info=True)
+        raise
+    finally:
+        conn.close()
+
+
+def _nam_trong_khoang(tu_ngay, den_ngay):
+    nam_list = danh_sach_nam_luu_tru()
+    if tu_ngay:
+        nam_list = [n for n in nam_list if n >= int(str(tu_ngay)[:4])]
+    if den_ngay:
+        nam_list = [n for n in nam_list if n <= int(str(den_ngay)[:4])]
+    return nam_list[-SO_FILE_ATTACH_TOI_DA:]
+
+
+def can_du_lieu_luu_tru(tu_ngay=None, den_ngay=None):
+    """True nếu khoảng ngày chạm tới năm đã có file lưu trữ."""
+    return bool(_nam_trong_khoang(tu_ngay, den_ngay))
+
+
+@contextmanager
+def ket_noi_lich_su(tu_ngay=None, den_ngay=None):
+    """
+    Kết nối có ATTACH các file lưu trữ giao với khoảng ngày.
+
+    Mỗi bảng trong BANG_LUU_TRU có thêm TEMP VIEW <Bang>_TatCa = DB chính
+    UNION ALL các năm lưu trữ (cột thiếu ở file cũ trả về NULL).
+
+    Sử dụng:
+        with ket_noi_lich_su("2023-01-01", "2023-12-31") as (conn, c):
+            c.execute("SELECT * FROM HoaDon_TatCa WHERE ngay >= ?", ("2023-01-01",))
+
+    Yields:
+        (conn, cursor)
+    """
+    conn = ket_noi()
+    try:
+        c = conn.cursor()
+        schemas = []
+        for nam in _nam_trong_khoang(tu_ngay, den_ngay):
+            schema = f"luu_tru_{nam}"
+            c.execute(f"ATTACH DATABASE ? AS {schema}", (duong_dan_luu_tru(nam),))
+            schemas.append(schema)
+        for bang in BANG_LUU_TRU:
+            cot_chinh = _cot(c, "main", bang)
+            cac_phan = [f"SELECT * FROM main.{bang}"]
+            for schema in schemas:
+                cot_file = set(_cot(c, schema, bang))
+                if not cot_file:
+                    continue
+                chon = ", ".join(
+                    f'"{x}"' if x in cot_file else f'NULL AS "{x}"' for x in cot_chinh
+                )
+                cac_phan.append(f"SELECT {chon} FROM {schema}.{bang}")
+            c.execute(
+                f"CREATE TEMP VIEW IF NOT EXISTS {bang}_TatCa AS "
+                + " UNION ALL ".join(cac_phan)
+            )
+        yield conn, c
+    finally:
+        conn.close()
+
+
+@contextmanager
+def ket_noi_theo_khoang(tu_ngay=None, den_ngay=None):
+    """
+    Kết nối đọc cho truy vấn theo khoảng ngày: chỉ ATTACH file lưu trữ khi
+    khoảng ngày chạm năm đã lưu trữ, ngược lại đọc thẳng DB chính.
+
+    Sử dụng:
+        with ket_noi_theo_khoang(tu, den) as (conn, c, hau_to):
+            c.execute(f"SELECT COUNT(*) FROM GiaoDichQuy{hau_to} WHERE ngay >= ?", (tu,))
+
+    Yields:
+        (conn, cursor, hau_to): hau_to là "_TatCa" khi đọc qua view gộp, "" nếu không
+    """
+    if can_du_lieu_luu_tru(tu_ngay, den_ngay):
+        with ket_noi_lich_su(tu_ngay, den_ngay) as (conn, c):
+            yield conn, c, "_TatCa"
+        return
+    conn = ket_noi()
+    try:
+        yield conn, conn.cursor(), ""
+    finally:
+        conn.close()
+
+
+def ngay_luu_tru_cuoi():
+    """
+    Ngày của hóa đơn mới nhất đã chuyển sang file lưu trữ.
+
+    Bảng tổng hợp doanh số của các ngày tới ngày này còn gồm phần đã lưu trữ,
+    nên không được dựng lại từ DB chính.
+
+    Returns:
+        'YYYY-MM-DD' hoặc None nếu chưa lưu trữ hóa đơn nào
+    """
+    conn = ket_noi()
+    try:
+        c = conn.cursor()
+        for nam in reversed(danh_sach_nam_luu_tru()):
+            c.execute("ATTACH DATABASE ? AS luu_tru", (duong_dan_luu_tru(nam),))
+            try:
+                if not _cot(c, "luu_tru", "HoaDon"):
+                    continue
+                c.execute("SELECT MAX(substr(ngay, 1, 10)) FROM luu_tru.HoaDon")
+                ngay = c.fetchone()[0]
+                if ngay:
+                    return ngay
+            finally:
+                c.execute("DETACH DATABASE luu_tru")
+        return None
+    finally:
+        conn.close()
+
+
+def truy_van_lich_su(sql, params=(), tu_ngay=None, den_ngay=None):
+    """
+    Chạy truy vấn đọc trên các view <Bang>_TatCa (gồm dữ liệu lưu trữ).
+
+    Returns:
+        list các dòng kết quả
+    """
+    with ket_noi_lich_su(tu_ngay, den_ngay) as (conn, c):
+        c.execute(sql, params)
+        return c.fetchall()
+
+
+if __name__ == "__main__":
+    moc_cat = sys.argv[1] if len(sys.argv) > 1 else None
+    print(luu_tru(moc_cat))
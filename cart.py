@@ -0,0 +1,293 @@
+"""
+Giỏ hàng tab Bán hàng (cart model + pricing engine)
+
+Trạng thái giỏ hàng nằm trong GioHang, không nằm trong các ô QTableWidget:
+bảng chỉ là view. Mỗi dòng là một DongGioHang (__slots__). Giá được chọn từ
+bảng giá đã nạp sẵn trong bộ nhớ (products.lay_bang_gia), nên sửa tên/SL/VIP
+không truy vấn DB. Tổng giỏ hàng được cộng/trừ theo phần chênh của dòng vừa
+đổi thay vì cộng lại cả giỏ.
+
+Mỗi hàm dat_*() trả về tập tên trường của dòng đã đổi (COT_TEN, COT_DON_GIA,
+COT_THANH_TIEN) để view chỉ vẽ lại đúng các ô đó; lỗi nghiệp vụ (sản phẩm không
+tồn tại, chưa nhận hàng...) báo bằng ValueError.
+
+Sử dụng:
+    from cart import GioHang
+    from products import lay_bang_gia
+
+    gio = GioHang(co_san=lambda ten: self.available_products.get(ten, 0))
+    gio.nap_bang_gia(lay_bang_gia())
+    i = gio.them_dong()
+    gio.dat_ten(i, "Dầu A")      # -> {"ten", "don_gia", "thanh_tien"}
+    gio.dat_so_luong(i, 12)     # -> {"don_gia", "thanh_tien"} nếu sang giá buôn
+    items, cho_no = gio.tao_items()
+    tao_hoa_don(user_id, "", items, 0, 0, 0, ngay)
+"""
+
+from utils.invoice import xac_dinh_loai_gia
+
+# Tên trường trả về từ dat_*() (view ánh xạ sang cột)
+COT_TEN = "ten"
+COT_DON_GIA = "don_gia"
+COT_THANH_TIEN = "thanh_tien"
+
+# Cột giá trong bản ghi sản phẩm (id, ten, gia_le, gia_buon, gia_vip, ton_kho, nguong_buon)
+_CHI_SO_GIA = {"le": 2, "buon": 3, "vip": 4}
+
+
+class DongGioHang:
+    """Một dòng giỏ hàng."""
+
+    __slots__ = (
+        "sanpham_id",
+        "ten",
+        "so_luong",
+        "don_gia",
+        "giam",
+        "vip",
+        "xhd",
+        "ghi_chu",
+        "cho_no_user_id",
+        "loai_gia",
+        "thanh_tien",
+        "da_cong",
+    )
+
+    def __init__(self):
+        self.sanpham_id = None
+        self.ten = ""
+        self.so_luong = 1.0
+        self.don_gia = 0.0
+        self.giam = 0.0
+        self.vip = False
+        self.xhd = False
+        self.ghi_chu = ""
+        self.cho_no_user_id = None
+        self.loai_gia = "le"
+        self.thanh_tien = 0.0
+        # Phần đã cộng vào GioHang.tong (dòng rỗng không tính)
+        self.da_cong = 0.0
+
+
+class GioHang:
+    """Các dòng giỏ hàng, bảng giá trong bộ nhớ và tổng tiền cộng dồn."""
+
+    def __init__(self, co_san=None):
+        """
+        Args:
+            co_san: Hàm ten -> số lượng có thể bán trong ca (None = không kiểm tra)
+        """
+        self._co_san = co_san
+        self._dong = []
+        self._theo_ten = {}
+        self._theo_id = {}
+        self._danh_sach_sp = []
+        self.tong = 0.0
+
+    # ---------- Bảng giá ----------
+
+    def nap_bang_gia(self, san_pham):
+        """
+        Nạp bảng giá; các dòng đã có giữ nguyên đơn giá tới lần sửa kế tiếp.
+
+        Args:
+            san_pham: list (id, ten, gia_le, gia_buon, gia_vip, ton_kho, nguong_buon)
+        """
+        self._danh_sach_sp = sorted(san_pham, key=lambda sp: sp[0])
+        self._theo_ten = {sp[1]: sp for sp in self._danh_sach_sp}
+        self._theo_id = {sp[0]: sp for sp in self._danh_sach_sp}
+
+    def tim(self, ten):
+        """Sản phẩm trùng tên; nếu không có, sản phẩm đầu tiên (theo id) chứa ten."""
+        sp = self._theo_ten.get(ten)
+        if sp is not None:
+            return sp
+        khoa = ten.casefold()
+        for sp in self._danh_sach_sp:
+            if khoa in (sp[1] or "").casefold():
+                return sp
+        return None
+
+    # ---------- Dòng ----------
+
+    def them_dong(self):
+        """Thêm dòng rỗng; trả về chỉ số dòng."""
+        self._dong.append(DongGioHang())
+        return len(self._dong) - 1
+
+    def xoa(self):
+        """Xóa toàn bộ giỏ hàng."""
+        self._dong = []
+        self.tong = 0.0
+
+    def dong(self, i):
+        return self._dong[i]
+
+    def so_dong(self):
+        return len(self._dong)
+
+    def cac_dong_co_hang(self):
+        """Các dòng đã chọn sản phẩm (bỏ qua dòng rỗng)."""
+        return [d for d in self._dong if d.ten]
+
+    # ---------- Sửa dòng ----------
+
+    def dat_ten(self, i, ten):
+        """
+        Chọn sản phẩm cho dòng i theo tên và tính lại giá.
+
+        Raises:
+            ValueError: Sản phẩm không tồn tại hoặc chưa được nhận hàng
+                (dòng được đưa về rỗng trước khi raise)
+        """
+        d = self._dong[i]
+        ten = (ten or "").strip()
+        if ten == d.ten and (d.sanpham_id is not None or not ten):
+            return set()
+        if not ten:
+            d.sanpham_id = None
+            d.ten = ""
+            return {COT_TEN} | self._tinh_tien(d)
+
+        sp = self.tim(ten)
+        if sp is None:
+            self._bo_chon(d)
+            raise ValueError(f"Sản phẩm '{ten}' không tồn tại")
+        if self._co_san is not None and (self._co_san(ten) or 0) <= 0:
+            self._bo_chon(d)
+            raise ValueError(f"Sản phẩm '{ten}' chưa được nhận hàng nên không thể bán")
+
+        d.sanpham_id = sp[0]
+        d.ten = ten
+        return {COT_TEN} | self._tinh_gia(d)
+
+    def dat_so_luong(self, i, so_luong):
+        d = self._dong[i]
+        so_luong = float(so_luong or 0)
+        if so_luong == d.so_luong:
+            return set()
+        d.so_luong = so_luong
+        return self._tinh_gia(d)
+
+    def dat_giam(self, i, giam):
+        d = self._dong[i]
+        giam = float(giam or 0)
+        if giam == d.giam:
+            return set()
+        d.giam = giam
+        return self._tinh_tien(d)
+
+    def dat_vip(self, i, vip):
+        d = self._dong[i]
+        vip = bool(vip)
+        if vip == d.vip:
+            return set()
+        d.vip = vip
+        return self._tinh_gia(d)
+
+    def dat_don_gia(self, i, don_gia):
+        """Đơn giá nhập tay (giữ tới khi tên/SL/VIP đổi)."""
+        d = self._dong[i]
+        don_gia = float(don_gia or 0)
+        if don_gia == d.don_gia:
+            return set()
+        d.don_gia = don_gia
+        return {COT_DON_GIA} | self._tinh_tien(d)
+
+    def dat_xhd(self, i, xhd):
+        self._dong[i].xhd = bool(xhd)
+        return set()
+
+    def dat_ghi_chu(self, i, ghi_chu):
+        self._dong[i].ghi_chu = (ghi_chu or "").strip()
+        return set()
+
+    def dat_cho_no(self, i, user_id):
+        self._dong[i].cho_no_user_id = user_id
+        return set()
+
+    # ---------- Pricing engine ----------
+
+    def _bo_chon(self, d):
+        d.sanpham_id = None
+        d.ten = ""
+        d.don_gia = 0.0
+        self._tinh_tien(d)
+
+    def _tinh_gia(self, d):
+        """Chọn loại giá/đơn giá theo SL và VIP; trả về các trường đã đổi."""
+        doi = set()
+        sp = self._theo_id.get(d.sanpham_id)
+        if sp is not None:
+            d.loai_gia = xac_dinh_loai_gia(
+                d.so_luong, sp[6] if len(sp) > 6 else 0, d.vip
+            )
+            try:
+                don_gia = float(sp[_CHI_SO_GIA[d.loai_gia]])
+            except (TypeError, ValueError):
+                # Thiếu giá loại này: dùng giá lẻ như chon_don_gia
+                try:
+                    don_gia = float(sp[2])
+                except (TypeError, ValueError):
+                    don_gia = 0.0
+            if don_gia != d.don_gia:
+                d.don_gia = don_gia
+                doi.add(COT_DON_GIA)
+        return doi | self._tinh_tien(d)
+
+    def _tinh_tien(self, d):
+        """Tính lại thành tiền của dòng và cộng phần chênh vào tổng."""
+        thanh_tien = d.so_luong * d.don_gia - d.giam
+        gop = thanh_tien if d.ten else 0.0
+        self.tong += gop - d.da_cong
+        d.da_cong = gop
+        if thanh_tien == d.thanh_tien:
+            return set()
+        d.thanh_tien = thanh_tien
+        return {COT_THANH_TIEN}
+
+    # ---------- Lập hóa đơn ----------
+
+    def tao_items(self):
+        """
+        Dữ liệu cho invoices.tao_hoa_don từ các dòng có hàng.
+
+        Returns:
+            tuple (items, cho_no_items)
+
+        Raises:
+            ValueError: Dòng cho nợ thiếu ghi chú
+        """
+        items = []
+        cho_no_items = []
+        for so_dong, d in enumerate(self._dong, 1):
+            if not d.ten:
+                continue
+            if d.cho_no_user_id is not None:
+                if not d.ghi_chu:
+                    raise ValueError(
+                        f"Dòng {so_dong}: Phải nhập ghi chú khi cho nợ\n"
+                        f"Ví dụ: 'A Bình nợ' hoặc 'Khách hàng X mua chịu'"
+                    )
+                cho_no_items.append(
+                    {
+                        "user_id": d.cho_no_user_id,
+                        "so_tien": d.thanh_tien,
+                        "ghi_chu": d.ghi_chu,
+                        "ten_sanpham": d.ten,
+                        "so_luong": d.so_luong,
+                        "gia": d.don_gia,
+                    }
+                )
+            items.append(
+                {
+                    "sanpham_id": d.sanpham_id,
+                    "so_luong": d.so_luong,
+                    "loai_gia": d.loai_gia,
+                    "gia": d.don_gia,
+                    "giam": d.giam,
+                    "xuat_hoa_don": d.xhd,
+                    "ghi_chu": d.ghi_chu,
+                }
+            )
+        return items, cho_no_items
@@ -284,6 +284,66 @@ def khoi_tao_db():
         """
     )
 
+    # Index phủ cho báo cáo kho gom nhóm theo sản phẩm (reports.tinh_bao_cao_kho)
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chitiethoadon_sp_xhd "
+        "ON ChiTietHoaDon(sanpham_id, xuat_hoa_don, so_luong)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_logkho_hanhdong_sp "
+        "ON LogKho(hanh_dong, sanpham_id, so_luong)"
+    )
+
+    # Index cho báo cáo công đoàn lọc theo khoảng ngày
+    c.execute("CREATE INDEX IF NOT EXISTS idx_congdoan_ngay ON CongDoan(ngay)")
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chenhlechxuatbo_ngay ON ChenhLechXuatBo(ngay)"
+    )
+
+    # Index phục vụ tra cứu giá theo thời điểm (price_timeline)
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_lichsugia_sp_loai_ngay "
+        "ON LichSuGia(sanpham_id, loai_gia, ngay_thay_doi)"
+    )
+
+    # Sổ cái số dư: mỗi thay đổi Users.so_du một dòng (xem ledger.py)
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS SoCaiSoDu (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            ngay TEXT,
+            so_tien REAL,
+            so_du_sau REAL,
+            ly_do TEXT,
+            nguon_id INTEGER,
+            ghi_chu TEXT,
+            FOREIGN KEY(user_id) REFERENCES Users(id)
+        )
+        """
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_socaisodu_user_ngay ON SoCaiSoDu(user_id, ngay)"
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_socaisodu_ngay ON SoCaiSoDu(ngay)")
+
+    # Snapshot số dư định kỳ theo user (mốc tra cứu số dư tại thời điểm)
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS SoDuSnapshot (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            ngay TEXT,
+            so_du REAL,
+            FOREIGN KEY(user_id) REFERENCES Users(id)
+        )
+        """
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_sodusnapshot_user_ngay ON SoDuSnapshot(user_id, ngay)"
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_giaodichquy_ngay ON GiaoDichQuy(ngay)")
+
     # Bảng feedback AI (Like/Dislike)
     c.execute(
         """
@@ -316,6 +376,45 @@ def khoi_tao_db():
     ]:
         _add_column_if_missing("HoaDon", col_name, col_def)
 
+    # Bảng tổng hợp doanh số theo ngày + trigger (cần HoaDon đủ cột ở trên)
+    from sales_rollup import tao_bang_tong_hop
+
+    conn = ket_noi()
+    try:
+        tao_bang_tong_hop(conn.cursor())
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        logger.error("Khong the tao bang tong hop doanh so: %s", e, exc_info=True)
+    finally:
+        conn.close()
+
+    # Bảng kết chuyển tồn kho cho dữ liệu đã lưu trữ (xem archive.py)
+    from archive import tao_bang_luu_tru
+
+    conn = ket_noi()
+    try:
+        tao_bang_luu_tru(conn.cursor())
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        logger.error("Khong the tao bang ket chuyen kho: %s", e, exc_info=True)
+    finally:
+        conn.close()
+
+    # Bảng tổng kết ca + trigger cộng tiền nộp (cần GiaoDichQuy có cột hoadon_id)
+    from shift_summary import tao_bang_tong_ket_ca
+
+    conn = ket_noi()
+    try:
+        tao_bang_tong_ket_ca(conn.cursor())
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        logger.error("Khong the tao bang tong ket ca: %s", e, exc_info=True)
+    finally:
+        conn.close()
+
     # Khởi tạo user mặc định nếu bảng Users đang rỗng
     try:
         conn = ket_noi()
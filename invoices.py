@@ -1,8 +1,12 @@
 from datetime import datetime
 from db import ket_noi
-from stock import cap_nhat_kho_sau_ban
+from stock import cap_nhat_kho_sau_ban, lay_tinh_trang_theo_id
 from utils.db_helpers import db_transaction, execute_query, execute_update
-import pandas as pd
+from ledger import cap_nhat_so_du, LY_DO_BAN_HANG
+from utils.report_cache import cache_bao_cao
+from archive import can_du_lieu_luu_tru, truy_van_lich_su
+from utils import event_bus
+from utils.event_bus import HoaDonDaTao, HoaDonDaSua, SoDuThayDoi
 
 
 def tao_hoa_don(
@@ -29,17 +33,17 @@ def tao_hoa_don(
         errors = []
         # Kiểm tra tồn kho trước khi tạo hóa đơn (đọc trong 1 transaction để đồng nhất)
         with db_transaction() as (conn, c):
+            tinh_trang = lay_tinh_trang_theo_id(
+                [item["sanpham_id"] for item in items], c
+            )
             for item in items:
                 sanpham_id = item["sanpham_id"]
                 so_luong = item["so_luong"]
-                c.execute(
-                    "SELECT ten, ton_kho FROM SanPham WHERE id = ?", (sanpham_id,)
-                )
-                result = c.fetchone()
-                if not result:
+                tt = tinh_trang.get(sanpham_id)
+                if tt is None:
                     errors.append(f"Sản phẩm ID {sanpham_id} không tồn tại")
                     continue
-                ten_sp, ton_kho = result
+                ten_sp, ton_kho = tt.ten, tt.ton_kho
                 if ton_kho < so_luong:
                     errors.append(
                         f"Sản phẩm '{ten_sp}' không đủ số lượng!\n"
@@ -117,17 +121,6 @@ def tao_hoa_don(
                     ),
                 )
 
-                # Tính chênh lệch công đoàn cho loại giá lẻ
-                if loai_gia == "le":
-                    c.execute(
-                        "SELECT gia_le, gia_buon FROM SanPham WHERE id = ?",
-                        (sanpham_id,),
-                    )
-                    result = c.fetchone()
-                    if result:
-                        gia_le_db, gia_buon_db = result
-                        _ = (gia_le_db - gia_buon_db) * so_luong - giam
-
         # Sau khi tạo hóa đơn và chi tiết thành công, cập nhật kho và sổ quỹ theo từng item
         for item in items:
             sanpham_id = item["sanpham_id"]
@@ -140,14 +133,9 @@ def tao_hoa_don(
             # Tính lại chênh lệch để ghi log kho nếu cần
             chenh_lech = 0
             if loai_gia == "le":
-                result = execute_query(
-                    "SELECT gia_le, gia_buon FROM SanPham WHERE id = ?",
-                    (sanpham_id,),
-                    fetch_one=True,
-                )
-                if result:
-                    gia_le_db, gia_buon_db = result
-                    chenh_lech = (gia_le_db - gia_buon_db) * so_luong - giam
+                tt = tinh_trang.get(sanpham_id)
+                if tt:
+                    chenh_lech = (tt.gia_le - tt.gia_buon) * so_luong - giam
 
             print(
                 f"Calling cap_nhat_kho_sau_ban: sanpham_id={sanpham_id}, so_luong={so_luong}, gia={gia}, chenh_lech={chenh_lech}"
@@ -161,11 +149,17 @@ def tao_hoa_don(
             # Nếu XHĐ=0, cộng tổng tiền vào so_du (tiền user giữ tạm)
             if xuat_hoa_don_item == 0:
                 item_total = so_luong * gia - giam
-                execute_update(
-                    "UPDATE Users SET so_du = so_du + ? WHERE id = ?",
-                    (item_total, user_id),
-                )
+                with db_transaction() as (conn, c):
+                    cap_nhat_so_du(c, user_id, item_total, LY_DO_BAN_HANG, hoadon_id)
 
+        # Tồn kho đã được cap_nhat_kho_sau_ban phát theo từng sản phẩm
+        event_bus.phat(
+            HoaDonDaTao(
+                [hoadon_id], [user_id], [item["sanpham_id"] for item in items]
+            )
+        )
+        if any(item.get("xuat_hoa_don", 1) == 0 for item in items):
+            event_bus.phat(SoDuThayDoi([user_id]))
         return True, hoadon_id, None
     except ValueError as ve:
         # Lỗi kiểm tra tồn kho
@@ -175,16 +169,82 @@ def tao_hoa_don(
         return False, str(e), None
 
 
-def lay_danh_sach_hoadon(trang_thai=None):
+def _dieu_kien_hoadon(trang_thai=None, hoadon_ids=None):
+    """Mệnh đề WHERE (theo trạng thái / danh sách id) cho các truy vấn HoaDon hd."""
+    dieu_kien = []
+    params = []
+    if trang_thai:
+        dieu_kien.append("hd.trang_thai = ?")
+        params.append(trang_thai)
+    if hoadon_ids is not None:
+        hoadon_ids = list(hoadon_ids)
+        dieu_kien.append(f"hd.id IN ({','.join('?' * len(hoadon_ids)) or 'NULL'})")
+        params.extend(hoadon_ids)
+    if not dieu_kien:
+        return "", ()
+    return " WHERE " + " AND ".join(dieu_kien), tuple(params)
+
+
+def lay_danh_sach_hoadon(trang_thai=None, hoadon_ids=None):
+    """
+    Danh sách hóa đơn kèm username.
+
+    Args:
+        trang_thai: Lọc theo HoaDon.trang_thai (None = tất cả)
+        hoadon_ids: Chỉ đọc các hóa đơn này (None = tất cả), dùng khi làm mới vài dòng
+
+    Returns:
+        list of (id, user_id, username, khach_hang, ngay, trang_thai, tong, giam_gia)
+    """
     sql = (
         "SELECT hd.id, hd.user_id, u.username, hd.khach_hang, hd.ngay, hd.trang_thai, hd.tong, hd.giam_gia "
         "FROM HoaDon hd JOIN Users u ON hd.user_id = u.id"
     )
-    params = None
-    if trang_thai:
-        sql += " WHERE hd.trang_thai = ?"
-        params = (trang_thai,)
-    return execute_query(sql, params, fetch_all=True) or []
+    where, params = _dieu_kien_hoadon(trang_thai, hoadon_ids)
+    return execute_query(sql + where, params, fetch_all=True) or []
+
+
+def lay_so_du_theo_hoadon(trang_thai=None, hoadon_ids=None):
+    """
+    Số dư còn phải nộp của từng hóa đơn trong một truy vấn.
+
+    Số dư = tổng (so_luong * gia - giam) các dòng chưa XHĐ - tổng đã nộp
+    (GiaoDichQuy.hoadon_id), không âm. Cùng công thức với tinh_unpaid_total.
+
+    Args:
+        trang_thai: Lọc theo HoaDon.trang_thai (None = tất cả)
+        hoadon_ids: Chỉ tính cho các hóa đơn này (None = tất cả)
+
+    Returns:
+        dict {hoadon_id: so_du}
+    """
+    if hoadon_ids is not None:
+        # Vài hóa đơn: tính riêng từng hóa đơn thay vì gom cả hai bảng
+        sql = """
+            SELECT hd.id, MAX(
+                COALESCE((SELECT SUM(so_luong * gia - giam) FROM ChiTietHoaDon
+                          WHERE hoadon_id = hd.id AND xuat_hoa_don = 0), 0)
+                - COALESCE((SELECT SUM(so_tien) FROM GiaoDichQuy
+                            WHERE hoadon_id = hd.id), 0), 0)
+            FROM HoaDon hd
+        """
+        where, params = _dieu_kien_hoadon(trang_thai, hoadon_ids)
+        return dict(execute_query(sql + where, params, fetch_all=True) or [])
+
+    sql = """
+        SELECT hd.id, MAX(COALESCE(ct.chua_nop, 0) - COALESCE(gd.da_nop, 0), 0)
+        FROM HoaDon hd
+        LEFT JOIN (
+            SELECT hoadon_id, SUM(so_luong * gia - giam) AS chua_nop
+            FROM ChiTietHoaDon WHERE xuat_hoa_don = 0 GROUP BY hoadon_id
+        ) ct ON ct.hoadon_id = hd.id
+        LEFT JOIN (
+            SELECT hoadon_id, SUM(so_tien) AS da_nop
+            FROM GiaoDichQuy WHERE hoadon_id IS NOT NULL GROUP BY hoadon_id
+        ) gd ON gd.hoadon_id = hd.id
+    """
+    where, params = _dieu_kien_hoadon(trang_thai)
+    return dict(execute_query(sql + where, params, fetch_all=True) or [])
 
 
 def lay_chi_tiet_hoadon(hoadon_id):
@@ -212,11 +272,20 @@ def xuat_hoa_don(hoadon_id, user_id):
             c.execute(
                 "UPDATE HoaDon SET trang_thai = 'Da_xuat' WHERE id = ?", (hoadon_id,)
             )
+        event_bus.phat(HoaDonDaSua([hoadon_id]))
         return True, "Xuất thành công"
     except Exception as e:
         return False, str(e)
 
 
+def _sql_tat_ca(sql):
+    """Đổi ChiTietHoaDon / HoaDon sang view gộp cả dữ liệu lưu trữ."""
+    return sql.replace("FROM ChiTietHoaDon ct", "FROM ChiTietHoaDon_TatCa ct").replace(
+        "JOIN HoaDon hd", "JOIN HoaDon_TatCa hd"
+    )
+
+
+@cache_bao_cao
 def lay_chi_tiet_hoadon_da_xuat(user_id, role, tu_ngay=None, den_ngay=None):
     """
     Lấy chi tiết các hóa đơn đã xuất
@@ -252,9 +321,55 @@ def lay_chi_tiet_hoadon_da_xuat(user_id, role, tu_ngay=None, den_ngay=None):
         params.append(den_ngay)
 
     sql += " ORDER BY hd.ngay DESC"
+    # Hóa đơn đã xuất hết của các năm cũ nằm trong file lưu trữ
+    if can_du_lieu_luu_tru(tu_ngay, den_ngay):
+        return truy_van_lich_su(_sql_tat_ca(sql), tuple(params), tu_ngay, den_ngay)
     return execute_query(sql, tuple(params) if params else None, fetch_all=True) or []
 
 
+@cache_bao_cao
+def lay_chi_tiet_xhd(user_id, role, tu_ngay=None, den_ngay=None):
+    """
+    Các dòng chi tiết đã xuất hóa đơn (xuat_hoa_don = 1) cho tab Hóa đơn.
+
+    - Staff: chỉ xem hóa đơn của mình
+    - Admin: có thêm hoadon_id, chitiet_id ở đầu mỗi dòng để sửa/xóa
+
+    Returns:
+        Admin: list of (hoadon_id, chitiet_id, ngay, username, ten_sp, so_luong, loai_gia, tong_tien)
+        Khác: list of (ngay, username, ten_sp, so_luong, loai_gia, tong_tien)
+    """
+    cot_id = "hd.id AS hoadon_id, ct.id AS chitiet_id," if role == "admin" else ""
+    sql = f"""
+        SELECT {cot_id}
+            hd.ngay,
+            u.username,
+            s.ten AS ten_sp,
+            ct.so_luong,
+            ct.loai_gia,
+            (ct.so_luong * ct.gia - ct.giam) AS tong_tien
+        FROM ChiTietHoaDon ct
+        JOIN HoaDon hd ON ct.hoadon_id = hd.id
+        JOIN Users u ON hd.user_id = u.id
+        JOIN SanPham s ON ct.sanpham_id = s.id
+        WHERE ct.xuat_hoa_don = 1
+    """
+    params = []
+    if role == "staff":
+        sql += " AND hd.user_id = ?"
+        params.append(user_id)
+    if tu_ngay:
+        sql += " AND hd.ngay >= ?"
+        params.append(str(tu_ngay)[:10])
+    if den_ngay:
+        sql += " AND hd.ngay < date(?, '+1 day')"
+        params.append(str(den_ngay)[:10])
+    sql += " ORDER BY hd.ngay DESC"
+    if can_du_lieu_luu_tru(tu_ngay, den_ngay):
+        return truy_van_lich_su(_sql_tat_ca(sql), tuple(params), tu_ngay, den_ngay)
+    return execute_query(sql, tuple(params), fetch_all=True) or []
+
+
 def sua_hoa_don(hoadon_id, ngay=None, khach_hang=None, ghi_chu=None):
     """
     Sửa thông tin hóa đơn (chỉ cho admin).
@@ -288,6 +403,8 @@ def sua_hoa_don(hoadon_id, ngay=None, khach_hang=None, ghi_chu=None):
         sql = f"UPDATE HoaDon SET {', '.join(updates)} WHERE id = ?"
 
         success = execute_update(sql, tuple(params))
+        if success:
+            event_bus.phat(HoaDonDaSua([hoadon_id], sua_ban_hang=True))
         return success
     except Exception as e:
         print(f"Lỗi sửa hóa đơn: {e}")
@@ -305,12 +422,21 @@ def xoa_hoa_don(hoadon_id):
             c.execute("DELETE FROM ChiTietHoaDon WHERE hoadon_id = ?", (hoadon_id,))
             # Xóa hóa đơn
             c.execute("DELETE FROM HoaDon WHERE id = ?", (hoadon_id,))
+        event_bus.phat(HoaDonDaSua([hoadon_id], sua_ban_hang=True))
         return True
     except Exception as e:
         print(f"Lỗi xóa hóa đơn: {e}")
         return False
 
 
+def _hoadon_ids_cua_chi_tiet(chitiet_id):
+    """[hoadon_id] của một dòng chi tiết; None (= mọi hóa đơn) nếu không tìm thấy."""
+    row = execute_query(
+        "SELECT hoadon_id FROM ChiTietHoaDon WHERE id = ?", (chitiet_id,), fetch_one=True
+    )
+    return [row[0]] if row else None
+
+
 def sua_chi_tiet_hoa_don(chitiet_id, so_luong=None, gia=None, giam=None, ghi_chu=None):
     """
     Sửa chi tiết hóa đơn (chỉ cho admin).
@@ -349,6 +475,10 @@ def sua_chi_tiet_hoa_don(chitiet_id, so_luong=None, gia=None, giam=None, ghi_chu
         sql = f"UPDATE ChiTietHoaDon SET {', '.join(updates)} WHERE id = ?"
 
         success = execute_update(sql, tuple(params))
+        if success:
+            event_bus.phat(
+                HoaDonDaSua(_hoadon_ids_cua_chi_tiet(chitiet_id), sua_ban_hang=True)
+            )
         return success
     except Exception as e:
         print(f"Lỗi sửa chi tiết hóa đơn: {e}")
@@ -361,9 +491,12 @@ def xoa_chi_tiet_hoa_don(chitiet_id):
     Lưu ý: Cần cân nhắc việc hoàn trả tồn kho.
     """
     try:
+        hoadon_ids = _hoadon_ids_cua_chi_tiet(chitiet_id)
         success = execute_update(
             "DELETE FROM ChiTietHoaDon WHERE id = ?", (chitiet_id,)
         )
+        if success:
+            event_bus.phat(HoaDonDaSua(hoadon_ids, sua_ban_hang=True))
         return success
     except Exception as e:
         print(f"Lỗi xóa chi tiết hóa đơn: {e}")
@@ -372,6 +505,8 @@ def xoa_chi_tiet_hoa_don(chitiet_id):
 
 def export_hoa_don_excel(file_path, trang_thai=None):
     try:
+        import pandas as pd
+
         conn = ket_noi()
         query = "SELECT * FROM HoaDon"
         params = None
@@ -0,0 +1,259 @@
+"""
+Sổ cái số dư user (balance ledger)
+
+Mọi thay đổi Users.so_du đều đi qua cap_nhat_so_du()/dat_so_du() để ghi kèm
+một dòng SoCaiSoDu (số tiền, số dư sau, lý do, ID nguồn) trong CÙNG transaction.
+Mỗi ngày, lần thay đổi đầu tiên của một user sẽ chụp số dư đầu ngày vào
+SoDuSnapshot; snapshot cũng là mốc chuyển số dư khi sổ cái cũ được lưu trữ.
+
+Tra cứu dùng index (user_id, ngay):
+    so_du_tai_thoi_diem(user_id, "2025-06-30 23:59:59")
+    bien_dong_so_du(user_id, "2025-06-01", "2025-06-30", limit=200, offset=0)
+
+Sổ cái của các năm đã lưu trữ được đọc qua view SoCaiSoDu_TatCa (archive).
+"""
+
+from datetime import datetime
+
+from archive import ket_noi_theo_khoang
+from utils.db_helpers import execute_query, db_transaction
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Lý do thay đổi số dư
+LY_DO_BAN_HANG = "ban_hang"  # Bán chưa xuất hóa đơn: user giữ tiền
+LY_DO_XUAT_BO = "xuat_bo"
+LY_DO_XUAT_DU = "xuat_du"
+LY_DO_CHUYEN_TIEN = "chuyen_tien"
+LY_DO_CHO_NO = "cho_no"
+LY_DO_CONG_DOAN = "cong_doan"
+LY_DO_CHENH_LECH = "chenh_lech"
+LY_DO_DAU_KY = "dau_ky"
+
+LY_DO_HIEN_THI = {
+    LY_DO_BAN_HANG: "Bán hàng (chưa XHĐ)",
+    LY_DO_XUAT_BO: "Xuất bổ",
+    LY_DO_XUAT_DU: "Xuất dư",
+    LY_DO_CHUYEN_TIEN: "Chuyển tiền",
+    LY_DO_CHO_NO: "Cho nợ",
+    LY_DO_CONG_DOAN: "Công đoàn",
+    LY_DO_CHENH_LECH: "Chênh lệch",
+    LY_DO_DAU_KY: "Số dư đầu kỳ",
+}
+
+
+def _bay_gio():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _chup_dau_ngay(c, user_id, ngay):
+    """Chụp số dư đầu ngày của user nếu hôm nay chưa có snapshot."""
+    ngay_bat_dau = ngay[:10]
+    c.execute(
+        "SELECT 1 FROM SoDuSnapshot WHERE user_id = ? AND ngay >= ? LIMIT 1",
+        (user_id, ngay_bat_dau),
+    )
+    if c.fetchone():
+        return
+    c.execute(
+        "INSERT INTO SoDuSnapshot (user_id, ngay, so_du) "
+        "SELECT id, ?, COALESCE(so_du, 0) FROM Users WHERE id = ?",
+        (ngay_bat_dau + " 00:00:00", user_id),
+    )
+
+
+def cap_nhat_so_du(c, user_id, so_tien, ly_do, nguon_id=None, ghi_chu=None, ngay=None):
+    """
+    Cộng so_tien (âm = trừ) vào số dư user và ghi sổ cái.
+
+    Chạy trên cursor của transaction đang mở, caller chịu trách nhiệm commit.
+
+    Args:
+        c: Cursor sqlite3 của transaction hiện tại
+        user_id: ID user
+        so_tien: Số tiền thay đổi (dương = cộng, âm = trừ)
+        ly_do: Một trong các hằng LY_DO_*
+        nguon_id: ID bản ghi nguồn (hóa đơn, giao dịch quỹ...) nếu có
+        ghi_chu: Ghi chú hiển thị
+        ngay: Thời điểm ghi nhận, mặc định là hiện tại
+
+    Returns:
+        float: Số dư sau khi cập nhật
+    """
+    if user_id is None or not so_tien:
+        return None
+    ngay = ngay or _bay_gio()
+    _chup_dau_ngay(c, user_id, ngay)
+    c.execute("UPDATE Users SET so_du = so_du + ? WHERE id = ?", (so_tien, user_id))
+    c.execute("SELECT so_du FROM Users WHERE id = ?", (user_id,))
+    row = c.fetchone()
+    so_du_sau = row[0] if row else 0
+    c.execute(
+        "INSERT INTO SoCaiSoDu (user_id, ngay, so_tien, so_du_sau, ly_do, nguon_id, ghi_chu) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (user_id, ngay, so_tien, so_du_sau, ly_do, nguon_id, ghi_chu),
+    )
+    return so_du_sau
+
+
+def ghi_so_cai_nhieu(c, rows):
+    """
+    Ghi nhiều dòng sổ cái bằng executemany với so_du_sau do caller tính sẵn.
+
+    Gọi TRƯỚC khi UPDATE Users để snapshot đầu ngày chụp đúng số dư cũ.
+
+    Args:
+        c: Cursor của transaction hiện tại
+        rows: list of (user_id, ngay, so_tien, so_du_sau, ly_do, nguon_id, ghi_chu)
+    """
+    if not rows:
+        return
+    user_ids = {r[0] for r in rows}
+    ngay = min(r[1] for r in rows)
+    for user_id in user_ids:
+        _chup_dau_ngay(c, user_id, ngay)
+    c.executemany(
+        "INSERT INTO SoCaiSoDu (user_id, ngay, so_tien, so_du_sau, ly_do, nguon_id, ghi_chu) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+
+
+def dat_so_du(c, user_id, so_du_moi, ly_do=LY_DO_DAU_KY, nguon_id=None, ghi_chu=None):
+    """
+    Đặt số dư tuyệt đối (vd: nhập số dư đầu kỳ), ghi phần chênh vào sổ cái.
+
+    Returns:
+        float: Số dư sau khi cập nhật
+    """
+    c.execute("SELECT so_du FROM Users WHERE id = ?", (user_id,))
+    row = c.fetchone()
+    if not row:
+        return None
+    chenh = float(so_du_moi) - float(row[0] or 0)
+    if abs(chenh) < 1e-9:
+        return row[0]
+    return cap_nhat_so_du(c, user_id, chenh, ly_do, nguon_id, ghi_chu)
+
+
+def chup_snapshot_so_du(ngay=None):
+    """
+    Chụp số dư hiện tại của mọi user chưa có snapshot trong ngày.
+
+    Gọi khi khởi động ứng dụng / đóng ca để có mốc số dư định kỳ.
+
+    Returns:
+        int: Số snapshot được tạo
+    """
+    ngay = ngay or _bay_gio()
+    try:
+        with db_transaction() as (conn, c):
+            c.execute(
+                """
+                INSERT INTO SoDuSnapshot (user_id, ngay, so_du)
+                SELECT u.id, ?, COALESCE(u.so_du, 0)
+                FROM Users u
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM SoDuSnapshot s
+                    WHERE s.user_id = u.id AND s.ngay >= ?
+                )
+                """,
+                (ngay, ngay[:10]),
+            )
+            return c.rowcount
+    except Exception as e:
+        logger.error(f"Lỗi chụp snapshot số dư: {e}")
+        return 0
+
+
+def so_du_tai_thoi_diem(user_id, ts):
+    """
+    Số dư của user tại thời điểm ts.
+
+    Lấy mốc gần nhất <= ts giữa dòng sổ cái (so_du_sau) và snapshot.
+
+    Args:
+        user_id: ID user
+        ts: 'YYYY-MM-DD' (hiểu là cuối ngày) hoặc 'YYYY-MM-DD HH:MM:SS'
+
+    Returns:
+        float: Số dư (0 nếu chưa có dữ liệu trước thời điểm đó)
+    """
+    ts = str(ts).replace("T", " ")
+    if len(ts) == 10:
+        ts += " 23:59:59"
+    so_cai = execute_query(
+        "SELECT ngay, so_du_sau FROM SoCaiSoDu WHERE user_id = ? AND ngay <= ? "
+        "ORDER BY ngay DESC, id DESC LIMIT 1",
+        (user_id, ts),
+        fetch_one=True,
+    )
+    snapshot = execute_query(
+        "SELECT ngay, so_du FROM SoDuSnapshot WHERE user_id = ? AND ngay <= ? "
+        "ORDER BY ngay DESC, id DESC LIMIT 1",
+        (user_id, ts),
+        fetch_one=True,
+    )
+    # Cùng thời điểm thì ưu tiên sổ cái: snapshot đã gồm các dòng trước nó
+    if so_cai and (not snapshot or so_cai[0] >= snapshot[0]):
+        return float(so_cai[1] or 0)
+    if snapshot:
+        return float(snapshot[1] or 0)
+    return 0.0
+
+
+def _dieu_kien_bien_dong(user_id, tu_ngay, den_ngay):
+    where = " WHERE 1=1"
+    params = []
+    if user_id is not None:
+        where += " AND l.user_id = ?"
+        params.append(user_id)
+    if tu_ngay:
+        where += " AND l.ngay >= ?"
+        params.append(str(tu_ngay)[:10])
+    if den_ngay:
+        where += " AND l.ngay < date(?, '+1 day')"
+        params.append(str(den_ngay)[:10])
+    return where, params
+
+
+def bien_dong_so_du(user_id=None, tu_ngay=None, den_ngay=None, limit=None, offset=0):
+    """
+    Các biến động số dư trong khoảng ngày (mới nhất trước), có phân trang.
+
+    Args:
+        user_id: ID user hoặc None = tất cả
+        tu_ngay, den_ngay: 'YYYY-MM-DD' (bao gồm cả hai đầu)
+        limit: Số dòng mỗi trang (None = không giới hạn)
+        offset: Vị trí bắt đầu
+
+    Returns:
+        list of (id, ngay, user_id, username, so_tien, so_du_sau, ly_do, nguon_id, ghi_chu)
+    """
+    where, params = _dieu_kien_bien_dong(user_id, tu_ngay, den_ngay)
+    where += " ORDER BY l.ngay DESC, l.id DESC"
+    if limit is not None:
+        where += " LIMIT ? OFFSET ?"
+        params += [int(limit), int(offset)]
+    with ket_noi_theo_khoang(tu_ngay, den_ngay) as (conn, c, hau_to):
+        c.execute(
+            "SELECT l.id, l.ngay, l.user_id, u.username, l.so_tien, l.so_du_sau, "
+            "l.ly_do, l.nguon_id, COALESCE(l.ghi_chu, '') "
+            f"FROM SoCaiSoDu{hau_to} l LEFT JOIN Users u ON l.user_id = u.id" + where,
+            params,
+        )
+        return c.fetchall()
+
+
+def dem_bien_dong_so_du(user_id=None, tu_ngay=None, den_ngay=None):
+    """Tổng số dòng và tổng tiền biến động trong khoảng (dùng cho phân trang)."""
+    where, params = _dieu_kien_bien_dong(user_id, tu_ngay, den_ngay)
+    with ket_noi_theo_khoang(tu_ngay, den_ngay) as (conn, c, hau_to):
+        c.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(l.so_tien), 0) FROM SoCaiSoDu{hau_to} l"
+            + where,
+            params,
+        )
+        row = c.fetchone()
+    return (row[0], float(row[1])) if row else (0, 0.0)
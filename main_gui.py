@@ -1,5 +1,11 @@
 import sys
-import pandas as pd
+
+# Đo thời gian khởi động (chỉ khi chạy trực tiếp), trước mọi import nặng
+from utils import startup_timing
+
+if __name__ == "__main__":
+    startup_timing.bat_dau()
+
 import os
 import csv
 from datetime import datetime, timedelta
@@ -19,7 +25,6 @@ from PyQt5.QtWidgets import (
     QFileDialog,
     QInputDialog,
     QSpinBox,
-    QCompleter,
     QCheckBox,
     QDateEdit,
     QDateTimeEdit,
@@ -31,11 +36,11 @@ from PyQt5.QtWidgets import (
     QHeaderView,
     QGroupBox,
 )
-from PyQt5.QtCore import Qt, QDate, QDateTime
-from PyQt5.QtGui import QIcon, QPixmap, QFont, QColor
+from PyQt5.QtCore import Qt, QDate, QDateTime, QTimer
+from PyQt5.QtGui import QIcon, QPixmap, QFont, QColor, QTextCharFormat
 
 from PyQt5.QtPrintSupport import QPrinter, QPrintDialog
-from PyQt5.QtGui import QPainter, QDoubleValidator
+from PyQt5.QtGui import QDoubleValidator
 
 # Logging
 from utils.logging_config import get_logger
@@ -46,8 +51,6 @@ logger = get_logger(__name__)
 from utils.money import MENH_GIA
 from utils.invoice import (
     tinh_unpaid_total,
-    chon_don_gia,
-    xac_dinh_loai_gia,
     tinh_chenh_lech,
 )
 from utils.ui_helpers import (
@@ -58,15 +61,34 @@ from utils.ui_helpers import (
     show_confirmation,
     setup_quantity_spinbox,
 )
+from utils.product_completer import lay_bo_goi_y_sanpham
+from utils.user_model import lay_model_cho_no
+from utils.pdf_render import Phieu, xuat_pdf_nen, in_html_nen, in_phieu_nen
+from utils.table_model import Cot, BangDuLieu, KIEU_NUT, KIEU_LINK, KIEU_CHON
+from utils.background_loader import BoTaiNen, tao_chi_bao_tai
+from utils.chart_render import VeBieuDoCot, KhungBieuDo, SO_CHUOI_TOI_DA
+from utils.price_history_model import LichSuGiaModel
+from utils.report_cache import lay_cache
+from utils.ai_worker import BoHoiAI
+from utils import event_bus
+from utils.event_bus import (
+    HoaDonDaTao,
+    HoaDonDaSua,
+    TonKhoThayDoi,
+    SoDuThayDoi,
+    SanPhamThayDoi,
+)
+from utils.view_invalidation import BoLamMoi, hop_ids
+import user_directory
+
 
 # 🤖 AI System (Gemma 2B via Ollama) - With Permissions
-try:
+# ai_system kéo theo requests/groq/langchain: chỉ import khi tạo trợ lý lần đầu
+def tao_tro_ly_ai(**kwargs):
     from ai_system import AIAssistant
 
-    AI_AGENT_AVAILABLE = True
-except ImportError as e:
-    logger.warning(f"AI system not available: {e}")
-    AI_AGENT_AVAILABLE = False
+    return AIAssistant(**kwargs)
+
 
 # Import các hàm từ module riêng
 from users import (
@@ -76,6 +98,7 @@ from users import (
     xoa_user,
     doi_mat_khau,
     chuyen_tien,
+    chuyen_tien_nhieu,
     lay_so_du,
     lay_lich_su_quy,
 )
@@ -83,11 +106,14 @@ from products import (
     them_sanpham,
     tim_sanpham,
     lay_tat_ca_sanpham,
+    lay_bang_gia,
     import_sanpham_from_dataframe,
     xoa_sanpham,
     lay_danh_sach_ten_sanpham,
+    lay_sanpham_theo_id,
     cap_nhat_ton,
 )
+from cart import GioHang, COT_TEN, COT_DON_GIA, COT_THANH_TIEN
 from invoices import (
     tao_hoa_don,
     lay_danh_sach_hoadon,
@@ -95,22 +121,72 @@ from invoices import (
     xuat_hoa_don,
     export_hoa_don_excel,
     lay_chi_tiet_hoadon_da_xuat,
+    lay_chi_tiet_xhd,
+    lay_so_du_theo_hoadon,
 )
 from reports import (
     chi_tiet_log_kho,
     doanh_thu_theo_thang,
     bao_cao_xuat_theo_thang,
     bao_cao_kho,
+    tinh_bao_cao_kho,
     bao_cao_doanh_thu,
+    du_lieu_trang_chu,
+    so_lit_moi_don_vi,
 )
 from stock import (
     lay_san_pham_chua_xuat,
     xuat_bo_san_pham,
     lay_tong_chua_xuat_theo_sp,
     lay_san_pham_chua_xuat_theo_loai_gia,
-    xuat_bo_san_pham_theo_ten,
+    bao_cao_chenh_lech_xuat_bo,
+    lay_chi_so_xuat_bo,
+    lay_tinh_trang_san_pham,
+    NHOM_CHI_TIET,
+    NHOM_NGAY,
+    NHOM_USER,
+    NHOM_SAN_PHAM,
+)
+from price_timeline import (
+    ghi_nhan_thay_doi_gia,
+    gia_moi_nhat_nhieu,
+    gia_tai_thoi_diem_nhieu,
+)
+from analytics import (
+    pivot_doanh_so,
+    gop_nhom_khac,
+    xuat_excel_pivot,
+    KY_NGAY,
+    KY_TUAN,
+    KY_THANG,
+    KY_NAM,
+    KY_HIEN_THI,
+)
+from ledger import (
+    cap_nhat_so_du,
+    dat_so_du,
+    bien_dong_so_du,
+    dem_bien_dong_so_du,
+    so_du_tai_thoi_diem,
+    chup_snapshot_so_du,
+    LY_DO_CHENH_LECH,
+    LY_DO_CHO_NO,
+    LY_DO_XUAT_BO,
+    LY_DO_CONG_DOAN,
+    LY_DO_DAU_KY,
+    LY_DO_HIEN_THI,
+)
+from shift_summary import (
+    mo_ca,
+    ghi_nhan_hoa_don,
+    dong_ca,
+    cap_nhat_file_pdf,
+    lay_tong_ket_ca,
+    danh_sach_ca,
+    tao_html_tong_ket,
 )
 from db import ket_noi, khoi_tao_db
+from archive import ket_noi_theo_khoang
 
 # Định dạng giá
 import locale
@@ -126,6 +202,13 @@ def format_price(value):
         return str(value)
 
 
+TEN_LOAI_GIA = {"le": "Lẻ", "buon": "Buôn", "vip": "VIP"}
+
+
+def format_loai_gia(loai_gia):
+    return TEN_LOAI_GIA.get(loai_gia, loai_gia)
+
+
 # ✅ Hàm quản lý thư mục lưu trữ file
 def tao_thu_muc_luu_tru():
     """Tạo thư mục để lưu file nhận hàng và tổng kết ca"""
@@ -443,17 +526,12 @@ class MainWindow(QWidget):
         self.role = role
         self.login_window = login_window
         self.last_invoice_id = None  # Lưu ID hóa đơn mới nhất trong ca
+        self.ca_id = None  # Ca đang mở (TongKetCa), tạo khi nhận hàng
 
-        # Lấy username từ database
-        from users import lay_tat_ca_user
-
+        # Lấy username từ danh bạ user dùng chung
         self.username = "User"
         try:
-            users = lay_tat_ca_user()
-            for u in users:
-                if u[0] == user_id:
-                    self.username = u[1]
-                    break
+            self.username = user_directory.lay_ten(user_id, "User")
         except Exception as e:
             print(f"Warning: Could not load username for user_id {user_id}: {e}")
 
@@ -517,10 +595,22 @@ class MainWindow(QWidget):
         # Tab navigation mapping: keyword -> (tab_index or (parent_index, child_index))
         self.tab_map = {}
 
+        # Tab dựng trễ: widget -> hàm init_tab_*, dựng khi được mở lần đầu
+        self._tab_chua_tao = {}
+
         # In-memory map of products available for sale in this session.
         # Keys: product name, value: total received quantity (float)
         self.available_products = {}
 
+        # Model tên sản phẩm dùng chung cho mọi completer (cập nhật từng dòng)
+        self.goi_y_sanpham = lay_bo_goi_y_sanpham()
+        self.goi_y_sanpham.cap_nhat_co_san(self.available_products)
+
+        # Làm mới theo sự kiện thay đổi dữ liệu (utils.event_bus): mỗi init_tab_*
+        # đăng ký phần cần làm mới của tab mình, chạy khi tab đang hiện
+        self.bo_lam_moi = BoLamMoi(self)
+        self.bo_lam_moi.dang_ky(None, (SanPhamThayDoi,), self._khi_san_pham_doi)
+
         # Track whether user has completed receiving products
         self.nhan_hang_completed = False
         # Track whether shift is closed
@@ -534,12 +624,10 @@ class MainWindow(QWidget):
 
         if self.role in ["accountant", "admin"]:
             self.tab_sanpham = QWidget()
-            self.tabs.addTab(self.tab_sanpham, "Sản phẩm")
-            self.init_tab_sanpham()
+            self._them_tab_tre(self.tab_sanpham, "Sản phẩm", self.init_tab_sanpham)
 
             self.tab_lich_su_gia = QWidget()
-            self.tabs.addTab(self.tab_lich_su_gia, "Lịch sử giá")
-            self.init_tab_lich_su_gia()
+            self._them_tab_tre(self.tab_lich_su_gia, "Lịch sử giá", self.init_tab_lich_su_gia)
 
         # Create a parent tab "Ca bán hàng" which contains two child tabs:
         # - "Bán hàng" (where products can be sold)
@@ -563,56 +651,90 @@ class MainWindow(QWidget):
 
         # Other top-level tabs
         self.tab_chitietban = QWidget()
-        self.tabs.addTab(self.tab_chitietban, "Chi tiết bán")
-        self.init_tab_chitietban()
+        self._them_tab_tre(self.tab_chitietban, "Chi tiết bán", self.init_tab_chitietban)
 
         self.tab_hoadon = QWidget()
-        self.tabs.addTab(self.tab_hoadon, "Hóa đơn")
-        self.init_tab_hoadon()
+        self._them_tab_tre(self.tab_hoadon, "Hóa đơn", self.init_tab_hoadon)
 
         self.tab_baocao = QWidget()
-        self.tabs.addTab(self.tab_baocao, "Báo cáo")
-        self.init_tab_baocao()
+        self._them_tab_tre(self.tab_baocao, "Báo cáo", self.init_tab_baocao)
 
         if self.role == "admin":
             self.tab_user = QWidget()
-            self.tabs.addTab(self.tab_user, "Quản lý User")
-            self.init_tab_user()
+            self._them_tab_tre(self.tab_user, "Quản lý User", self.init_tab_user)
 
         # Tab chênh lệch cho admin và accountant
         if self.role in ["admin", "accountant"]:
             self.tab_chenhlech = QWidget()
-            self.tabs.addTab(self.tab_chenhlech, "Chênh lệch")
-            self.init_tab_chenhlech()
+            self._them_tab_tre(self.tab_chenhlech, "Chênh lệch", self.init_tab_chenhlech)
 
         if self.role == "accountant":
             self.tab_xuat_bo = QWidget()
-            self.tabs.addTab(self.tab_xuat_bo, "Xuất bổ")
-            self.init_tab_xuat_bo()
+            self._them_tab_tre(self.tab_xuat_bo, "Xuất bổ", self.init_tab_xuat_bo)
 
             self.tab_cong_doan = QWidget()
-            self.tabs.addTab(self.tab_cong_doan, "Công đoàn")
-            self.init_tab_cong_doan()
+            self._them_tab_tre(self.tab_cong_doan, "Công đoàn", self.init_tab_cong_doan)
 
             self.tab_so_quy = QWidget()
-            self.tabs.addTab(self.tab_so_quy, "Sổ quỹ")
-            self.init_tab_so_quy()
+            self._them_tab_tre(self.tab_so_quy, "Sổ quỹ", self.init_tab_so_quy)
 
             self.tab_nhap_dau_ky = QWidget()
-            self.tabs.addTab(self.tab_nhap_dau_ky, "Nhập đầu kỳ")
-            self.init_tab_nhap_dau_ky()
+            self._them_tab_tre(self.tab_nhap_dau_ky, "Nhập đầu kỳ", self.init_tab_nhap_dau_ky)
 
         # ⚙️ Settings Tab (AI Configuration) - Moved to end
         self.tab_settings = QWidget()
-        self.tabs.addTab(self.tab_settings, "⚙️ Cài đặt")
-        self.init_tab_settings()
+        self._them_tab_tre(self.tab_settings, "⚙️ Cài đặt", self.init_tab_settings)
 
         # Build tab navigation map after all tabs are added
         self.build_tab_map()
+        self.tabs.currentChanged.connect(self._khi_doi_tab)
 
         # ==================== AI CHAT PANEL (BÊN PHẢI) ====================
         self.create_ai_chat_panel(main_layout)
 
+    def _them_tab_tre(self, tab, tieu_de, ham_khoi_tao):
+        """
+        Thêm tab nhưng chưa dựng nội dung; nội dung được dựng khi mở tab lần đầu.
+
+        Args:
+            tab: QWidget rỗng của tab (ham_khoi_tao sẽ setLayout cho nó)
+            tieu_de: Tiêu đề tab
+            ham_khoi_tao: Hàm init_tab_* tương ứng
+        """
+        self.tabs.addTab(tab, tieu_de)
+        self._tab_chua_tao[tab] = ham_khoi_tao
+
+    def tab_da_tao(self, ten_tab):
+        """
+        Tab đã được dựng chưa (loader của tab chưa dựng sẽ bỏ qua, vì
+        init_tab_* tự nạp dữ liệu khi dựng).
+
+        Args:
+            ten_tab: Tên thuộc tính tab, vd: "tab_so_quy"
+
+        Returns:
+            bool: False nếu tab không có (theo quyền) hoặc chưa dựng
+        """
+        tab = getattr(self, ten_tab, None)
+        return tab is not None and tab not in self._tab_chua_tao
+
+    def dam_bao_tab(self, tab):
+        """Dựng tab nếu chưa dựng."""
+        ham_khoi_tao = self._tab_chua_tao.pop(tab, None)
+        if ham_khoi_tao is None:
+            return
+        try:
+            ham_khoi_tao()
+        except Exception as e:
+            logger.error(f"Lỗi dựng tab {ham_khoi_tao.__name__}: {e}")
+
+    def _khi_doi_tab(self, index):
+        """Dựng tab vừa mở, rồi dựng sẵn tab kế tiếp khi giao diện rảnh."""
+        self.dam_bao_tab(self.tabs.widget(index))
+        tab_ke = self.tabs.widget(index + 1)
+        if tab_ke in self._tab_chua_tao:
+            QTimer.singleShot(300, lambda: self.dam_bao_tab(tab_ke))
+
     def build_tab_map(self):
         """Build keyword -> tab index mapping dynamically based on current tabs"""
         self.tab_map = {}
@@ -873,6 +995,29 @@ class MainWindow(QWidget):
         send_btn.clicked.connect(self.send_ai_message_right)
         btn_layout.addWidget(send_btn)
 
+        # Hủy câu hỏi đang chờ (chỉ hiện khi AI đang trả lời)
+        self.btn_huy_ai_phai = QPushButton("⏹")
+        self.btn_huy_ai_phai.setFixedWidth(40)
+        self.btn_huy_ai_phai.setStyleSheet(
+            """
+            QPushButton {
+                background: #e67e22;
+                color: white;
+                font-weight: bold;
+                padding: 8px;
+                border-radius: 5px;
+                border: none;
+            }
+            QPushButton:hover {
+                background: #d35400;
+            }
+        """
+        )
+        self.btn_huy_ai_phai.setToolTip("Dừng câu trả lời")
+        self.btn_huy_ai_phai.setVisible(False)
+        self.btn_huy_ai_phai.clicked.connect(self.huy_ai_message_right)
+        btn_layout.addWidget(self.btn_huy_ai_phai)
+
         clear_btn = QPushButton("🗑️")
         clear_btn.setFixedWidth(40)
         clear_btn.setStyleSheet(
@@ -897,45 +1042,28 @@ class MainWindow(QWidget):
         input_layout.addLayout(btn_layout)
         ai_layout.addLayout(input_layout)
 
-        # Initialize AI Assistant with current user role
-        if AI_AGENT_AVAILABLE:
-            try:
-                self.ai_agent_right = AIAssistant(
-                    main_window=self,
-                    current_user_role=self.role,  # Pass user role for permissions
-                    current_user_id=self.user_id,  # Pass user ID for LangChain memory
-                )
-
-                # Check AI mode and display appropriate message
-                mode = self.ai_agent_right.get_ai_mode()
-                model = self.ai_agent_right.get_model_name()
-
-                if mode == "online":
-                    # Groq API connected
-                    self.ai_chat_display.append(
-                        f"✅ <b>AI đã sẵn sàng! (ONLINE - {model})</b><br>"
-                        f"<i>Hỏi gì đó...</i><br>"
-                    )
-                else:
-                    # Offline mode
-                    if self.ai_agent_right.is_server_running():
-                        self.ai_chat_display.append(
-                            f"✅ <b>AI đã sẵn sàng! (OFFLINE - {model})</b><br>"
-                            f"<i>Hỏi gì đó...</i><br>"
-                        )
-                    else:
-                        self.ai_chat_display.append(
-                            "⚠️ <b>Ollama server chưa chạy</b><br>"
-                            "Chạy: ollama serve<br>"
-                            "Hoặc cấu hình Groq API trong Settings để dùng ONLINE mode!<br>"
-                        )
-
-                # Update Settings tab status
-                self._update_ai_status_display()
-
-            except Exception as e:
-                self.ai_chat_display.append(f"❌ <b>Lỗi khởi tạo AI:</b> {e}<br>")
-                print(f"❌ Chi tiết lỗi AI: {e}")
+        # AI trả lời ở luồng nền, token hiện dần trong khung chat
+        self.hoi_ai_phai = BoHoiAI(self)
+        self.hoi_ai_phai.co_token.connect(
+            lambda doan: self._them_token_ai(self.ai_chat_display, "_moc_ai_phai", doan)
+        )
+        self.hoi_ai_phai.xong.connect(self._khi_ai_tra_loi_right)
+        self.hoi_ai_phai.loi.connect(
+            lambda loi: self._khi_ai_loi(self.ai_chat_display, "_moc_ai_phai", loi)
+        )
+        self.hoi_ai_phai.dang_hoi.connect(self.btn_huy_ai_phai.setVisible)
+        self._moc_ai_phai = None
+
+        # Khởi tạo AI Assistant ở luồng nền: import ai_system và kiểm tra
+        # Groq/Ollama (gọi mạng) không chặn việc mở cửa sổ chính
+        self.ai_chat_display.append("⏳ <i>Đang khởi động AI...</i><br>")
+        self.tai_ai_phai = BoTaiNen(
+            self._tao_ai_phai,
+            self._khi_ai_phai_san_sang,
+            khi_loi=self._khi_ai_phai_loi,
+            parent=self,
+        )
+        self.tai_ai_phai.tai(self.role, self.user_id)
 
         # Add to main layout (HIỂN THỊ BÊN PHẢI MẶC ĐỊNH)
         main_layout.addWidget(self.ai_container)
@@ -944,6 +1072,47 @@ class MainWindow(QWidget):
         # Nút toggle để đóng/mở AI panel
         self.create_ai_toggle_button()
 
+    def _tao_ai_phai(self, role, user_id):
+        """Chạy ở luồng nền: tạo trợ lý và kiểm tra server (không chạm widget)."""
+        tro_ly = tao_tro_ly_ai(
+            main_window=self,
+            current_user_role=role,  # Pass user role for permissions
+            current_user_id=user_id,  # Pass user ID for LangChain memory
+        )
+        mode = tro_ly.get_ai_mode()
+        dang_chay = mode == "online" or tro_ly.is_server_running()
+        return tro_ly, mode, tro_ly.get_model_name(), dang_chay
+
+    def _khi_ai_phai_san_sang(self, ket_qua):
+        tro_ly, mode, model, dang_chay = ket_qua
+        self.ai_agent_right = tro_ly
+
+        # Check AI mode and display appropriate message
+        if mode == "online":
+            # Groq API connected
+            self.ai_chat_display.append(
+                f"✅ <b>AI đã sẵn sàng! (ONLINE - {model})</b><br>"
+                f"<i>Hỏi gì đó...</i><br>"
+            )
+        elif dang_chay:
+            self.ai_chat_display.append(
+                f"✅ <b>AI đã sẵn sàng! (OFFLINE - {model})</b><br>"
+                f"<i>Hỏi gì đó...</i><br>"
+            )
+        else:
+            self.ai_chat_display.append(
+                "⚠️ <b>Ollama server chưa chạy</b><br>"
+                "Chạy: ollama serve<br>"
+                "Hoặc cấu hình Groq API trong Settings để dùng ONLINE mode!<br>"
+            )
+
+        # Update Settings tab status
+        self._update_ai_status_display()
+
+    def _khi_ai_phai_loi(self, loi):
+        self.ai_chat_display.append(f"❌ <b>Lỗi khởi tạo AI:</b> {loi}<br>")
+        print(f"❌ Chi tiết lỗi AI: {loi}")
+
     def create_ai_toggle_button(self):
         """Tạo nút floating để mở/đóng AI panel"""
         self.btn_open_ai = QPushButton("🤖")
@@ -997,82 +1166,149 @@ class MainWindow(QWidget):
             self.btn_open_ai.hide()
 
     def send_ai_message_right(self):
-        """Gửi tin nhắn từ panel bên phải"""
+        """Gửi tin nhắn từ panel bên phải (AI trả lời ở luồng nền)"""
         message = self.ai_input_right.text().strip()
         if not message:
             return
 
+        # Câu hỏi mới thay câu đang chờ
+        if self.hoi_ai_phai.dang_cho():
+            self.huy_ai_message_right()
+
         # Add user message
         self.ai_chat_display.append(f"<br><b>😊 Bạn:</b> {message}<br>")
         self.ai_input_right.clear()
 
-        # Get AI response
-        try:
-            self.ai_chat_display.append("<b>🤖 AI:</b> <i>Đang suy nghĩ...</i>")
-            QApplication.processEvents()
+        tro_ly = getattr(self, "ai_agent_right", None)
+        if tro_ly is None:
+            if self.tai_ai_phai.dang_cho():
+                self.ai_chat_display.append(
+                    "<b>⏳ AI đang khởi động,</b> vui lòng gửi lại sau giây lát<br>"
+                )
+            else:
+                self.ai_chat_display.append("<b>❌ Lỗi:</b> AI chưa được khởi tạo<br>")
+            return
 
-            # Gọi AI (role đã được set trong __init__)
-            # LangChain version returns (answer, conversation_id)
-            result = self.ai_agent_right.ask(message)
+        self._cau_hoi_ai_phai = message
+        self._moc_ai_phai = self._bat_dau_tra_loi_ai(self.ai_chat_display)
+        self.hoi_ai_phai.hoi(tro_ly, message)
 
-            # Handle both old (string) and new (tuple) return format
-            if isinstance(result, tuple):
-                response, conversation_id = result
-            else:
-                response = result
-                conversation_id = None
+    def huy_ai_message_right(self):
+        """Dừng câu trả lời đang chờ ở panel bên phải"""
+        if not self.hoi_ai_phai.dang_cho():
+            return
+        self.hoi_ai_phai.huy()
+        self._ket_thuc_tra_loi_ai_da_huy(self.ai_chat_display, "_moc_ai_phai")
 
-            # Remove thinking message
-            cursor = self.ai_chat_display.textCursor()
+    def _bat_dau_tra_loi_ai(self, display):
+        """Thêm dòng "Đang suy nghĩ..."; trả về mốc (vị trí, đã có token chưa)"""
+        display.append("<b>🤖 AI:</b> <i>Đang suy nghĩ...</i>")
+        cursor = display.textCursor()
+        cursor.movePosition(cursor.End)
+        self._cuon_cuoi(display)
+        return [cursor.block().position(), False]
+
+    def _thay_khoi_tra_loi_ai(self, display, moc, html):
+        """Thay mọi thứ từ mốc tới cuối khung chat bằng html"""
+        cursor = display.textCursor()
+        cursor.setPosition(moc[0])
+        cursor.movePosition(cursor.End, cursor.KeepAnchor)
+        cursor.removeSelectedText()
+        cursor.insertHtml(html)
+        return cursor
+
+    def _them_token_ai(self, display, ten_moc, doan):
+        """Nối một đoạn câu trả lời đang stream vào khung chat"""
+        moc = getattr(self, ten_moc)
+        if moc is None:
+            return
+        if not moc[1]:
+            # Token đầu tiên: bỏ "Đang suy nghĩ..."
+            cursor = self._thay_khoi_tra_loi_ai(display, moc, "<b>🤖 AI:</b><br>")
+            moc[1] = True
+        else:
+            cursor = display.textCursor()
             cursor.movePosition(cursor.End)
-            cursor.select(cursor.BlockUnderCursor)
-            cursor.removeSelectedText()
-
-            # Format response for better readability
-            # Convert markdown-style formatting to HTML
-            formatted_response = response.replace(
-                "\n\n", "<br><br>"
-            )  # Paragraph breaks
-            formatted_response = formatted_response.replace(
-                "\n- ", "<br>• "
-            )  # Bullet points
-            formatted_response = formatted_response.replace(
-                "\n* ", "<br>• "
-            )  # Bullet points
-            formatted_response = formatted_response.replace("**", "<b>", 1).replace(
-                "**", "</b>", 1
-            )  # Bold
-
-            self.ai_chat_display.append(f"<b>🤖 AI:</b><br>{formatted_response}<br>")
-
-            # Add feedback buttons if conversation_id available
-            if conversation_id:
-                # Store conversation_id for feedback
-                if not hasattr(self, "conversation_ids"):
-                    self.conversation_ids = {}
-                self.conversation_ids[conversation_id] = {
-                    "question": message,
-                    "answer": response,
-                }
+        cursor.insertText(doan, QTextCharFormat())
+        self._cuon_cuoi(display)
 
-                # Add clickable feedback HTML (NO widgets, just HTML links)
-                self.ai_chat_display.append(
-                    f'<span style="color: #7f8c8d; font-size: 9pt;">'
-                    f"<i>Câu trả lời này có hữu ích không? </i>"
-                    f'<a href="helpful:{conversation_id}" style="color: #2ecc71; text-decoration: none; font-size: 14pt;">👍</a> '
-                    f'<a href="helpful:{conversation_id}" style="color: #2ecc71; text-decoration: none; font-size: 9pt;">Có</a> '
-                    f'<a href="not-helpful:{conversation_id}" style="color: #e74c3c; text-decoration: none; font-size: 14pt;">👎</a> '
-                    f'<a href="not-helpful:{conversation_id}" style="color: #e74c3c; text-decoration: none; font-size: 9pt;">Không</a>'
-                    f"</span><br>"
-                )
+    def _ket_thuc_tra_loi_ai_da_huy(self, display, ten_moc):
+        moc = getattr(self, ten_moc)
+        if moc is None:
+            return
+        if moc[1]:
+            cursor = display.textCursor()
+            cursor.movePosition(cursor.End)
+            cursor.insertHtml(" <i style='color: #7f8c8d;'>(đã dừng)</i>")
+        else:
+            self._thay_khoi_tra_loi_ai(
+                display, moc, "<b>🤖 AI:</b> <i style='color: #7f8c8d;'>Đã dừng</i>"
+            )
+        setattr(self, ten_moc, None)
+        self._cuon_cuoi(display)
+
+    def _khi_ai_loi(self, display, ten_moc, thong_bao):
+        moc = getattr(self, ten_moc)
+        if moc is not None:
+            self._thay_khoi_tra_loi_ai(display, moc, f"<b>❌ Lỗi:</b> {thong_bao}<br>")
+            setattr(self, ten_moc, None)
+        self._cuon_cuoi(display)
+
+    def _cuon_cuoi(self, display):
+        display.verticalScrollBar().setValue(display.verticalScrollBar().maximum())
+
+    def _dinh_dang_tra_loi_ai(self, response):
+        """Chuyển định dạng kiểu markdown của câu trả lời sang HTML"""
+        formatted_response = response.replace(
+            "\n\n", "<br><br>"
+        )  # Paragraph breaks
+        formatted_response = formatted_response.replace(
+            "\n- ", "<br>• "
+        )  # Bullet points
+        formatted_response = formatted_response.replace(
+            "\n* ", "<br>• "
+        )  # Bullet points
+        formatted_response = formatted_response.replace("**", "<b>", 1).replace(
+            "**", "</b>", 1
+        )  # Bold
+        return formatted_response
+
+    def _khi_ai_tra_loi_right(self, response, conversation_id):
+        """Nhận câu trả lời đầy đủ: thay phần stream bằng bản đã định dạng"""
+        moc = self._moc_ai_phai
+        if moc is None:
+            return
+        self._moc_ai_phai = None
+        message = getattr(self, "_cau_hoi_ai_phai", "")
 
-        except Exception as e:
-            self.ai_chat_display.append(f"<b>❌ Lỗi:</b> {e}<br>")
+        formatted_response = self._dinh_dang_tra_loi_ai(response)
+        self._thay_khoi_tra_loi_ai(
+            self.ai_chat_display, moc, f"<b>🤖 AI:</b><br>{formatted_response}<br>"
+        )
+
+        # Add feedback buttons if conversation_id available
+        if conversation_id:
+            # Store conversation_id for feedback
+            if not hasattr(self, "conversation_ids"):
+                self.conversation_ids = {}
+            self.conversation_ids[conversation_id] = {
+                "question": message,
+                "answer": response,
+            }
+
+            # Add clickable feedback HTML (NO widgets, just HTML links)
+            self.ai_chat_display.append(
+                f'<span style="color: #7f8c8d; font-size: 9pt;">'
+                f"<i>Câu trả lời này có hữu ích không? </i>"
+                f'<a href="helpful:{conversation_id}" style="color: #2ecc71; text-decoration: none; font-size: 14pt;">👍</a> '
+                f'<a href="helpful:{conversation_id}" style="color: #2ecc71; text-decoration: none; font-size: 9pt;">Có</a> '
+                f'<a href="not-helpful:{conversation_id}" style="color: #e74c3c; text-decoration: none; font-size: 14pt;">👎</a> '
+                f'<a href="not-helpful:{conversation_id}" style="color: #e74c3c; text-decoration: none; font-size: 9pt;">Không</a>'
+                f"</span><br>"
+            )
 
         # Scroll to bottom
-        self.ai_chat_display.verticalScrollBar().setValue(
-            self.ai_chat_display.verticalScrollBar().maximum()
-        )
+        self._cuon_cuoi(self.ai_chat_display)
 
     def handle_feedback_click(self, url):
         """Handle click on feedback links"""
@@ -1227,6 +1463,10 @@ class MainWindow(QWidget):
     def clear_ai_history_right(self):
         """Xóa lịch sử chat bên phải"""
         try:
+            # Bỏ câu trả lời đang chờ
+            self.hoi_ai_phai.huy()
+            self._moc_ai_phai = None
+
             # Clear conversation history in AI (legacy)
             if hasattr(self, "ai_agent_right") and hasattr(
                 self.ai_agent_right, "conversation_history"
@@ -1456,6 +1696,7 @@ class MainWindow(QWidget):
                 # Apply changes to DB: update SanPham.ton_kho = counted (ton_sau), insert into LogKho and ChenhLech
                 conn = ket_noi()
                 c = conn.cursor()
+                da_kiem_ke = []
                 try:
                     for ten, ch, reason in to_apply:
                         # Get product id and current stock
@@ -1470,6 +1711,7 @@ class MainWindow(QWidget):
                             conn.rollback()
                             return
                         sp_id, ton_truoc = row
+                        da_kiem_ke.append(sp_id)
                         # Find counted qty from nhan_hang_data
                         counted = None
                         for rec in nhan_hang_data:
@@ -1517,6 +1759,7 @@ class MainWindow(QWidget):
                     conn.close()
                     return
                 conn.close()
+                event_bus.phat(TonKhoThayDoi(da_kiem_ke))
 
                 # Update in-memory baseline
                 for ten, ch, reason in to_apply:
@@ -1562,6 +1805,16 @@ class MainWindow(QWidget):
         # Refresh completer used in Bán hàng
         self.cap_nhat_completer_sanpham()
 
+        # Mở ca mới: tổng kết ca được cộng dồn từ đây cho đến khi đóng ca
+        self.ca_id = mo_ca(
+            self.user_id,
+            [
+                (ten_sp, sl_dem, ton_db, chenh, ghi_chu)
+                for _, ten_sp, sl_dem, ton_db, chenh, ghi_chu, _ in nhan_hang_data
+                if sl_dem > 0
+            ],
+        )
+
         # Mark receiving as completed and disable the tab
         self.nhan_hang_completed = True
         self.tab_nhan_hang.setEnabled(False)
@@ -1628,21 +1881,12 @@ class MainWindow(QWidget):
         return QLabel(text)
 
     def tao_completer_sanpham(self):
-        """Tạo QCompleter cho tên sản phẩm (tái sử dụng).
+        """Trả về QCompleter dùng chung cho toàn bộ tên sản phẩm (không tạo mới).
 
-        If available_only is True, only return names present in self.available_products
-        with quantity > 0. Otherwise return the full product name list from DB.
+        Completer gắn với model tên sản phẩm chung của ứng dụng, nên thêm/xóa
+        sản phẩm chỉ cập nhật model thay vì dựng lại completer.
         """
-
-        def _make(names):
-            comp = QCompleter(names, self)
-            comp.setCaseSensitivity(Qt.CaseInsensitive)
-            comp.setFilterMode(Qt.MatchContains)
-            return comp
-
-        # Default: full list
-        ten_sanpham_list = lay_danh_sach_ten_sanpham()
-        return _make(ten_sanpham_list)
+        return self.goi_y_sanpham.completer_tat_ca
 
     def sys_baocao_by_ten(self, ten_sanpham: str) -> float:
         """
@@ -1650,77 +1894,28 @@ class MainWindow(QWidget):
         SYS = Tồn kho hiện tại + Số lượng chưa xuất (CTHD xuat_hoa_don=0 + DauKyXuatBo)
 
         Trả về 0 nếu không tìm thấy sản phẩm hoặc có lỗi.
+        Nhiều sản phẩm: dùng stock.lay_tinh_trang_san_pham (một lần đọc DB).
         """
+        ten = (ten_sanpham or "").strip()
         try:
-            ten = (ten_sanpham or "").strip()
-            if not ten:
-                return 0
-            conn = ket_noi()
-            c = conn.cursor()
-            c.execute("SELECT id, ton_kho FROM SanPham WHERE ten=?", (ten,))
-            row = c.fetchone()
-            if not row:
-                conn.close()
-                return 0
-            sp_id, ton_kho = row[0], float(row[1] or 0)
-
-            # Số lượng bán chưa xuất hóa đơn
-            try:
-                c.execute(
-                    """
-                    SELECT COALESCE(SUM(so_luong), 0)
-                    FROM ChiTietHoaDon
-                    WHERE sanpham_id = ? AND xuat_hoa_don = 0
-                    """,
-                    (sp_id,),
-                )
-                sl_chua_xuat_cthd = float(c.fetchone()[0] or 0)
-            except Exception:
-                sl_chua_xuat_cthd = 0.0
-
-            # Đầu kỳ còn lại
-            try:
-                c.execute(
-                    """
-                    SELECT COALESCE(SUM(so_luong), 0)
-                    FROM DauKyXuatBo
-                    WHERE sanpham_id = ?
-                    """,
-                    (sp_id,),
-                )
-                sl_dau_ky = float(c.fetchone()[0] or 0)
-            except Exception:
-                sl_dau_ky = 0.0
-
-            conn.close()
-            sl_chua_xuat = sl_chua_xuat_cthd + sl_dau_ky
-            return ton_kho + sl_chua_xuat
+            tt = lay_tinh_trang_san_pham([ten]).get(ten)
         except Exception:
-            try:
-                conn.close()
-            except Exception:
-                pass
             return 0
+        return tt.sys if tt else 0
 
     def cap_nhat_completer_sanpham(self):
-        """Cập nhật lại completer cho tất cả các bảng sau khi thêm/xóa sản phẩm"""
-        # Cập nhật cho tab bán hàng
+        """Cập nhật gợi ý sau khi available_products hoặc danh sách sản phẩm thay đổi"""
+        # Lọc lại view "có sẵn" theo available_products (chỉ khi tập tên đổi)
+        self.goi_y_sanpham.cap_nhat_co_san(self.available_products)
+
+        # Giá/sản phẩm có thể đã đổi: nạp lại bảng giá giỏ hàng (đọc từ cache)
+        self._nap_bang_gia_giohang()
+
+        # Tab bán hàng chỉ gợi ý sản phẩm có sẵn (số lượng nhận > 0)
         if hasattr(self, "tbl_giohang"):
             delegate = self.tbl_giohang.itemDelegateForColumn(0)
             if isinstance(delegate, CompleterDelegate):
-                # Build a completer that only suggests products that are available
-                # for sale (received quantity > 0). If no received products yet,
-                # provide an empty completer so no suggestions appear.
-                available_names = [
-                    name for name, qty in self.available_products.items() if qty > 0
-                ]
-                if available_names:
-                    comp = QCompleter(available_names, self)
-                    comp.setCaseSensitivity(Qt.CaseInsensitive)
-                    comp.setFilterMode(Qt.MatchContains)
-                    delegate.completer = comp
-                else:
-                    delegate.completer = QCompleter([], self)
+                delegate.completer = self.goi_y_sanpham.completer_co_san
 
     # ==================== TAB HOME (TỔNG QUAN) ====================
     def init_tab_home(self):
@@ -1751,23 +1946,39 @@ class MainWindow(QWidget):
         btn_load_home.clicked.connect(self.load_home_data)
         filter_layout.addWidget(btn_load_home)
 
+        self.chi_bao_home = tao_chi_bao_tai()
+        filter_layout.addWidget(self.chi_bao_home)
+        self.tai_home = BoTaiNen(
+            du_lieu_trang_chu,
+            self._hien_thi_trang_chu,
+            lambda loi: show_error(self, "Lỗi", f"Lỗi tải dữ liệu Home: {loi}"),
+            chi_bao=self.chi_bao_home,
+            parent=self,
+        )
+        self.home_tu_ngay.dateChanged.connect(lambda _: self.load_home_data(tre=True))
+        self.home_den_ngay.dateChanged.connect(lambda _: self.load_home_data(tre=True))
+
         filter_layout.addStretch()
         layout.addLayout(filter_layout)
 
         # Table
-        self.tbl_home = QTableWidget()
-        self.tbl_home.setColumnCount(6)
-        self.tbl_home.setHorizontalHeaderLabels(
+        so_2 = "{:.2f}".format
+        self.tbl_home = BangDuLieu(
             [
-                "Tên sản phẩm",
-                "Đơn vị",
-                "Tồn kho",
-                "Đã xuất (XHD)",
-                "Đã xuất (Xuất bổ)",
-                "Tổng LÍT",
+                Cot("Tên sản phẩm", 1),
+                Cot("Đơn vị", 2),
+                Cot("Tồn kho", 3, dinh_dang=so_2),
+                Cot("Đã xuất (XHD)", 4, dinh_dang=so_2),
+                Cot("Đã xuất (Xuất bổ)", 5, dinh_dang=so_2),
+                Cot(
+                    "Tổng LÍT",
+                    6,
+                    dinh_dang="{:.2f} L".format,
+                    mau=QColor(0, 100, 200),  # Màu xanh dương
+                    dam=True,
+                ),
             ]
         )
-        self.setup_table(self.tbl_home)
         layout.addWidget(self.tbl_home)
 
         # Summary labels
@@ -1781,214 +1992,57 @@ class MainWindow(QWidget):
 
         self.tab_home.setLayout(layout)
 
-        # Auto-load on init (with error handling)
-        try:
-            self.load_home_data()
-        except Exception as e:
-            print(f"⚠️ Tab Home init: Không thể tải dữ liệu ban đầu - {e}")
+        # Auto-load on init (chạy nền, lỗi báo qua tai_home)
+        self.load_home_data()
+        self.bo_lam_moi.dang_ky(
+            self.tab_home,
+            (HoaDonDaTao, HoaDonDaSua, TonKhoThayDoi),
+            lambda _: self.load_home_data(),
+        )
 
     def parse_don_vi_to_liters(self, don_vi_text):
-        """
-        Parse đơn vị thành số LÍT
+        """Số LÍT mỗi đơn vị (xem reports.so_lit_moi_don_vi)"""
+        return so_lit_moi_don_vi(don_vi_text)
 
-        ⚠️ QUY TẮC ĐặC BIỆT:
-        - Nếu parse ra >= 50 lít → Coi như 1 đơn vị = 1 lít
-        - Nếu parse ra < 50 lít → Giữ nguyên giá trị
-
-        Ví dụ:
-        - "209 lít" → Parse: 209 → Vì 209 >= 50 → Return: 1 lít/đơn vị
-        - "4 lít" → Parse: 4 → Vì 4 < 50 → Return: 4 lít/đơn vị
-        - "1 lít" → 1
-        - "lít" → 1
-        - "chai" / "lon" / khác → 1 (mặc định)
-
-        Returns:
-            float: Số lít per đơn vị
+    def load_home_data(self, tre=False):
         """
-        if not don_vi_text:
-            return 1.0
-
-        import re
-
-        text = str(don_vi_text).lower().strip()
-
-        # Pattern: "209 lít", "4 lít", etc
-        match = re.search(r"(\d+(?:\.\d+)?)\s*l[ií]t", text)
-        if match:
-            parsed_value = float(match.group(1))
-
-            # ⚠️ QUY TẮC ĐẶC BIỆT: Nếu >= 50 → Chỉ tính 1 lít/đơn vị
-            if parsed_value >= 50:
-                return 1.0
-            else:
-                return parsed_value
-
-        # Nếu chỉ có "lít" (không có số)
-        if "lít" in text or "lit" in text:
-            return 1.0
-
-        # Mặc định: 1 đơn vị = 1 lít
-        return 1.0
-
-    def load_home_data(self):
-        """Load dữ liệu tổng quan: Tồn kho + Đã xuất (XHD + Xuất bổ)"""
-        try:
-            from db import ket_noi
-
-            tu_ngay = self.home_tu_ngay.date().toString("yyyy-MM-dd")
-            den_ngay = self.home_den_ngay.date().toString("yyyy-MM-dd")
-
-            conn = ket_noi()
-            c = conn.cursor()
-
-            # Lấy tất cả sản phẩm
-            c.execute(
-                """
-                SELECT id, ten, don_vi, 
-                       COALESCE(gia_le, 0), 
-                       COALESCE(gia_buon, 0), 
-                       COALESCE(gia_vip, 0)
-                FROM SanPham
-                ORDER BY ten
-            """
-            )
-            products = c.fetchall()
-
-            data = []
-            tong_lit = 0.0
-
-            for product in products:
-                product_id = product[0]
-                ten = product[1]
-                don_vi = product[2]
-
-                # Parse đơn vị → số lít
-                liters_per_unit = self.parse_don_vi_to_liters(don_vi)
-
-                # 1. Tồn kho
-                c.execute(
-                    """
-                    SELECT COALESCE(SUM(so_luong), 0)
-                    FROM LogKho
-                    WHERE sanpham_id = ?
-                """,
-                    (product_id,),
-                )
-                ton_kho_result = c.fetchone()
-                ton_kho = ton_kho_result[0] if ton_kho_result else 0
-
-                # 2. Đã xuất HÓA ĐƠN (XHD = 1)
-                c.execute(
-                    """
-                    SELECT COALESCE(SUM(ct.so_luong), 0)
-                    FROM ChiTietHoaDon ct
-                    JOIN HoaDon h ON ct.hoadon_id = h.id
-                    JOIN SanPham s ON ct.sanpham_id = s.id
-                    WHERE s.id = ?
-                      AND ct.xuat_hoa_don = 1
-                      AND date(h.ngay) >= ?
-                      AND date(h.ngay) <= ?
-                """,
-                    (product_id, tu_ngay, den_ngay),
-                )
-                xhd_result = c.fetchone()
-                xhd_qty = xhd_result[0] if xhd_result else 0
-
-                # 3. Đã xuất BỔ (từ bảng ChenhLechXuatBo)
-                c.execute(
-                    """
-                    SELECT COALESCE(SUM(so_luong), 0)
-                    FROM ChenhLechXuatBo
-                    WHERE ten_sanpham = ?
-                      AND date(ngay) >= ?
-                      AND date(ngay) <= ?
-                """,
-                    (ten, tu_ngay, den_ngay),
-                )
-                xuat_bo_result = c.fetchone()
-                xuat_bo_qty = xuat_bo_result[0] if xuat_bo_result else 0
-
-                # Tính tổng LÍT
-                total_qty = float(xhd_qty) + float(xuat_bo_qty)
-                total_liters = total_qty * liters_per_unit
-
-                # Chỉ hiển thị sản phẩm có xuất
-                if total_qty > 0:
-                    data.append(
-                        {
-                            "ten": ten,
-                            "don_vi": don_vi,
-                            "ton_kho": ton_kho,
-                            "xhd": xhd_qty,
-                            "xuat_bo": xuat_bo_qty,
-                            "liters": total_liters,
-                        }
-                    )
-                    tong_lit += total_liters
-
-            conn.close()
-
-            # Hiển thị lên bảng
-            self.tbl_home.setRowCount(len(data))
-
-            for row, item in enumerate(data):
-                # Tên sản phẩm
-                self.tbl_home.setItem(row, 0, QTableWidgetItem(item["ten"]))
-
-                # Đơn vị
-                self.tbl_home.setItem(row, 1, QTableWidgetItem(item["don_vi"]))
-
-                # Tồn kho
-                self.tbl_home.setItem(
-                    row, 2, QTableWidgetItem(f"{item['ton_kho']:.2f}")
-                )
+        Load dữ liệu tổng quan: Tồn kho + Đã xuất (XHD + Xuất bổ) ở luồng nền.
 
-                # Đã xuất XHD
-                self.tbl_home.setItem(row, 3, QTableWidgetItem(f"{item['xhd']:.2f}"))
-
-                # Đã xuất Xuất bổ
-                self.tbl_home.setItem(
-                    row, 4, QTableWidgetItem(f"{item['xuat_bo']:.2f}")
-                )
-
-                # Tổng LÍT
-                lit_item = QTableWidgetItem(f"{item['liters']:.2f} L")
-                lit_item.setForeground(QColor(0, 100, 200))  # Màu xanh dương
-                from PyQt5.QtGui import QFont
-
-                font = QFont()
-                font.setBold(True)
-                lit_item.setFont(font)
-                self.tbl_home.setItem(row, 5, lit_item)
-
-            # Update summary
-            self.lbl_home_tong_sp.setText(f"Tổng sản phẩm: {len(data)}")
-            self.lbl_home_tong_lit.setText(
-                f"<b>Tổng LÍT đã xuất: {tong_lit:,.2f} L</b>"
-            )
-
-            # Resize columns
-            self.tbl_home.resizeColumnsToContents()
+        Args:
+            tre: True khi gọi từ thay đổi bộ lọc (gom các lần đổi liên tiếp)
+        """
+        tu_ngay = self.home_tu_ngay.date().toString("yyyy-MM-dd")
+        den_ngay = self.home_den_ngay.date().toString("yyyy-MM-dd")
+        if tre:
+            self.tai_home.tai_tre(tu_ngay, den_ngay)
+        else:
+            self.tai_home.tai(tu_ngay, den_ngay)
 
-        except Exception as e:
-            from utils.ui_helpers import show_error
+    def _hien_thi_trang_chu(self, ket_qua):
+        data, tong_lit = ket_qua
 
-            show_error(self, "Lỗi", f"Lỗi tải dữ liệu Home: {e}")
-            import traceback
+        # Hiển thị lên bảng
+        self.tbl_home.dat_du_lieu(data)
 
-            traceback.print_exc()
+        # Update summary
+        self.lbl_home_tong_sp.setText(f"Tổng sản phẩm: {len(data)}")
+        self.lbl_home_tong_lit.setText(f"<b>Tổng LÍT đã xuất: {tong_lit:,.2f} L</b>")
 
     def init_tab_sanpham(self):
         layout = QVBoxLayout()
-        self.tbl_sanpham = QTableWidget()
-        self.tbl_sanpham.setColumnCount(7)
-        self.tbl_sanpham.setHorizontalHeaderLabels(
-            ["ID", "Tên", "Giá lẻ", "Giá buôn", "Giá VIP", "Tồn kho", "Ngưỡng buôn"]
+        # Double click để sửa giá lẻ, giá buôn, giá VIP, tồn kho
+        self.tbl_sanpham = BangDuLieu(
+            [
+                Cot("ID", 0),
+                Cot("Tên", 1),
+                Cot("Giá lẻ", 2, dinh_dang=format_price, sua=True),
+                Cot("Giá buôn", 3, dinh_dang=format_price, sua=True),
+                Cot("Giá VIP", 4, dinh_dang=format_price, sua=True),
+                Cot("Tồn kho", 5, sua=True),
+                Cot("Ngưỡng buôn", 6),
+            ]
         )
-        self.setup_table(self.tbl_sanpham)
-
-        self.tbl_sanpham.setEditTriggers(QTableWidget.DoubleClicked)
-        self.tbl_sanpham.itemChanged.connect(self.update_product_price)
+        self.tbl_sanpham.da_sua.connect(self.update_product_price)
         layout.addWidget(self.tbl_sanpham)
 
         btn_layout = QHBoxLayout()
@@ -2009,6 +2063,13 @@ class MainWindow(QWidget):
 
         self.load_sanpham()
         self.tab_sanpham.setLayout(layout)
+        self.bo_lam_moi.dang_ky(
+            self.tab_sanpham,
+            (SanPhamThayDoi, TonKhoThayDoi),
+            lambda cac_su_kien: self.lam_moi_dong_sanpham(
+                hop_ids(cac_su_kien, "sanpham_ids")
+            ),
+        )
 
     def init_tab_lich_su_gia(self):
         """Tab để xem lịch sử thay đổi giá - hiển thị theo ngày với 3 loại giá"""
@@ -2025,7 +2086,7 @@ class MainWindow(QWidget):
         )
         layout.addWidget(info_label)
 
-        # Bộ lọc - chỉ còn lọc theo ngày
+        # Bộ lọc: ngày, tên sản phẩm, loại giá (lọc trong SQL)
         filter_layout = QHBoxLayout()
         filter_layout.addWidget(QLabel("Từ ngày:"))
         self.lich_su_gia_tu = QDateEdit()
@@ -2039,175 +2100,87 @@ class MainWindow(QWidget):
         self.lich_su_gia_den.setDate(QDate.currentDate())
         filter_layout.addWidget(self.lich_su_gia_den)
 
+        self.lich_su_gia_tim = QLineEdit()
+        self.lich_su_gia_tim.setPlaceholderText("🔍 Tên sản phẩm...")
+        self.lich_su_gia_tim.setClearButtonEnabled(True)
+        filter_layout.addWidget(self.lich_su_gia_tim)
+
+        self.lich_su_gia_loai = QComboBox()
+        self.lich_su_gia_loai.addItem("Tất cả loại giá", None)
+        self.lich_su_gia_loai.addItem("Lẻ", "le")
+        self.lich_su_gia_loai.addItem("Buôn", "buon")
+        self.lich_su_gia_loai.addItem("VIP", "vip")
+        filter_layout.addWidget(self.lich_su_gia_loai)
+
         btn_load_lich_su = QPushButton("Tải dữ liệu")
         btn_load_lich_su.clicked.connect(self.load_lich_su_gia)
         filter_layout.addWidget(btn_load_lich_su)
+
+        # Gom các thay đổi bộ lọc liên tiếp (gõ tên, đổi ngày) thành một lần nạp
+        self.hen_gio_lich_su_gia = QTimer(self)
+        self.hen_gio_lich_su_gia.setSingleShot(True)
+        self.hen_gio_lich_su_gia.setInterval(300)
+        self.hen_gio_lich_su_gia.timeout.connect(self.load_lich_su_gia)
+        self.lich_su_gia_tu.dateChanged.connect(
+            lambda _: self.load_lich_su_gia(tre=True)
+        )
+        self.lich_su_gia_den.dateChanged.connect(
+            lambda _: self.load_lich_su_gia(tre=True)
+        )
+        self.lich_su_gia_tim.textChanged.connect(
+            lambda _: self.load_lich_su_gia(tre=True)
+        )
+        self.lich_su_gia_loai.currentIndexChanged.connect(
+            lambda _: self.load_lich_su_gia()
+        )
         filter_layout.addStretch()
         layout.addLayout(filter_layout)
 
-        # TreeWidget cho lịch sử (dòng cha: ngày, dòng con: sản phẩm)
-        from PyQt5.QtWidgets import QTreeWidget
+        # Cây lịch sử (dòng cha: sản phẩm + lần đổi gần nhất, dòng con: từng lần
+        # đổi giá); sản phẩm đọc theo trang, lần đổi giá đọc khi mở rộng dòng
+        from PyQt5.QtWidgets import QTreeView
 
-        self.tree_lich_su_gia = QTreeWidget()
-        self.tree_lich_su_gia.setHeaderLabels(
-            [
-                "Ngày/Sản phẩm",
-                "Lẻ cũ",
-                "Lẻ mới",
-                "Buôn cũ",
-                "Buôn mới",
-                "VIP cũ",
-                "VIP mới",
-                "User",
-            ]
+        self.model_lich_su_gia = LichSuGiaModel(dinh_dang_gia=format_price, parent=self)
+        self.model_lich_su_gia.da_nap.connect(
+            lambda da_nap, tong: self.lbl_tong_lich_su.setText(
+                f"Tổng số sản phẩm: {tong} (đã hiện {da_nap})"
+            )
         )
+        self.model_lich_su_gia.loi.connect(
+            lambda loi: show_error(self, "Lỗi", f"Không thể tải lịch sử giá: {loi}")
+        )
+        self.tree_lich_su_gia = QTreeView()
+        self.tree_lich_su_gia.setModel(self.model_lich_su_gia)
         self.tree_lich_su_gia.setAlternatingRowColors(True)
+        self.tree_lich_su_gia.setUniformRowHeights(True)
+        self.tree_lich_su_gia.header().setSectionResizeMode(QHeaderView.Interactive)
+        self.tree_lich_su_gia.setColumnWidth(0, 260)
         layout.addWidget(self.tree_lich_su_gia)
 
-        # Label tổng số thay đổi
+        # Label tổng số sản phẩm
         self.lbl_tong_lich_su = QLabel("Tổng số sản phẩm: 0")
         layout.addWidget(self.lbl_tong_lich_su)
 
         self.tab_lich_su_gia.setLayout(layout)
         self.load_lich_su_gia()
+        self.bo_lam_moi.dang_ky(
+            self.tab_lich_su_gia, (SanPhamThayDoi,), lambda _: self.load_lich_su_gia()
+        )
 
-    def load_lich_su_gia(self):
-        """Load dữ liệu lịch sử thay đổi giá - hiển thị TẤT CẢ sản phẩm"""
-        from PyQt5.QtWidgets import QTreeWidgetItem
-        from collections import defaultdict
-
-        try:
-            conn = ket_noi()
-            c = conn.cursor()
-
-            tu_ngay = self.lich_su_gia_tu.date().toString("yyyy-MM-dd")
-            den_ngay = self.lich_su_gia_den.date().toString("yyyy-MM-dd")
-
-            # 1. Lấy TẤT CẢ sản phẩm hiện có
-            c.execute(
-                "SELECT id, ten, gia_le, gia_buon, gia_vip FROM SanPham ORDER BY ten"
-            )
-            all_products = c.fetchall()
-
-            # 2. Lấy lịch sử thay đổi giá trong khoảng thời gian
-            sql = """
-                SELECT 
-                    date(ls.ngay_thay_doi) as ngay,
-                    ls.ten_sanpham, 
-                    ls.loai_gia,
-                    ls.gia_cu, 
-                    ls.gia_moi,
-                    u.username
-                FROM LichSuGia ls
-                LEFT JOIN Users u ON ls.user_id = u.id
-                WHERE date(ls.ngay_thay_doi) >= ? AND date(ls.ngay_thay_doi) <= ?
-                ORDER BY ls.ngay_thay_doi DESC, ls.ten_sanpham
-            """
-            c.execute(sql, [tu_ngay, den_ngay])
-            history_rows = c.fetchall()
-
-            self.tree_lich_su_gia.clear()
-
-            # 3. Nhóm lịch sử theo (ngày, sản phẩm, loại giá)
-            history_groups = defaultdict(lambda: defaultdict(dict))
-            for ngay, ten_sp, loai_gia, gia_cu, gia_moi, username in history_rows:
-                history_groups[ngay][ten_sp][loai_gia] = {
-                    "gia_cu": gia_cu,
-                    "gia_moi": gia_moi,
-                    "username": username,
-                }
-
-            # 4. Tạo dict để tra cứu giá hiện tại
-            current_prices = {}
-            for sp_id, ten, gia_le, gia_buon, gia_vip in all_products:
-                current_prices[ten] = {"le": gia_le, "buon": gia_buon, "vip": gia_vip}
-
-            tong_san_pham = len(all_products)
-
-            if history_groups:
-                # Có lịch sử thay đổi - hiển thị theo ngày
-                for ngay in sorted(history_groups.keys(), reverse=True):
-                    # Tạo dòng cha cho ngày
-                    parent = QTreeWidgetItem(self.tree_lich_su_gia)
-                    parent.setText(0, ngay)
-                    font = parent.font(0)
-                    font.setBold(True)
-                    parent.setFont(0, font)
-
-                    # Tạo dòng con cho từng sản phẩm trong ngày này
-                    for ten_sp in sorted(history_groups[ngay].keys()):
-                        data = history_groups[ngay][ten_sp]
-
-                        child = QTreeWidgetItem(parent)
-                        child.setText(0, ten_sp)
-
-                        # Lẻ
-                        if "le" in data:
-                            child.setText(1, format_price(data["le"]["gia_cu"]))
-                            child.setText(2, format_price(data["le"]["gia_moi"]))
-                        elif ten_sp in current_prices:
-                            # Chưa thay đổi giá lẻ → hiển thị giá hiện tại
-                            gia = current_prices[ten_sp]["le"]
-                            child.setText(1, format_price(gia))
-                            child.setText(2, format_price(gia))
-
-                        # Buôn
-                        if "buon" in data:
-                            child.setText(3, format_price(data["buon"]["gia_cu"]))
-                            child.setText(4, format_price(data["buon"]["gia_moi"]))
-                        elif ten_sp in current_prices:
-                            gia = current_prices[ten_sp]["buon"]
-                            child.setText(3, format_price(gia))
-                            child.setText(4, format_price(gia))
-
-                        # VIP
-                        if "vip" in data:
-                            child.setText(5, format_price(data["vip"]["gia_cu"]))
-                            child.setText(6, format_price(data["vip"]["gia_moi"]))
-                        elif ten_sp in current_prices:
-                            gia = current_prices[ten_sp]["vip"]
-                            child.setText(5, format_price(gia))
-                            child.setText(6, format_price(gia))
-
-                        # User
-                        username = ""
-                        for loai in ["le", "buon", "vip"]:
-                            if loai in data:
-                                username = data[loai]["username"] or ""
-                                break
-                        child.setText(7, username)
-
-                    parent.setExpanded(True)
-            else:
-                # Không có lịch sử → hiển thị TẤT CẢ sản phẩm với giá hiện tại
-                parent = QTreeWidgetItem(self.tree_lich_su_gia)
-                parent.setText(0, "Giá hiện tại (chưa có thay đổi)")
-                font = parent.font(0)
-                font.setBold(True)
-                parent.setFont(0, font)
-
-                for sp_id, ten, gia_le, gia_buon, gia_vip in all_products:
-                    child = QTreeWidgetItem(parent)
-                    child.setText(0, ten)
-                    # Giá cũ = Giá mới (chưa thay đổi)
-                    child.setText(1, format_price(gia_le))
-                    child.setText(2, format_price(gia_le))
-                    child.setText(3, format_price(gia_buon))
-                    child.setText(4, format_price(gia_buon))
-                    child.setText(5, format_price(gia_vip))
-                    child.setText(6, format_price(gia_vip))
-                    child.setText(7, "")
-
-                parent.setExpanded(True)
-
-            self.lbl_tong_lich_su.setText(f"Tổng số sản phẩm: {tong_san_pham}")
-
-            for i in range(8):
-                self.tree_lich_su_gia.resizeColumnToContents(i)
-
-            conn.close()
-        except Exception as e:
-            show_error(self, "Lỗi", f"Không thể tải lịch sử giá: {e}")
+    def load_lich_su_gia(self, tre=False):
+        """Nạp lại lịch sử giá theo bộ lọc (model chỉ đọc trang đầu, phần còn lại đọc khi cần)"""
+        if not self.tab_da_tao("tab_lich_su_gia"):
+            return
+        if tre:
+            self.hen_gio_lich_su_gia.start()
+            return
+        self.hen_gio_lich_su_gia.stop()
+        self.model_lich_su_gia.dat_bo_loc(
+            self.lich_su_gia_tu.date().toString("yyyy-MM-dd"),
+            self.lich_su_gia_den.date().toString("yyyy-MM-dd"),
+            tu_khoa=self.lich_su_gia_tim.text(),
+            loai_gia=self.lich_su_gia_loai.currentData(),
+        )
 
     def init_tab_chenhlech(self):
         layout = QVBoxLayout()
@@ -2227,15 +2200,33 @@ class MainWindow(QWidget):
         btn_load = QPushButton("Tải dữ liệu")
         btn_load.clicked.connect(self.load_chenhlech)
         fl.addWidget(btn_load)
+        self.chi_bao_chenhlech = tao_chi_bao_tai()
+        fl.addWidget(self.chi_bao_chenhlech)
+        self.tai_chenhlech = BoTaiNen(
+            self._doc_chenhlech,
+            self._hien_thi_chenhlech,
+            lambda loi: show_error(self, "Lỗi", f"Lỗi tải chênh lệch: {loi}"),
+            chi_bao=self.chi_bao_chenhlech,
+            parent=self,
+        )
+        self.chenh_tu.dateChanged.connect(lambda _: self.load_chenhlech(tre=True))
+        self.chenh_den.dateChanged.connect(lambda _: self.load_chenhlech(tre=True))
         fl.addStretch()
         layout.addLayout(fl)
 
-        self.tbl_chenhlech = QTableWidget()
-        self.tbl_chenhlech.setColumnCount(7)
-        self.tbl_chenhlech.setHorizontalHeaderLabels(
-            ["Ngày", "Sản phẩm", "Chênh", "Tồn trước", "Tồn sau", "Ghi chú", "Xử lý"]
+        self.tbl_chenhlech = BangDuLieu(
+            [
+                Cot("Ngày", 0),
+                Cot("Sản phẩm", 1),
+                Cot("Chênh", 2),
+                Cot("Tồn trước", 3),
+                Cot("Tồn sau", 4),
+                Cot("Ghi chú", 5),
+                Cot("Giá lẻ lúc ghi", 6, dinh_dang=format_price),
+                Cot("Giá trị", 7, dinh_dang=format_price),
+                Cot("Xử lý", 0, kieu=KIEU_CHON),
+            ]
         )
-        self.setup_table(self.tbl_chenhlech)
         layout.addWidget(self.tbl_chenhlech)
 
         # Thêm nút xử lý chênh lệch (góc phải)
@@ -2248,37 +2239,43 @@ class MainWindow(QWidget):
 
         self.tab_chenhlech.setLayout(layout)
         self.load_chenhlech()
+        self.bo_lam_moi.dang_ky(
+            self.tab_chenhlech, (TonKhoThayDoi,), lambda _: self.load_chenhlech()
+        )
+
+    def load_chenhlech(self, tre=False):
+        """Nạp chênh lệch ở luồng nền (tre=True: gom các lần đổi bộ lọc)."""
+        if not self.tab_da_tao("tab_chenhlech"):
+            return
+        tu = self.chenh_tu.date().toString("yyyy-MM-dd")
+        den = self.chenh_den.date().toString("yyyy-MM-dd")
+        if tre:
+            self.tai_chenhlech.tai_tre(tu, den)
+        else:
+            self.tai_chenhlech.tai(tu, den)
 
-    def load_chenhlech(self):
+    def _doc_chenhlech(self, tu, den):
+        conn = ket_noi()
         try:
-            conn = ket_noi()
             c = conn.cursor()
-            tu = self.chenh_tu.date().toString("yyyy-MM-dd")
-            den = self.chenh_den.date().toString("yyyy-MM-dd")
-            sql = "SELECT cl.ngay, s.ten, cl.chenh, cl.ton_truoc, cl.ton_sau, cl.ghi_chu FROM ChenhLech cl JOIN SanPham s ON cl.sanpham_id = s.id WHERE date(cl.ngay) >= ? AND date(cl.ngay) <= ? ORDER BY cl.ngay DESC"
+            sql = "SELECT cl.ngay, s.ten, cl.chenh, cl.ton_truoc, cl.ton_sau, cl.ghi_chu, cl.sanpham_id FROM ChenhLech cl JOIN SanPham s ON cl.sanpham_id = s.id WHERE date(cl.ngay) >= ? AND date(cl.ngay) <= ? ORDER BY cl.ngay DESC"
             c.execute(sql, (tu, den))
             rows = c.fetchall()
-            self.tbl_chenhlech.setRowCount(len(rows))
-            for i, r in enumerate(rows):
-                for j, v in enumerate(r):
-                    self.tbl_chenhlech.setItem(i, j, QTableWidgetItem(str(v)))
-                # Thêm checkbox vào cột xử lý
-                chk_item = QTableWidgetItem()
-                chk_item.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
-                chk_item.setCheckState(Qt.Unchecked)
-                self.tbl_chenhlech.setItem(i, 6, chk_item)
-        except Exception as e:
-            show_error(self, "Lỗi", f"Lỗi tải chênh lệch: {e}")
         finally:
             conn.close()
+        # Định giá chênh lệch theo giá lẻ áp dụng tại thời điểm ghi nhận
+        gia_list = gia_tai_thoi_diem_nhieu((r[6], "le", r[0]) for r in rows)
+        return [
+            r[:6] + (gia, float(r[2] or 0) * (gia or 0))
+            for r, gia in zip(rows, gia_list)
+        ]
+
+    def _hien_thi_chenhlech(self, rows):
+        self.tbl_chenhlech.dat_du_lieu(rows)
 
     def xu_ly_chenh_lech_click(self):
         # Lấy các dòng được chọn (checkbox checked)
-        selected_rows = []
-        for row in range(self.tbl_chenhlech.rowCount()):
-            chk_item = self.tbl_chenhlech.item(row, 6)
-            if chk_item and chk_item.checkState() == Qt.Checked:
-                selected_rows.append(row)
+        selected_rows = self.tbl_chenhlech.dong_da_chon()
 
         if not selected_rows:
             show_error(
@@ -2351,9 +2348,8 @@ class MainWindow(QWidget):
             c = conn.cursor()
 
             for row in selected_rows:
-                ngay = self.tbl_chenhlech.item(row, 0).text()
-                ten_sp = self.tbl_chenhlech.item(row, 1).text()
-                chenh = float(self.tbl_chenhlech.item(row, 2).text())
+                ngay, ten_sp, chenh = self.tbl_chenhlech.dong(row)[:3]
+                chenh = float(chenh)
 
                 # Lấy thông tin sản phẩm
                 from products import tim_sanpham
@@ -2384,9 +2380,12 @@ class MainWindow(QWidget):
                     so_tien = float(so_tien_str)
 
                     # Trừ tiền từ accountant
-                    c.execute(
-                        "UPDATE Users SET so_du = so_du - ? WHERE id = ?",
-                        (so_tien, accountant_id),
+                    cap_nhat_so_du(
+                        c,
+                        accountant_id,
+                        -so_tien,
+                        LY_DO_CHENH_LECH,
+                        ghi_chu=f"Trả lại tiền - {ten_sp}",
                     )
                     # Ghi log vào GiaoDichQuy
                     from datetime import datetime
@@ -2417,6 +2416,8 @@ class MainWindow(QWidget):
 
             conn.commit()
             conn.close()
+            if xu_ly_type == 1:
+                event_bus.phat(SoDuThayDoi([user_combo.currentData()]))
 
             show_success(self, f"Đã xử lý {len(selected_rows)} dòng chênh lệch")
             # Reload bảng và xóa các dòng đã xử lý khỏi UI
@@ -2472,12 +2473,18 @@ class MainWindow(QWidget):
         delegate = CompleterDelegate(self)
         delegate.completer = self.tao_completer_sanpham()
         self.tbl_giohang.setItemDelegateForColumn(0, delegate)
-        # Kết nối signal itemChanged để xử lý thay đổi Tên và VIP
+        # Trạng thái giỏ hàng nằm trong GioHang; bảng chỉ hiển thị
+        self.gio_hang = GioHang(co_san=lambda ten: self.available_products.get(ten, 0))
+        self.gio_hang.nap_bang_gia(lay_bang_gia())
+        # Kết nối signal itemChanged để đưa thay đổi của ô vào giỏ hàng
         self.tbl_giohang.itemChanged.connect(self.update_giohang)
         layout.addWidget(self.tbl_giohang)
 
         # Nút thêm dòng và Lưu - xếp ngang góc phải
         btn_layout = QHBoxLayout()
+        self.lbl_tong_giohang = QLabel()
+        btn_layout.addWidget(self.lbl_tong_giohang)
+        self._hien_thi_tong_giohang()
         btn_layout.addStretch()
         btn_them_dong = QPushButton("Thêm dòng")
         btn_them_dong.clicked.connect(self.them_dong_giohang)
@@ -2492,6 +2499,9 @@ class MainWindow(QWidget):
         btn_close_shift = QPushButton("Đóng ca (In tổng kết)")
         btn_close_shift.clicked.connect(self.dong_ca_in_pdf)
         btn_layout.addWidget(btn_close_shift)
+        btn_ca_cu = QPushButton("In lại ca cũ")
+        btn_ca_cu.clicked.connect(self.xem_lai_ca_cu)
+        btn_layout.addWidget(btn_ca_cu)
 
         layout.addLayout(btn_layout)
 
@@ -2501,15 +2511,19 @@ class MainWindow(QWidget):
             self.them_dong_giohang()
 
     def them_dong_giohang(self):
-        row = self.tbl_giohang.rowCount()
+        row = self.gio_hang.them_dong()
+        dong = self.gio_hang.dong(row)
+        self.tbl_giohang.blockSignals(True)
         self.tbl_giohang.insertRow(row)
         # Khởi tạo các ô
         self.tbl_giohang.setItem(row, 0, QTableWidgetItem(""))  # Tên
         # Số lượng: QDoubleSpinBox cho số thực
         sl_spin = QDoubleSpinBox()
         setup_quantity_spinbox(sl_spin, decimals=5, maximum=9999)
-        sl_spin.setValue(1.0)
-        sl_spin.valueChanged.connect(lambda: self.update_giohang_row(row))
+        sl_spin.setValue(dong.so_luong)
+        sl_spin.valueChanged.connect(
+            lambda v: self._sua_gio_hang(row, self.gio_hang.dat_so_luong, v)
+        )
         self.tbl_giohang.setCellWidget(row, 1, sl_spin)  # SL
         self.tbl_giohang.setItem(row, 2, QTableWidgetItem(format_price(0)))  # Đơn giá
         # Giảm giá: QDoubleSpinBox cho số thực
@@ -2518,9 +2532,13 @@ class MainWindow(QWidget):
         giam_spin.setMaximum(999999)
         giam_spin.setDecimals(2)
         giam_spin.setValue(0)
-        giam_spin.valueChanged.connect(lambda: self.update_giohang_row(row))
+        giam_spin.valueChanged.connect(
+            lambda v: self._sua_gio_hang(row, self.gio_hang.dat_giam, v)
+        )
         self.tbl_giohang.setCellWidget(row, 3, giam_spin)  # Giảm giá
-        self.tbl_giohang.setItem(row, 4, QTableWidgetItem(format_price(0)))  # Tổng tiền
+        self.tbl_giohang.setItem(
+            row, 4, QTableWidgetItem(format_price(dong.thanh_tien))
+        )  # Tổng tiền
         vip_item = QTableWidgetItem()
         vip_item.setCheckState(Qt.Unchecked)
         vip_item.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
@@ -2531,198 +2549,90 @@ class MainWindow(QWidget):
         self.tbl_giohang.setItem(row, 6, xhd_item)  # XHD
         self.tbl_giohang.setItem(row, 7, QTableWidgetItem(""))  # Ghi chú
 
-        # Cột 8: Người cho nợ - QComboBox với danh sách user
+        # Cột 8: Người cho nợ - dùng chung model user (trừ user hiện tại),
+        # mặc định "-- Không --"
         cho_no_combo = QComboBox()
-        cho_no_combo.addItem("-- Không --", None)  # Mặc định không cho nợ
-
-        # Lấy danh sách user (trừ user hiện tại)
-        from users import lay_tat_ca_user
-
         try:
-            users = lay_tat_ca_user()
-            for user in users:
-                if user[0] != self.user_id:  # Không hiển thị chính mình
-                    cho_no_combo.addItem(f"{user[1]}", user[0])  # username, user_id
+            cho_no_combo.setModel(lay_model_cho_no(loai_tru=self.user_id))
         except Exception as e:
             logger.error(f"Error loading users for debt combo: {e}")
+        self.gio_hang.dat_cho_no(row, cho_no_combo.currentData())
+        cho_no_combo.currentIndexChanged.connect(
+            lambda _: self.gio_hang.dat_cho_no(row, cho_no_combo.currentData())
+        )
 
         self.tbl_giohang.setCellWidget(row, 8, cho_no_combo)  # Người cho nợ
+        self.tbl_giohang.blockSignals(False)
 
         logger.debug(f"Added row {row} with default values")
 
-    def update_giohang_row(self, row):
-        logger.debug(f"Updating row {row}")
-        # Tạm disconnect signal để tránh vòng lặp
-        self.tbl_giohang.itemChanged.disconnect(self.update_giohang)
-
-        # Lấy dữ liệu dòng
-        ten_item = self.tbl_giohang.item(row, 0)
-        ten = ten_item.text().strip() if ten_item else ""
-        print(f"Ten: {ten}")  # Debug
-        sl_spin = self.tbl_giohang.cellWidget(row, 1)
-        sl = sl_spin.value() if sl_spin else 1.0
-        print(f"SL: {sl}")  # Debug
-        don_gia_item = self.tbl_giohang.item(row, 2)
-        don_gia = (
-            float(don_gia_item.text().replace(",", ""))
-            if don_gia_item and don_gia_item.text()
-            else 0
-        )
-        print(f"Don gia (before update): {don_gia}")  # Debug
-        giam_spin = self.tbl_giohang.cellWidget(row, 3)
-        giam_gia = giam_spin.value() if giam_spin else 0
-        print(f"Giam gia: {giam_gia}")  # Debug
-        vip_item = self.tbl_giohang.item(row, 5)
-        is_vip = vip_item.checkState() == Qt.Checked if vip_item else False
-        print(f"Is VIP: {is_vip}")  # Debug
-
-        # Cập nhật Đơn giá
-        if ten:
-            res = tim_sanpham(ten)
-            print(f"tim_sanpham({ten}) result: {res}")  # Debug
-            if res:
-                sp = res[
-                    0
-                ]  # [id, ten, gia_le, gia_buon, gia_vip, ton_kho, nguong_buon]
-                try:
-                    don_gia = chon_don_gia(sp, sl, is_vip)
-                    print(f"Selected don_gia: {don_gia}")  # Debug
-                    self.tbl_giohang.setItem(
-                        row, 2, QTableWidgetItem(format_price(don_gia))
-                    )
-                except (ValueError, TypeError):
-                    print(f"Invalid price data for product '{ten}'")  # Debug
-                    # Reconnect signal trước khi return
-                    self.tbl_giohang.itemChanged.connect(self.update_giohang)
-                    return  # Không làm gì nếu dữ liệu giá không hợp lệ
-            else:
-                # Product not found in DB
-                print(f"Sản phẩm '{ten}' không tồn tại")  # Debug
-                show_error(self, "Lỗi", f"Sản phẩm '{ten}' không tồn tại")
-                self.tbl_giohang.setItem(row, 2, QTableWidgetItem(format_price(0)))
-                don_gia = 0
-                # Clear name to avoid creating invalid invoice
-                self.tbl_giohang.setItem(row, 0, QTableWidgetItem(""))
-                self.tbl_giohang.itemChanged.connect(self.update_giohang)
-                return
-
-        # Check availability: product must have been received
-        if ten:
-            avail_qty = self.available_products.get(ten, 0)
-            if avail_qty <= 0:
-                show_error(
-                    self,
-                    "Lỗi",
-                    f"Sản phẩm '{ten}' chưa được nhận hàng nên không thể bán",
-                )
-                # reset name and price
-                self.tbl_giohang.setItem(row, 0, QTableWidgetItem(""))
-                self.tbl_giohang.setItem(row, 2, QTableWidgetItem(format_price(0)))
-                self.tbl_giohang.itemChanged.connect(self.update_giohang)
-                return
-
-        # Tính Tổng tiền
+    def _sua_gio_hang(self, row, ham, gia_tri):
+        """Đưa thay đổi của một ô vào giỏ hàng rồi vẽ lại đúng các ô đã đổi"""
         try:
-            tong_tien = sl * don_gia - giam_gia
-            print(f"Tong tien: {tong_tien}")  # Debug
-            self.tbl_giohang.setItem(row, 4, QTableWidgetItem(format_price(tong_tien)))
-        except (ValueError, TypeError):
-            print(f"Error calculating tong_tien for row {row}")  # Debug
+            doi = ham(row, gia_tri)
+        except ValueError as e:
+            show_error(self, "Lỗi", str(e))
+            # Dòng đã được đưa về rỗng trong giỏ hàng
+            doi = {COT_TEN, COT_DON_GIA, COT_THANH_TIEN}
+        self._ve_dong_giohang(row, doi)
+
+    def _ve_dong_giohang(self, row, doi):
+        """Vẽ lại các ô trong doi (COT_TEN/COT_DON_GIA/COT_THANH_TIEN) của một dòng"""
+        if not doi:
+            return
+        dong = self.gio_hang.dong(row)
+        self.tbl_giohang.blockSignals(True)
+        try:
+            if COT_TEN in doi:
+                self.tbl_giohang.item(row, 0).setText(dong.ten)
+            if COT_DON_GIA in doi:
+                self.tbl_giohang.item(row, 2).setText(format_price(dong.don_gia))
+            if COT_THANH_TIEN in doi:
+                self.tbl_giohang.item(row, 4).setText(format_price(dong.thanh_tien))
+        finally:
+            self.tbl_giohang.blockSignals(False)
+        if COT_THANH_TIEN in doi:
+            self._hien_thi_tong_giohang()
 
-            # Reconnect signal
-        self.tbl_giohang.itemChanged.connect(self.update_giohang)
+    def _hien_thi_tong_giohang(self):
+        self.lbl_tong_giohang.setText(
+            f"<b>Tổng giỏ hàng: {format_price(self.gio_hang.tong)}</b>"
+        )
+
+    def _nap_bang_gia_giohang(self):
+        """Nạp lại bảng giá của giỏ hàng sau khi sản phẩm/giá thay đổi"""
+        if hasattr(self, "gio_hang"):
+            self.gio_hang.nap_bang_gia(lay_bang_gia())
 
     def update_giohang(self, item):
         row = item.row()
         col = item.column()
-        print(f"Item changed: row={row}, col={col}")  # Debug
-        if col in [0, 5]:  # Chỉ xử lý khi thay đổi Tên hoặc VIP
-            self.update_giohang_row(row)
-
-    def tao_hoa_don_click(self):
-        items = []
-        cho_no_items = []  # Danh sách các item có cho nợ
-
-        for row in range(self.tbl_giohang.rowCount()):
-            ten_item = self.tbl_giohang.item(row, 0)
-            sl_spin = self.tbl_giohang.cellWidget(row, 1)
-            don_gia_item = self.tbl_giohang.item(row, 2)
-            giam_spin = self.tbl_giohang.cellWidget(row, 3)
-            vip_item = self.tbl_giohang.item(row, 5)
-            xhd_item = self.tbl_giohang.item(row, 6)
-            ghi_chu_item = self.tbl_giohang.item(row, 7)
-            cho_no_combo = self.tbl_giohang.cellWidget(row, 8)
-
-            # Bỏ qua dòng rỗng (nếu Tên rỗng)
-            if not (ten_item and ten_item.text()):
-                continue
-
-            if not (sl_spin and don_gia_item):
-                show_error(self, "Lỗi", f"Dòng {row+1} thiếu dữ liệu")
-                return
-
-            ten = ten_item.text().strip()
-            res = tim_sanpham(ten)
-            if not res:
-                show_error(self, "Lỗi", f"Sản phẩm '{ten}' không tồn tại")
-                return
-            sanpham_id = res[0][0]
-            so_luong = sl_spin.value() if sl_spin else 0
+        if col == 0:  # Tên
+            self._sua_gio_hang(row, self.gio_hang.dat_ten, item.text())
+        elif col == 2:  # Đơn giá nhập tay
             try:
-                gia = float(don_gia_item.text().replace(",", ""))
+                don_gia = float(item.text().replace(",", ""))
             except (ValueError, TypeError):
                 show_error(self, "Lỗi", f"Giá không hợp lệ ở dòng {row+1}")
+                self._ve_dong_giohang(row, {COT_DON_GIA})
                 return
-            giam = giam_spin.value() if giam_spin else 0
-            loai_gia = xac_dinh_loai_gia(
-                so_luong,
-                res[0][6] if len(res[0]) > 6 else 0,
-                vip_item.checkState() == Qt.Checked,
+            self._sua_gio_hang(row, self.gio_hang.dat_don_gia, don_gia)
+        elif col == 5:  # VIP
+            self._sua_gio_hang(
+                row, self.gio_hang.dat_vip, item.checkState() == Qt.Checked
             )
-            xhd = xhd_item.checkState() == Qt.Checked
-            ghi_chu = ghi_chu_item.text().strip() if ghi_chu_item else ""
-
-            # Kiểm tra người cho nợ
-            cho_no_user_id = cho_no_combo.currentData() if cho_no_combo else None
-
-            # Nếu có chọn người cho nợ
-            if cho_no_user_id is not None:
-                # Bắt buộc phải có ghi chú
-                if not ghi_chu:
-                    show_error(
-                        self,
-                        "Lỗi",
-                        f"Dòng {row+1}: Phải nhập ghi chú khi cho nợ\n"
-                        f"Ví dụ: 'A Bình nợ' hoặc 'Khách hàng X mua chịu'",
-                    )
-                    return
-
-                # Tính tổng tiền của dòng này
-                tong_tien = so_luong * gia - giam
-
-                # Lưu thông tin cho nợ
-                cho_no_items.append(
-                    {
-                        "user_id": cho_no_user_id,
-                        "so_tien": tong_tien,
-                        "ghi_chu": ghi_chu,
-                        "ten_sanpham": ten,
-                        "so_luong": so_luong,
-                        "gia": gia,
-                    }
-                )
+        elif col == 6:  # XHD
+            self.gio_hang.dat_xhd(row, item.checkState() == Qt.Checked)
+        elif col == 7:  # Ghi chú
+            self.gio_hang.dat_ghi_chu(row, item.text())
 
-            items.append(
-                {
-                    "sanpham_id": sanpham_id,
-                    "so_luong": so_luong,
-                    "loai_gia": loai_gia,
-                    "gia": gia,
-                    "giam": giam,
-                    "xuat_hoa_don": xhd,
-                    "ghi_chu": ghi_chu,
-                }
-            )
+    def tao_hoa_don_click(self):
+        # Dữ liệu lấy thẳng từ giỏ hàng (không đọc lại widget, không tra DB)
+        try:
+            items, cho_no_items = self.gio_hang.tao_items()
+        except ValueError as e:
+            show_error(self, "Lỗi", str(e))
+            return
 
         if not items:
             show_error(self, "Lỗi", "Giỏ hàng rỗng")
@@ -2758,31 +2668,9 @@ class MainWindow(QWidget):
             return
 
         # Deduct sold quantities from available_products
-        for it in items:
-            try:
-                # find product name by id
-                from products import tim_sanpham_by_id
-
-                # fallback: try lookup by id via DB select
-                # We will attempt to get name from DB via tim_sanpham (which accepts name),
-                # so instead query all and match id.
-                conn = ket_noi()
-                c = conn.cursor()
-                c.execute("SELECT ten FROM SanPham WHERE id=?", (it["sanpham_id"],))
-                row = c.fetchone()
-                if row:
-                    name = row[0]
-                else:
-                    name = None
-            except Exception:
-                name = None
-
-            if name:
-                prev = self.available_products.get(name, 0)
-                new = prev - it["so_luong"]
-                if new < 0:
-                    new = 0
-                self.available_products[name] = new
+        for dong in self.gio_hang.cac_dong_co_hang():
+            prev = self.available_products.get(dong.ten, 0)
+            self.available_products[dong.ten] = max(prev - dong.so_luong, 0)
 
         # refresh completers after sale
         self.cap_nhat_completer_sanpham()
@@ -2868,38 +2756,8 @@ class MainWindow(QWidget):
 
                     traceback.print_exc()
 
-        # Tự động làm mới các tab liên quan (với error handling)
-        try:
-            self.load_chitietban()  # Tab chi tiết bán
-        except Exception as e:
-            print(f"⚠️ Không thể load chi tiết bán: {e}")
-
-        try:
-            self.load_hoadon()  # Tab hóa đơn
-        except Exception as e:
-            print(f"⚠️ Không thể load hóa đơn: {e}")
-
-        # Tab sổ quỹ chỉ có cho accountant
-        if hasattr(self, "load_so_quy"):
-            try:
-                self.load_so_quy()
-            except Exception as e:
-                print(f"⚠️ Không thể load sổ quỹ: {e}")
-
-        # Tab lịch sử giao dịch - refresh nếu tồn tại (để hiện giao dịch cho nợ)
-        if hasattr(self, "load_lich_su_quy"):
-            try:
-                self.load_lich_su_quy()
-                print("✅ Đã refresh lịch sử giao dịch")
-            except Exception as e:
-                print(f"⚠️ Không thể load lịch sử giao dịch: {e}")
-
-        # Tab Home - refresh nếu tồn tại
-        if hasattr(self, "load_home_data"):
-            try:
-                self.load_home_data()
-            except Exception as e:
-                print(f"⚠️ Không thể load Tab Home: {e}")
+        # Các tab liên quan (chi tiết bán, sổ quỹ, trang chủ...) tự làm mới theo
+        # sự kiện tao_hoa_don / chuyen_tien phát ra, chỉ các dòng bị ảnh hưởng
 
         # ✅ Reset thời gian về hiện tại sau khi lưu thành công
         self.datetime_hoadon.setDateTime(QDateTime.currentDateTime())
@@ -2911,9 +2769,15 @@ class MainWindow(QWidget):
             print(f"Warning: Could not parse invoice ID '{msg}': {e}")
             self.last_invoice_id = None
 
+        # Cộng hóa đơn vào tổng kết ca đang mở
+        ghi_nhan_hoa_don(self.ca_id, self.last_invoice_id)
+
+        self.gio_hang.xoa()
+        self._nap_bang_gia_giohang()
         self.tbl_giohang.setRowCount(0)
         for _ in range(15):
             self.them_dong_giohang()
+        self._hien_thi_tong_giohang()
 
     def init_tab_chitietban(self):
         layout = QVBoxLayout()
@@ -2935,25 +2799,48 @@ class MainWindow(QWidget):
         btn_load = QPushButton("Tải dữ liệu")
         btn_load.clicked.connect(self.load_chitietban)
         filter_layout.addWidget(btn_load)
+
+        self.chi_bao_chitietban = tao_chi_bao_tai()
+        filter_layout.addWidget(self.chi_bao_chitietban)
+        self.tai_chitietban = BoTaiNen(
+            self._doc_chitietban,
+            self._hien_thi_chitietban,
+            lambda loi: show_error(self, "Lỗi", f"Lỗi tải chi tiết bán: {loi}"),
+            chi_bao=self.chi_bao_chitietban,
+            parent=self,
+        )
+        self.chitiet_tu_ngay.dateChanged.connect(
+            lambda _: self.load_chitietban(tre=True)
+        )
+        self.chitiet_den_ngay.dateChanged.connect(
+            lambda _: self.load_chitietban(tre=True)
+        )
         filter_layout.addStretch()
 
         layout.addLayout(filter_layout)
 
-        self.tbl_chitietban = QTableWidget()
-        self.tbl_chitietban.setColumnCount(8)
-        self.tbl_chitietban.setHorizontalHeaderLabels(
+        # Dòng: (id, user_id, username, ngày, trạng thái, số dư)
+        self.tbl_chitietban = BangDuLieu(
             [
-                "ID",
-                "User ID",
-                "Username",
-                "Ngày",
-                "Trạng thái",
-                "Số dư (Nợ)",
-                "Chi tiết",
-                "Nộp tiền",
+                Cot("Username", 2),
+                Cot("Ngày", 3),
+                Cot("Số dư (Nợ)", 5, dinh_dang=format_price, can_le=Qt.AlignRight),
+                Cot("Chi tiết", 0, dinh_dang=lambda _: "Chi tiết", kieu=KIEU_LINK),
+                # Số dư > 0: nút "Nộp cho Accountant", = 0: chữ "Đã thanh toán"
+                Cot(
+                    "Nộp tiền",
+                    5,
+                    dinh_dang=lambda so_du: (
+                        "💰 Nộp cho Accountant" if so_du > 0 else "✅ Đã thanh toán"
+                    ),
+                    kieu=KIEU_NUT,
+                    mau=lambda dong: QColor("green") if dong[5] <= 0 else None,
+                    dam=True,
+                    kich_hoat=lambda dong: dong[5] > 0,
+                ),
             ]
         )
-        self.setup_table(self.tbl_chitietban)
+        self.tbl_chitietban.bam_o.connect(self._bam_o_chitietban)
         layout.addWidget(self.tbl_chitietban)
 
         # Nút hành động
@@ -2962,6 +2849,10 @@ class MainWindow(QWidget):
         btn_refresh.clicked.connect(self.load_chitietban)
         btn_layout.addWidget(btn_refresh)
 
+        btn_in_phieu_thu = QPushButton("🖨️ Phiếu thu (tất cả)")
+        btn_in_phieu_thu.clicked.connect(self.in_phieu_thu_tat_ca)
+        btn_layout.addWidget(btn_in_phieu_thu)
+
         # Chỉ admin mới có quyền sửa/xóa hóa đơn trong tab này
         if self.role == "admin":
             btn_sua_hd_chitiet = QPushButton("✏️ Sửa ca bán hàng")
@@ -2977,20 +2868,51 @@ class MainWindow(QWidget):
 
         self.tab_chitietban.setLayout(layout)
         self.load_chitietban()
+        self.bo_lam_moi.dang_ky(
+            self.tab_chitietban,
+            (HoaDonDaTao, HoaDonDaSua),
+            lambda cac_su_kien: self.lam_moi_dong_chitietban(
+                hop_ids(cac_su_kien, "hoadon_ids")
+            ),
+        )
 
-    def load_chitietban(self):
-        # Lấy điều kiện lọc ngày nếu có
-        tu_ngay = None
-        den_ngay = None
+    def _khoang_ngay_chitietban(self):
+        """(tu_ngay, den_ngay) của bộ lọc tab Chi tiết bán, None nếu không đọc được."""
         try:
-            if hasattr(self, "chitiet_tu_ngay") and hasattr(self, "chitiet_den_ngay"):
-                tu_ngay = self.chitiet_tu_ngay.date().toPyDate()
-                den_ngay = self.chitiet_den_ngay.date().toPyDate()
+            return (
+                self.chitiet_tu_ngay.date().toPyDate(),
+                self.chitiet_den_ngay.date().toPyDate(),
+            )
         except Exception:
-            tu_ngay = None
-            den_ngay = None
+            return None, None
+
+    def load_chitietban(self, tre=False):
+        """Nạp danh sách ca bán hàng chưa xuất ở luồng nền (tre=True: gom các lần đổi bộ lọc)."""
+        if not self.tab_da_tao("tab_chitietban"):
+            return
+        tu_ngay, den_ngay = self._khoang_ngay_chitietban()
+        if tre:
+            self.tai_chitietban.tai_tre(tu_ngay, den_ngay)
+        else:
+            self.tai_chitietban.tai(tu_ngay, den_ngay)
+
+    def lam_moi_dong_chitietban(self, hoadon_ids):
+        """Đọc lại các hóa đơn vừa đổi (None = nạp lại cả bảng)."""
+        if not self.tab_da_tao("tab_chitietban"):
+            return
+        if hoadon_ids is None or self.tai_chitietban.dang_cho():
+            # Lần nạp toàn bộ đang chạy có thể đã đọc dữ liệu cũ
+            self.load_chitietban()
+            return
+        if hoadon_ids:
+            tu_ngay, den_ngay = self._khoang_ngay_chitietban()
+            self.tbl_chitietban.cap_nhat_theo_khoa(
+                hoadon_ids, self._doc_chitietban(tu_ngay, den_ngay, hoadon_ids)
+            )
 
-        hoadons = lay_danh_sach_hoadon("Chua_xuat")
+    def _doc_chitietban(self, tu_ngay, den_ngay, hoadon_ids=None):
+        """Đọc hóa đơn chưa xuất trong khoảng ngày kèm số dư (chạy ở luồng nền)."""
+        hoadons = lay_danh_sach_hoadon("Chua_xuat", hoadon_ids)
 
         # Nếu lọc theo ngày, giữ lại những hóa đơn trong khoảng
         if tu_ngay or den_ngay:
@@ -3017,72 +2939,23 @@ class MainWindow(QWidget):
                 filtered.append(hd)
             hoadons = filtered
 
-        self.tbl_chitietban.setRowCount(len(hoadons))
-        for row_idx, hd in enumerate(hoadons):
-            self.tbl_chitietban.setItem(row_idx, 0, QTableWidgetItem(str(hd[0])))  # ID
-            self.tbl_chitietban.setItem(
-                row_idx, 1, QTableWidgetItem(str(hd[1]))
-            )  # User ID
-            self.tbl_chitietban.setItem(row_idx, 2, QTableWidgetItem(hd[2]))  # Username
-            self.tbl_chitietban.setItem(row_idx, 3, QTableWidgetItem(hd[4]))  # Ngày
-            self.tbl_chitietban.setItem(
-                row_idx, 4, QTableWidgetItem(hd[5])
-            )  # Trạng thái
-
-            # Tính số dư = tổng tiền các sản phẩm CHƯA xuất hóa đơn (xuat_hoa_don=0)
-            hoadon_id = hd[0]
-            chi_tiet = lay_chi_tiet_hoadon(hoadon_id)
-            unpaid_total = tinh_unpaid_total(chi_tiet)
-
-            # Lấy tổng đã nộp cho hóa đơn này (nếu GiaoDichQuy có trường hoadon_id)
-            try:
-                from users import lay_tong_nop_theo_hoadon
-
-                paid = lay_tong_nop_theo_hoadon(hoadon_id)
-            except Exception:
-                paid = 0
-
-            so_du = unpaid_total - (paid or 0)
-            if so_du < 0:
-                so_du = 0
+        # Số dư = tổng tiền các sản phẩm CHƯA xuất hóa đơn - tổng đã nộp (một truy vấn)
+        so_du = lay_so_du_theo_hoadon("Chua_xuat", hoadon_ids)
+        return [
+            (hd[0], hd[1], hd[2], hd[4], hd[5], so_du.get(hd[0], 0)) for hd in hoadons
+        ]
 
-            self.tbl_chitietban.setItem(
-                row_idx, 5, QTableWidgetItem(format_price(so_du))
-            )  # Số dư
+    def _hien_thi_chitietban(self, rows):
+        self.tbl_chitietban.dat_du_lieu(rows)
 
-            # Thay nút "Chi tiết" bằng text link màu xanh
-            link_detail = QLabel(
-                f'<a href="#" style="color: #0A6CBF; text-decoration: none; font-weight: bold;">Chi tiết</a>'
-            )
-            link_detail.setAlignment(Qt.AlignCenter)
-            link_detail.setOpenExternalLinks(False)
-            link_detail.linkActivated.connect(lambda _, r=row_idx: self.xem_chi_tiet(r))
-            link_detail.setCursor(Qt.PointingHandCursor)
-            self.tbl_chitietban.setCellWidget(row_idx, 6, link_detail)
-
-            # Nút "Nộp tiền cho Accountant" - tất cả user đều thấy
-            # Nếu số dư > 0 thì hiện nút, nếu = 0 thì hiện "Đã thanh toán"
-            if so_du > 0:
-                btn_nop = QPushButton("💰 Nộp cho Accountant")
-                btn_nop.setStyleSheet(
-                    "background-color: #4CAF50; color: white; font-weight: bold;"
-                )
-                btn_nop.clicked.connect(lambda checked, r=row_idx: self.nop_tien(r))
-                self.tbl_chitietban.setCellWidget(row_idx, 7, btn_nop)
-            else:
-                lbl_done = QLabel("✅ Đã thanh toán")
-                lbl_done.setAlignment(Qt.AlignCenter)
-                lbl_done.setStyleSheet("color: green; font-weight: bold;")
-                self.tbl_chitietban.setCellWidget(row_idx, 7, lbl_done)
-        # Ẩn cột không cần hiển thị
-        self.tbl_chitietban.setColumnHidden(0, True)  # ID
-        self.tbl_chitietban.setColumnHidden(1, True)  # User ID
-        self.tbl_chitietban.setColumnHidden(4, True)  # Trạng thái
+    def _bam_o_chitietban(self, row, cot):
+        if cot == 3:
+            self.xem_chi_tiet(row)
+        elif cot == 4:
+            self.nop_tien(row)
 
     def xem_chi_tiet(self, row):
-        hoadon_id = int(self.tbl_chitietban.item(row, 0).text())
-        username = self.tbl_chitietban.item(row, 2).text()
-        ngay = self.tbl_chitietban.item(row, 3).text()
+        hoadon_id, _, username, ngay = self.tbl_chitietban.dong(row)[:4]
         data = lay_chi_tiet_hoadon(hoadon_id)
 
         dialog = QDialog(self)
@@ -3210,21 +3083,13 @@ class MainWindow(QWidget):
         dialog.exec_()
 
     def nop_tien(self, row):
-        # Lấy thông tin từ bảng (an toàn hơn vì có thể giá trị cell trống)
+        # Lấy thông tin từ dòng dữ liệu của bảng
         try:
-            hoadon_id = int(self.tbl_chitietban.item(row, 0).text())
+            hoadon_id, user_id_from, username_from = self.tbl_chitietban.dong(row)[:3]
         except Exception:
             show_error(self, "Lỗi", "Không lấy được ID hóa đơn")
             return
-        try:
-            user_id_from = int(self.tbl_chitietban.item(row, 1).text())
-        except Exception:
-            user_id_from = None
-        username_from = (
-            self.tbl_chitietban.item(row, 2).text()
-            if self.tbl_chitietban.item(row, 2)
-            else ""
-        )
+        username_from = username_from or ""
 
         # Tính số dư hiện tại từ DB: unpaid_total - paid
         from users import lay_tong_nop_theo_hoadon
@@ -3389,11 +3254,7 @@ class MainWindow(QWidget):
                         f"👤 Đến: Accountant\n\n"
                         f"Vui lòng nộp tiếp số còn lại!",
                     )
-                self.load_chitietban()  # Làm mới bảng
-                if hasattr(self, "load_so_quy"):
-                    self.load_so_quy()  # Tự động làm mới tab Sổ quỹ
-                if hasattr(self, "load_lich_su_quy"):
-                    self.load_lich_su_quy()  # Tự động làm mới lịch sử giao dịch
+                # Dòng hóa đơn và sổ quỹ làm mới theo sự kiện chuyen_tien phát ra
                 dialog.close()
             else:
                 show_error(self, "Lỗi", f"Chuyển tiền thất bại: {msg}")
@@ -3402,10 +3263,8 @@ class MainWindow(QWidget):
 
     def in_phieu_thu(self, row):
         """In phiếu thu với số tờ các mệnh giá"""
-        hoadon_id = int(self.tbl_chitietban.item(row, 0).text())
-        user_id_from = int(self.tbl_chitietban.item(row, 1).text())
-        username_from = self.tbl_chitietban.item(row, 2).text()
-        so_tien = float(self.tbl_chitietban.item(row, 5).text().replace(",", ""))
+        hoadon_id, user_id_from, username_from = self.tbl_chitietban.dong(row)[:3]
+        so_tien = float(self.tbl_chitietban.dong(row)[5])
 
         dialog = QDialog(self)
         dialog.setWindowTitle("In phiếu thu")
@@ -3458,57 +3317,74 @@ class MainWindow(QWidget):
         self.lbl_tong_to_phieu_thu.setText(f"Tổng từ tờ: {format_price(tong)}")
 
     def in_phieu_thu_actual(self, dialog, row):
-        """In phiếu thu thực tế"""
-        printer = QPrinter()
+        """In phiếu thu thực tế (vẽ ở luồng nền sau khi chọn máy in)"""
+        printer = QPrinter(QPrinter.HighResolution)
         print_dialog = QPrintDialog(printer, self)
-        if print_dialog.exec_() == QPrintDialog.Accepted:
-            painter = QPainter()
-            painter.begin(printer)
-
-            # Lấy thông tin từ dialog
-            so_tien = float(self.tbl_chitietban.item(row, 5).text().replace(",", ""))
-            username_from = self.tbl_chitietban.item(row, 2).text()
-
-            # Vẽ nội dung phiếu thu
-            y = 50
-            painter.drawText(100, y, "PHIẾU THU")
-            y += 30
-            from datetime import datetime
-
-            painter.drawText(
-                100, y, f"Ngày: {datetime.now().strftime('%d/%m/%Y %H:%M')}"
-            )
-            y += 30
-            painter.drawText(100, y, f"Từ: {username_from}")
-            y += 30
-            painter.drawText(100, y, f"Số tiền: {format_price(so_tien)}")
-            y += 50
+        if print_dialog.exec_() != QPrintDialog.Accepted:
+            return
+        dem_to = [(mg, spin.value()) for spin, mg in self.to_tien_spins_phieu_thu]
+        in_phieu_nen(
+            [self._tao_phieu_thu(self.tbl_chitietban.dong(row), dem_to)],
+            printer,
+            khi_xong=lambda _: show_success(self, "In phiếu thu thành công!"),
+            khi_loi=lambda loi: show_error(self, "Lỗi", f"In phiếu thu thất bại: {loi}"),
+        )
+        dialog.close()
 
-            painter.drawText(100, y, "Đếm tờ:")
-            y += 30
+    def _tao_phieu_thu(self, dong, dem_to=()):
+        """
+        Phiếu thu của một dòng chi tiết bán.
 
-            # Vẽ số tờ các mệnh giá
-            for spin, mg in self.to_tien_spins_phieu_thu:
-                if spin.value() > 0:
-                    painter.drawText(100, y, f"{format_price(mg)}: {spin.value()} tờ")
-                    y += 25
+        Args:
+            dong: (id, user_id, username, ngày, trạng thái, số dư)
+            dem_to: list (mệnh giá, số tờ)
 
-            painter.end()
-            show_success(self, "In phiếu thu thành công!")
-            dialog.close()
+        Returns:
+            Phieu
+        """
+        cac_dong = [
+            ("Ngày", datetime.now().strftime("%d/%m/%Y %H:%M")),
+            ("Từ", dong[2]),
+            ("Số tiền", format_price(float(dong[5]))),
+        ]
+        to_tien = [(format_price(mg), f"{so_to} tờ") for mg, so_to in dem_to if so_to > 0]
+        if to_tien:
+            cac_dong += [("Đếm tờ", None)] + to_tien
+        return Phieu("PHIẾU THU", cac_dong)
+
+    def in_phieu_thu_tat_ca(self):
+        """Xuất phiếu thu của mọi ca còn nợ đang hiển thị ra một file PDF"""
+        cac_dong = [d for d in self.tbl_chitietban.cac_dong() if d[5] > 0]
+        if not cac_dong:
+            show_warning(self, "Không có ca nào cần thu tiền")
+            return
+        file_path, _ = QFileDialog.getSaveFileName(
+            self,
+            "Lưu phiếu thu",
+            f"phieu_thu_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf",
+            "PDF Files (*.pdf)",
+        )
+        if not file_path:
+            return
+        in_phieu_nen(
+            [self._tao_phieu_thu(d) for d in cac_dong],
+            file_path,
+            khi_xong=lambda path: show_success(
+                self, f"Đã xuất {len(cac_dong)} phiếu thu ra {path}"
+            ),
+            khi_loi=lambda loi: show_error(self, "Lỗi", f"Xuất phiếu thu thất bại: {loi}"),
+        )
 
     def sua_hoadon_chitiet_admin(self):
         """Admin sửa toàn bộ ca bán hàng (chi tiết sản phẩm)"""
         from invoices import lay_chi_tiet_hoadon
 
-        row = self.tbl_chitietban.currentRow()
+        row = self.tbl_chitietban.dong_hien_tai()
         if row < 0:
             show_warning(self, "Vui lòng chọn ca bán hàng cần sửa")
             return
 
-        hoadon_id = int(self.tbl_chitietban.item(row, 0).text())
-        username = self.tbl_chitietban.item(row, 2).text()
-        ngay = self.tbl_chitietban.item(row, 3).text()
+        hoadon_id, _, username, ngay = self.tbl_chitietban.dong(row)[:4]
 
         # Lấy chi tiết hóa đơn hiện tại
         chi_tiet = lay_chi_tiet_hoadon(hoadon_id)
@@ -3614,11 +3490,7 @@ class MainWindow(QWidget):
 
             # Cột 8: Người cho nợ (QComboBox)
             cho_no_combo = QComboBox()
-            cho_no_combo.addItem("-- Không --", None)
-
-            # Thêm danh sách user
-            for user in users:
-                cho_no_combo.addItem(f"{user[1]}", user[0])
+            cho_no_combo.setModel(lay_model_cho_no())
 
             # TODO: Lấy thông tin người cho nợ từ ghi chú hoặc bảng riêng
             # Hiện tại để mặc định "-- Không --"
@@ -3706,9 +3578,7 @@ class MainWindow(QWidget):
 
         # Cột 8: Người cho nợ
         cho_no_combo = QComboBox()
-        cho_no_combo.addItem("-- Không --", None)
-        for user in users:
-            cho_no_combo.addItem(f"{user[1]}", user[0])
+        cho_no_combo.setModel(lay_model_cho_no())
         table.setCellWidget(row, 8, cho_no_combo)
 
     def xoa_dong_sua_chitiet(self, table):
@@ -3894,30 +3764,44 @@ class MainWindow(QWidget):
                             ),
                         )
 
-                        # Cập nhật số dư Users
-                        c.execute(
-                            """
-                            UPDATE Users 
-                            SET so_du = so_du - ? 
-                            WHERE id = ?
-                        """,
-                            (tien_chuyen, user_ban_id),
+                        # Cập nhật số dư Users (ghi sổ cái theo hóa đơn)
+                        cap_nhat_so_du(
+                            c,
+                            user_ban_id,
+                            -tien_chuyen,
+                            LY_DO_CHO_NO,
+                            hoadon_id,
+                            ghi_chu_gd,
+                            ngay_gd,
                         )
-
-                        c.execute(
-                            """
-                            UPDATE Users 
-                            SET so_du = so_du + ? 
-                            WHERE id = ?
-                        """,
-                            (tien_chuyen, ct["cho_no_user_id"]),
+                        cap_nhat_so_du(
+                            c,
+                            ct["cho_no_user_id"],
+                            tien_chuyen,
+                            LY_DO_CHO_NO,
+                            hoadon_id,
+                            ghi_chu_gd,
+                            ngay_gd,
                         )
 
             conn.commit()
             conn.close()
 
+            user_cho_no_ids = [
+                ct["cho_no_user_id"] for ct in chi_tiet_moi if ct["cho_no_user_id"]
+            ]
+            event_bus.phat(
+                HoaDonDaSua(
+                    [hoadon_id],
+                    [user_ban_id] + user_cho_no_ids,
+                    [ct["sanpham_id"] for ct in chi_tiet_moi],
+                    sua_ban_hang=True,
+                )
+            )
+            if user_cho_no_ids:
+                event_bus.phat(SoDuThayDoi([user_ban_id] + user_cho_no_ids))
+
             show_success(self, "Đã lưu thay đổi ca bán hàng và cập nhật giao dịch")
-            self.load_chitietban()
 
             # Refresh các tab liên quan
             if hasattr(self, "load_giaodich"):
@@ -3936,12 +3820,12 @@ class MainWindow(QWidget):
 
     def xoa_hoadon_chitiet_admin(self):
         """Chỉ admin mới được xóa hóa đơn trong tab Chi tiết bán"""
-        row = self.tbl_chitietban.currentRow()
+        row = self.tbl_chitietban.dong_hien_tai()
         if row < 0:
             show_warning(self, "Vui lòng chọn hóa đơn cần xóa")
             return
 
-        hoadon_id = int(self.tbl_chitietban.item(row, 0).text())
+        hoadon_id = self.tbl_chitietban.dong(row)[0]
 
         if not show_confirmation(
             self,
@@ -3955,25 +3839,9 @@ class MainWindow(QWidget):
 
         if xoa_hoa_don(hoadon_id):
             show_success(self, "Đã xóa hóa đơn")
-            self.load_chitietban()
         else:
             show_error(self, "Lỗi khi xóa hóa đơn")
 
-    def xem_chi_tiet_hoadon(self):
-        try:
-            hoadon_id = int(self.hoadon_id_edit.text())
-            cts = lay_chi_tiet_hoadon(hoadon_id)
-            self.tbl_chitietban.setRowCount(len(cts))
-            for row_idx, ct in enumerate(cts):
-                for col_idx, val in enumerate(ct):
-                    if col_idx == 6:
-                        val = format_price(val)
-                    self.tbl_chitietban.setItem(
-                        row_idx, col_idx, QTableWidgetItem(str(val))
-                    )
-        except Exception as e:
-            show_error(self, "Lỗi", f"Hóa đơn ID không hợp lệ: {e}")
-
     def init_tab_hoadon(self):
         layout = QVBoxLayout()
 
@@ -3994,33 +3862,39 @@ class MainWindow(QWidget):
         btn_load = QPushButton("Tải dữ liệu")
         btn_load.clicked.connect(self.load_hoadon)
         filter_layout.addWidget(btn_load)
+
+        self.chi_bao_hoadon = tao_chi_bao_tai()
+        filter_layout.addWidget(self.chi_bao_hoadon)
+        self.tai_hoadon = BoTaiNen(
+            lay_chi_tiet_xhd,
+            self._hien_thi_hoadon,
+            lambda loi: print(f"Lỗi load XHD data: {loi}"),
+            chi_bao=self.chi_bao_hoadon,
+            parent=self,
+        )
+        self.hoadon_tu_ngay.dateChanged.connect(lambda _: self.load_hoadon(tre=True))
+        self.hoadon_den_ngay.dateChanged.connect(lambda _: self.load_hoadon(tre=True))
         filter_layout.addStretch()
 
         layout.addLayout(filter_layout)
 
         # Bảng sản phẩm đã XHĐ
-        self.tbl_hoadon = QTableWidget()
-        # Thêm cột ID để admin có thể sửa/xóa
+        # Thêm cột ID để admin có thể sửa/xóa (dòng admin có thêm 2 cột ID ở đầu)
         if self.role == "admin":
-            self.tbl_hoadon.setColumnCount(8)
-            self.tbl_hoadon.setHorizontalHeaderLabels(
-                [
-                    "ID HĐ",
-                    "ID CT",
-                    "Ngày",
-                    "Username",
-                    "Tên SP",
-                    "SL",
-                    "Loại giá",
-                    "Tổng tiền",
-                ]
-            )
+            cot_hoadon = [Cot("ID HĐ", 0), Cot("ID CT", 1)]
+            i = 2
         else:
-            self.tbl_hoadon.setColumnCount(6)
-            self.tbl_hoadon.setHorizontalHeaderLabels(
-                ["Ngày", "Username", "Tên SP", "SL", "Loại giá", "Tổng tiền"]
-            )
-        self.setup_table(self.tbl_hoadon)
+            cot_hoadon = []
+            i = 0
+        cot_hoadon += [
+            Cot("Ngày", i),
+            Cot("Username", i + 1),
+            Cot("Tên SP", i + 2),
+            Cot("SL", i + 3),
+            Cot("Loại giá", i + 4, dinh_dang=format_loai_gia),
+            Cot("Tổng tiền", i + 5, dinh_dang=format_price, can_le=Qt.AlignRight),
+        ]
+        self.tbl_hoadon = BangDuLieu(cot_hoadon)
         layout.addWidget(self.tbl_hoadon)
 
         # Label tổng tiền
@@ -4056,133 +3930,28 @@ class MainWindow(QWidget):
 
         self.load_hoadon()
         self.tab_hoadon.setLayout(layout)
+        self.bo_lam_moi.dang_ky(
+            self.tab_hoadon, (HoaDonDaTao, HoaDonDaSua), lambda _: self.load_hoadon()
+        )
 
-    def load_hoadon(self):
+    def load_hoadon(self, tre=False):
+        """Nạp sản phẩm đã XHĐ ở luồng nền (tre=True: gom các lần đổi bộ lọc)."""
+        if not self.tab_da_tao("tab_hoadon"):
+            return
         tu_ngay = self.hoadon_tu_ngay.date().toString("yyyy-MM-dd")
         den_ngay = self.hoadon_den_ngay.date().toString("yyyy-MM-dd")
 
-        # Load dữ liệu sản phẩm đã XHĐ
-        from db import ket_noi
-
-        try:
-            conn = ket_noi()
-            c = conn.cursor()
-
-            # Admin cần thêm ID để sửa/xóa
-            if self.role == "admin":
-                sql = """
-                    SELECT
-                        hd.id as hoadon_id,
-                        ct.id as chitiet_id,
-                        hd.ngay,
-                        u.username,
-                        s.ten as ten_sp,
-                        ct.so_luong,
-                        ct.loai_gia,
-                        (ct.so_luong * ct.gia - ct.giam) as tong_tien
-                    FROM ChiTietHoaDon ct
-                    JOIN HoaDon hd ON ct.hoadon_id = hd.id
-                    JOIN Users u ON hd.user_id = u.id
-                    JOIN SanPham s ON ct.sanpham_id = s.id
-                    WHERE ct.xuat_hoa_don = 1
-                """
-            else:
-                sql = """
-                    SELECT
-                        hd.ngay,
-                        u.username,
-                        s.ten as ten_sp,
-                        ct.so_luong,
-                        ct.loai_gia,
-                        (ct.so_luong * ct.gia - ct.giam) as tong_tien
-                    FROM ChiTietHoaDon ct
-                    JOIN HoaDon hd ON ct.hoadon_id = hd.id
-                    JOIN Users u ON hd.user_id = u.id
-                    JOIN SanPham s ON ct.sanpham_id = s.id
-                    WHERE ct.xuat_hoa_don = 1
-                """
-
-            params = []
-
-            # Nếu là staff thì chỉ xem hóa đơn của mình
-            if self.role == "staff":
-                sql += " AND hd.user_id = ?"
-                params.append(self.user_id)
-
-            # Lọc theo ngày
-            if tu_ngay:
-                sql += " AND date(hd.ngay) >= date(?)"
-                params.append(tu_ngay)
-            if den_ngay:
-                sql += " AND date(hd.ngay) <= date(?)"
-                params.append(den_ngay)
-
-            sql += " ORDER BY hd.ngay DESC"
-
-            c.execute(sql, params)
-            data = c.fetchall()
-
-            # Hiển thị dữ liệu
-            self.tbl_hoadon.setRowCount(len(data))
-            tong_tien = 0
-
-            for row_idx, row in enumerate(data):
-                if self.role == "admin":
-                    (
-                        hoadon_id,
-                        chitiet_id,
-                        ngay,
-                        username,
-                        ten_sp,
-                        so_luong,
-                        loai_gia,
-                        tong_tien_item,
-                    ) = row
-
-                    # Chuyển đổi loại giá
-                    loai_gia_text = {"le": "Lẻ", "buon": "Buôn", "vip": "VIP"}.get(
-                        loai_gia, loai_gia
-                    )
-
-                    self.tbl_hoadon.setItem(
-                        row_idx, 0, QTableWidgetItem(str(hoadon_id))
-                    )
-                    self.tbl_hoadon.setItem(
-                        row_idx, 1, QTableWidgetItem(str(chitiet_id))
-                    )
-                    self.tbl_hoadon.setItem(row_idx, 2, QTableWidgetItem(ngay))
-                    self.tbl_hoadon.setItem(row_idx, 3, QTableWidgetItem(username))
-                    self.tbl_hoadon.setItem(row_idx, 4, QTableWidgetItem(ten_sp))
-                    self.tbl_hoadon.setItem(row_idx, 5, QTableWidgetItem(str(so_luong)))
-                    self.tbl_hoadon.setItem(row_idx, 6, QTableWidgetItem(loai_gia_text))
-                    self.tbl_hoadon.setItem(
-                        row_idx, 7, QTableWidgetItem(format_price(tong_tien_item))
-                    )
-                else:
-                    ngay, username, ten_sp, so_luong, loai_gia, tong_tien_item = row
-
-                    # Chuyển đổi loại giá
-                    loai_gia_text = {"le": "Lẻ", "buon": "Buôn", "vip": "VIP"}.get(
-                        loai_gia, loai_gia
-                    )
-
-                    self.tbl_hoadon.setItem(row_idx, 0, QTableWidgetItem(ngay))
-                    self.tbl_hoadon.setItem(row_idx, 1, QTableWidgetItem(username))
-                    self.tbl_hoadon.setItem(row_idx, 2, QTableWidgetItem(ten_sp))
-                    self.tbl_hoadon.setItem(row_idx, 3, QTableWidgetItem(str(so_luong)))
-                    self.tbl_hoadon.setItem(row_idx, 4, QTableWidgetItem(loai_gia_text))
-                    self.tbl_hoadon.setItem(
-                        row_idx, 5, QTableWidgetItem(format_price(tong_tien_item))
-                    )
-
-                tong_tien += tong_tien_item
-
-            self.lbl_tong_hoadon.setText(f"Tổng XHĐ: {format_price(tong_tien)}")
+        # Load dữ liệu sản phẩm đã XHĐ (cache tới lần ghi DB kế tiếp)
+        tham_so = (self.user_id, self.role, tu_ngay, den_ngay)
+        if tre:
+            self.tai_hoadon.tai_tre(*tham_so)
+        else:
+            self.tai_hoadon.tai(*tham_so)
 
-        except Exception as e:
-            print(f"Lỗi load XHD data: {e}")
-        finally:
-            conn.close()
+    def _hien_thi_hoadon(self, data):
+        self.tbl_hoadon.dat_du_lieu(data)
+        tong_tien = sum(row[-1] or 0 for row in data)
+        self.lbl_tong_hoadon.setText(f"Tổng XHĐ: {format_price(tong_tien)}")
 
     def export_hoadon_excel(self):
         file_path, _ = QFileDialog.getSaveFileName(
@@ -4195,14 +3964,14 @@ class MainWindow(QWidget):
 
     def sua_chi_tiet_hoadon_admin(self):
         """Chỉ admin mới được sửa chi tiết hóa đơn"""
-        row = self.tbl_hoadon.currentRow()
+        row = self.tbl_hoadon.dong_hien_tai()
         if row < 0:
             show_warning(self, "Vui lòng chọn chi tiết hóa đơn cần sửa")
             return
 
-        chitiet_id = int(self.tbl_hoadon.item(row, 1).text())
-        ten_sp = self.tbl_hoadon.item(row, 4).text()
-        so_luong_cu = self.tbl_hoadon.item(row, 5).text()
+        chitiet_id = int(self.tbl_hoadon.gia_tri(row, 1))
+        ten_sp = self.tbl_hoadon.gia_tri(row, 4)
+        so_luong_cu = str(self.tbl_hoadon.gia_tri(row, 5))
 
         # Dialog nhập thông tin mới
         from PyQt5.QtWidgets import QDialog, QFormLayout, QLineEdit, QDialogButtonBox
@@ -4235,7 +4004,6 @@ class MainWindow(QWidget):
                     chitiet_id, so_luong=so_luong_moi, ghi_chu=ghi_chu
                 ):
                     show_success(self, "Đã sửa chi tiết hóa đơn")
-                    self.load_hoadon()
                 else:
                     show_error(self, "Lỗi khi sửa chi tiết hóa đơn")
             except ValueError:
@@ -4243,13 +4011,13 @@ class MainWindow(QWidget):
 
     def xoa_chi_tiet_hoadon_admin(self):
         """Chỉ admin mới được xóa chi tiết hóa đơn"""
-        row = self.tbl_hoadon.currentRow()
+        row = self.tbl_hoadon.dong_hien_tai()
         if row < 0:
             show_warning(self, "Vui lòng chọn chi tiết hóa đơn cần xóa")
             return
 
-        chitiet_id = int(self.tbl_hoadon.item(row, 1).text())
-        ten_sp = self.tbl_hoadon.item(row, 4).text()
+        chitiet_id = int(self.tbl_hoadon.gia_tri(row, 1))
+        ten_sp = self.tbl_hoadon.gia_tri(row, 4)
 
         if not show_confirmation(
             self,
@@ -4261,19 +4029,18 @@ class MainWindow(QWidget):
 
         if xoa_chi_tiet_hoa_don(chitiet_id):
             show_success(self, "Đã xóa chi tiết hóa đơn")
-            self.load_hoadon()
         else:
             show_error(self, "Lỗi khi xóa chi tiết hóa đơn")
 
     def sua_hoadon_admin(self):
         """Chỉ admin mới được sửa thông tin hóa đơn"""
-        row = self.tbl_hoadon.currentRow()
+        row = self.tbl_hoadon.dong_hien_tai()
         if row < 0:
             show_warning(self, "Vui lòng chọn hóa đơn cần sửa")
             return
 
-        hoadon_id = int(self.tbl_hoadon.item(row, 0).text())
-        ngay_cu = self.tbl_hoadon.item(row, 2).text()
+        hoadon_id = int(self.tbl_hoadon.gia_tri(row, 0))
+        ngay_cu = self.tbl_hoadon.gia_tri(row, 2)
 
         # Dialog nhập thông tin mới
         from PyQt5.QtWidgets import QDialog, QFormLayout, QLineEdit, QDialogButtonBox
@@ -4315,18 +4082,17 @@ class MainWindow(QWidget):
 
             if sua_hoa_don(hoadon_id, ngay=ngay_moi, ghi_chu=ghi_chu):
                 show_success(self, "Đã sửa hóa đơn")
-                self.load_hoadon()
             else:
                 show_error(self, "Lỗi khi sửa hóa đơn")
 
     def xoa_hoadon_admin(self):
         """Chỉ admin mới được xóa hóa đơn"""
-        row = self.tbl_hoadon.currentRow()
+        row = self.tbl_hoadon.dong_hien_tai()
         if row < 0:
             show_warning(self, "Vui lòng chọn hóa đơn cần xóa")
             return
 
-        hoadon_id = int(self.tbl_hoadon.item(row, 0).text())
+        hoadon_id = int(self.tbl_hoadon.gia_tri(row, 0))
 
         if not show_confirmation(
             self,
@@ -4340,7 +4106,6 @@ class MainWindow(QWidget):
 
         if xoa_hoa_don(hoadon_id):
             show_success(self, "Đã xóa hóa đơn")
-            self.load_hoadon()
         else:
             show_error(self, "Lỗi khi xóa hóa đơn")
 
@@ -4403,21 +4168,55 @@ class MainWindow(QWidget):
         self.bieudo_month.addItems(["Tất cả"] + [str(m) for m in range(1, 13)])
         filter_layout.addWidget(self.bieudo_month)
 
+        # Gom theo kỳ
+        filter_layout.addWidget(QLabel("Kỳ:"))
+        self.bieudo_ky = QComboBox()
+        for ky in (KY_NGAY, KY_TUAN, KY_THANG, KY_NAM):
+            self.bieudo_ky.addItem(KY_HIEN_THI[ky], ky)
+        self.bieudo_ky.setCurrentIndex(self.bieudo_ky.findData(KY_THANG))
+        filter_layout.addWidget(self.bieudo_ky)
+
+        # Chỉ hiện N sản phẩm sản lượng cao nhất
+        filter_layout.addWidget(QLabel("Top:"))
+        self.bieudo_top = QComboBox()
+        self.bieudo_top.addItem("Tất cả", None)
+        for n in (5, 10, 20):
+            self.bieudo_top.addItem(str(n), n)
+        filter_layout.addWidget(self.bieudo_top)
+
         # Nút cập nhật biểu đồ
         btn_update = QPushButton("Cập nhật biểu đồ")
         btn_update.clicked.connect(self.cap_nhat_bieu_do)
         filter_layout.addWidget(btn_update)
 
+        btn_excel_bieudo = QPushButton("Xuất Excel")
+        btn_excel_bieudo.clicked.connect(self.xuat_excel_bieu_do)
+        filter_layout.addWidget(btn_excel_bieudo)
+
+        self.chi_bao_bieu_do = tao_chi_bao_tai()
+        filter_layout.addWidget(self.chi_bao_bieu_do)
+
         filter_layout.addStretch()
         bieudo_layout.addLayout(filter_layout)
 
-        # Widget để chứa biểu đồ matplotlib
-        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
-        from matplotlib.figure import Figure
-
-        self.figure = Figure()
-        self.canvas = FigureCanvasQTAgg(self.figure)
-        bieudo_layout.addWidget(self.canvas)
+        # Biểu đồ được vẽ thành ảnh ở luồng nền; ảnh đã vẽ được cache theo bộ lọc
+        self.khung_bieu_do = KhungBieuDo()
+        bieudo_layout.addWidget(self.khung_bieu_do, 1)
+        self.ve_bieu_do = VeBieuDoCot()
+        self.tai_bieu_do = BoTaiNen(
+            self._ve_bieu_do_nen,
+            self._hien_thi_bieu_do,
+            lambda loi: show_error(self, "Lỗi", f"Lỗi vẽ biểu đồ: {loi}"),
+            chi_bao=self.chi_bao_bieu_do,
+            parent=self,
+        )
+        for combo in (self.bieudo_year, self.bieudo_month, self.bieudo_ky, self.bieudo_top):
+            combo.currentIndexChanged.connect(lambda _: self.cap_nhat_bieu_do())
+        self.hen_gio_bieu_do = QTimer(self)
+        self.hen_gio_bieu_do.setSingleShot(True)
+        self.hen_gio_bieu_do.setInterval(200)
+        self.hen_gio_bieu_do.timeout.connect(self.cap_nhat_bieu_do)
+        self.khung_bieu_do.doi_kich_thuoc.connect(self._khi_doi_kich_thuoc_bieu_do)
 
         tab_bieudo.setLayout(bieudo_layout)
         tab_widget.addTab(tab_bieudo, "Biểu đồ sản lượng")
@@ -4550,12 +4349,27 @@ class MainWindow(QWidget):
         help_btn.clicked.connect(self.show_ai_help)
         action_layout.addWidget(help_btn)
 
+        self.btn_huy_ai = QPushButton("⏹ Dừng")
+        self.btn_huy_ai.setVisible(False)
+        self.btn_huy_ai.clicked.connect(self.huy_ai_message)
+        action_layout.addWidget(self.btn_huy_ai)
+
         action_layout.addStretch()
         layout.addLayout(action_layout)
 
+        # AI trả lời ở luồng nền, token hiện dần trong khung chat
+        self.hoi_ai = BoHoiAI(self)
+        self.hoi_ai.co_token.connect(
+            lambda doan: self._them_token_ai(self.ai_chat_history, "_moc_ai", doan)
+        )
+        self.hoi_ai.xong.connect(self._khi_ai_tra_loi)
+        self.hoi_ai.loi.connect(self._khi_ai_loi_tab)
+        self.hoi_ai.dang_hoi.connect(self.btn_huy_ai.setVisible)
+        self._moc_ai = None
+
         # Initialize AI Assistant with current user role
         try:
-            self.ai_agent = AIAssistant(
+            self.ai_agent = tao_tro_ly_ai(
                 main_window=self,
                 current_user_role=self.role,  # Pass user role for permissions
             )
@@ -4575,45 +4389,58 @@ class MainWindow(QWidget):
         self.tab_ai_agent.setLayout(layout)
 
     def send_ai_message(self):
-        """Gửi tin nhắn đến AI Agent"""
+        """Gửi tin nhắn đến AI Agent (AI trả lời ở luồng nền)"""
         message = self.ai_input.text().strip()
         if not message:
             return
 
+        # Câu hỏi mới thay câu đang chờ
+        if self.hoi_ai.dang_cho():
+            self.huy_ai_message()
+
         # Add user message to chat
         self.ai_chat_history.append(f"\n<b>😊 Bạn:</b> {message}")
         self.ai_input.clear()
 
-        # Get AI response
-        try:
-            self.ai_chat_history.append("<b>🤖 AI:</b> <i>Đang suy nghĩ...</i>")
-            QApplication.processEvents()  # Update UI
-
-            # Gọi AI (role đã được set trong __init__)
-            response = self.ai_agent.ask(message)
-
-            # Remove "thinking" message and add real response
-            cursor = self.ai_chat_history.textCursor()
-            cursor.movePosition(cursor.End)
-            cursor.select(cursor.LineUnderCursor)
-            cursor.removeSelectedText()
-            cursor.deletePreviousChar()  # Remove newline
+        tro_ly = getattr(self, "ai_agent", None)
+        if tro_ly is None:
+            self._khi_ai_loi_tab("AI chưa được khởi tạo")
+            return
 
-            self.ai_chat_history.append(f"<b>🤖 AI:</b> {response}\n")
+        self._moc_ai = self._bat_dau_tra_loi_ai(self.ai_chat_history)
+        self.hoi_ai.hoi(tro_ly, message)
 
-        except Exception as e:
-            self.ai_chat_history.append(f"<b>❌ Lỗi:</b> {e}\n")
-            self.ai_chat_history.append("💡 Kiểm tra xem llama server đã chạy chưa?\n")
+    def huy_ai_message(self):
+        """Dừng câu trả lời đang chờ ở tab AI"""
+        if not self.hoi_ai.dang_cho():
+            return
+        self.hoi_ai.huy()
+        self._ket_thuc_tra_loi_ai_da_huy(self.ai_chat_history, "_moc_ai")
 
-        # Scroll to bottom
-        self.ai_chat_history.verticalScrollBar().setValue(
-            self.ai_chat_history.verticalScrollBar().maximum()
+    def _khi_ai_tra_loi(self, response, conversation_id):
+        moc = self._moc_ai
+        if moc is None:
+            return
+        self._moc_ai = None
+        self._thay_khoi_tra_loi_ai(
+            self.ai_chat_history, moc, f"<b>🤖 AI:</b> {response}\n"
         )
+        self._cuon_cuoi(self.ai_chat_history)
+
+    def _khi_ai_loi_tab(self, thong_bao):
+        if self._moc_ai is None:
+            self.ai_chat_history.append(f"<b>❌ Lỗi:</b> {thong_bao}\n")
+        else:
+            self._khi_ai_loi(self.ai_chat_history, "_moc_ai", thong_bao)
+        self.ai_chat_history.append("💡 Kiểm tra xem llama server đã chạy chưa?\n")
+        self._cuon_cuoi(self.ai_chat_history)
 
     def clear_ai_history(self):
         """Xóa lịch sử chat"""
         try:
             # Simple AI không có history, chỉ xóa hiển thị
+            self.hoi_ai.huy()
+            self._moc_ai = None
             self.ai_chat_history.clear()
             self.ai_chat_history.append("🗑️ <b>Đã xóa lịch sử chat</b>\n")
             self.ai_chat_history.append("✅ AI đã sẵn sàng! Hãy hỏi gì đó...\n")
@@ -4684,15 +4511,6 @@ class MainWindow(QWidget):
 
     def xem_bao_cao_kho(self):
         try:
-            conn = ket_noi()
-            c = conn.cursor()
-
-            # Lấy danh sách sản phẩm với tồn kho và ngưỡng buôn
-            c.execute(
-                "SELECT id, ten, ton_kho, gia_buon, nguong_buon FROM SanPham ORDER BY ten"
-            )
-            san_pham_list = c.fetchall()
-
             # Sắp xếp theo thứ tự tùy chỉnh (các tên không có trong danh sách sẽ đứng sau, theo ABC)
             custom_order = [
                 "PLC KOMAT SUPER 20W/40 200 lít",
@@ -4717,122 +4535,23 @@ class MainWindow(QWidget):
             ]
             order_map = {name: idx for idx, name in enumerate(custom_order)}
 
-            def _sort_key(sp_row):
-                ten_sp = sp_row[1] or ""
+            def _sort_key(dong):
+                ten_sp = dong.ten or ""
                 return (order_map.get(ten_sp, 10_000), ten_sp)
 
-            try:
-                san_pham_list.sort(key=_sort_key)
-            except Exception:
-                pass
-
-            # Chuẩn bị data cho bảng
-            table_data = []
-            for sp in san_pham_list:
-                sp_id, ten, ton_kho, _, nguong_buon = sp
-
-                # Lấy số lượng đã xuất hóa đơn
-                c.execute(
-                    """
-                    SELECT COALESCE(SUM(so_luong), 0)
-                    FROM ChiTietHoaDon 
-                    WHERE sanpham_id = ? AND xuat_hoa_don = 1
-                """,
-                    (sp_id,),
-                )
-                sl_xhd = c.fetchone()[0] or 0
-
-                # Lấy số lượng đã xuất bổ (chuẩn hóa theo 'xuatbo' mới, vẫn hỗ trợ dữ liệu cũ)
-                try:
-                    c.execute(
-                        """
-                        SELECT COALESCE(SUM(so_luong), 0)
-                        FROM LogKho 
-                        WHERE sanpham_id = ? AND hanh_dong IN ('xuatbo','xuat_bo')
-                    """,
-                        (sp_id,),
-                    )
-                    sl_xuat_bo = c.fetchone()[0] or 0
-                except Exception:
-                    # Fallback: một số DB cũ có thể dùng 'xuat'
-                    c.execute(
-                        """
-                        SELECT COALESCE(SUM(so_luong), 0)
-                        FROM LogKho 
-                        WHERE sanpham_id = ? AND hanh_dong = 'xuat'
-                    """,
-                        (sp_id,),
-                    )
-                    sl_xuat_bo = c.fetchone()[0] or 0
-
-                # Lấy số lượng chưa xuất
-                # Gồm: (1) số lượng bán chưa xuất từ ChiTietHoaDon (xuat_hoa_don=0)
-                #      (2) số lượng đầu kỳ (DauKyXuatBo) còn lại
-                try:
-                    c.execute(
-                        """
-                        SELECT COALESCE(SUM(so_luong), 0)
-                        FROM ChiTietHoaDon 
-                        WHERE sanpham_id = ? AND xuat_hoa_don = 0
-                        """,
-                        (sp_id,),
-                    )
-                    sl_chua_xuat_cthd = c.fetchone()[0] or 0
-                except Exception:
-                    sl_chua_xuat_cthd = 0
-
-                # DauKyXuatBo: dùng sanpham_id để cộng dồn số lượng đầu kỳ còn tồn
-                try:
-                    c.execute(
-                        """
-                        SELECT COALESCE(SUM(so_luong), 0)
-                        FROM DauKyXuatBo
-                        WHERE sanpham_id = ?
-                        """,
-                        (sp_id,),
-                    )
-                    sl_dau_ky = c.fetchone()[0] or 0
-                except Exception:
-                    sl_dau_ky = 0
-
-                sl_chua_xuat = (sl_chua_xuat_cthd or 0) + (sl_dau_ky or 0)
-
-                # SYS = tồn kho hiện tại + số lượng chưa xuất hóa đơn
-                # (theo yêu cầu: SYS = kho + số lượng chưa xuất hóa đơn)
-                try:
-                    sys_val = (ton_kho or 0) + (sl_chua_xuat or 0)
-                except Exception:
-                    sys_val = 0
-
-                # Kiểm tra trạng thái tồn kho vs ngưỡng buôn
-                trang_thai = ""
-                if ton_kho is None:
-                    ton_kho = 0
-                if nguong_buon is None:
-                    nguong_buon = 0
-                if ton_kho < nguong_buon:
-                    trang_thai = "Dưới ngưỡng buôn"
-
-                # Build row in the chosen column order (see header)
-                table_data.append(
-                    [
-                        ten,
-                        ton_kho,
-                        sl_xhd,
-                        sl_xuat_bo,
-                        sl_chua_xuat,
-                        sys_val,
-                        trang_thai,
-                    ]
-                )
-
-                # Debug print to console so you can verify values easily
-                try:
-                    print(
-                        f"BAOCAOKHO: {ten} | ton_kho={ton_kho} | sl_xhd={sl_xhd} | sl_xuat_bo={sl_xuat_bo} | sl_chua_xuat(cthd+dk)={sl_chua_xuat} | SYS={sys_val}"
-                    )
-                except Exception:
-                    pass
+            # Một truy vấn cho toàn bộ sản phẩm (tồn kho, XHĐ, xuất bổ, chưa xuất, SYS)
+            table_data = [
+                [
+                    dong.ten,
+                    dong.ton_kho,
+                    dong.sl_xhd,
+                    dong.sl_xuat_bo,
+                    dong.sl_chua_xuat,
+                    dong.sys,
+                    "Dưới ngưỡng buôn" if dong.duoi_nguong else "",
+                ]
+                for dong in tinh_bao_cao_kho(sap_xep=_sort_key)
+            ]
 
             # Hiển thị dữ liệu (đã sắp xếp theo thứ tự tùy chỉnh ở trên)
             self.tbl_baocao_kho.setRowCount(len(table_data))
@@ -4868,85 +4587,92 @@ class MainWindow(QWidget):
 
         except Exception as e:
             show_error(self, "Lỗi", f"Lỗi truy vấn dữ liệu: {str(e)}")
-        finally:
-            conn.close()
-
-    def cap_nhat_bieu_do(self):
-        try:
-            conn = ket_noi()
-            c = conn.cursor()
-
-            nam = int(self.bieudo_year.currentText())
-            thang = self.bieudo_month.currentText()
-
-            # Xây dựng query với điều kiện lọc
-            params = []
-            date_filter = ""
-            if thang != "Tất cả":
-                date_filter = "AND strftime('%m', h.ngay) = ?"
-                params.append(thang.zfill(2))
-
-            # Query lấy sản lượng theo sản phẩm và thời gian
-            sql = f"""
-                SELECT 
-                    s.ten,
-                    strftime('%m', h.ngay) as thang,
-                    SUM(c.so_luong) as tong_sl
-                FROM ChiTietHoaDon c
-                JOIN HoaDon h ON c.hoadon_id = h.id
-                JOIN SanPham s ON c.sanpham_id = s.id
-                WHERE strftime('%Y', h.ngay) = ?
-                {date_filter}
-                GROUP BY s.ten, strftime('%m', h.ngay)
-                ORDER BY s.ten, thang
-            """
-            params.insert(0, str(nam))
-
-            c.execute(sql, params)
-            data = c.fetchall()
-
-            # Chuẩn bị data cho biểu đồ
-            products = sorted(list(set(row[0] for row in data)))
-            months = sorted(list(set(row[1] for row in data)))
-
-            # Tạo ma trận sản lượng
-            quantities = {}
-            for p in products:
-                quantities[p] = [0] * len(months)
-                for row in data:
-                    if row[0] == p:
-                        idx = months.index(row[1])
-                        quantities[p][idx] = row[2]
 
-            # Vẽ biểu đồ
-            self.figure.clear()
-            ax = self.figure.add_subplot(111)
-
-            x = range(len(months))
-            width = 0.8 / len(products)
-
-            for i, (product, qty) in enumerate(quantities.items()):
-                ax.bar([xi + i * width for xi in x], qty, width, label=product)
+    def _tham_so_bieu_do(self):
+        """(tu_ngay, den_ngay, ky, top_n) theo bộ lọc hiện tại của tab biểu đồ."""
+        nam = int(self.bieudo_year.currentText())
+        thang = self.bieudo_month.currentText()
+        if thang != "Tất cả":
+            tu_ngay = QDate(nam, int(thang), 1)
+            den_ngay = tu_ngay.addMonths(1).addDays(-1)
+        else:
+            tu_ngay = QDate(nam, 1, 1)
+            den_ngay = QDate(nam, 12, 31)
+        return (
+            tu_ngay.toString("yyyy-MM-dd"),
+            den_ngay.toString("yyyy-MM-dd"),
+            self.bieudo_ky.currentData(),
+            self.bieudo_top.currentData(),
+        )
 
-            ax.set_xticks([xi + (len(products) - 1) * width / 2 for xi in x])
-            ax.set_xticklabels([f"Tháng {m}" for m in months])
+    def _pivot_bieu_do(self):
+        """Ma trận sản phẩm x kỳ theo bộ lọc hiện tại của tab biểu đồ."""
+        tu_ngay, den_ngay, ky, top_n = self._tham_so_bieu_do()
+        return pivot_doanh_so(tu_ngay, den_ngay, ky=ky, top_n=top_n)
 
-            ax.set_ylabel("Sản lượng")
-            ax.set_title(
-                f"Sản lượng theo sản phẩm năm {nam}"
-                + (f" - Tháng {thang}" if thang != "Tất cả" else "")
+    def cap_nhat_bieu_do(self):
+        """Hiện ảnh đã cache của bộ lọc hiện tại, chưa có thì vẽ ở luồng nền."""
+        try:
+            khoa = self._tham_so_bieu_do() + (
+                max(self.khung_bieu_do.width(), 400),
+                max(self.khung_bieu_do.height(), 300),
+                lay_cache().phien_ban_du_lieu(),
             )
+        except Exception as e:
+            show_error(self, "Lỗi", f"Lỗi vẽ biểu đồ: {str(e)}")
+            return
+        anh = self.ve_bieu_do.lay_anh(khoa)
+        if anh is not None:
+            self.tai_bieu_do.huy()
+            self.khung_bieu_do.hien_anh(anh)
+        else:
+            self.tai_bieu_do.tai(khoa)
+
+    def _khi_doi_kich_thuoc_bieu_do(self):
+        # Chỉ vẽ lại cho vừa khung khi đã có biểu đồ
+        if self.khung_bieu_do.da_co_anh() or self.tai_bieu_do.dang_cho():
+            self.hen_gio_bieu_do.start()
+
+    def _ve_bieu_do_nen(self, khoa):
+        """Đọc pivot và vẽ ảnh biểu đồ (luồng nền, không chạm widget)."""
+        tu_ngay, den_ngay, ky, top_n, rong, cao, _ = khoa
+        pv = gop_nhom_khac(
+            pivot_doanh_so(tu_ngay, den_ngay, ky=ky),
+            top_n or SO_CHUOI_TOI_DA,
+        )
+        if ky == KY_THANG:
+            nhan_cot = [f"Tháng {p[5:7]}" for p in pv.ky]
+        else:
+            nhan_cot = pv.ky
+        tieu_de = f"Sản lượng theo sản phẩm năm {tu_ngay[:4]}"
+        if tu_ngay[5:7] == den_ngay[5:7]:
+            tieu_de += f" - Tháng {int(tu_ngay[5:7])}"
+        anh = self.ve_bieu_do.ve(
+            pv.ten, nhan_cot, pv.ma_tran, tieu_de, "Sản lượng", rong, cao
+        )
+        return khoa, anh
 
-            if len(products) > 1:
-                ax.legend(bbox_to_anchor=(1.05, 1), loc="upper left")
-
-            self.figure.tight_layout()
-            self.canvas.draw()
+    def _hien_thi_bieu_do(self, ket_qua):
+        khoa, anh = ket_qua
+        self.ve_bieu_do.luu_anh(khoa, anh)
+        self.khung_bieu_do.hien_anh(anh)
 
+    def xuat_excel_bieu_do(self):
+        """Xuất ma trận sản phẩm x kỳ của biểu đồ hiện tại ra Excel."""
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Lưu file Excel", "", "Excel Files (*.xlsx)"
+        )
+        if not file_path:
+            return
+        try:
+            pv = self._pivot_bieu_do()
         except Exception as e:
-            show_error(self, "Lỗi", f"Lỗi vẽ biểu đồ: {str(e)}")
-        finally:
-            conn.close()
+            show_error(self, "Lỗi", f"Lỗi truy vấn dữ liệu: {str(e)}")
+            return
+        if xuat_excel_pivot(pv, file_path):
+            show_success(self, f"Đã xuất báo cáo sản lượng ra {file_path}")
+        else:
+            show_error(self, "Lỗi", "Xuất Excel thất bại")
 
     def init_tab_settings(self):
         """⚙️ Settings Tab - Cấu hình AI và Information"""
@@ -5372,6 +5098,8 @@ class MainWindow(QWidget):
             show_error(self, "Lỗi", "Xóa user thất bại")
 
     def load_users(self):
+        if not self.tab_da_tao("tab_user"):
+            return
         users = lay_tat_ca_user()
         self.tbl_user.setRowCount(len(users))
         for row_idx, user in enumerate(users):
@@ -5390,10 +5118,7 @@ class MainWindow(QWidget):
         buon_layout = QVBoxLayout()
         lbl_buon_chua = QLabel("CHƯA XUẤT - GIÁ BUÔN")
         buon_layout.addWidget(lbl_buon_chua)
-        self.tbl_xuatbo_buon = QTableWidget()
-        self.tbl_xuatbo_buon.setColumnCount(2)
-        self.tbl_xuatbo_buon.setHorizontalHeaderLabels(["Tên sản phẩm", "Số lượng"])
-        self.setup_table(self.tbl_xuatbo_buon)
+        self.tbl_xuatbo_buon = BangDuLieu([Cot("Tên sản phẩm", 0), Cot("Số lượng", 1)])
         buon_layout.addWidget(self.tbl_xuatbo_buon)
         chua_xuat_layout.addLayout(buon_layout)
 
@@ -5401,10 +5126,7 @@ class MainWindow(QWidget):
         vip_layout = QVBoxLayout()
         lbl_vip_chua = QLabel("CHƯA XUẤT - GIÁ VIP")
         vip_layout.addWidget(lbl_vip_chua)
-        self.tbl_xuatbo_vip = QTableWidget()
-        self.tbl_xuatbo_vip.setColumnCount(2)
-        self.tbl_xuatbo_vip.setHorizontalHeaderLabels(["Tên sản phẩm", "Số lượng"])
-        self.setup_table(self.tbl_xuatbo_vip)
+        self.tbl_xuatbo_vip = BangDuLieu([Cot("Tên sản phẩm", 0), Cot("Số lượng", 1)])
         vip_layout.addWidget(self.tbl_xuatbo_vip)
         chua_xuat_layout.addLayout(vip_layout)
 
@@ -5412,12 +5134,9 @@ class MainWindow(QWidget):
         le_layout = QVBoxLayout()
         lbl_le_chua = QLabel("CHƯA XUẤT - GIÁ LẺ")
         le_layout.addWidget(lbl_le_chua)
-        self.tbl_xuatbo_le = QTableWidget()
-        self.tbl_xuatbo_le.setColumnCount(3)
-        self.tbl_xuatbo_le.setHorizontalHeaderLabels(
-            ["Tên sản phẩm", "Số lượng", "Trạng thái"]
+        self.tbl_xuatbo_le = BangDuLieu(
+            [Cot("Tên sản phẩm", 0), Cot("Số lượng", 1), Cot("Trạng thái", 2)]
         )
-        self.setup_table(self.tbl_xuatbo_le)
         le_layout.addWidget(self.tbl_xuatbo_le)
         chua_xuat_layout.addLayout(le_layout)
 
@@ -5430,10 +5149,9 @@ class MainWindow(QWidget):
         buon_du_layout = QVBoxLayout()
         lbl_buon_du = QLabel("XUẤT DƯ - GIÁ BUÔN")
         buon_du_layout.addWidget(lbl_buon_du)
-        self.tbl_xuatdu_buon = QTableWidget()
-        self.tbl_xuatdu_buon.setColumnCount(2)
-        self.tbl_xuatdu_buon.setHorizontalHeaderLabels(["Tên sản phẩm", "Số lượng"])
-        self.setup_table(self.tbl_xuatdu_buon)
+        self.tbl_xuatdu_buon = BangDuLieu(
+            [Cot("Tên sản phẩm", 0), Cot("Số lượng", 1, mau=QColor(Qt.red))]
+        )
         buon_du_layout.addWidget(self.tbl_xuatdu_buon)
         xuat_du_layout.addLayout(buon_du_layout)
 
@@ -5441,10 +5159,9 @@ class MainWindow(QWidget):
         vip_du_layout = QVBoxLayout()
         lbl_vip_du = QLabel("XUẤT DƯ - GIÁ VIP")
         vip_du_layout.addWidget(lbl_vip_du)
-        self.tbl_xuatdu_vip = QTableWidget()
-        self.tbl_xuatdu_vip.setColumnCount(2)
-        self.tbl_xuatdu_vip.setHorizontalHeaderLabels(["Tên sản phẩm", "Số lượng"])
-        self.setup_table(self.tbl_xuatdu_vip)
+        self.tbl_xuatdu_vip = BangDuLieu(
+            [Cot("Tên sản phẩm", 0), Cot("Số lượng", 1, mau=QColor(Qt.red))]
+        )
         vip_du_layout.addWidget(self.tbl_xuatdu_vip)
         xuat_du_layout.addLayout(vip_du_layout)
 
@@ -5452,10 +5169,9 @@ class MainWindow(QWidget):
         le_du_layout = QVBoxLayout()
         lbl_le_du = QLabel("XUẤT DƯ - GIÁ LẺ")
         le_du_layout.addWidget(lbl_le_du)
-        self.tbl_xuatdu_le = QTableWidget()
-        self.tbl_xuatdu_le.setColumnCount(2)
-        self.tbl_xuatdu_le.setHorizontalHeaderLabels(["Tên sản phẩm", "Số lượng"])
-        self.setup_table(self.tbl_xuatdu_le)
+        self.tbl_xuatdu_le = BangDuLieu(
+            [Cot("Tên sản phẩm", 0), Cot("Số lượng", 1, mau=QColor(Qt.red))]
+        )
         le_du_layout.addWidget(self.tbl_xuatdu_le)
         xuat_du_layout.addLayout(le_du_layout)
 
@@ -5513,6 +5229,11 @@ class MainWindow(QWidget):
         layout.addLayout(footer_layout)
 
         self.load_xuatbo()
+        self.bo_lam_moi.dang_ky(
+            self.tab_xuat_bo,
+            (HoaDonDaTao, HoaDonDaSua, TonKhoThayDoi),
+            lambda _: self.load_xuatbo(),
+        )
         # Thêm 5 dòng rỗng ban đầu
         for _ in range(5):
             self.them_dong_xuat_bo()
@@ -5530,172 +5251,39 @@ class MainWindow(QWidget):
         - Nếu Chưa xuất < 0 => Xuất dư = abs(Chưa xuất), Chưa xuất = 0
         - Nếu Chưa xuất >= 0 => Xuất dư = 0
         """
-        from db import ket_noi
-
-        conn = ket_noi()
-        c = conn.cursor()
-
-        # === 1. TÍNH SỐ LƯỢNG ĐÃ BÁN (chưa xuất hóa đơn) ===
-        # Từ ChiTietHoaDon (xuat_hoa_don=0, so_luong > 0)
-        c.execute(
-            """
-            SELECT s.ten, ct.loai_gia, SUM(ct.so_luong)
-            FROM ChiTietHoaDon ct
-            JOIN SanPham s ON ct.sanpham_id = s.id
-            WHERE ct.xuat_hoa_don = 0 AND ct.so_luong > 0
-            GROUP BY s.ten, ct.loai_gia
-        """
-        )
-        rows_hoadon = c.fetchall()
-
-        # Từ DauKyXuatBo (nhập đầu kỳ)
-        c.execute(
-            """
-            SELECT ten_sanpham, loai_gia, SUM(so_luong)
-            FROM DauKyXuatBo
-            GROUP BY ten_sanpham, loai_gia
-        """
-        )
-        rows_dauky = c.fetchall()
-
-        # Tổng hợp: Tổng bán = Bán hàng + Nhập đầu kỳ
-        tong_ban = {}
-        for ten, loai_gia, sl in rows_hoadon:
-            key = (ten, loai_gia)
-            tong_ban[key] = tong_ban.get(key, 0) + (sl or 0)
-        for ten, loai_gia, sl in rows_dauky:
-            key = (ten, loai_gia)
-            tong_ban[key] = tong_ban.get(key, 0) + (sl or 0)
-
-        # === 2. TÍNH SỐ LƯỢNG XUẤT DƯ (từ bảng XuatDu) ===
-        c.execute(
-            """
-            SELECT ten_sanpham, loai_gia, SUM(so_luong)
-            FROM XuatDu
-            GROUP BY ten_sanpham, loai_gia
-            """
-        )
-        rows_xuatdu = c.fetchall()
-        xuat_du_tong = {}
-        for ten, loai_gia, sl in rows_xuatdu:
-            key = (ten, loai_gia)
-            xuat_du_tong[key] = xuat_du_tong.get(key, 0) + (sl or 0)
-
-        conn.close()
-
-        # === 3. TÍNH "CHƯA XUẤT" VÀ "XUẤT DƯ" HIỂN THỊ ===
-        # Chưa xuất = Tổng bán - Xuất dư
-        # Nếu kết quả âm => Xuất dư hiển thị = abs(kết quả), Chưa xuất = 0
-        # Nếu kết quả >= 0 => Chưa xuất = kết quả, Xuất dư hiển thị = 0
-
-        chua_xuat_display = {}
-        xuat_du_display = {}
-
-        # Lấy tất cả các key từ cả hai nguồn
-        all_keys = set(tong_ban.keys()) | set(xuat_du_tong.keys())
+        if not self.tab_da_tao("tab_xuat_bo"):
+            return
 
-        for key in all_keys:
-            ban = tong_ban.get(key, 0)
-            du = xuat_du_tong.get(key, 0)
+        # Chỉ số (sản phẩm, loại giá) -> chưa xuất / xuất dư, tính trong DB
+        chi_so = lay_chi_so_xuat_bo()
 
-            net = ban - du  # Số lượng thực còn chưa xuất
+        def theo_loai(bang, loai_gia):
+            return sorted(
+                (ten, sl) for (ten, loai), sl in bang.items() if loai == loai_gia
+            )
 
-            if net >= 0:
-                # Bình thường: còn hàng chưa xuất
-                chua_xuat_display[key] = net
-                xuat_du_display[key] = 0
-            else:
-                # Xuất dư: đã xuất nhiều hơn số lượng bán
-                chua_xuat_display[key] = 0
-                xuat_du_display[key] = abs(net)
-
-        # === 4. PHÂN LOẠI THEO LOẠI GIÁ ===
-        data_buon_chua = []
-        data_vip_chua = []
-        data_le_chua = []
-        data_buon_du = []
-        data_vip_du = []
-        data_le_du = []
-
-        # Chưa xuất
-        for (ten, loai_gia), sl in chua_xuat_display.items():
-            if sl > 0:
-                if loai_gia == "buon":
-                    data_buon_chua.append((ten, sl))
-                elif loai_gia == "vip":
-                    data_vip_chua.append((ten, sl))
-                elif loai_gia == "le":
-                    data_le_chua.append((ten, sl))
-
-        # Xuất dư
-        for (ten, loai_gia), sl in xuat_du_display.items():
-            if sl > 0:
-                if loai_gia == "buon":
-                    data_buon_du.append((ten, sl))
-                elif loai_gia == "vip":
-                    data_vip_du.append((ten, sl))
-                elif loai_gia == "le":
-                    data_le_du.append((ten, sl))
-
-        # === 5. LOAD VÀO CÁC BẢNG UI ===
-        # Bảng Chưa xuất - Buôn
-        self.tbl_xuatbo_buon.setRowCount(len(data_buon_chua))
-        for row_idx, (ten, sl) in enumerate(data_buon_chua):
-            self.tbl_xuatbo_buon.setItem(row_idx, 0, QTableWidgetItem(ten))
-            self.tbl_xuatbo_buon.setItem(row_idx, 1, QTableWidgetItem(str(sl)))
-
-        # Bảng Chưa xuất - VIP
-        self.tbl_xuatbo_vip.setRowCount(len(data_vip_chua))
-        for row_idx, (ten, sl) in enumerate(data_vip_chua):
-            self.tbl_xuatbo_vip.setItem(row_idx, 0, QTableWidgetItem(ten))
-            self.tbl_xuatbo_vip.setItem(row_idx, 1, QTableWidgetItem(str(sl)))
+        # Bảng Chưa xuất
+        self.tbl_xuatbo_buon.dat_du_lieu(theo_loai(chi_so.chua_xuat, "buon"))
+        self.tbl_xuatbo_vip.dat_du_lieu(theo_loai(chi_so.chua_xuat, "vip"))
 
         # Bảng Chưa xuất - Lẻ (có cột trạng thái ngưỡng buôn)
-        self.tbl_xuatbo_le.setRowCount(len(data_le_chua))
-        from products import tim_sanpham
-
-        for row_idx, (ten, sl) in enumerate(data_le_chua):
-            self.tbl_xuatbo_le.setItem(row_idx, 0, QTableWidgetItem(ten))
-            self.tbl_xuatbo_le.setItem(row_idx, 1, QTableWidgetItem(str(sl)))
-
+        dong_le = []
+        for ten, sl in theo_loai(chi_so.chua_xuat, "le"):
             # Tính trạng thái: so sánh với ngưỡng buôn
-            sp_info = tim_sanpham(ten)
-            if sp_info:
-                nguong_buon = sp_info[0][6] if len(sp_info[0]) > 6 else 0
-                if sl >= nguong_buon:
-                    trang_thai = "Đủ ngưỡng buôn"
-                else:
-                    trang_thai = "Dưới ngưỡng buôn"
-            else:
+            nguong_buon = chi_so.nguong_buon.get(ten)
+            if nguong_buon is None:
                 trang_thai = "Không xác định"
-            self.tbl_xuatbo_le.setItem(row_idx, 2, QTableWidgetItem(trang_thai))
-
-        # Bảng Xuất dư - Buôn
-        self.tbl_xuatdu_buon.setRowCount(len(data_buon_du))
-        for row_idx, (ten, sl) in enumerate(data_buon_du):
-            item_ten = QTableWidgetItem(ten)
-            item_sl = QTableWidgetItem(str(sl))
-            item_sl.setForeground(Qt.red)  # Màu đỏ cho xuất dư
-            self.tbl_xuatdu_buon.setItem(row_idx, 0, item_ten)
-            self.tbl_xuatdu_buon.setItem(row_idx, 1, item_sl)
-
-        # Bảng Xuất dư - VIP
-        self.tbl_xuatdu_vip.setRowCount(len(data_vip_du))
-        for row_idx, (ten, sl) in enumerate(data_vip_du):
-            item_ten = QTableWidgetItem(ten)
-            item_sl = QTableWidgetItem(str(sl))
-            item_sl.setForeground(Qt.red)
-            self.tbl_xuatdu_vip.setItem(row_idx, 0, item_ten)
-            self.tbl_xuatdu_vip.setItem(row_idx, 1, item_sl)
-
-        # Bảng Xuất dư - Lẻ
-        self.tbl_xuatdu_le.setRowCount(len(data_le_du))
-        for row_idx, (ten, sl) in enumerate(data_le_du):
-            item_ten = QTableWidgetItem(ten)
-            item_sl = QTableWidgetItem(str(sl))
-            item_sl.setForeground(Qt.red)
-            self.tbl_xuatdu_le.setItem(row_idx, 0, item_ten)
-            self.tbl_xuatdu_le.setItem(row_idx, 1, item_sl)
+            elif sl >= nguong_buon:
+                trang_thai = "Đủ ngưỡng buôn"
+            else:
+                trang_thai = "Dưới ngưỡng buôn"
+            dong_le.append((ten, sl, trang_thai))
+        self.tbl_xuatbo_le.dat_du_lieu(dong_le)
+
+        # Bảng Xuất dư (số lượng tô đỏ)
+        self.tbl_xuatdu_buon.dat_du_lieu(theo_loai(chi_so.xuat_du, "buon"))
+        self.tbl_xuatdu_vip.dat_du_lieu(theo_loai(chi_so.xuat_du, "vip"))
+        self.tbl_xuatdu_le.dat_du_lieu(theo_loai(chi_so.xuat_du, "le"))
 
     def them_dong_xuat_bo(self):
         row = self.xuat_bo_table.rowCount()
@@ -5791,7 +5379,6 @@ class MainWindow(QWidget):
 
         CHÊNH LỆCH: Tính SAU KHI XUẤT BỔ = (Giá đã bán - Giá xuất bổ)
         """
-        from products import tim_sanpham
         from db import ket_noi
 
         # 1. Lấy danh sách sản phẩm cần xuất
@@ -5817,6 +5404,31 @@ class MainWindow(QWidget):
             show_error(self, "Lỗi", "Không có sản phẩm để xuất")
             return
 
+        # Giá, số lượng chưa xuất và SYS của mọi sản phẩm trong một lần đọc DB
+        tinh_trang = lay_tinh_trang_san_pham({item["ten"] for item in items})
+
+        for item in items:
+            if item["ten"] not in tinh_trang:
+                show_error(self, "Lỗi", f"Không tìm thấy sản phẩm '{item['ten']}'")
+                return
+
+        # Không cho xuất vượt SYS (cùng công thức tab Báo cáo)
+        tong_theo_sp = {}
+        for item in items:
+            tong_theo_sp[item["ten"]] = tong_theo_sp.get(item["ten"], 0) + item["so_luong"]
+        vuot_sys = [
+            (ten, sl, tinh_trang[ten].sys)
+            for ten, sl in tong_theo_sp.items()
+            if sl > tinh_trang[ten].sys
+        ]
+        if vuot_sys:
+            msg = "\n".join(
+                f"- {ten}: yêu cầu {sl} > SYS {format_price(sys)}"
+                for ten, sl, sys in vuot_sys
+            )
+            show_error(self, "Vượt SYS", f"Không thể xuất vì vượt SYS:\n{msg}")
+            return
+
         # 2. Xử lý từng sản phẩm
         xuat_du_list = []  # [(ten, sl_du, loai_gia)]
         xuat_plan = []  # Chi tiết kế hoạch xuất
@@ -5826,22 +5438,13 @@ class MainWindow(QWidget):
             sl_yeu_cau = item["so_luong"]
             loai_gia = item["loai_gia"]
 
-            # Lấy thông tin sản phẩm
-            sp_info = tim_sanpham(ten)
-            if not sp_info:
-                show_error(self, "Lỗi", f"Không tìm thấy sản phẩm '{ten}'")
-                return
-
-            sp = sp_info[0]
-            gia_le = float(sp[2])
-            gia_buon = float(sp[3])
-            gia_vip = float(sp[4])
-            nguong_buon = sp[6] if len(sp) > 6 else 0
+            sp = tinh_trang[ten]
+            nguong_buon = sp.nguong_buon
 
             # Lấy số lượng hiện có
-            sl_chua_xuat_le = self.get_sl_from_table("le", ten)
-            sl_chua_xuat_buon = self.get_sl_from_table("buon", ten)
-            sl_chua_xuat_vip = self.get_sl_from_table("vip", ten)
+            sl_chua_xuat_le = float(sp.chua_xuat_theo_loai.get("le", 0))
+            sl_chua_xuat_buon = float(sp.chua_xuat_theo_loai.get("buon", 0))
+            sl_chua_xuat_vip = float(sp.chua_xuat_theo_loai.get("vip", 0))
 
             # === XỬ LÝ THEO LOẠI GIÁ ===
             plan = {
@@ -5985,6 +5588,43 @@ class MainWindow(QWidget):
 
         tong_chenh_lech = 0
         chenh_lech_chi_tiet = []  # Để hiển thị sau
+        hoadon_da_xuat = set()  # Các hóa đơn có dòng được xuất (để báo thay đổi)
+
+        # Giá mới nhất trong lịch sử đổi giá của mọi sản phẩm, một truy vấn
+        gia_moi_nhat = gia_moi_nhat_nhieu(sp.sanpham_id for sp in tinh_trang.values())
+
+        def ghi_chenh_lech(
+            sp, tru, loai_gia_nguon, loai_gia_xuat, gia_ban, gia_xuat_bo, chenh_lech_phan
+        ):
+            # Giá bán là "giá mới" nếu trùng lần đổi giá gần nhất của loại giá
+            # nguồn; chưa từng đổi giá thì so với giá catalog hiện tại
+            gia_moc = gia_moi_nhat.get((sp.sanpham_id, loai_gia_nguon))
+            if gia_moc is None:
+                gia_moc = {"vip": sp.gia_vip, "buon": sp.gia_buon}.get(
+                    loai_gia_nguon, sp.gia_le
+                )
+            is_gia_moi = 1 if abs(float(gia_ban) - float(gia_moc)) < 1e-6 else 0
+            c.execute(
+                """
+                INSERT INTO ChenhLechXuatBo 
+                (user_id, sanpham_id, ten_sanpham, so_luong, loai_gia_nguon, 
+                 loai_gia_xuat, gia_ban, gia_xuat, chenh_lech, ngay, is_gia_moi)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    self.user_id,
+                    sp.sanpham_id,
+                    sp.ten,
+                    tru,
+                    loai_gia_nguon,
+                    loai_gia_xuat,
+                    gia_ban,
+                    gia_xuat_bo,
+                    chenh_lech_phan,
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    is_gia_moi,
+                ),
+            )
 
         try:
             for plan in xuat_plan:
@@ -5992,13 +5632,10 @@ class MainWindow(QWidget):
                 loai_gia_xuat = plan["loai_gia_xuat"]
 
                 # Lấy giá xuất bổ (giá catalog hiện tại)
-                sp_info = tim_sanpham(ten)
-                if not sp_info:
-                    continue
-                sp = sp_info[0]
-                gia_le_catalog = float(sp[2])
-                gia_buon_catalog = float(sp[3])
-                gia_vip_catalog = float(sp[4])
+                sp = tinh_trang[ten]
+                gia_le_catalog = sp.gia_le
+                gia_buon_catalog = sp.gia_buon
+                gia_vip_catalog = sp.gia_vip
 
                 # Xác định giá xuất bổ
                 if loai_gia_xuat == "vip":
@@ -6040,76 +5677,15 @@ class MainWindow(QWidget):
                             )
 
                             # Lưu vào bảng ChenhLechXuatBo
-                            c.execute("SELECT id FROM SanPham WHERE ten=?", (ten,))
-                            sp_row = c.fetchone()
-                            if sp_row:
-                                from datetime import datetime
-
-                                sanpham_id = sp_row[0]
-
-                                # Xác định giá mới/cũ dựa trên lịch sử thay đổi giá
-                                # Lấy lần thay đổi giá gần nhất cho loại giá này
-                                c.execute(
-                                    """
-                                    SELECT gia_moi, ngay_thay_doi 
-                                    FROM LichSuGia 
-                                    WHERE sanpham_id=? AND loai_gia=? 
-                                    ORDER BY ngay_thay_doi DESC 
-                                    LIMIT 1
-                                    """,
-                                    (sanpham_id, loai_gia_nguon),
-                                )
-                                lich_su = c.fetchone()
-
-                                if lich_su:
-                                    gia_moi_nhat, ngay_doi = lich_su
-                                    # So sánh giá bán với giá mới nhất trong lịch sử
-                                    is_gia_moi = (
-                                        1
-                                        if abs(
-                                            float(gia_ban_dauky) - float(gia_moi_nhat)
-                                        )
-                                        < 1e-6
-                                        else 0
-                                    )
-                                else:
-                                    # Không có lịch sử thay đổi, coi như giá hiện tại
-                                    if loai_gia_nguon == "vip":
-                                        gia_hien_tai = gia_vip_catalog
-                                    elif loai_gia_nguon == "buon":
-                                        gia_hien_tai = gia_buon_catalog
-                                    else:
-                                        gia_hien_tai = gia_le_catalog
-                                    is_gia_moi = (
-                                        1
-                                        if abs(
-                                            float(gia_ban_dauky) - float(gia_hien_tai)
-                                        )
-                                        < 1e-6
-                                        else 0
-                                    )
-
-                                c.execute(
-                                    """
-                                    INSERT INTO ChenhLechXuatBo 
-                                    (user_id, sanpham_id, ten_sanpham, so_luong, loai_gia_nguon, 
-                                     loai_gia_xuat, gia_ban, gia_xuat, chenh_lech, ngay, is_gia_moi)
-                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                                    """,
-                                    (
-                                        self.user_id,
-                                        sanpham_id,
-                                        ten,
-                                        tru,
-                                        loai_gia_nguon,
-                                        loai_gia_xuat,
-                                        gia_ban_dauky,
-                                        gia_xuat_bo,
-                                        chenh_lech_phan,
-                                        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                                        is_gia_moi,
-                                    ),
-                                )
+                            ghi_chenh_lech(
+                                sp,
+                                tru,
+                                loai_gia_nguon,
+                                loai_gia_xuat,
+                                gia_ban_dauky,
+                                gia_xuat_bo,
+                                chenh_lech_phan,
+                            )
 
                         c.execute(
                             "UPDATE DauKyXuatBo SET so_luong=so_luong-? WHERE id=?",
@@ -6125,7 +5701,7 @@ class MainWindow(QWidget):
                     if sl_can_tru > 0:
                         c.execute(
                             """
-                            SELECT c.id, c.so_luong, c.gia, h.ngay
+                            SELECT c.id, c.so_luong, c.gia, h.ngay, c.hoadon_id
                             FROM ChiTietHoaDon c
                             JOIN SanPham s ON c.sanpham_id = s.id
                             JOIN HoaDon h ON c.hoadon_id = h.id
@@ -6136,10 +5712,11 @@ class MainWindow(QWidget):
                         )
                         hd_rows = c.fetchall()
 
-                        for row_id, sl_row, gia_ban_hd, ngay_ban in hd_rows:
+                        for row_id, sl_row, gia_ban_hd, ngay_ban, hd_id in hd_rows:
                             if sl_can_tru <= 0:
                                 break
                             tru = min(sl_row, sl_can_tru)
+                            hoadon_da_xuat.add(hd_id)
 
                             # Tính chênh lệch: Giá bán - Giá xuất bổ
                             chenh_lech_don_vi = gia_ban_hd - gia_xuat_bo
@@ -6159,76 +5736,15 @@ class MainWindow(QWidget):
                                 )
 
                                 # Lưu vào bảng ChenhLechXuatBo
-                                c.execute("SELECT id FROM SanPham WHERE ten=?", (ten,))
-                                sp_row = c.fetchone()
-                                if sp_row:
-                                    from datetime import datetime
-
-                                    sanpham_id = sp_row[0]
-
-                                    # Xác định giá mới/cũ dựa trên lịch sử thay đổi giá
-                                    c.execute(
-                                        """
-                                        SELECT gia_moi, ngay_thay_doi 
-                                        FROM LichSuGia 
-                                        WHERE sanpham_id=? AND loai_gia=? 
-                                        ORDER BY ngay_thay_doi DESC 
-                                        LIMIT 1
-                                        """,
-                                        (sanpham_id, loai_gia_nguon),
-                                    )
-                                    lich_su = c.fetchone()
-
-                                    if lich_su:
-                                        gia_moi_nhat, ngay_doi = lich_su
-                                        is_gia_moi = (
-                                            1
-                                            if abs(
-                                                float(gia_ban_hd) - float(gia_moi_nhat)
-                                            )
-                                            < 1e-6
-                                            else 0
-                                        )
-                                    else:
-                                        # Không có lịch sử, so với giá catalog hiện tại
-                                        if loai_gia_nguon == "vip":
-                                            gia_hien_tai = gia_vip_catalog
-                                        elif loai_gia_nguon == "buon":
-                                            gia_hien_tai = gia_buon_catalog
-                                        else:
-                                            gia_hien_tai = gia_le_catalog
-                                        is_gia_moi = (
-                                            1
-                                            if abs(
-                                                float(gia_ban_hd) - float(gia_hien_tai)
-                                            )
-                                            < 1e-6
-                                            else 0
-                                        )
-
-                                    c.execute(
-                                        """
-                                        INSERT INTO ChenhLechXuatBo 
-                                        (user_id, sanpham_id, ten_sanpham, so_luong, loai_gia_nguon, 
-                                         loai_gia_xuat, gia_ban, gia_xuat, chenh_lech, ngay, is_gia_moi)
-                                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                                        """,
-                                        (
-                                            self.user_id,
-                                            sanpham_id,
-                                            ten,
-                                            tru,
-                                            loai_gia_nguon,
-                                            loai_gia_xuat,
-                                            gia_ban_hd,
-                                            gia_xuat_bo,
-                                            chenh_lech_phan,
-                                            datetime.now().strftime(
-                                                "%Y-%m-%d %H:%M:%S"
-                                            ),
-                                            is_gia_moi,
-                                        ),
-                                    )
+                                ghi_chenh_lech(
+                                    sp,
+                                    tru,
+                                    loai_gia_nguon,
+                                    loai_gia_xuat,
+                                    gia_ban_hd,
+                                    gia_xuat_bo,
+                                    chenh_lech_phan,
+                                )
 
                             c.execute(
                                 "UPDATE ChiTietHoaDon SET xuat_hoa_don=1, so_luong=so_luong-? WHERE id=?",
@@ -6237,21 +5753,15 @@ class MainWindow(QWidget):
                             sl_can_tru -= tru
 
             # Tạo bản ghi xuất dư (nếu có)
-            from datetime import datetime
-
             for ten, sl_du, loai_gia_du in xuat_du_list:
-                c.execute("SELECT id FROM SanPham WHERE ten=?", (ten,))
-                row = c.fetchone()
-                if row:
-                    sp_id = row[0]
-                    ngay = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    c.execute(
-                        """
-                        INSERT INTO XuatDu (user_id, sanpham_id, ten_sanpham, so_luong, loai_gia, ngay)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                        """,
-                        (self.user_id, sp_id, ten, sl_du, loai_gia_du, ngay),
-                    )
+                ngay = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                c.execute(
+                    """
+                    INSERT INTO XuatDu (user_id, sanpham_id, ten_sanpham, so_luong, loai_gia, ngay)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (self.user_id, tinh_trang[ten].sanpham_id, ten, sl_du, loai_gia_du, ngay),
+                )
 
             # KHÔNG commit ngay - chờ user xác nhận
 
@@ -6309,9 +5819,12 @@ class MainWindow(QWidget):
                 if result == QDialog.Accepted:
                     # User bấm OK → Thực hiện commit
                     if tong_chenh_lech != 0:
-                        c.execute(
-                            "UPDATE Users SET so_du = so_du - ? WHERE id = ?",
-                            (tong_chenh_lech, self.user_id),
+                        cap_nhat_so_du(
+                            c,
+                            self.user_id,
+                            -tong_chenh_lech,
+                            LY_DO_XUAT_BO,
+                            ghi_chu="Chênh lệch xuất bổ",
                         )
                     conn.commit()
                     show_success(
@@ -6329,8 +5842,14 @@ class MainWindow(QWidget):
                 conn.commit()
                 show_success(self, "Xuất bổ thành công!\n(Không có chênh lệch)")
 
-            # Làm mới
-            self.load_xuatbo()
+            # Bảng chưa xuất, chi tiết bán, sổ quỹ... làm mới theo sự kiện
+            sanpham_ids = [tinh_trang[plan["ten"]].sanpham_id for plan in xuat_plan]
+            event_bus.phat(
+                HoaDonDaSua(hoadon_da_xuat, [self.user_id], sanpham_ids),
+                TonKhoThayDoi(sanpham_ids),
+            )
+            if tong_chenh_lech != 0:
+                event_bus.phat(SoDuThayDoi([self.user_id]))
             self.xuat_bo_table.setRowCount(0)
             for _ in range(5):
                 self.them_dong_xuat_bo()
@@ -6340,651 +5859,84 @@ class MainWindow(QWidget):
             show_error(self, "Lỗi", f"Lỗi khi xuất bổ: {e}")
         finally:
             conn.close()
-        # Lấy danh sách các dòng cần xuất
-        items = []
-        for row in range(self.xuat_bo_table.rowCount()):
-            ten_edit = self.xuat_bo_table.cellWidget(row, 0)
-            sl_spin = self.xuat_bo_table.cellWidget(row, 1)
-            loai_gia_cb = self.xuat_bo_table.cellWidget(row, 2)
 
-            if not (ten_edit and sl_spin and loai_gia_cb):
-                continue
-
-            ten = ten_edit.text().strip()
-            if not ten:
-                continue
+    def get_sl_from_table(self, loai_gia, ten_sp):
+        """Số lượng chưa xuất của (sản phẩm, loại giá), tra theo khóa"""
+        return float(lay_chi_so_xuat_bo().chua_xuat.get((ten_sp, loai_gia), 0))
 
-            sl = sl_spin.value()
-            loai_gia = loai_gia_cb.currentText()
+    def get_sl_xuatdu_from_table(self, loai_gia, ten_sp):
+        """Số lượng xuất dư của (sản phẩm, loại giá), tra theo khóa"""
+        return float(lay_chi_so_xuat_bo().xuat_du.get((ten_sp, loai_gia), 0))
 
-            items.append({"ten": ten, "so_luong": sl, "loai_gia": loai_gia})
+    def init_tab_cong_doan(self):
+        layout = QVBoxLayout()
 
-        if not items:
-            show_error(self, "Lỗi", "Không có sản phẩm để xuất")
-            return
+        # Lọc theo ngày và username
+        filter_layout = QHBoxLayout()
 
-        # Kiểm tra số lượng có sẵn và tính chênh lệch công đoạn
-        chenh_lech_total = 0
-        chenh_lech_items = []
+        filter_layout.addWidget(QLabel("User:"))
+        self.cd_user_combo = QComboBox()
+        self.cd_user_combo.addItem("Tất cả", None)
+        from users import lay_tat_ca_user
 
-        # Trước khi duyệt chi tiết, kiểm tra ngưỡng SYS cho từng sản phẩm (không cho xuất vượt SYS)
-        # Sử dụng đúng công thức của tab Báo cáo để đảm bảo đồng nhất số liệu.
-        def tinh_sys(ten):
-            return self.sys_baocao_by_ten(ten)
+        try:
+            for uid, uname, role, so_du in lay_tat_ca_user():
+                self.cd_user_combo.addItem(f"{uname} (ID: {uid})", uid)
+        except Exception:
+            pass
+        filter_layout.addWidget(self.cd_user_combo)
 
-        tong_theo_sp = {}
-        for it in items:
-            ten_it = it["ten"]
-            tong_theo_sp[ten_it] = tong_theo_sp.get(ten_it, 0) + it["so_luong"]
-        vuot_sys = []
-        for ten_sp, sl_yeu_cau in tong_theo_sp.items():
-            sys_val = tinh_sys(ten_sp)
-            if sl_yeu_cau > sys_val:
-                vuot_sys.append((ten_sp, sl_yeu_cau, sys_val))
-        if vuot_sys:
-            msg = "\n".join(
-                [
-                    f"- {ten}: yêu cầu {sl} > SYS {format_price(sys)}"
-                    for ten, sl, sys in vuot_sys
-                ]
-            )
-            show_error(self, "Vượt SYS", f"Không thể xuất vì vượt SYS:\n{msg}")
-            return
+        filter_layout.addWidget(QLabel("Từ ngày:"))
+        self.tu_ngay_edit = QDateEdit()
+        self.tu_ngay_edit.setCalendarPopup(True)
+        self.tu_ngay_edit.setDate(QDate.currentDate().addMonths(-1))
+        filter_layout.addWidget(self.tu_ngay_edit)
 
-        need_over_accept = []
+        filter_layout.addWidget(QLabel("Đến ngày:"))
+        self.den_ngay_edit = QDateEdit()
+        self.den_ngay_edit.setCalendarPopup(True)
+        self.den_ngay_edit.setDate(QDate.currentDate())
+        filter_layout.addWidget(self.den_ngay_edit)
 
-        for item in items:
-            ten = item["ten"]
-            sl_xuat = item["so_luong"]
-            loai_gia_xuat = item["loai_gia"]
+        filter_layout.addWidget(QLabel("Nhóm theo:"))
+        self.cd_nhom_combo = QComboBox()
+        self.cd_nhom_combo.addItem("Chi tiết xuất bổ", NHOM_CHI_TIET)
+        self.cd_nhom_combo.addItem("Ngày", NHOM_NGAY)
+        self.cd_nhom_combo.addItem("User", NHOM_USER)
+        self.cd_nhom_combo.addItem("Sản phẩm", NHOM_SAN_PHAM)
+        filter_layout.addWidget(self.cd_nhom_combo)
 
-            # Lấy thông tin sản phẩm
-            from products import tim_sanpham
+        btn_load_cd = QPushButton("Tải báo cáo")
+        btn_load_cd.clicked.connect(self.load_bao_cao_cong_doan)
+        filter_layout.addWidget(btn_load_cd)
 
-            sp_info = tim_sanpham(ten)
-            if not sp_info:
-                show_error(self, "Lỗi", f"Sản phẩm '{ten}' không tồn tại")
-                return
+        layout.addLayout(filter_layout)
 
-            sp = sp_info[0]
-            gia_le = float(sp[2])
-            gia_buon = float(sp[3])
-            gia_vip = float(sp[4])
-
-            # Lấy số lượng có sẵn từ các bảng
-            sl_vip = self.get_sl_from_table("vip", ten)
-            sl_buon = self.get_sl_from_table("buon", ten)
-            sl_le = self.get_sl_from_table("le", ten)
-
-            # Kiểm tra đủ số lượng và tính chênh lệch
-            if loai_gia_xuat == "le":
-                if sl_le < sl_xuat:
-                    # Đánh dấu cần chấp nhận xuất dư
-                    item["need_over_accept"] = True
-                    item["over_qty"] = sl_xuat - sl_le
-                    need_over_accept.append((ten, sl_xuat, sl_le))
-                # Giá lẻ không có chênh lệch công đoạn
-
-            elif loai_gia_xuat == "buon":
-                sl_can_tru = sl_xuat
-                print(
-                    f"DEBUG BUON - Sản phẩm: {ten}, Cần xuất: {sl_xuat}, Buôn có: {sl_buon}, Lẻ có: {sl_le}"
-                )
-                if sl_buon >= sl_can_tru:
-                    # Đủ từ bảng buôn
-                    print(f"DEBUG BUON - Đủ từ bảng buôn")
-                    pass
-                else:
-                    # Hỏi có lấy thêm từ bảng lẻ không
-                    thieu = sl_can_tru - sl_buon
-                    print(f"DEBUG BUON - Thiếu {thieu}, cần lấy từ lẻ")
-                    reply = QMessageBox.question(
-                        self,
-                        "Thiếu số lượng",
-                        f"Giá buôn chỉ còn {sl_buon}. Cần lấy thêm {thieu} từ bảng giá lẻ?\n(Giá lẻ hiện có: {sl_le})",
-                        QMessageBox.Yes | QMessageBox.No,
-                    )
-                    if reply != QMessageBox.Yes:
-                        return
-                    # Lấy tối đa từ bảng lẻ, phần còn thiếu sẽ là xuất dư nếu được chấp nhận
-                    lay_tu_le = min(sl_le, thieu)
-                    item["loai_gia_phu"] = "le"
-                    item["so_luong_phu"] = lay_tu_le
-                    if lay_tu_le < thieu:
-                        du = thieu - lay_tu_le
-                        item["need_over_accept"] = True
-                        item["over_qty"] = du
-                        need_over_accept.append((ten, sl_xuat, sl_buon + sl_le))
-                    print(f"DEBUG BUON - Sẽ xuất {sl_buon} từ buôn và {thieu} từ lẻ")
-
-            elif loai_gia_xuat == "vip":
-                sl_can_tru = sl_xuat
-                # Trừ VIP trước
-                sl_tru_vip = min(sl_can_tru, sl_vip)
-                sl_can_tru -= sl_tru_vip
-
-                # Sau đó trừ BUÔN
-                sl_tru_buon = 0
-                if sl_can_tru > 0 and sl_buon > 0:
-                    sl_tru_buon = min(sl_can_tru, sl_buon)
-                    sl_can_tru -= sl_tru_buon
-                    # Lưu thông tin về loại giá phụ thứ 1 (buôn) để xuất từ cả ba loại giá
-                    item["loai_gia_phu"] = "buon"
-                    item["so_luong_phu"] = sl_tru_buon
-
-                # Cuối cùng trừ LẺ
-                sl_tru_le = 0
-                if sl_can_tru > 0:
-                    sl_tru_le = sl_can_tru
-                    if sl_le < sl_tru_le:
-                        # Lấy tối đa từ lẻ, phần thiếu là xuất dư
-                        item["loai_gia_phu2"] = "le"
-                        item["so_luong_phu2"] = sl_le
-                        du = sl_tru_le - sl_le
-                        item["need_over_accept"] = True
-                        item["over_qty"] = du
-                        need_over_accept.append(
-                            (ten, sl_xuat, sl_vip + sl_buon + sl_le)
-                        )
-                    else:
-                        # Lưu thông tin về loại giá phụ thứ 2 (lẻ) để xuất từ cả ba loại giá
-                        item["loai_gia_phu2"] = "le"
-                        item["so_luong_phu2"] = sl_tru_le
-
-                # Hiển thị thông báo xác nhận mượn cho giá VIP
-                if sl_tru_buon > 0 or sl_tru_le > 0:
-                    muon_text = f"Sản phẩm '{ten}' cần mượn:\n"
-                    if sl_tru_buon > 0:
-                        muon_text += f"- {sl_tru_buon} từ giá buôn\n"
-                    if sl_tru_le > 0:
-                        muon_text += f"- {sl_tru_le} từ giá lẻ\n"
-                    muon_text += "\nXác nhận mượn?"
+        # Bảng công đoàn với TreeWidget để hiển thị phân cấp
+        from PyQt5.QtWidgets import QTreeWidget, QTreeWidgetItem
+        from PyQt5.QtCore import Qt
 
-                    reply = QMessageBox.question(
-                        self,
-                        "Xác nhận mượn",
-                        muon_text,
-                        QMessageBox.Yes | QMessageBox.No,
-                    )
-                    if reply != QMessageBox.Yes:
-                        return
+        self.tree_cong_doan = QTreeWidget()
+        self.tree_cong_doan.setColumnCount(7)
+        self.tree_cong_doan.setHeaderLabels(
+            [
+                "User/Chi tiết",
+                "Ngày",
+                "Sản phẩm",
+                "Số lượng",
+                "Tổng giá bán",
+                "Tổng giá xuất",
+                "Chênh lệch",
+            ]
+        )
+        self.tree_cong_doan.setAlternatingRowColors(True)
+        for i in range(7):
+            self.tree_cong_doan.resizeColumnToContents(i)
+        layout.addWidget(self.tree_cong_doan)
 
-                # Tính chênh lệch công đoạn theo yêu cầu mới
-                if sl_tru_buon > 0:
-                    chenh_lech_items.append(
-                        {
-                            "ten": ten,
-                            "sl": sl_tru_buon,
-                            "gia_xuat": gia_vip,
-                            "gia_goc": gia_buon,
-                            "chenh_lech": gia_buon - gia_vip,  # (giá buôn - giá VIP)
-                        }
-                    )
-                if sl_tru_le > 0:
-                    chenh_lech_items.append(
-                        {
-                            "ten": ten,
-                            "sl": sl_tru_le,
-                            "gia_xuat": gia_vip,
-                            "gia_goc": gia_le,
-                            "chenh_lech": gia_le - gia_vip,  # (giá lẻ - giá VIP)
-                        }
-                    )
-
-        # Nếu có dòng cần chấp nhận xuất dư, hỏi xác nhận trước
-        if need_over_accept:
-            details = [
-                f"- {ten}: cần {can}, hiện có {co}. Cho phép xuất dư phần thiếu?"
-                for ten, can, co in need_over_accept
-            ]
-            reply_over = QMessageBox.question(
-                self,
-                "Xác nhận xuất dư",
-                "\n".join(details),
-                QMessageBox.Yes | QMessageBox.No,
-            )
-            if reply_over != QMessageBox.Yes:
-                return
-            for it in items:
-                if it.get("need_over_accept"):
-                    it["allow_over_export"] = True
-
-        # Hiển thị dialog chênh lệch công đoạn nếu có
-        if chenh_lech_items:
-            dialog = QDialog(self)
-            dialog.setWindowTitle("Chênh lệch công đoạn")
-            layout = QVBoxLayout()
-
-            layout.addWidget(
-                QLabel("Các sản phẩm cần điều chỉnh chênh lệch công đoạn:")
-            )
-
-            for item in chenh_lech_items:
-                # Sử dụng chênh lệch đã tính sẵn theo công thức mới
-                chenh_lech_item = item.get("chenh_lech", 0) * item["sl"]
-                chenh_lech_total += chenh_lech_item
-                layout.addWidget(
-                    QLabel(
-                        f"- {item['ten']}: {item['sl']} x {item.get('chenh_lech', 0)} = {format_price(chenh_lech_item)}"
-                    )
-                )
-
-            layout.addWidget(
-                QLabel(f"Tổng chênh lệch: {format_price(chenh_lech_total)}")
-            )
-
-            btn_ok = QPushButton("Xác nhận")
-            btn_ok.clicked.connect(dialog.accept)
-            layout.addWidget(btn_ok)
-
-            dialog.setLayout(layout)
-            if dialog.exec_() != QDialog.Accepted:
-                return
-
-        # Xuất từng sản phẩm
-        errors = []
-        from db import ket_noi
-
-        conn = ket_noi()
-        c = conn.cursor()
-        try:
-            for item in items:
-                ten = item["ten"]
-                loai_gia = item["loai_gia"]
-                so_luong_xuat = item["so_luong"]
-                # Truyền thông tin về loại giá phụ nếu có
-                loai_gia_phu = item.get("loai_gia_phu")
-                so_luong_phu = item.get("so_luong_phu", 0)
-                loai_gia_phu2 = item.get("loai_gia_phu2")
-                so_luong_phu2 = item.get("so_luong_phu2", 0)
-
-                # Kiểm tra số lượng đầu kỳ còn lại
-                c.execute(
-                    "SELECT id, so_luong FROM DauKyXuatBo WHERE ten_sanpham=? AND loai_gia=? ORDER BY id ASC",
-                    (ten, loai_gia),
-                )
-                dauky_rows = c.fetchall()
-                sl_dauky_con = sum([r[1] for r in dauky_rows])
-                sl_xuat_dauky = min(so_luong_xuat, sl_dauky_con)
-                sl_xuat_hoadon = so_luong_xuat - sl_xuat_dauky
-
-                # Nếu có số lượng đầu kỳ, trừ trong DauKyXuatBo
-                if sl_xuat_dauky > 0:
-                    sl_can_tru = sl_xuat_dauky
-                    for r in dauky_rows:
-                        if sl_can_tru <= 0:
-                            break
-                        row_id, sl_row = r
-                        tru = min(sl_row, sl_can_tru)
-                        # Trừ số lượng
-                        c.execute(
-                            "UPDATE DauKyXuatBo SET so_luong=so_luong-? WHERE id=?",
-                            (tru, row_id),
-                        )
-                        # Nếu hết số lượng thì xóa dòng
-                        c.execute(
-                            "DELETE FROM DauKyXuatBo WHERE id=? AND so_luong<=0",
-                            (row_id,),
-                        )
-                        sl_can_tru -= tru
-
-                conn.commit()
-        except Exception as e:
-            conn.rollback()
-            show_error(self, "Lỗi", f"Lỗi khi xử lý đầu kỳ: {e}")
-            conn.close()
-            return
-        finally:
-            conn.close()
-
-        # Nếu còn số lượng phải xuất từ hóa đơn
-        for item in items:
-            ten = item["ten"]
-            so_luong_xuat = item["so_luong"]
-            loai_gia = item["loai_gia"]
-            loai_gia_phu = item.get("loai_gia_phu")
-            so_luong_phu = item.get("so_luong_phu", 0)
-            loai_gia_phu2 = item.get("loai_gia_phu2")
-            so_luong_phu2 = item.get("so_luong_phu2", 0)
-
-            # Recalculate xuất hóa đơn - kiểm tra lại sau khi đã trừ đầu kỳ
-            conn = ket_noi()
-            c = conn.cursor()
-            c.execute(
-                "SELECT id, so_luong FROM DauKyXuatBo WHERE ten_sanpham=? AND loai_gia=? ORDER BY id ASC",
-                (ten, loai_gia),
-            )
-            dauky_rows = c.fetchall()
-            conn.close()
-            sl_dauky_con = sum([r[1] for r in dauky_rows])
-            sl_xuat_dauky = min(so_luong_xuat, sl_dauky_con)
-            sl_xuat_hoadon = so_luong_xuat - sl_xuat_dauky
-
-            print(f"DEBUG XUẤT - {ten} ({loai_gia}):")
-            print(f"  - Yêu cầu xuất: {so_luong_xuat}")
-            print(
-                f"  - Đã xuất từ đầu kỳ: {so_luong_xuat - sl_dauky_con if sl_dauky_con < so_luong_xuat else so_luong_xuat}"
-            )
-            print(f"  - Còn phải xuất từ hóa đơn: {sl_xuat_hoadon}")
-
-            # Nếu còn số lượng phải xuất từ hóa đơn, gọi hàm xuất bổ cũ
-            if sl_xuat_hoadon > 0:
-                sp_info = tim_sanpham(ten)
-                if not sp_info:
-                    errors.append(f"{ten}: Không tìm thấy thông tin sản phẩm")
-                    continue
-                sp = sp_info[0]
-                gia_le = float(sp[2])
-                gia_buon = float(sp[3])
-                gia_vip = float(sp[4])
-                # Với VIP, tính chênh lệch cho từng phần theo công thức mới
-                if loai_gia == "vip":
-                    chenh_lech = 0
-                    chenh_buon = gia_buon - gia_vip
-                    chenh_le = gia_le - gia_vip
-                else:
-                    chenh_lech = chenh_lech_total
-                if loai_gia == "vip":
-                    chenh_lech_final = chenh_lech
-                else:
-                    chenh_lech_final = chenh_lech_total
-                # Kiểm tra xem có cho phép xuất dư không
-                if item.get("allow_over_export"):
-                    # Tính số lượng thực tế có thể xuất từ hóa đơn (bao gồm cả loại giá phụ)
-                    try:
-                        conn2 = ket_noi()
-                        c2 = conn2.cursor()
-
-                        # QUAN TRỌNG: sl_xuat_hoadon đã TRỪ ĐI phần xuất từ đầu kỳ rồi
-                        # Nên chỉ cần xuất TỐI ĐA là sl_xuat_hoadon, không được vượt quá!
-
-                        # Tính số lượng thực tế cần xuất từ loại giá chính
-                        # (phần còn lại sau khi đã trừ từ loại giá phụ nếu có)
-                        sl_can_xuat_chinh = sl_xuat_hoadon
-                        if loai_gia_phu and so_luong_phu > 0:
-                            sl_can_xuat_chinh -= so_luong_phu
-                        if loai_gia_phu2 and so_luong_phu2 > 0:
-                            sl_can_xuat_chinh -= so_luong_phu2
-
-                        # Đảm bảo không âm
-                        sl_can_xuat_chinh = max(0, sl_can_xuat_chinh)
-
-                        # Số lượng hóa đơn còn lại có thể xuất theo loại giá chính
-                        c2.execute(
-                            """
-                            SELECT COALESCE(SUM(c.so_luong), 0) FROM ChiTietHoaDon c
-                            JOIN SanPham s ON c.sanpham_id = s.id
-                            WHERE s.ten=? AND c.loai_gia=? AND c.xuat_hoa_don=0
-                            """,
-                            (ten, loai_gia),
-                        )
-                        sl_hd_chinh_total = c2.fetchone()[0] or 0
-                        # Giới hạn số lượng xuất từ loại giá chính
-                        sl_hd_chinh = min(sl_can_xuat_chinh, sl_hd_chinh_total)
-
-                        # Số lượng từ loại giá phụ (nếu có)
-                        sl_hd_phu = 0
-                        if loai_gia_phu and so_luong_phu > 0:
-                            c2.execute(
-                                """
-                                SELECT COALESCE(SUM(c.so_luong), 0) FROM ChiTietHoaDon c
-                                JOIN SanPham s ON c.sanpham_id = s.id
-                                WHERE s.ten=? AND c.loai_gia=? AND c.xuat_hoa_don=0
-                                """,
-                                (ten, loai_gia_phu),
-                            )
-                            sl_hd_phu_total = c2.fetchone()[0] or 0
-                            sl_hd_phu = min(so_luong_phu, sl_hd_phu_total)
-
-                        # Số lượng từ loại giá phụ 2 (nếu có)
-                        sl_hd_phu2 = 0
-                        if loai_gia_phu2 and so_luong_phu2 > 0:
-                            c2.execute(
-                                """
-                                SELECT COALESCE(SUM(c.so_luong), 0) FROM ChiTietHoaDon c
-                                JOIN SanPham s ON c.sanpham_id = s.id
-                                WHERE s.ten=? AND c.loai_gia=? AND c.xuat_hoa_don=0
-                                """,
-                                (ten, loai_gia_phu2),
-                            )
-                            sl_hd_phu2_total = c2.fetchone()[0] or 0
-                            sl_hd_phu2 = min(so_luong_phu2, sl_hd_phu2_total)
-
-                        conn2.close()
-
-                        # Tổng số lượng có thể xuất từ hóa đơn
-                        sl_co_the_xuat = sl_hd_chinh + sl_hd_phu + sl_hd_phu2
-
-                        # Debug log
-                        print(f"DEBUG XUẤT DƯ - {ten}:")
-                        print(
-                            f"  - sl_xuat_hoadon (sau khi trừ đầu kỳ): {sl_xuat_hoadon}"
-                        )
-                        print(f"  - sl_can_xuat_chinh: {sl_can_xuat_chinh}")
-                        print(
-                            f"  - sl_hd_chinh ({loai_gia}): {sl_hd_chinh} / {sl_hd_chinh_total}"
-                        )
-                        print(f"  - sl_hd_phu ({loai_gia_phu}): {sl_hd_phu}")
-                        print(f"  - sl_hd_phu2 ({loai_gia_phu2}): {sl_hd_phu2}")
-                        print(f"  - sl_co_the_xuat (TONG THUC TE): {sl_co_the_xuat}")
-
-                        # Tính phần dư
-                        du = sl_xuat_hoadon - sl_co_the_xuat
-                        print(f"  - du (SO AM CAN TAO): {du}")
-
-                        # Xuất phần có từ hóa đơn
-                        # QUAN TRỌNG: xuat_bo_san_pham_theo_ten ĐÃ TỰ ĐỘNG XỬ LÝ loai_gia_phu!
-                        # Không được gọi nhiều lần riêng biệt, sẽ bị xuất trùng!
-                        if sl_co_the_xuat > 0:
-                            # Gọi MỘT LẦN với số lượng THỰC TẾ có thể xuất (không phải tổng yêu cầu)
-                            ok, m2 = xuat_bo_san_pham_theo_ten(
-                                ten,
-                                loai_gia,
-                                sl_co_the_xuat,  # CHỈ XUẤT PHẦN CÓ SẴN (đã tính cả phụ)
-                                self.user_id,
-                                chenh_lech_final,
-                                loai_gia_phu if sl_hd_phu > 0 else None,
-                                sl_hd_phu if sl_hd_phu > 0 else 0,
-                                loai_gia_phu2 if sl_hd_phu2 > 0 else None,
-                                sl_hd_phu2 if sl_hd_phu2 > 0 else 0,
-                            )
-                            if not ok:
-                                errors.append(f"{ten}: {m2}")
-                                continue
-
-                        # Phần dư đã được tính ở trên: du = sl_xuat_hoadon - sl_co_the_xuat
-                        # Nếu du > 0 nghĩa là xuất vượt quá số có sẵn → tạo XuatDu tracking
-                        if du > 0:
-                            # Tạo bản ghi XuatDu cho loại giá chính
-                            conn3 = ket_noi()
-                            c3 = conn3.cursor()
-                            try:
-                                c3.execute("SELECT id FROM SanPham WHERE ten=?", (ten,))
-                                row3 = c3.fetchone()
-                                if row3:
-                                    sp_id3 = row3[0]
-                                    from datetime import datetime
-
-                                    ngay3 = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                                    # INSERT vào bảng XuatDu
-                                    c3.execute(
-                                        """
-                                        INSERT INTO XuatDu (user_id, sanpham_id, ten_sanpham, so_luong, loai_gia, ngay)
-                                        VALUES (?, ?, ?, ?, ?, ?)
-                                        """,
-                                        (
-                                            self.user_id,
-                                            sp_id3,
-                                            ten,
-                                            du,
-                                            loai_gia,
-                                            ngay3,
-                                        ),
-                                    )
-
-                                    # Log phần dư vào LogKho
-                                    c3.execute(
-                                        "INSERT INTO LogKho (sanpham_id, user_id, ngay, hanh_dong, so_luong, ton_truoc, ton_sau, gia_ap_dung, chenh_lech_cong_doan, loai_gia) VALUES (?, ?, ?, 'xuatbo', ?, 0, 0, 0, ?, ?)",
-                                        (
-                                            sp_id3,
-                                            self.user_id,
-                                            ngay3,
-                                            du,
-                                            chenh_lech_final,
-                                            loai_gia,
-                                        ),
-                                    )
-
-                                    # Trừ số dư phần chênh lệch cho phần dư
-                                    c3.execute(
-                                        "UPDATE Users SET so_du = so_du - ? WHERE id = ?",
-                                        (du * chenh_lech_final, self.user_id),
-                                    )
-
-                                    conn3.commit()
-                                    print(
-                                        f"XUAT_DU: Tạo {du} xuất dư {loai_gia} cho {ten}"
-                                    )
-                                conn3.close()
-                            except Exception as e3:
-                                try:
-                                    conn3.rollback()
-                                    conn3.close()
-                                except Exception:
-                                    pass
-                                errors.append(f"{ten}: Lỗi khi ghi log xuất dư: {e3}")
-                    except Exception as e2:
-                        errors.append(f"{ten}: Lỗi khi xử lý xuất dư: {e2}")
-                else:
-                    # Xuất bình thường, không cho phép xuất dư
-                    success, msg = xuat_bo_san_pham_theo_ten(
-                        ten,
-                        loai_gia,
-                        sl_xuat_hoadon,
-                        self.user_id,
-                        chenh_lech_final,
-                        loai_gia_phu,
-                        so_luong_phu,
-                        loai_gia_phu2,
-                        so_luong_phu2,
-                    )
-                    if not success:
-                        errors.append(f"{ten}: {msg}")
-        conn.close()
-
-        if errors:
-            show_error(self, "Lỗi", "\n".join(errors))
-        else:
-            show_success(self, "Xuất bổ thành công")
-
-        # Làm mới
-        self.load_xuatbo()
-        self.xuat_bo_table.setRowCount(0)
-        for _ in range(5):
-            self.them_dong_xuat_bo()
-
-    def get_sl_from_table(self, loai_gia, ten_sp):
-        """Lấy số lượng từ bảng 'Chưa xuất' tương ứng"""
-        if loai_gia == "vip":
-            table = self.tbl_xuatbo_vip
-        elif loai_gia == "buon":
-            table = self.tbl_xuatbo_buon
-        else:  # le
-            table = self.tbl_xuatbo_le
-
-        for row in range(table.rowCount()):
-            ten_item = table.item(row, 0)
-            if ten_item and ten_item.text() == ten_sp:
-                sl_item = table.item(row, 1)
-                if sl_item:
-                    try:
-                        return float(sl_item.text())
-                    except:
-                        return 0
-        return 0
-
-    def get_sl_xuatdu_from_table(self, loai_gia, ten_sp):
-        """Lấy số lượng từ bảng 'Xuất dư' tương ứng"""
-        if loai_gia == "vip":
-            table = self.tbl_xuatdu_vip
-        elif loai_gia == "buon":
-            table = self.tbl_xuatdu_buon
-        else:  # le
-            table = self.tbl_xuatdu_le
-
-        for row in range(table.rowCount()):
-            ten_item = table.item(row, 0)
-            if ten_item and ten_item.text() == ten_sp:
-                sl_item = table.item(row, 1)
-                if sl_item:
-                    try:
-                        return float(sl_item.text())
-                    except:
-                        return 0
-        return 0
-
-    def init_tab_cong_doan(self):
-        layout = QVBoxLayout()
-
-        # Lọc theo ngày và username
-        filter_layout = QHBoxLayout()
-
-        filter_layout.addWidget(QLabel("User:"))
-        self.cd_user_combo = QComboBox()
-        self.cd_user_combo.addItem("Tất cả", None)
-        from users import lay_tat_ca_user
-
-        try:
-            for uid, uname, role, so_du in lay_tat_ca_user():
-                self.cd_user_combo.addItem(f"{uname} (ID: {uid})", uid)
-        except Exception:
-            pass
-        filter_layout.addWidget(self.cd_user_combo)
-
-        filter_layout.addWidget(QLabel("Từ ngày:"))
-        self.tu_ngay_edit = QDateEdit()
-        self.tu_ngay_edit.setCalendarPopup(True)
-        self.tu_ngay_edit.setDate(QDate.currentDate().addMonths(-1))
-        filter_layout.addWidget(self.tu_ngay_edit)
-
-        filter_layout.addWidget(QLabel("Đến ngày:"))
-        self.den_ngay_edit = QDateEdit()
-        self.den_ngay_edit.setCalendarPopup(True)
-        self.den_ngay_edit.setDate(QDate.currentDate())
-        filter_layout.addWidget(self.den_ngay_edit)
-
-        btn_load_cd = QPushButton("Tải báo cáo")
-        btn_load_cd.clicked.connect(self.load_bao_cao_cong_doan)
-        filter_layout.addWidget(btn_load_cd)
-
-        layout.addLayout(filter_layout)
-
-        # Bảng công đoàn với TreeWidget để hiển thị phân cấp
-        from PyQt5.QtWidgets import QTreeWidget, QTreeWidgetItem
-        from PyQt5.QtCore import Qt
-
-        self.tree_cong_doan = QTreeWidget()
-        self.tree_cong_doan.setColumnCount(7)
-        self.tree_cong_doan.setHeaderLabels(
-            [
-                "User/Chi tiết",
-                "Ngày",
-                "Sản phẩm",
-                "Số lượng",
-                "Tổng giá bán",
-                "Tổng giá xuất",
-                "Chênh lệch",
-            ]
-        )
-        self.tree_cong_doan.setAlternatingRowColors(True)
-        for i in range(7):
-            self.tree_cong_doan.resizeColumnToContents(i)
-        layout.addWidget(self.tree_cong_doan)
-
-        # Tổng tiền chênh lệch
-        self.lbl_tong_cd = QLabel("Tổng chênh lệch: 0")
-        layout.addWidget(self.lbl_tong_cd)
+        # Tổng tiền chênh lệch
+        self.lbl_tong_cd = QLabel("Tổng chênh lệch: 0")
+        layout.addWidget(self.lbl_tong_cd)
 
         # Các nút
         btn_layout = QHBoxLayout()
@@ -6999,129 +5951,90 @@ class MainWindow(QWidget):
         layout.addLayout(btn_layout)
 
         self.tab_cong_doan.setLayout(layout)
+        # Báo cáo chỉ tải khi bấm nút; đã tải thì làm mới sau mỗi lần xuất bổ
+        self.bo_lam_moi.dang_ky(
+            self.tab_cong_doan,
+            (HoaDonDaSua,),
+            lambda _: self.tree_cong_doan.topLevelItemCount()
+            and self.load_bao_cao_cong_doan(),
+        )
 
     def load_bao_cao_cong_doan(self):
         """Load báo cáo công đoàn từ bảng ChenhLechXuatBo - hiển thị theo nhóm xuất bổ"""
+        if not self.tab_da_tao("tab_cong_doan"):
+            return
         from PyQt5.QtWidgets import QTreeWidgetItem
 
         tu_ngay = self.tu_ngay_edit.date().toString("yyyy-MM-dd")
         den_ngay = self.den_ngay_edit.date().toString("yyyy-MM-dd")
         user_id = self.cd_user_combo.currentData()
+        nhom_theo = self.cd_nhom_combo.currentData()
 
         try:
-            conn = ket_noi()
-            c = conn.cursor()
-
-            base_sql = """
-                SELECT 
-                    u.username,
-                    cl.user_id,
-                    datetime(cl.ngay) as ngay_xuat,
-                    cl.ten_sanpham,
-                    cl.loai_gia_xuat,
-                    cl.loai_gia_nguon,
-                    COALESCE(cl.is_gia_moi, 0) as is_gia_moi,
-                    COALESCE(cl.gia_ban, 0) as gia_ban,
-                    COALESCE(cl.gia_xuat, 0) as gia_xuat,
-                    COALESCE(cl.so_luong, 0) as so_luong,
-                    (COALESCE(cl.gia_ban, 0) * COALESCE(cl.so_luong, 0)) as tong_gia_ban,
-                    (COALESCE(cl.gia_xuat, 0) * COALESCE(cl.so_luong, 0)) as tong_gia_xuat,
-                    COALESCE(cl.chenh_lech, 0) as chenh_lech
-                FROM ChenhLechXuatBo cl
-                JOIN Users u ON cl.user_id = u.id
-                WHERE date(cl.ngay) >= ? AND date(cl.ngay) <= ?
-            """
-            params = [tu_ngay, den_ngay]
-
-            if user_id is not None:
-                base_sql += " AND cl.user_id = ?"
-                params.append(user_id)
-
-            base_sql += """
-                ORDER BY cl.ngay DESC, u.username, cl.ten_sanpham, cl.loai_gia_nguon, COALESCE(cl.is_gia_moi,0)
-            """
-
-            c.execute(base_sql, params)
-            rows = c.fetchall()
+            bao_cao = bao_cao_chenh_lech_xuat_bo(tu_ngay, den_ngay, user_id, nhom_theo)
 
             self.tree_cong_doan.clear()
 
-            from collections import defaultdict
-
-            groups = defaultdict(list)
-            for r in rows:
-                # r = (username, user_id, ngay_xuat, ten_sp, loai_gia_xuat, loai_gia_nguon,
-                #      is_gia_moi, gia_ban, gia_xuat, so_luong, tong_gia_ban, tong_gia_xuat, chenh_lech)
-                # Index:  0         1        2          3       4              5
-                #         6           7        8         9         10            11              12
-                key = (
-                    r[0],
-                    r[2],
-                    r[3],
-                    r[4],
-                )  # username, ngay_xuat, ten_sp, loai_gia_xuat
-                groups[key].append(r)
-
-            tong_chenh_lech_tat_ca = 0
-            for key, details in groups.items():
-                username, ngay_xuat, ten_sp, loai_gia_xuat = key
-
-                # Tính tổng cho dòng cha từ các dòng con
-                tong_sl = sum(d[9] for d in details)  # d[9] = so_luong
-                tong_gia_ban = sum(d[10] for d in details)  # d[10] = tong_gia_ban
-                tong_gia_xuat = sum(d[11] for d in details)  # d[11] = tong_gia_xuat
-                tong_chenh_lech = sum(d[12] for d in details)  # d[12] = chenh_lech
-                tong_chenh_lech_tat_ca += tong_chenh_lech
-
-                parent = QTreeWidgetItem(self.tree_cong_doan)
-                parent.setText(0, username)
-                parent.setText(1, str(ngay_xuat))
-                parent.setText(2, ten_sp)
-                parent.setText(3, f"{int(tong_sl)}")
-                parent.setText(4, format_price(tong_gia_ban))
-                parent.setText(5, format_price(tong_gia_xuat))
-                parent.setText(6, format_price(tong_chenh_lech))
+            def to_dam(item):
                 for col in range(7):
-                    font = parent.font(col)
+                    font = item.font(col)
                     font.setBold(True)
-                    parent.setFont(col, font)
-
-                # Tạo dòng con
-                for detail in details:
-                    loai_gia_nguon = detail[5]
-                    is_gia_moi = int(detail[6]) if detail[6] is not None else 0
-                    gia_ban = detail[7]
-                    gia_xuat = detail[8]
-                    sl = detail[9]
-                    gia_ban_tong = detail[10]
-                    gia_xuat_tong = detail[11]
-                    chenh_lech = detail[12]
-
-                    child = QTreeWidgetItem(parent)
-                    nhan = (
-                        f"{loai_gia_nguon.upper()} {'MỚI' if is_gia_moi==1 else 'CŨ'}"
-                    )
-                    child.setText(0, nhan)
-                    child.setText(1, "")
-                    child.setText(2, "")
-                    child.setText(3, f"{int(sl)}")
-                    child.setText(
-                        4, f"{format_price(gia_ban)}/sp → {format_price(gia_ban_tong)}"
-                    )
-                    child.setText(
-                        5,
-                        f"{format_price(gia_xuat)}/sp → {format_price(gia_xuat_tong)}",
-                    )
-                    child.setText(6, format_price(chenh_lech))
+                    item.setFont(col, font)
+
+            parent = None
+            khoa_truoc = None
+            for d in bao_cao.dong:
+                if nhom_theo is not None:
+                    # Mỗi (nhóm, user) một dòng đã gom sẵn trong SQL
+                    item = QTreeWidgetItem(self.tree_cong_doan)
+                    item.setText(0, d.username)
+                    item.setText(1, str(d.nhom) if nhom_theo == NHOM_NGAY else "")
+                    item.setText(2, str(d.nhom) if nhom_theo == NHOM_SAN_PHAM else "")
+                    item.setText(3, f"{int(d.so_luong)}")
+                    item.setText(4, format_price(d.tong_gia_ban))
+                    item.setText(5, format_price(d.tong_gia_xuat))
+                    item.setText(6, format_price(d.chenh_lech))
+                    continue
 
-                parent.setExpanded(True)
+                # Dòng cha: một lần xuất bổ (user, thời điểm, sản phẩm, loại giá xuất)
+                khoa = (d.username, d.nhom, d.ten_sanpham, d.loai_gia_xuat)
+                if khoa != khoa_truoc:
+                    khoa_truoc = khoa
+                    parent = QTreeWidgetItem(self.tree_cong_doan)
+                    parent.setText(0, d.username)
+                    parent.setText(1, str(d.ngay))
+                    parent.setText(2, d.ten_sanpham)
+                    parent.setText(3, f"{int(d.nhom_so_luong)}")
+                    parent.setText(4, format_price(d.nhom_gia_ban))
+                    parent.setText(5, format_price(d.nhom_gia_xuat))
+                    parent.setText(6, format_price(d.nhom_chenh_lech))
+                    to_dam(parent)
+                    parent.setExpanded(True)
 
-            self.lbl_tong_cd.setText(
-                f"Tổng chênh lệch: {format_price(tong_chenh_lech_tat_ca)}"
-            )
+                child = QTreeWidgetItem(parent)
+                nhan = f"{(d.loai_gia_nguon or '').upper()} {'MỚI' if int(d.is_gia_moi or 0) == 1 else 'CŨ'}"
+                child.setText(0, nhan)
+                child.setText(1, "")
+                child.setText(2, "")
+                child.setText(3, f"{int(d.so_luong)}")
+                child.setText(
+                    4, f"{format_price(d.gia_ban)}/sp → {format_price(d.tong_gia_ban)}"
+                )
+                child.setText(
+                    5, f"{format_price(d.gia_xuat)}/sp → {format_price(d.tong_gia_xuat)}"
+                )
+                child.setText(6, format_price(d.chenh_lech))
+
+            # Tổng theo user (khi xem nhiều user) + tổng chung
+            text = f"Tổng chênh lệch: {format_price(bao_cao.tong)}"
+            if len(bao_cao.tong_theo_user) > 1:
+                text += " | " + "; ".join(
+                    f"{ten}: {format_price(tong)}"
+                    for ten, tong in sorted(bao_cao.tong_theo_user.items())
+                )
+            self.lbl_tong_cd.setText(text)
             for i in range(7):
                 self.tree_cong_doan.resizeColumnToContents(i)
-            conn.close()
         except Exception as e:
             show_error(self, "Lỗi", f"Lỗi tải báo cáo công đoàn: {e}")
 
@@ -7209,12 +6122,6 @@ class MainWindow(QWidget):
                 conn.close()
                 return
 
-            # Trừ tiền từ user hiện tại
-            c.execute(
-                "UPDATE Users SET so_du = so_du - ? WHERE id = ?",
-                (so_tien, self.user_id),
-            )
-
             # Ghi log vào GiaoDichQuy (không có user_nhan_id vì nhận bằng tay)
             thoi_gian = datetime.now().isoformat()
             ghi_chu_full = (
@@ -7227,12 +6134,22 @@ class MainWindow(QWidget):
                 (self.user_id, so_tien, thoi_gian, ghi_chu_full),
             )
 
+            # Trừ tiền từ user hiện tại, nguồn là giao dịch quỹ vừa ghi
+            cap_nhat_so_du(
+                c,
+                self.user_id,
+                -so_tien,
+                LY_DO_CONG_DOAN,
+                c.lastrowid,
+                ghi_chu_full,
+            )
+
             conn.commit()
+            event_bus.phat(SoDuThayDoi([self.user_id]))
             show_success(
                 self,
                 f"Đã chuyển {format_price(so_tien)} từ {current_user_name} cho {den_user_name}",
             )
-            self.load_so_quy()
         except Exception as e:
             conn.rollback()
             show_error(self, "Lỗi", f"Lỗi chuyển tiền: {e}")
@@ -7307,21 +6224,20 @@ class MainWindow(QWidget):
         </html>
         """
 
-        # In qua dialog
-        from PyQt5.QtPrintSupport import QPrinter, QPrintDialog
-        from PyQt5.QtWidgets import QTextEdit
-
+        # In qua dialog, vẽ ở luồng nền
         printer = QPrinter(QPrinter.HighResolution)
         dialog = QPrintDialog(printer, self)
 
         if dialog.exec_() == QPrintDialog.Accepted:
-            text_edit = QTextEdit()
-            text_edit.setHtml(html)
-            text_edit.print_(printer)
-            show_success(self, "Đã gửi báo cáo đến máy in")
+            in_html_nen(
+                html,
+                printer,
+                khi_xong=lambda _: show_success(self, "Đã gửi báo cáo đến máy in"),
+                khi_loi=lambda loi: show_error(self, "Lỗi", f"In báo cáo thất bại: {loi}"),
+            )
 
     def init_tab_so_quy(self):
-        """Khởi tạo tab Sổ quỹ với 2 tab con: Số dư và Lịch sử giao dịch"""
+        """Khởi tạo tab Sổ quỹ với các tab con: Số dư, Lịch sử giao dịch, Biến động số dư"""
         # Tạo tab con cho Sổ quỹ: "Số dư" và "Lịch sử giao dịch"
         parent_layout = QVBoxLayout()
         self.so_quy_tabs = QTabWidget()
@@ -7332,10 +6248,14 @@ class MainWindow(QWidget):
         sodu_layout = QVBoxLayout()
 
         # Bảng số dư
-        self.tbl_soquy = QTableWidget()
-        self.tbl_soquy.setColumnCount(4)
-        self.tbl_soquy.setHorizontalHeaderLabels(["ID", "Username", "Vai trò", "Số dư"])
-        self.setup_table(self.tbl_soquy)
+        self.tbl_soquy = BangDuLieu(
+            [
+                Cot("ID", 0),
+                Cot("Username", 1),
+                Cot("Vai trò", 2),
+                Cot("Số dư", 3, dinh_dang=format_price, can_le=Qt.AlignRight),
+            ]
+        )
         sodu_layout.addWidget(self.tbl_soquy)
 
         # Nút chuyển tiền
@@ -7343,6 +6263,9 @@ class MainWindow(QWidget):
         btn_chuyen_tien = QPushButton("Chuyển tiền")
         btn_chuyen_tien.clicked.connect(self.chuyen_tien_click)
         btn_layout_quy.addWidget(btn_chuyen_tien)
+        btn_chuyen_nhieu = QPushButton("Chuyển tiền nhiều người (chốt ca)")
+        btn_chuyen_nhieu.clicked.connect(self.chuyen_tien_nhieu_click)
+        btn_layout_quy.addWidget(btn_chuyen_nhieu)
         sodu_layout.addLayout(btn_layout_quy)
 
         self.tab_so_quy_sodu.setLayout(sodu_layout)
@@ -7380,10 +6303,11 @@ class MainWindow(QWidget):
         self.ls_den.setDate(QDate.currentDate())
         fl.addWidget(self.ls_den)
 
-        # Tự động tải khi thay đổi filter
-        self.ls_user_combo.currentIndexChanged.connect(self.load_lich_su_quy)
-        self.ls_tu.dateChanged.connect(self.load_lich_su_quy)
-        self.ls_den.dateChanged.connect(self.load_lich_su_quy)
+        # Tự động tải (từ trang đầu) khi thay đổi filter
+        self.ls_trang = 0
+        self.ls_user_combo.currentIndexChanged.connect(self.loc_lich_su_quy)
+        self.ls_tu.dateChanged.connect(self.loc_lich_su_quy)
+        self.ls_den.dateChanged.connect(self.loc_lich_su_quy)
 
         ls_layout.addLayout(fl)
 
@@ -7396,40 +6320,206 @@ class MainWindow(QWidget):
         self.setup_table(self.tbl_ls_quy)
         ls_layout.addWidget(self.tbl_ls_quy)
 
+        # Phân trang
+        page_layout = QHBoxLayout()
+        btn_ls_truoc = QPushButton("◀ Trang trước")
+        btn_ls_truoc.clicked.connect(lambda: self.chuyen_trang_lich_su_quy(-1))
+        page_layout.addWidget(btn_ls_truoc)
+        self.lbl_ls_trang = QLabel("Trang 1/1")
+        page_layout.addWidget(self.lbl_ls_trang)
+        btn_ls_sau = QPushButton("Trang sau ▶")
+        btn_ls_sau.clicked.connect(lambda: self.chuyen_trang_lich_su_quy(1))
+        page_layout.addWidget(btn_ls_sau)
+        page_layout.addStretch()
+        ls_layout.addLayout(page_layout)
+
         self.tab_so_quy_ls.setLayout(ls_layout)
         self.so_quy_tabs.addTab(self.tab_so_quy_ls, "Lịch sử giao dịch")
 
+        # Tab con: Biến động số dư (sổ cái, theo trang và khoảng ngày)
+        self.tab_so_quy_socai = QWidget()
+        socai_layout = QVBoxLayout()
+        fl_sc = QHBoxLayout()
+        self.sc_user_combo = QComboBox()
+        self.sc_user_combo.addItem("Tất cả", None)
+        for i in range(1, self.ls_user_combo.count()):
+            self.sc_user_combo.addItem(
+                self.ls_user_combo.itemText(i), self.ls_user_combo.itemData(i)
+            )
+        fl_sc.addWidget(QLabel("User:"))
+        fl_sc.addWidget(self.sc_user_combo)
+        fl_sc.addStretch()
+        fl_sc.addWidget(QLabel("Từ ngày:"))
+        self.sc_tu = QDateEdit()
+        self.sc_tu.setCalendarPopup(True)
+        self.sc_tu.setDate(QDate.currentDate().addMonths(-1))
+        fl_sc.addWidget(self.sc_tu)
+        fl_sc.addWidget(QLabel("Đến ngày:"))
+        self.sc_den = QDateEdit()
+        self.sc_den.setCalendarPopup(True)
+        self.sc_den.setDate(QDate.currentDate())
+        fl_sc.addWidget(self.sc_den)
+        socai_layout.addLayout(fl_sc)
+
+        self.lbl_sc_so_du = QLabel("")
+        socai_layout.addWidget(self.lbl_sc_so_du)
+
+        self.tbl_socai = QTableWidget()
+        self.tbl_socai.setColumnCount(6)
+        self.tbl_socai.setHorizontalHeaderLabels(
+            ["Thời gian", "User", "Lý do", "Số tiền", "Số dư sau", "Ghi chú"]
+        )
+        self.setup_table(self.tbl_socai)
+        socai_layout.addWidget(self.tbl_socai)
+
+        sc_page_layout = QHBoxLayout()
+        btn_sc_truoc = QPushButton("◀ Trang trước")
+        btn_sc_truoc.clicked.connect(lambda: self.chuyen_trang_so_cai(-1))
+        sc_page_layout.addWidget(btn_sc_truoc)
+        self.lbl_sc_trang = QLabel("Trang 1/1")
+        sc_page_layout.addWidget(self.lbl_sc_trang)
+        btn_sc_sau = QPushButton("Trang sau ▶")
+        btn_sc_sau.clicked.connect(lambda: self.chuyen_trang_so_cai(1))
+        sc_page_layout.addWidget(btn_sc_sau)
+        sc_page_layout.addStretch()
+        socai_layout.addLayout(sc_page_layout)
+
+        self.sc_trang = 0
+        self.sc_user_combo.currentIndexChanged.connect(self.loc_so_cai)
+        self.sc_tu.dateChanged.connect(self.loc_so_cai)
+        self.sc_den.dateChanged.connect(self.loc_so_cai)
+
+        self.tab_so_quy_socai.setLayout(socai_layout)
+        self.so_quy_tabs.addTab(self.tab_so_quy_socai, "Biến động số dư")
+
         self.tab_so_quy.setLayout(parent_layout)
         # Nạp dữ liệu mặc định
         self.load_so_quy()
         self.load_lich_su_quy()
+        self.load_so_cai()
+
+        # Mỗi tab con chỉ làm mới khi đang mở
+        self.bo_lam_moi.dang_ky(
+            self.tab_so_quy_sodu,
+            (SoDuThayDoi,),
+            lambda cac_su_kien: self.lam_moi_dong_so_quy(
+                hop_ids(cac_su_kien, "user_ids")
+            ),
+        )
+        self.bo_lam_moi.dang_ky(
+            self.tab_so_quy_ls, (SoDuThayDoi,), lambda _: self.load_lich_su_quy()
+        )
+        self.bo_lam_moi.dang_ky(
+            self.tab_so_quy_socai, (SoDuThayDoi,), lambda _: self.load_so_cai()
+        )
+
+    # Số dòng mỗi trang của lịch sử quỹ / sổ cái
+    SO_QUY_PAGE_SIZE = 200
+
+    def loc_lich_su_quy(self):
+        """Filter thay đổi: quay về trang đầu rồi tải lại"""
+        self.ls_trang = 0
+        self.load_lich_su_quy()
+
+    def chuyen_trang_lich_su_quy(self, buoc):
+        self.ls_trang = max(0, self.ls_trang + buoc)
+        self.load_lich_su_quy()
+
+    def loc_so_cai(self):
+        self.sc_trang = 0
+        self.load_so_cai()
+
+    def chuyen_trang_so_cai(self, buoc):
+        self.sc_trang = max(0, self.sc_trang + buoc)
+        self.load_so_cai()
+
+    def load_so_cai(self):
+        """Tải biến động số dư từ sổ cái theo trang và khoảng ngày"""
+        if not self.tab_da_tao("tab_so_quy"):
+            return
+        uid = self.sc_user_combo.currentData()
+        tu = self.sc_tu.date().toString("yyyy-MM-dd")
+        den = self.sc_den.date().toString("yyyy-MM-dd")
+        try:
+            tong_dong, tong_tien = dem_bien_dong_so_du(uid, tu, den)
+            so_trang = max(1, -(-tong_dong // self.SO_QUY_PAGE_SIZE))
+            self.sc_trang = min(self.sc_trang, so_trang - 1)
+            rows = bien_dong_so_du(
+                uid,
+                tu,
+                den,
+                limit=self.SO_QUY_PAGE_SIZE,
+                offset=self.sc_trang * self.SO_QUY_PAGE_SIZE,
+            )
+        except Exception as e:
+            show_error(self, "Lỗi", f"Lỗi tải sổ cái số dư: {e}")
+            return
+
+        self.lbl_sc_trang.setText(f"Trang {self.sc_trang + 1}/{so_trang}")
+        if uid is not None:
+            # Số dư đầu/cuối kỳ: tra theo index, không cộng dồn toàn bộ lịch sử
+            dau_ky = so_du_tai_thoi_diem(uid, f"{tu} 00:00:00")
+            cuoi_ky = so_du_tai_thoi_diem(uid, den)
+            self.lbl_sc_so_du.setText(
+                f"Số dư đầu kỳ: {format_price(dau_ky)}   |   "
+                f"Biến động: {format_price(tong_tien)}   |   "
+                f"Số dư cuối kỳ: {format_price(cuoi_ky)}"
+            )
+        else:
+            self.lbl_sc_so_du.setText(f"Tổng biến động: {format_price(tong_tien)}")
+
+        self.tbl_socai.setRowCount(len(rows))
+        for i, r in enumerate(rows):
+            # r = (id, ngay, user_id, username, so_tien, so_du_sau, ly_do, nguon_id, ghi_chu)
+            self.tbl_socai.setItem(i, 0, QTableWidgetItem(str(r[1] or "")))
+            self.tbl_socai.setItem(i, 1, QTableWidgetItem(str(r[3] or "")))
+            self.tbl_socai.setItem(
+                i, 2, QTableWidgetItem(LY_DO_HIEN_THI.get(r[6], str(r[6] or "")))
+            )
+            self.tbl_socai.setItem(i, 3, QTableWidgetItem(format_price(r[4] or 0)))
+            self.tbl_socai.setItem(i, 4, QTableWidgetItem(format_price(r[5] or 0)))
+            self.tbl_socai.setItem(i, 5, QTableWidgetItem(str(r[8] or "")))
 
     def load_lich_su_quy(self):
+        if not self.tab_da_tao("tab_so_quy"):
+            return
         # Đọc filter
         uid = self.ls_user_combo.currentData()
         tu = self.ls_tu.date().toString("yyyy-MM-dd")
         den = self.ls_den.date().toString("yyyy-MM-dd")
-        # Query DB
+        # Query DB: so sánh khoảng trên g.ngay (dùng index) và chỉ lấy một trang;
+        # khoảng ngày chạm năm đã lưu trữ thì đọc qua view gộp *_TatCa
         try:
-            conn = ket_noi()
-            c = conn.cursor()
-            base_sql = (
-                "SELECT g.id, u.username AS tu_user, un.username AS den_user, "
-                "g.so_tien, g.ngay, COALESCE(g.ghi_chu, '') AS ghi_chu, "
-                "COALESCE(h.ngay, '') AS ca_ngay, g.hoadon_id "
-                "FROM GiaoDichQuy g "
-                "LEFT JOIN Users u ON g.user_id = u.id "
-                "LEFT JOIN Users un ON g.user_nhan_id = un.id "
-                "LEFT JOIN HoaDon h ON g.hoadon_id = h.id "
-                "WHERE date(g.ngay) >= ? AND date(g.ngay) <= ?"
-            )
-            params = [tu, den]
-            if uid is not None:
-                base_sql += " AND (g.user_id = ? OR g.user_nhan_id = ?)"
-                params += [uid, uid]
-            base_sql += " ORDER BY g.ngay DESC, g.id DESC"
-            c.execute(base_sql, params)
-            rows = c.fetchall()
+            with ket_noi_theo_khoang(tu, den) as (conn, c, hau_to):
+                where_sql = " WHERE g.ngay >= ? AND g.ngay < date(?, '+1 day')"
+                params = [tu, den]
+                if uid is not None:
+                    where_sql += " AND (g.user_id = ? OR g.user_nhan_id = ?)"
+                    params += [uid, uid]
+                c.execute(
+                    f"SELECT COUNT(*) FROM GiaoDichQuy{hau_to} g" + where_sql, params
+                )
+                tong_dong = c.fetchone()[0]
+                so_trang = max(1, -(-tong_dong // self.SO_QUY_PAGE_SIZE))
+                self.ls_trang = min(self.ls_trang, so_trang - 1)
+                self.lbl_ls_trang.setText(f"Trang {self.ls_trang + 1}/{so_trang}")
+
+                base_sql = (
+                    "SELECT g.id, u.username AS tu_user, un.username AS den_user, "
+                    "g.so_tien, g.ngay, COALESCE(g.ghi_chu, '') AS ghi_chu, "
+                    "COALESCE(h.ngay, '') AS ca_ngay, g.hoadon_id "
+                    f"FROM GiaoDichQuy{hau_to} g "
+                    "LEFT JOIN Users u ON g.user_id = u.id "
+                    "LEFT JOIN Users un ON g.user_nhan_id = un.id "
+                    f"LEFT JOIN HoaDon{hau_to} h ON g.hoadon_id = h.id" + where_sql
+                )
+                base_sql += " ORDER BY g.ngay DESC, g.id DESC LIMIT ? OFFSET ?"
+                params += [
+                    self.SO_QUY_PAGE_SIZE,
+                    self.ls_trang * self.SO_QUY_PAGE_SIZE,
+                ]
+                c.execute(base_sql, params)
+                rows = c.fetchall()
             self.tbl_ls_quy.setRowCount(len(rows))
             for i, r in enumerate(rows):
                 # r = (id, tu_user, den_user, so_tien, ngay_nop_tien, ghi_chu, ca_ngay, hoadon_id)
@@ -7469,20 +6559,21 @@ class MainWindow(QWidget):
                 self.tbl_ls_quy.setItem(i, 5, QTableWidgetItem(str(r[5] or "")))
         except Exception as e:
             show_error(self, "Lỗi", f"Lỗi tải lịch sử quỹ: {e}")
-        finally:
-            try:
-                conn.close()
-            except Exception:
-                pass
 
     def load_so_quy(self):
-        users = lay_tat_ca_user()
-        self.tbl_soquy.setRowCount(len(users))
-        for row_idx, user in enumerate(users):
-            for col_idx, val in enumerate(user):
-                if col_idx == 3:
-                    val = format_price(val)
-                self.tbl_soquy.setItem(row_idx, col_idx, QTableWidgetItem(str(val)))
+        if not self.tab_da_tao("tab_so_quy"):
+            return
+        self.tbl_soquy.dat_du_lieu(lay_tat_ca_user())
+
+    def lam_moi_dong_so_quy(self, user_ids):
+        """Cập nhật số dư của các user vừa đổi (None = nạp lại cả bảng)."""
+        if user_ids is None:
+            self.load_so_quy()
+        elif user_ids and self.tab_da_tao("tab_so_quy"):
+            # Sự kiện phát sau commit; danh bạ user tự nạp lại số dư theo data_version
+            self.tbl_soquy.cap_nhat_theo_khoa(
+                user_ids, [u for u in lay_tat_ca_user() if u[0] in user_ids]
+            )
 
     def chuyen_tien_click(self):
         dialog = QDialog(self)
@@ -7547,12 +6638,135 @@ class MainWindow(QWidget):
         )
         layout.addWidget(btn_confirm)
         btn_print = QPushButton("In phiếu")
-        btn_print.clicked.connect(self.in_phieu_chuyen)
+        btn_print.clicked.connect(
+            lambda: self.in_phieu_chuyen(
+                current_username,
+                den_user_combo.currentText(),
+                so_tien_edit.text(),
+                noi_dung_edit.text(),
+            )
+        )
         layout.addWidget(btn_print)
 
         dialog.setLayout(layout)
         dialog.exec_()
 
+    def chuyen_tien_nhieu_click(self):
+        """Form chuyển tiền nhiều dòng: ghi tất cả trong một transaction"""
+        users = lay_tat_ca_user()
+        if not users:
+            show_error(self, "Lỗi", "Không tải được danh sách user")
+            return
+
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Chuyển tiền nhiều người (chốt ca)")
+        dialog.resize(800, 450)
+        layout = QVBoxLayout()
+
+        tbl = QTableWidget()
+        tbl.setColumnCount(5)
+        tbl.setHorizontalHeaderLabels(
+            ["Từ user", "Số dư", "Đến user", "Số tiền", "Nội dung"]
+        )
+        self.setup_table(tbl)
+        layout.addWidget(tbl)
+
+        so_du_map = {u[0]: u[3] for u in users}
+
+        def them_dong(tu_id=None):
+            row = tbl.rowCount()
+            tbl.insertRow(row)
+            tu_combo = QComboBox()
+            den_combo = QComboBox()
+            for u in users:
+                tu_combo.addItem(u[1], u[0])
+                den_combo.addItem(u[1], u[0])
+            if tu_id is not None:
+                tu_combo.setCurrentIndex(max(0, tu_combo.findData(tu_id)))
+            # Mặc định nộp về user đang đăng nhập (kế toán)
+            den_combo.setCurrentIndex(max(0, den_combo.findData(self.user_id)))
+            lbl_so_du = QTableWidgetItem(
+                format_price(so_du_map.get(tu_combo.currentData(), 0))
+            )
+            lbl_so_du.setFlags(Qt.ItemIsEnabled)
+            tbl.setItem(row, 1, lbl_so_du)
+            so_tien_spin = QDoubleSpinBox()
+            so_tien_spin.setMaximum(1e12)
+            so_tien_spin.setDecimals(0)
+            so_tien_spin.setValue(max(0, so_du_map.get(tu_combo.currentData(), 0)))
+
+            def on_tu_changed(_idx, combo=tu_combo, item=lbl_so_du):
+                item.setText(format_price(so_du_map.get(combo.currentData(), 0)))
+
+            tu_combo.currentIndexChanged.connect(on_tu_changed)
+            tbl.setCellWidget(row, 0, tu_combo)
+            tbl.setCellWidget(row, 2, den_combo)
+            tbl.setCellWidget(row, 3, so_tien_spin)
+            tbl.setItem(row, 4, QTableWidgetItem("Chốt ca"))
+
+        # Điền sẵn các user (trừ mình) đang có số dư dương
+        for u in users:
+            if u[0] != self.user_id and (u[3] or 0) > 0:
+                them_dong(u[0])
+        if tbl.rowCount() == 0:
+            them_dong()
+
+        btn_layout = QHBoxLayout()
+        btn_them = QPushButton("Thêm dòng")
+        btn_them.clicked.connect(lambda: them_dong())
+        btn_layout.addWidget(btn_them)
+        btn_xoa = QPushButton("Xóa dòng")
+        btn_xoa.clicked.connect(
+            lambda: tbl.removeRow(tbl.currentRow()) if tbl.currentRow() >= 0 else None
+        )
+        btn_layout.addWidget(btn_xoa)
+        btn_layout.addStretch()
+        btn_ok = QPushButton("Xác nhận chuyển tất cả")
+        btn_ok.clicked.connect(dialog.accept)
+        btn_layout.addWidget(btn_ok)
+        btn_huy = QPushButton("Hủy")
+        btn_huy.clicked.connect(dialog.reject)
+        btn_layout.addWidget(btn_huy)
+        layout.addLayout(btn_layout)
+        dialog.setLayout(layout)
+
+        if dialog.exec_() != QDialog.Accepted:
+            return
+
+        giao_dich = []
+        for row in range(tbl.rowCount()):
+            so_tien = tbl.cellWidget(row, 3).value()
+            if so_tien <= 0:
+                continue
+            noi_dung_item = tbl.item(row, 4)
+            giao_dich.append(
+                (
+                    tbl.cellWidget(row, 0).currentData(),
+                    tbl.cellWidget(row, 2).currentData(),
+                    so_tien,
+                    noi_dung_item.text().strip() if noi_dung_item else "",
+                    None,
+                )
+            )
+        if not giao_dich:
+            show_info(self, "Thông báo", "Không có dòng nào có số tiền > 0")
+            return
+
+        tong = sum(g[2] for g in giao_dich)
+        if not show_confirmation(
+            self,
+            f"Chuyển {len(giao_dich)} giao dịch, tổng {format_price(tong)}?",
+        ):
+            return
+
+        success, result = chuyen_tien_nhieu(giao_dich)
+        if not success:
+            show_error(self, "Lỗi", f"Không chuyển được, chưa ghi giao dịch nào:\n{result}")
+            return
+
+        # Sổ quỹ làm mới một lần cho cả lô (chuyen_tien_nhieu phát một sự kiện)
+        show_success(self, f"Đã chuyển {len(giao_dich)} giao dịch trong một lần ghi")
+
     def update_tong_to_tien(self):
         tong = sum(spin.value() * mg for spin, mg in self.to_tien_spins)
         self.lbl_tong_to.setText(f"Tổng từ tờ: {format_price(tong)}")
@@ -7587,22 +6801,41 @@ class MainWindow(QWidget):
                         self,
                         f"Chuyển tiền thành công\nNội dung: {noi_dung}",
                     )
-                    self.load_so_quy()  # Tự động làm mới số dư
-                    self.load_lich_su_quy()  # Tự động làm mới lịch sử
                     dialog.close()
                 else:
                     show_error(self, "Lỗi", msg)
         except Exception as e:
             show_error(self, "Lỗi", f"Dữ liệu không hợp lệ: {e}")
 
-    def in_phieu_chuyen(self):
-        printer = QPrinter()
+    def in_phieu_chuyen(self, tu_user, den_user, so_tien, noi_dung):
+        """In phiếu chuyển tiền theo nội dung đang nhập (vẽ ở luồng nền)"""
+        printer = QPrinter(QPrinter.HighResolution)
         dialog = QPrintDialog(printer, self)
         if dialog.exec_() != QPrintDialog.Accepted:
             return
-        painter = QPainter(printer)
-        painter.drawText(100, 100, "Phiếu chuyển tiền")
-        painter.end()
+        try:
+            so_tien = format_price(float(so_tien))
+        except ValueError:
+            pass
+        cac_dong = [
+            ("Ngày", datetime.now().strftime("%d/%m/%Y %H:%M")),
+            ("Từ", tu_user),
+            ("Đến", den_user),
+            ("Số tiền", so_tien),
+            ("Nội dung", noi_dung),
+        ]
+        to_tien = [
+            (format_price(mg), f"{spin.value()} tờ")
+            for spin, mg in self.to_tien_spins
+            if spin.value() > 0
+        ]
+        if to_tien:
+            cac_dong += [("Đếm tờ", None)] + to_tien
+        in_phieu_nen(
+            [Phieu("PHIẾU CHUYỂN TIỀN", cac_dong)],
+            printer,
+            khi_loi=lambda loi: show_error(self, "Lỗi", f"In phiếu thất bại: {loi}"),
+        )
 
     def doi_mat_khau_click(self):
         new_pwd, ok = QInputDialog.getText(
@@ -7614,6 +6847,11 @@ class MainWindow(QWidget):
             else:
                 show_error(self, "Lỗi", "Đổi mật khẩu thất bại")
 
+    def closeEvent(self, event):
+        # Cửa sổ đã đóng (đăng xuất) thôi nhận sự kiện thay đổi dữ liệu
+        self.bo_lam_moi.dong()
+        super().closeEvent(event)
+
     def dang_xuat(self):
         """Đăng xuất và quay về màn hình login"""
         try:
@@ -7636,13 +6874,24 @@ class MainWindow(QWidget):
             sys.exit(0)
 
     def load_sanpham(self):
-        data = lay_tat_ca_sanpham()
-        self.tbl_sanpham.setRowCount(len(data))
-        for row_idx, sp in enumerate(data):
-            for col_idx, val in enumerate(sp):
-                if col_idx in [2, 3, 4]:
-                    val = format_price(val)
-                self.tbl_sanpham.setItem(row_idx, col_idx, QTableWidgetItem(str(val)))
+        if not self.tab_da_tao("tab_sanpham"):
+            return
+        self.tbl_sanpham.dat_du_lieu(lay_tat_ca_sanpham())
+
+    def lam_moi_dong_sanpham(self, sanpham_ids):
+        """Đọc lại các sản phẩm vừa đổi (None = nạp lại cả bảng)."""
+        if sanpham_ids is None:
+            self.load_sanpham()
+        elif sanpham_ids and self.tab_da_tao("tab_sanpham"):
+            self.tbl_sanpham.cap_nhat_theo_khoa(
+                sanpham_ids, lay_sanpham_theo_id(sanpham_ids)
+            )
+
+    def _khi_san_pham_doi(self, cac_su_kien):
+        """Đồng bộ gợi ý tên và bảng giá giỏ hàng khi sản phẩm thay đổi."""
+        if any(su_kien.doi_danh_sach for su_kien in cac_su_kien):
+            self.goi_y_sanpham.dong_bo(lay_danh_sach_ten_sanpham())
+        self.cap_nhat_completer_sanpham()
 
     def them_sanpham_click(self):
         ten, ok = QInputDialog.getText(self, "Thêm sản phẩm", "Tên:")
@@ -7665,8 +6914,6 @@ class MainWindow(QWidget):
             return
         if them_sanpham(ten, gia_le, gia_buon, gia_vip, ton_kho, nguong_buon):
             show_success(self, "Thêm sản phẩm thành công")
-            self.load_sanpham()
-            self.cap_nhat_completer_sanpham()
         else:
             show_error(self, "Lỗi", "Thêm sản phẩm thất bại")
 
@@ -7712,26 +6959,21 @@ class MainWindow(QWidget):
                 "Thành công",
                 f"Nhập kho thành công!\nSản phẩm: {ten}\nSố lượng nhập: {so_luong}\nTồn kho cũ: {ton_kho_cu}\nTồn kho mới: {ton_kho_moi}",
             )
-            self.load_sanpham()
         else:
             show_error(self, "Lỗi", "Nhập kho thất bại")
 
     def xoa_sanpham_click(self):
-        row = self.tbl_sanpham.currentRow()
+        row = self.tbl_sanpham.dong_hien_tai()
         if row < 0:
             show_error(self, "Lỗi", "Chọn một sản phẩm")
             return
-        ten_sp = self.tbl_sanpham.item(row, 1).text()
+        ten_sp = self.tbl_sanpham.gia_tri(row, 1)
         if xoa_sanpham(ten_sp):
             show_success(self, "Xóa sản phẩm thành công")
-            self.load_sanpham()  # Tự động làm mới danh sách sản phẩm
-            self.cap_nhat_completer_sanpham()  # Cập nhật autocomplete
         else:
             show_error(self, "Lỗi", "Xóa sản phẩm thất bại")
 
-    def update_product_price(self, item):
-        row = item.row()
-        col = item.column()
+    def update_product_price(self, row, col, text):
         if col not in [
             2,
             3,
@@ -7740,9 +6982,9 @@ class MainWindow(QWidget):
         ]:  # Chỉ cho phép chỉnh sửa giá lẻ, giá buôn, giá VIP, tồn kho
             return
         try:
-            product_id = int(self.tbl_sanpham.item(row, 0).text())
-            ten_sanpham = self.tbl_sanpham.item(row, 1).text()
-            value = float(item.text().replace(",", ""))
+            product_id = int(self.tbl_sanpham.gia_tri(row, 0))
+            ten_sanpham = self.tbl_sanpham.gia_tri(row, 1)
+            value = float(text.replace(",", ""))
             # ✅ Validate field name to prevent SQL injection
             allowed_fields = ["gia_le", "gia_buon", "gia_vip", "ton_kho"]
             field = allowed_fields[col - 2]
@@ -7750,6 +6992,7 @@ class MainWindow(QWidget):
             conn = ket_noi()
             c = conn.cursor()
 
+            thay_doi_gia = None
             # Lấy giá cũ trước khi cập nhật (chỉ với các trường giá, không phải tồn kho)
             if field in ["gia_le", "gia_buon", "gia_vip"]:
                 c.execute(f"SELECT {field} FROM SanPham WHERE id=?", (product_id,))
@@ -7765,6 +7008,7 @@ class MainWindow(QWidget):
                         "gia_vip": "vip",
                     }
                     loai_gia = loai_gia_map[field]
+                    ngay_thay_doi = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
                     c.execute(
                         """
@@ -7779,14 +7023,30 @@ class MainWindow(QWidget):
                             old_value,
                             value,
                             self.user_id,
-                            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                            ngay_thay_doi,
                             "Cập nhật từ tab Sản phẩm",
                         ),
                     )
+                    thay_doi_gia = (
+                        product_id,
+                        loai_gia,
+                        old_value,
+                        value,
+                        ngay_thay_doi,
+                    )
 
             c.execute(f"UPDATE SanPham SET {field}=? WHERE id=?", (value, product_id))
             conn.commit()
             conn.close()
+
+            # Giữ dòng thời gian giá đồng bộ mà không cần nạp lại LichSuGia
+            if thay_doi_gia:
+                ghi_nhan_thay_doi_gia(*thay_doi_gia)
+            # Dòng sản phẩm, bảng giá giỏ hàng, lịch sử giá... làm mới theo sự kiện
+            if field == "ton_kho":
+                event_bus.phat(TonKhoThayDoi([product_id]))
+            else:
+                event_bus.phat(SanPhamThayDoi([product_id]))
         except Exception as e:
             show_error(self, "Lỗi", f"Giá trị không hợp lệ: {e}")
 
@@ -7796,16 +7056,16 @@ class MainWindow(QWidget):
         )
         if file_path:
             try:
+                import pandas as pd
+
                 df = pd.read_excel(file_path)
                 # Truyền user_id để lưu lịch sử thay đổi giá
                 if import_sanpham_from_dataframe(df, user_id=self.user_id):
+                    # Bảng sản phẩm, lịch sử giá, gợi ý tên làm mới theo sự kiện
                     show_success(
                         self,
                         "Import sản phẩm thành công!\nLịch sử thay đổi giá đã được lưu.",
                     )
-                    self.load_sanpham()  # Tự động làm mới danh sách sản phẩm
-                    self.load_lich_su_gia()  # Tự động làm mới lịch sử giá
-                    self.cap_nhat_completer_sanpham()  # Cập nhật autocomplete
                 else:
                     show_error(self, "Lỗi", "Import sản phẩm thất bại")
             except Exception as e:
@@ -7818,353 +7078,30 @@ class MainWindow(QWidget):
             )
             return
 
-        from datetime import datetime
-        from PyQt5.QtPrintSupport import QPrinter
-        from PyQt5.QtGui import QPainter
-
-        # Lấy dữ liệu nhận hàng với chênh lệch
-        nhan_hang_data = []
-        chenh_lech_data = []
-        for row in range(self.tbl_nhan_hang.rowCount()):
-            ten_sp = self.tbl_nhan_hang.item(row, 0).text()
-            try:
-                sl_dem = float(self.tbl_nhan_hang.item(row, 1).text())
-            except Exception as e:
-                print(f"Warning: Invalid quantity at row {row}: {e}")
-                sl_dem = 0
-            try:
-                ton_db = float(self.tbl_nhan_hang.item(row, 2).text())
-            except Exception as e:
-                print(f"Warning: Invalid stock at row {row}: {e}")
-                ton_db = 0
-            try:
-                chenh = float(self.tbl_nhan_hang.item(row, 3).text())
-            except Exception as e:
-                print(f"Warning: Invalid difference at row {row}: {e}")
-                chenh = 0
-            ghi_chu = (
-                self.tbl_nhan_hang.item(row, 4).text()
-                if self.tbl_nhan_hang.item(row, 4)
-                else ""
-            )
-
-            if sl_dem > 0:
-                nhan_hang_data.append((ten_sp, sl_dem, ton_db, chenh, ghi_chu))
-                if abs(chenh) > 0.001:  # Có chênh lệch
-                    chenh_lech_data.append((ten_sp, ton_db, sl_dem, chenh, ghi_chu))
-
-        # Lấy dữ liệu bán hàng từ HÓA ĐƠN CUỐI CÙNG (hóa đơn vừa tạo)
-        today = datetime.now().strftime("%Y-%m-%d")
-        today_display = datetime.now().strftime("%d/%m/%Y %H:%M")
-        from invoices import lay_chi_tiet_hoadon
-
-        # Dùng dict để gộp sản phẩm: key = (tên, loại_gia, giá, xhd)
-        sp_dict_xhd = {}  # {(tên, loại_gia, giá): [tổng_sl, tổng_tiền]}
-        sp_dict_chua_xhd = {}
-        tong_tien_ban = 0
-        tong_tien_xhd = 0
-        tong_tien_chua_xhd = 0
-
-        # Lấy chi tiết từ hóa đơn cuối cùng (nếu có)
-        if self.last_invoice_id:
-            chi_tiet = lay_chi_tiet_hoadon(self.last_invoice_id)
-            for r in chi_tiet:
-                # r = (id, hoadon_id, sanpham_id, ten, so_luong, loai_gia, gia, xuat_hoa_don, gia_le, giam, ghi_chu)
-                ten = r[3]
-                sl = r[4]
-                loai_gia = r[5]
-                gia = r[6]
-                xhd = r[7]
-                giam = r[9] if len(r) > 9 else 0
-                tong = sl * gia - giam
-                tong_tien_ban += tong
-
-                loai_gia_text = {"le": "Lẻ", "buon": "Buôn", "vip": "VIP"}.get(
-                    loai_gia, loai_gia
-                )
-                key = (ten, loai_gia_text, gia)
-
-                if xhd == 1:
-                    if key not in sp_dict_xhd:
-                        sp_dict_xhd[key] = [0, 0]
-                    sp_dict_xhd[key][0] += sl
-                    sp_dict_xhd[key][1] += tong
-                    tong_tien_xhd += tong
-                else:
-                    if key not in sp_dict_chua_xhd:
-                        sp_dict_chua_xhd[key] = [0, 0]
-                    sp_dict_chua_xhd[key][0] += sl
-                    sp_dict_chua_xhd[key][1] += tong
-                    tong_tien_chua_xhd += tong
-
-        # Chuyển dict thành list để hiển thị
-        sp_da_xhd = [
-            (ten, sl, loai_gia, gia, tong)
-            for (ten, loai_gia, gia), [sl, tong] in sp_dict_xhd.items()
-        ]
-        sp_chua_xhd = [
-            (ten, sl, loai_gia, gia, tong)
-            for (ten, loai_gia, gia), [sl, tong] in sp_dict_chua_xhd.items()
-        ]
-
-        # Lấy công đoàn và tiền nộp
-        from users import lay_tong_nop_theo_hoadon
-        from invoices import lay_danh_sach_hoadon
-
-        # Tính tổng công đoàn từ LogKho
-        tong_cong_doan = 0
-        try:
-            conn = ket_noi()
-            c = conn.cursor()
-            c.execute(
-                "SELECT SUM(chenh_lech_cong_doan) FROM LogKho WHERE date(ngay) = ? AND hanh_dong = 'xuat'",
-                (today,),
-            )
-            result = c.fetchone()
-            tong_cong_doan = result[0] if result and result[0] else 0
-            conn.close()
-        except Exception as e:
-            print(f"Warning: Could not load tong_cong_doan: {e}")
-            tong_cong_doan = 0
+        # Tổng kết đã được cộng dồn trong ca (shift_summary), chỉ cần đọc lại
+        if not self.ca_id:
+            show_error(self, "Lỗi", "Không tìm thấy ca đang mở. Vui lòng nhận hàng lại.")
+            return
+        ca = lay_tong_ket_ca(self.ca_id)
+        if not ca:
+            show_error(self, "Lỗi", f"Không đọc được tổng kết ca {self.ca_id}.")
+            return
 
-        tong_nop = 0
-        # Lấy tiền đã nộp từ hóa đơn cuối cùng
-        if self.last_invoice_id:
-            tong_nop = lay_tong_nop_theo_hoadon(self.last_invoice_id) or 0
+        self._xem_truoc_tong_ket_ca(ca, cho_phep_dong_ca=True)
 
-        tong_thieu = tong_tien_ban - tong_nop
+    def _xem_truoc_tong_ket_ca(self, ca, cho_phep_dong_ca=False):
+        """Hộp thoại xem trước / in tổng kết ca; đóng ca nếu cho_phep_dong_ca."""
+        ca_id = ca["id"]
+        html_content = tao_html_tong_ket(ca)
 
         # Show preview dialog
         preview_dialog = QDialog(self)
-        preview_dialog.setWindowTitle("Xem trước tổng kết ca")
+        preview_dialog.setWindowTitle(f"Xem trước tổng kết ca #{ca_id}")
         preview_dialog.resize(800, 600)
         layout = QVBoxLayout()
 
-        # Create text content
         content = QTextEdit()
         content.setReadOnly(True)
-
-        # Import helper to resolve username
-        from users import lay_username
-
-        html_content = f"""
-        <html>
-        <head>
-            <style>
-                @page {{
-                    size: A4 portrait;
-                    margin: 15mm;
-                }}
-                @media print {{
-                    body {{
-                        margin: 0;
-                        padding: 0;
-                    }}
-                    .no-print {{
-                        display: none;
-                    }}
-                }}
-                body {{
-                    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                    font-size: 10pt;
-                    margin: 0;
-                    padding: 10px;
-                    max-width: 210mm;
-                }}
-                h1 {{
-                    text-align: center;
-                    color: #2c3e50;
-                    border-bottom: 2px solid #3498db;
-                    padding-bottom: 8px;
-                    margin: 10px 0 15px 0;
-                    font-size: 16pt;
-                }}
-                h2 {{
-                    color: #34495e;
-                    margin-top: 15px;
-                    margin-bottom: 8px;
-                    border-left: 3px solid #3498db;
-                    padding-left: 8px;
-                    font-size: 12pt;
-                }}
-                table {{
-                    width: 100%;
-                    border-collapse: collapse;
-                    margin: 5px 0 10px 0;
-                    font-size: 9pt;
-                }}
-                th {{
-                    background-color: #3498db;
-                    color: white;
-                    padding: 6px 8px;
-                    text-align: left;
-                    font-weight: bold;
-                    border: 1px solid #2980b9;
-                }}
-                td {{
-                    padding: 5px 8px;
-                    border: 1px solid #ddd;
-                }}
-                tr:nth-child(even) {{
-                    background-color: #f9f9f9;
-                }}
-                .info-box {{
-                    background-color: #e8f5e9;
-                    padding: 8px;
-                    border-left: 3px solid #4caf50;
-                    margin: 10px 0;
-                    font-size: 9pt;
-                }}
-                .money {{
-                    text-align: right;
-                    font-weight: bold;
-                }}
-                .total-row {{
-                    background-color: #3498db !important;
-                    color: white;
-                    font-weight: bold;
-                }}
-            </style>
-        </head>
-        <body>
-            <h1>BÁO CÁO ĐÓNG CA</h1>
-            
-            <div class="info-box">
-                <strong>Ngày giờ:</strong> {datetime.now().strftime("%d/%m/%Y %H:%M")}<br>
-                <strong>Người bán:</strong> {lay_username(self.user_id)} (ID: {self.user_id})
-            </div>
-
-            <h2>Danh sách nhận hàng</h2>
-        """
-
-        if nhan_hang_data:
-            html_content += """
-            <table>
-                <tr>
-                    <th>Sản phẩm</th>
-                    <th style="text-align: right;">SL Đếm</th>
-                    <th style="text-align: right;">Tồn HT</th>
-                    <th style="text-align: right;">Chênh lệch</th>
-                    <th>Lý do</th>
-                </tr>
-            """
-            for sp in nhan_hang_data:
-                ten, sl_dem, ton_db, chenh, ghi_chu = sp
-                chenh_style = (
-                    "color: red;"
-                    if chenh < 0
-                    else ("color: green;" if chenh > 0 else "")
-                )
-                html_content += f"""
-                <tr>
-                    <td>{ten}</td>
-                    <td class="money">{sl_dem:.0f}</td>
-                    <td class="money">{ton_db:.0f}</td>
-                    <td class="money" style="{chenh_style}">{chenh:+.0f}</td>
-                    <td>{ghi_chu if ghi_chu else '-'}</td>
-                </tr>
-                """
-            html_content += "</table>"
-        else:
-            html_content += "<p><i>Không có dữ liệu nhận hàng</i></p>"
-
-        html_content += "<h2>Danh sách sản phẩm đã bán - ĐÃ XUẤT HÓA ĐƠN</h2>"
-
-        if sp_da_xhd:
-            html_content += """
-            <table>
-                <tr>
-                    <th>Sản phẩm</th>
-                    <th style="text-align: center;">SL</th>
-                    <th style="text-align: center;">Loại giá</th>
-                    <th style="text-align: right;">Đơn giá</th>
-                    <th style="text-align: right;">Thành tiền</th>
-                </tr>
-            """
-            for sp in sp_da_xhd:
-                ten, sl, loai_gia, gia, tong = sp
-                html_content += f"""
-                <tr>
-                    <td>{ten}</td>
-                    <td style="text-align: center;">{sl:.0f}</td>
-                    <td style="text-align: center;">{loai_gia}</td>
-                    <td class="money">{gia:,.0f}</td>
-                    <td class="money">{tong:,.0f}</td>
-                </tr>
-                """
-            html_content += f"""
-                <tr class="total-row">
-                    <td colspan="4">TỔNG ĐÃ XUẤT HÓA ĐƠN</td>
-                    <td class="money">{tong_tien_xhd:,.0f}</td>
-                </tr>
-            </table>
-            """
-        else:
-            html_content += "<p><i>Không có sản phẩm đã xuất hóa đơn</i></p>"
-
-        html_content += "<h2>Danh sách sản phẩm đã bán - CHƯA XUẤT HÓA ĐƠN</h2>"
-
-        if sp_chua_xhd:
-            html_content += """
-            <table>
-                <tr>
-                    <th>Sản phẩm</th>
-                    <th style="text-align: center;">SL</th>
-                    <th style="text-align: center;">Loại giá</th>
-                    <th style="text-align: right;">Đơn giá</th>
-                    <th style="text-align: right;">Thành tiền</th>
-                </tr>
-            """
-            for sp in sp_chua_xhd:
-                ten, sl, loai_gia, gia, tong = sp
-                html_content += f"""
-                <tr>
-                    <td>{ten}</td>
-                    <td style="text-align: center;">{sl:.0f}</td>
-                    <td style="text-align: center;">{loai_gia}</td>
-                    <td class="money">{gia:,.0f}</td>
-                    <td class="money">{tong:,.0f}</td>
-                </tr>
-                """
-            html_content += f"""
-                <tr class="total-row">
-                    <td colspan="4">TỔNG CHƯA XUẤT HÓA ĐƠN</td>
-                    <td class="money">{tong_tien_chua_xhd:,.0f}</td>
-                </tr>
-            </table>
-            """
-        else:
-            html_content += "<p><i>Không có sản phẩm chưa xuất hóa đơn</i></p>"
-
-        html_content += f"""
-            <h2>Tổng kết tài chính</h2>
-                <table>
-                    <tr>
-                        <th>Khoản mục</th>
-                        <th style="text-align: right;">Số tiền</th>
-                    </tr>
-                    <tr>
-                        <td>Tổng tiền bán hàng</td>
-                        <td class="money">{tong_tien_ban:,.0f} VNĐ</td>
-                    </tr>
-                    <tr>
-                        <td>Tổng công đoàn</td>
-                        <td class="money">{tong_cong_doan:,.0f} VNĐ</td>
-                    </tr>
-                    <tr>
-                        <td>Tổng tiền đã nộp</td>
-                        <td class="money">{tong_nop:,.0f} VNĐ</td>
-                    </tr>
-                    <tr class="total-row">
-                        <td>Còn thiếu</td>
-                        <td class="money">{tong_thieu:,.0f} VNĐ</td>
-                    </tr>
-                </table>
-            </div>
-        </body>
-        </html>
-        """
-
         content.setHtml(html_content)
         layout.addWidget(content)
 
@@ -8173,35 +7110,35 @@ class MainWindow(QWidget):
 
         def do_print():
             # Mở hộp thoại in (cho phép chọn máy in hoặc PDF)
-            from PyQt5.QtPrintSupport import QPrintDialog
-
             printer = QPrinter(QPrinter.HighResolution)
             printer.setPageSize(QPrinter.A4)
 
-            # Mở dialog in
             print_dialog = QPrintDialog(printer, preview_dialog)
             print_dialog.setWindowTitle("In báo cáo đóng ca")
 
             if print_dialog.exec_() == QPrintDialog.Accepted:
-                # In nội dung HTML
-                content.document().print_(printer)
-
-                # ✅ Lưu file HTML tổng kết ca vào thư mục riêng và xóa file cũ
-                try:
-                    _, tong_ket_dir = tao_thu_muc_luu_tru()
-                    xoa_file_cu(tong_ket_dir, so_thang=3)  # Xóa file cũ hơn 3 tháng
-
-                    html_filename = f"tong_ket_ca_{self.user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
-                    html_filepath = os.path.join(tong_ket_dir, html_filename)
-
-                    with open(html_filepath, "w", encoding="utf-8") as f:
-                        f.write(html_content)
-
-                    print(f"Đã lưu file tổng kết: {html_filename}")
-                except Exception as e:
-                    print(f"Lỗi khi lưu file tổng kết: {e}")
+                in_html_nen(
+                    html_content,
+                    printer,
+                    khi_xong=lambda _: show_success(self, "Đã in báo cáo đóng ca!"),
+                    khi_loi=lambda loi: show_error(self, "Lỗi", f"In thất bại: {loi}"),
+                )
 
-                show_success(preview_dialog, "Đã in báo cáo đóng ca!")
+        def luu_pdf(html):
+            # ✅ Lưu file PDF tổng kết ca ở luồng nền và xóa file cũ
+            try:
+                _, tong_ket_dir = tao_thu_muc_luu_tru()
+                xoa_file_cu(tong_ket_dir, so_thang=3)  # Xóa file cũ hơn 3 tháng
+
+                pdf_filename = f"tong_ket_ca_{ca['user_id']}_{ca_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+                xuat_pdf_nen(
+                    html,
+                    os.path.join(tong_ket_dir, pdf_filename),
+                    khi_xong=lambda path: cap_nhat_file_pdf(ca_id, path),
+                    khi_loi=lambda err: print(f"Lỗi khi lưu file tổng kết: {err}"),
+                )
+            except Exception as e:
+                print(f"Lỗi khi lưu file tổng kết: {e}")
 
         def close_shift():
             reply = QMessageBox.question(
@@ -8212,23 +7149,13 @@ class MainWindow(QWidget):
                 QMessageBox.No,
             )
             if reply == QMessageBox.Yes:
-                # ✅ Lưu file tổng kết ca khi đóng ca
-                try:
-                    _, tong_ket_dir = tao_thu_muc_luu_tru()
-                    xoa_file_cu(tong_ket_dir, so_thang=3)  # Xóa file cũ hơn 3 tháng
-
-                    html_filename = f"tong_ket_ca_{self.user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
-                    html_filepath = os.path.join(tong_ket_dir, html_filename)
-
-                    with open(html_filepath, "w", encoding="utf-8") as f:
-                        f.write(html_content)
-
-                    print(f"Đã lưu file tổng kết: {html_filename}")
-                except Exception as e:
-                    print(f"Lỗi khi lưu file tổng kết: {e}")
+                dong_ca(ca_id)
+                da_dong = lay_tong_ket_ca(ca_id) or ca
+                luu_pdf(tao_html_tong_ket(da_dong))
 
                 # Mark shift as closed and disable selling
                 self.ca_closed = True
+                self.ca_id = None
                 self.tab_banhang.setEnabled(False)
                 # Disable the 'Lưu' button to prevent creating invoices after closing shift
                 try:
@@ -8253,11 +7180,12 @@ class MainWindow(QWidget):
         btn_print.clicked.connect(do_print)
         btn_layout.addWidget(btn_print)
 
-        btn_close = QPushButton("Đóng ca")
-        btn_close.clicked.connect(close_shift)
-        btn_layout.addWidget(btn_close)
+        if cho_phep_dong_ca:
+            btn_close = QPushButton("Đóng ca")
+            btn_close.clicked.connect(close_shift)
+            btn_layout.addWidget(btn_close)
 
-        btn_cancel = QPushButton("Hủy")
+        btn_cancel = QPushButton("Hủy" if cho_phep_dong_ca else "Đóng")
         btn_cancel.clicked.connect(preview_dialog.reject)
         btn_layout.addWidget(btn_cancel)
 
@@ -8265,6 +7193,68 @@ class MainWindow(QWidget):
         preview_dialog.setLayout(layout)
         preview_dialog.exec_()
 
+    def xem_lai_ca_cu(self):
+        """Danh sách các ca trước, in lại tổng kết từ số liệu đã lưu"""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("In lại tổng kết ca")
+        dialog.resize(700, 450)
+        layout = QVBoxLayout()
+
+        # Accountant/admin xem được mọi ca, user chỉ xem ca của mình
+        user_loc = None if self.role in ["admin", "accountant"] else self.user_id
+        ds_ca = danh_sach_ca(user_loc)
+
+        tbl = QTableWidget(len(ds_ca), 7)
+        tbl.setHorizontalHeaderLabels(
+            ["Ca", "Người bán", "Bắt đầu", "Kết thúc", "Số HĐ", "Tiền bán", "Đã nộp"]
+        )
+        tbl.setEditTriggers(QTableWidget.NoEditTriggers)
+        tbl.setSelectionBehavior(QTableWidget.SelectRows)
+        tbl.setSelectionMode(QTableWidget.SingleSelection)
+        for row, (
+            ca_id,
+            username,
+            bat_dau,
+            ket_thuc,
+            trang_thai,
+            tong_tien_ban,
+            tong_nop,
+            so_hoadon,
+        ) in enumerate(ds_ca):
+            tbl.setItem(row, 0, QTableWidgetItem(str(ca_id)))
+            tbl.setItem(row, 1, QTableWidgetItem(username))
+            tbl.setItem(row, 2, QTableWidgetItem(bat_dau or ""))
+            tbl.setItem(row, 3, QTableWidgetItem(ket_thuc or "Đang mở"))
+            tbl.setItem(row, 4, QTableWidgetItem(str(so_hoadon or 0)))
+            tbl.setItem(row, 5, QTableWidgetItem(format_price(tong_tien_ban or 0)))
+            tbl.setItem(row, 6, QTableWidgetItem(format_price(tong_nop or 0)))
+        tbl.resizeColumnsToContents()
+        layout.addWidget(tbl)
+
+        def xem_ca():
+            row = tbl.currentRow()
+            if row < 0:
+                show_info(dialog, "Chọn ca", "Vui lòng chọn một ca.")
+                return
+            ca = lay_tong_ket_ca(int(tbl.item(row, 0).text()))
+            if ca:
+                self._xem_truoc_tong_ket_ca(ca)
+
+        tbl.cellDoubleClicked.connect(lambda *_: xem_ca())
+
+        btn_layout = QHBoxLayout()
+        btn_layout.addStretch()
+        btn_xem = QPushButton("Xem / In lại")
+        btn_xem.clicked.connect(xem_ca)
+        btn_layout.addWidget(btn_xem)
+        btn_dong = QPushButton("Đóng")
+        btn_dong.clicked.connect(dialog.close)
+        btn_layout.addWidget(btn_dong)
+        layout.addLayout(btn_layout)
+
+        dialog.setLayout(layout)
+        dialog.exec_()
+
     def init_tab_nhap_dau_ky(self):
         """Tab nhập đầu kỳ cho số dư user và sản phẩm đã bán chưa xuất hóa đơn"""
         layout = QVBoxLayout()
@@ -8357,6 +7347,8 @@ class MainWindow(QWidget):
 
     def load_nhap_sodu_users(self):
         """Tải danh sách user để nhập số dư đầu kỳ"""
+        if not self.tab_da_tao("tab_nhap_dau_ky"):
+            return
         from users import lay_tat_ca_user
 
         users = lay_tat_ca_user()
@@ -8410,12 +7402,11 @@ class MainWindow(QWidget):
             c = conn.cursor()
 
             for so_du_moi, user_id in updates:
-                # Cập nhật số dư trong bảng Users
-                c.execute(
-                    "UPDATE Users SET so_du = ? WHERE id = ?", (so_du_moi, user_id)
-                )
+                # Cập nhật số dư trong bảng Users, phần chênh ghi vào sổ cái
+                dat_so_du(c, user_id, so_du_moi, LY_DO_DAU_KY, ghi_chu="Nhập đầu kỳ")
 
             conn.commit()
+            event_bus.phat(SoDuThayDoi([user_id for _, user_id in updates]))
 
             show_success(self, f"Đã cập nhật số dư cho {len(updates)} user")
             self.load_nhap_sodu_users()
@@ -8573,6 +7564,8 @@ class MainWindow(QWidget):
 
             conn.commit()
             conn.close()
+            # Số lượng chưa xuất đổi: tab Xuất bổ làm mới khi được mở
+            event_bus.phat(TonKhoThayDoi([item["sanpham_id"] for item in items]))
 
             show_success(
                 self,
@@ -8584,10 +7577,6 @@ class MainWindow(QWidget):
             for _ in range(10):
                 self.them_dong_nhap_sanpham_dau_ky()
 
-            # Làm mới tab Xuất bỏ nếu có
-            if hasattr(self, "load_xuatbo"):
-                self.load_xuatbo()
-
         except Exception as e:
             show_error(self, "Lỗi", f"Lỗi khi lưu đầu kỳ: {e}")
             try:
@@ -8597,45 +7586,53 @@ class MainWindow(QWidget):
                 print(f"Warning: Could not close/rollback connection: {close_err}")
 
 
+def khoi_dong_nen():
+    """
+    Việc chạy sau splash, ở luồng nền: tạo bảng DB, chụp mốc số dư và nạp sẵn
+    các cache dùng ngay sau đăng nhập (danh bạ user, bảng giá, trang chủ).
+    Mỗi bước lỗi chỉ ghi log, không chặn việc mở màn hình đăng nhập.
+    """
+    # Cùng khoảng ngày mặc định của tab Trang chủ (khóa cache trùng khớp)
+    tu_ngay = QDate.currentDate().addMonths(-1).toString("yyyy-MM-dd")
+    den_ngay = QDate.currentDate().toString("yyyy-MM-dd")
+    cac_buoc = [
+        # Đảm bảo tạo các bảng DB mới (ví dụ ChenhLech) khi khởi động
+        ("khoi_tao_db", khoi_tao_db),
+        # Mốc số dư định kỳ (mỗi ngày một snapshot cho mỗi user)
+        ("chup_snapshot_so_du", chup_snapshot_so_du),
+        ("user_directory", user_directory.lay_tat_ca),
+        ("lay_bang_gia", lay_bang_gia),
+        ("du_lieu_trang_chu", lambda: du_lieu_trang_chu(tu_ngay, den_ngay)),
+    ]
+    for ten, ham in cac_buoc:
+        with startup_timing.do(ten):
+            try:
+                ham()
+            except Exception as e:
+                logger.error(f"Lỗi khởi động ({ten}): {e}")
+
+
 if __name__ == "__main__":
-    import sys
     from PyQt5.QtWidgets import QApplication
-    from PyQt5.QtCore import QTimer
 
+    startup_timing.moc("Import main_gui")
+    startup_timing.dung_do_import()
     app = QApplication(sys.argv)
 
     # Show splash screen
     splash = SplashScreen()
     splash.show()
+    QApplication.processEvents()
+    startup_timing.moc("Splash")
 
     # Global reference to login window to prevent garbage collection
     login_window = None
 
-    # Simulate loading process
-    def init_app():
+    def hien_dang_nhap():
         global login_window
 
-        splash.update_status("Đang khởi tạo database...")
-        QApplication.processEvents()
-
-        # Đảm bảo tạo các bảng DB mới (ví dụ ChenhLech) khi khởi động
-        try:
-            from db import khoi_tao_db
-
-            khoi_tao_db()
-        except Exception as e:
-            print(f"DB init error: {e}")
-
-        splash.update_status("Đang tải giao diện...")
-        QApplication.processEvents()
-
-        # Small delay for smooth loading
-        import time
-
-        time.sleep(0.5)
-
+        startup_timing.moc("Khởi động nền (DB + cache)")
         splash.update_status("Hoàn tất!")
-        QApplication.processEvents()
 
         # Show login window
         login_window = DangNhap()
@@ -8643,8 +7640,28 @@ if __name__ == "__main__":
 
         # Close splash
         splash.close()
+        startup_timing.moc("Màn hình đăng nhập")
+        startup_timing.ket_thuc()
+
+    # Splash vẫn vẽ/animate trong lúc luồng nền khởi tạo DB và cache; luồng
+    # GUI chỉ hỏi định kỳ xem luồng nền xong chưa (không phát tín hiệu chéo luồng)
+    import threading
+
+    splash.update_status("Đang khởi tạo database...")
+    luong_khoi_dong = threading.Thread(
+        target=khoi_dong_nen, name="khoi_dong_nen", daemon=True
+    )
+    luong_khoi_dong.start()
+
+    cho_khoi_dong = QTimer()
+    cho_khoi_dong.setInterval(30)
+
+    def kiem_tra_khoi_dong():
+        if not luong_khoi_dong.is_alive():
+            cho_khoi_dong.stop()
+            hien_dang_nhap()
 
-    # Use QTimer to run init after splash is shown
-    QTimer.singleShot(100, init_app)
+    cho_khoi_dong.timeout.connect(kiem_tra_khoi_dong)
+    cho_khoi_dong.start()
 
     sys.exit(app.exec_())
@@ -0,0 +1,436 @@
+"""
+Dòng thời gian giá sản phẩm (tra cứu giá tại một thời điểm)
+
+Nạp bảng LichSuGia một lần thành các mảng đã sắp xếp theo
+(sanpham_id, loai_gia): danh sách thời điểm thay đổi và giá mới tương ứng.
+Tra cứu giá tại thời điểm bất kỳ bằng tìm kiếm nhị phân (bisect).
+
+Sử dụng:
+    from price_timeline import gia_tai_thoi_diem, gia_tai_thoi_diem_nhieu
+
+    gia = gia_tai_thoi_diem(5, "le", "2025-03-01 08:00:00")
+    gia_list = gia_tai_thoi_diem_nhieu([(5, "le", "2025-03-01"), (7, "vip", ...)])
+
+Tab Chênh lệch định giá mỗi dòng chênh lệch theo giá lẻ áp dụng tại thời điểm
+ghi nhận (gia_tai_thoi_diem_nhieu), dùng cả khi xử lý "Bán bổ sung".
+
+Các đường ghi giá (tab Sản phẩm, import Excel) gọi ghi_nhan_thay_doi_gia()
+sau khi commit để dòng thời gian luôn cập nhật mà không cần nạp lại.
+
+Tab Lịch sử giá đọc trực tiếp từ DB theo trang: lay_tom_tat_lich_su_gia() cho
+danh sách sản phẩm kèm lần đổi giá gần nhất (tính bằng SQL), và
+lay_thay_doi_gia() cho các lần đổi của một sản phẩm khi mở rộng dòng.
+"""
+
+import threading
+from bisect import bisect_right, insort
+from collections import namedtuple
+
+from utils.db_helpers import execute_query
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# (sanpham_id, loai_gia) -> {"ngay": [...], "gia": [...], "gia_dau": float}
+_timeline = {}
+# sanpham_id -> {"le": gia_le, "buon": gia_buon, "vip": gia_vip} (giá hiện tại)
+_gia_hien_tai = {}
+_loaded = False
+_lock = threading.RLock()
+
+LOAI_GIA = ("le", "buon", "vip")
+
+# Số id mỗi câu lệnh khi đọc theo danh sách sản phẩm
+_SO_ID_MOI_LO = 900
+
+TomTatGiaSanPham = namedtuple(
+    "TomTatGiaSanPham",
+    [
+        "sanpham_id",
+        "ten",
+        "gia_hien_tai",  # {loai_gia: giá catalog}
+        "so_lan",  # số lần đổi giá trong khoảng (0 = chưa đổi)
+        "lan_cuoi",  # thời điểm đổi gần nhất hoặc None
+        "username",  # người đổi gần nhất
+        "thay_doi",  # {loai_gia: (gia_cu, gia_moi)} của lần đổi gần nhất mỗi loại
+    ],
+)
+
+ThayDoiGia = namedtuple(
+    "ThayDoiGia", ["ngay_thay_doi", "loai_gia", "gia_cu", "gia_moi", "username", "ghi_chu"]
+)
+
+
+def _chuan_hoa_ngay(ts):
+    """Đưa thời điểm về dạng 'YYYY-MM-DD HH:MM:SS' để so sánh chuỗi đúng thứ tự.
+
+    Chấp nhận datetime, 'YYYY-MM-DD', 'YYYY-MM-DD HH:MM:SS' và dạng ISO có 'T'.
+    Ngày không có giờ được hiểu là cuối ngày (giá áp dụng trong ngày đó).
+    """
+    if ts is None:
+        return "9999-12-31 23:59:59"
+    if hasattr(ts, "strftime"):
+        if not hasattr(ts, "hour"):
+            return ts.strftime("%Y-%m-%d") + " 23:59:59"
+        return ts.strftime("%Y-%m-%d %H:%M:%S")
+    s = str(ts).strip().replace("T", " ")
+    if len(s) == 10:
+        return s + " 23:59:59"
+    return s[:19]
+
+
+def tai_lich_su_gia(force=False):
+    """
+    Nạp toàn bộ LichSuGia và giá hiện tại vào bộ nhớ (chỉ một lần).
+
+    Args:
+        force: True để nạp lại kể cả khi đã nạp
+
+    Returns:
+        int: Số chuỗi (sanpham_id, loai_gia) có lịch sử
+    """
+    global _loaded
+    with _lock:
+        if _loaded and not force:
+            return len(_timeline)
+
+        rows = (
+            execute_query(
+                "SELECT sanpham_id, loai_gia, gia_cu, gia_moi, ngay_thay_doi "
+                "FROM LichSuGia ORDER BY sanpham_id, loai_gia, ngay_thay_doi, id",
+                fetch_all=True,
+            )
+            or []
+        )
+        sp_rows = (
+            execute_query(
+                "SELECT id, gia_le, gia_buon, gia_vip FROM SanPham", fetch_all=True
+            )
+            or []
+        )
+
+        _timeline.clear()
+        for sanpham_id, loai_gia, gia_cu, gia_moi, ngay in rows:
+            key = (sanpham_id, loai_gia)
+            tl = _timeline.get(key)
+            if tl is None:
+                tl = {"ngay": [], "gia": [], "gia_dau": float(gia_cu or 0)}
+                _timeline[key] = tl
+            tl["ngay"].append(_chuan_hoa_ngay(ngay))
+            tl["gia"].append(float(gia_moi or 0))
+
+        _gia_hien_tai.clear()
+        for sp_id, gia_le, gia_buon, gia_vip in sp_rows:
+            _gia_hien_tai[sp_id] = {
+                "le": float(gia_le or 0),
+                "buon": float(gia_buon or 0),
+                "vip": float(gia_vip or 0),
+            }
+
+        _loaded = True
+        logger.info(
+            f"Đã nạp dòng thời gian giá: {len(rows)} thay đổi, {len(_timeline)} chuỗi"
+        )
+        return len(_timeline)
+
+
+def lam_moi():
+    """Đánh dấu cần nạp lại ở lần tra cứu kế tiếp (vd: sau khi xóa/sửa hàng loạt)."""
+    global _loaded
+    with _lock:
+        _loaded = False
+
+
+def ghi_nhan_thay_doi_gia(sanpham_id, loai_gia, gia_cu, gia_moi, ngay_thay_doi):
+    """
+    Cập nhật dòng thời gian sau khi một thay đổi giá đã được ghi vào LichSuGia.
+
+    Args:
+        sanpham_id: ID sản phẩm
+        loai_gia: 'le', 'buon' hoặc 'vip'
+        gia_cu: Giá trước khi đổi
+        gia_moi: Giá sau khi đổi
+        ngay_thay_doi: Thời điểm đổi giá
+    """
+    with _lock:
+        if not _loaded:
+            # Chưa nạp thì lần tra cứu đầu tiên sẽ đọc cả bản ghi này từ DB
+            return
+        ngay = _chuan_hoa_ngay(ngay_thay_doi)
+        key = (sanpham_id, loai_gia)
+        tl = _timeline.get(key)
+        if tl is None:
+            tl = {"ngay": [], "gia": [], "gia_dau": float(gia_cu or 0)}
+            _timeline[key] = tl
+        if not tl["ngay"] or ngay >= tl["ngay"][-1]:
+            tl["ngay"].append(ngay)
+            tl["gia"].append(float(gia_moi or 0))
+        else:
+            # Thay đổi ghi lùi ngày: chèn đúng vị trí để giữ mảng có thứ tự
+            i = bisect_right(tl["ngay"], ngay)
+            insort(tl["ngay"], ngay)
+            tl["gia"].insert(i, float(gia_moi or 0))
+        if sanpham_id in _gia_hien_tai:
+            _gia_hien_tai[sanpham_id][loai_gia] = float(gia_moi or 0)
+
+
+def _gia_catalog(sanpham_id, loai_gia):
+    gia = _gia_hien_tai.get(sanpham_id)
+    if gia is None:
+        # Sản phẩm thêm sau khi nạp: đọc một lần rồi giữ lại
+        row = execute_query(
+            "SELECT gia_le, gia_buon, gia_vip FROM SanPham WHERE id=?",
+            (sanpham_id,),
+            fetch_one=True,
+        )
+        gia = {}
+        if row:
+            gia = {
+                "le": float(row[0] or 0),
+                "buon": float(row[1] or 0),
+                "vip": float(row[2] or 0),
+            }
+        _gia_hien_tai[sanpham_id] = gia
+    return gia.get(loai_gia)
+
+
+def _tra_cuu(sanpham_id, loai_gia, ngay):
+    tl = _timeline.get((sanpham_id, loai_gia))
+    if tl is None:
+        return _gia_catalog(sanpham_id, loai_gia)
+    i = bisect_right(tl["ngay"], ngay)
+    if i == 0:
+        # Trước lần đổi giá đầu tiên: giá cũ của lần đổi đó
+        return tl["gia_dau"]
+    return tl["gia"][i - 1]
+
+
+def gia_tai_thoi_diem(sanpham_id, loai_gia, ts):
+    """
+    Giá niêm yết của sản phẩm theo loại giá tại thời điểm ts.
+
+    Args:
+        sanpham_id: ID sản phẩm
+        loai_gia: 'le', 'buon' hoặc 'vip'
+        ts: Thời điểm (datetime hoặc chuỗi 'YYYY-MM-DD[ HH:MM:SS]')
+
+    Returns:
+        float hoặc None nếu không tìm thấy sản phẩm
+    """
+    with _lock:
+        if not _loaded:
+            tai_lich_su_gia()
+        return _tra_cuu(sanpham_id, loai_gia, _chuan_hoa_ngay(ts))
+
+
+def gia_tai_thoi_diem_nhieu(rows):
+    """
+    Phiên bản theo lô của gia_tai_thoi_diem cho hàng nghìn dòng chi tiết.
+
+    Args:
+        rows: Iterable các tuple (sanpham_id, loai_gia, ts)
+
+    Returns:
+        list giá (float hoặc None) cùng thứ tự với rows
+    """
+    with _lock:
+        if not _loaded:
+            tai_lich_su_gia()
+        return [
+            _tra_cuu(sp_id, loai_gia, _chuan_hoa_ngay(ts))
+            for sp_id, loai_gia, ts in rows
+        ]
+
+
+def gia_moi_nhat_nhieu(sanpham_ids):
+    """
+    Giá mới của lần đổi giá gần nhất theo từng loại giá, đọc trong MỘT truy vấn.
+
+    Args:
+        sanpham_ids: Iterable ID sản phẩm
+
+    Returns:
+        dict {(sanpham_id, loai_gia): gia_moi}; loại giá chưa từng đổi không có trong dict
+    """
+    ids = sorted({i for i in sanpham_ids if i is not None})
+    rows = []
+    # Chia lô: SQLite cũ giới hạn 999 biến mỗi câu lệnh
+    for dau in range(0, len(ids), _SO_ID_MOI_LO):
+        lo = ids[dau : dau + _SO_ID_MOI_LO]
+        rows += (
+            execute_query(
+                f"""
+                SELECT sanpham_id, loai_gia, gia_moi FROM (
+                    SELECT sanpham_id, loai_gia, gia_moi,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY sanpham_id, loai_gia
+                               ORDER BY ngay_thay_doi DESC, id DESC
+                           ) AS moi_nhat
+                    FROM LichSuGia
+                    WHERE sanpham_id IN ({",".join("?" * len(lo))})
+                )
+                WHERE moi_nhat = 1
+                """,
+                tuple(lo),
+                fetch_all=True,
+            )
+            or []
+        )
+    return {(sp_id, loai_gia): gia_moi for sp_id, loai_gia, gia_moi in rows}
+
+
+def dinh_gia_lai_chi_tiet_hoadon(tu_ngay=None, den_ngay=None):
+    """
+    Lấy chi tiết hóa đơn trong khoảng ngày kèm giá niêm yết tại thời điểm bán.
+
+    Dùng cho phân tích chênh lệch / biên lợi nhuận theo giá lịch sử.
+
+    Args:
+        tu_ngay: Ngày bắt đầu 'YYYY-MM-DD' (None = không giới hạn)
+        den_ngay: Ngày kết thúc 'YYYY-MM-DD' (None = không giới hạn)
+
+    Returns:
+        list of (chitiet_id, hoadon_id, ngay, sanpham_id, loai_gia, so_luong,
+                 gia_ban, giam, gia_niem_yet)
+    """
+    sql = """
+        SELECT ct.id, ct.hoadon_id, hd.ngay, ct.sanpham_id, ct.loai_gia,
+               ct.so_luong, ct.gia, ct.giam
+        FROM ChiTietHoaDon ct
+        JOIN HoaDon hd ON ct.hoadon_id = hd.id
+        WHERE 1=1
+    """
+    params = []
+    if tu_ngay:
+        sql += " AND hd.ngay >= ?"
+        params.append(str(tu_ngay)[:10])
+    if den_ngay:
+        sql += " AND hd.ngay < date(?, '+1 day')"
+        params.append(str(den_ngay)[:10])
+    rows = execute_query(sql, tuple(params) if params else None, fetch_all=True) or []
+
+    gia_list = gia_tai_thoi_diem_nhieu((r[3], r[4], r[2]) for r in rows)
+    return [tuple(r) + (g,) for r, g in zip(rows, gia_list)]
+
+
+def _dieu_kien_lich_su(tu_ngay, den_ngay, loai_gia):
+    sql = " AND l.ngay_thay_doi >= ? AND l.ngay_thay_doi < date(?, '+1 day')"
+    params = [str(tu_ngay)[:10], str(den_ngay)[:10]]
+    if loai_gia:
+        sql += " AND l.loai_gia = ?"
+        params.append(loai_gia)
+    return sql, params
+
+
+def lay_tom_tat_lich_su_gia(
+    tu_ngay, den_ngay, tu_khoa=None, loai_gia=None, gioi_han=100, bo_qua=0
+):
+    """
+    Một trang sản phẩm kèm tóm tắt lần đổi giá gần nhất trong khoảng ngày.
+
+    Sản phẩm có đổi giá đứng trước (mới nhất trước), sau đó tới sản phẩm chưa đổi
+    theo tên. Khi lọc theo loại giá chỉ trả về sản phẩm có đổi loại giá đó.
+
+    Args:
+        tu_ngay, den_ngay: 'YYYY-MM-DD' (bao gồm cả hai đầu)
+        tu_khoa: Lọc tên sản phẩm (chứa chuỗi, không phân biệt hoa thường)
+        loai_gia: 'le', 'buon', 'vip' hoặc None = tất cả
+        gioi_han: Số sản phẩm mỗi trang
+        bo_qua: Số sản phẩm bỏ qua (trang trước)
+
+    Returns:
+        tuple (list TomTatGiaSanPham, tổng số sản phẩm thỏa bộ lọc)
+    """
+    dieu_kien, params = _dieu_kien_lich_su(tu_ngay, den_ngay, loai_gia)
+    # Giá cũ/mới của lần đổi gần nhất theo từng loại giá: cot_loai cho CTE, cot_tt để SELECT
+    cot_loai = ", ".join(
+        f"MAX(CASE WHEN loai_gia = '{loai}' AND moi_nhat_loai = 1 THEN {cot} END) "
+        f"AS {loai}_{cot}"
+        for loai in LOAI_GIA
+        for cot in ("gia_cu", "gia_moi")
+    )
+    cot_tt = ", ".join(
+        f"tt.{loai}_{cot}" for loai in LOAI_GIA for cot in ("gia_cu", "gia_moi")
+    )
+    sql = f"""
+        WITH ls AS (
+            SELECT l.sanpham_id, l.loai_gia, l.gia_cu, l.gia_moi,
+                   l.ngay_thay_doi, l.user_id,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY l.sanpham_id, l.loai_gia
+                       ORDER BY l.ngay_thay_doi DESC, l.id DESC
+                   ) AS moi_nhat_loai,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY l.sanpham_id
+                       ORDER BY l.ngay_thay_doi DESC, l.id DESC
+                   ) AS moi_nhat
+            FROM LichSuGia l
+            WHERE 1=1 {dieu_kien}
+        ),
+        tt AS (
+            SELECT sanpham_id, COUNT(*) AS so_lan, MAX(ngay_thay_doi) AS lan_cuoi,
+                   MAX(CASE WHEN moi_nhat = 1 THEN user_id END) AS user_id,
+                   {cot_loai}
+            FROM ls
+            GROUP BY sanpham_id
+        )
+        SELECT s.id, s.ten, s.gia_le, s.gia_buon, s.gia_vip,
+               tt.so_lan, tt.lan_cuoi, u.username, {cot_tt},
+               COUNT(*) OVER () AS tong
+        FROM SanPham s
+        {"JOIN" if loai_gia else "LEFT JOIN"} tt ON tt.sanpham_id = s.id
+        LEFT JOIN Users u ON u.id = tt.user_id
+        WHERE 1=1
+    """
+    if tu_khoa:
+        sql += " AND s.ten LIKE ?"
+        params.append(f"%{tu_khoa}%")
+    sql += " ORDER BY tt.lan_cuoi IS NULL, tt.lan_cuoi DESC, s.ten LIMIT ? OFFSET ?"
+    params += [int(gioi_han), int(bo_qua)]
+
+    rows = execute_query(sql, tuple(params), fetch_all=True) or []
+    ket_qua = []
+    for r in rows:
+        thay_doi = {}
+        for i, loai in enumerate(LOAI_GIA):
+            gia_cu, gia_moi = r[8 + 2 * i], r[9 + 2 * i]
+            if gia_moi is not None:
+                thay_doi[loai] = (gia_cu, gia_moi)
+        ket_qua.append(
+            TomTatGiaSanPham(
+                r[0],
+                r[1],
+                dict(zip(LOAI_GIA, r[2:5])),
+                r[5] or 0,
+                r[6],
+                r[7] or "",
+                thay_doi,
+            )
+        )
+    return ket_qua, (rows[0][-1] if rows else 0)
+
+
+def lay_thay_doi_gia(sanpham_id, tu_ngay, den_ngay, loai_gia=None):
+    """
+    Các lần đổi giá của một sản phẩm trong khoảng ngày (mới nhất trước).
+
+    Returns:
+        list ThayDoiGia
+    """
+    dieu_kien, params = _dieu_kien_lich_su(tu_ngay, den_ngay, loai_gia)
+    rows = (
+        execute_query(
+            f"""
+            SELECT l.ngay_thay_doi, l.loai_gia, l.gia_cu, l.gia_moi,
+                   COALESCE(u.username, ''), COALESCE(l.ghi_chu, '')
+            FROM LichSuGia l
+            LEFT JOIN Users u ON u.id = l.user_id
+            WHERE l.sanpham_id = ? {dieu_kien}
+            ORDER BY l.ngay_thay_doi DESC, l.id DESC
+            """,
+            tuple([sanpham_id] + params),
+            fetch_all=True,
+        )
+        or []
+    )
+    return [ThayDoiGia(*r) for r in rows]
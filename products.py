@@ -1,6 +1,9 @@
 from db import ket_noi
-import pandas as pd
 from utils.db_helpers import execute_query, db_transaction
+from utils.report_cache import cache_bao_cao
+from price_timeline import ghi_nhan_thay_doi_gia, lam_moi as lam_moi_lich_su_gia
+from utils import event_bus
+from utils.event_bus import SanPhamThayDoi, TonKhoThayDoi
 
 
 def them_sanpham(ten, gia_le, gia_buon, gia_vip, ton_kho=0, nguong_buon=0):
@@ -19,12 +22,15 @@ def them_sanpham(ten, gia_le, gia_buon, gia_vip, ton_kho=0, nguong_buon=0):
             if row:
                 ton_moi = row[1] + ton_kho
                 c.execute("UPDATE SanPham SET ton_kho=? WHERE id=?", (ton_moi, row[0]))
+                su_kien = TonKhoThayDoi([row[0]])
             else:
                 c.execute(
                     """INSERT INTO SanPham (ten, gia_le, gia_buon, gia_vip, ton_kho, nguong_buon)
                              VALUES (?, ?, ?, ?, ?, ?)""",
                     (ten, gia_le, gia_buon, gia_vip, ton_kho, nguong_buon),
                 )
+                su_kien = SanPhamThayDoi([c.lastrowid], doi_danh_sach=True)
+        event_bus.phat(su_kien)
         return True
     except Exception as e:
         print("Lỗi thêm sản phẩm:", e)
@@ -40,6 +46,7 @@ def cap_nhat_ton(product_id, ton_moi):
     try:
         with db_transaction() as (conn, c):
             c.execute("UPDATE SanPham SET ton_kho=? WHERE id=?", (ton_moi, product_id))
+        event_bus.phat(TonKhoThayDoi([product_id]))
         return True
     except Exception as e:
         print(f"Lỗi cập nhật tồn kho: {e}")
@@ -67,6 +74,40 @@ def lay_tat_ca_sanpham():
     )
 
 
+def lay_sanpham_theo_id(sanpham_ids):
+    """
+    Đọc lại một số sản phẩm (cùng cột với lay_tat_ca_sanpham), dùng khi chỉ cần
+    làm mới vài dòng của bảng sản phẩm.
+
+    Returns:
+        list of (id, ten, gia_le, gia_buon, gia_vip, ton_kho, nguong_buon)
+    """
+    sanpham_ids = list(sanpham_ids)
+    if not sanpham_ids:
+        return []
+    dau_hoi = ",".join("?" * len(sanpham_ids))
+    return (
+        execute_query(
+            "SELECT id, ten, gia_le, gia_buon, gia_vip, ton_kho, nguong_buon "
+            f"FROM SanPham WHERE id IN ({dau_hoi})",
+            tuple(sanpham_ids),
+            fetch_all=True,
+        )
+        or []
+    )
+
+
+@cache_bao_cao
+def lay_bang_gia():
+    """
+    Bảng giá cho giỏ hàng (cache tới lần ghi DB kế tiếp).
+
+    Returns:
+        list of (id, ten, gia_le, gia_buon, gia_vip, ton_kho, nguong_buon)
+    """
+    return lay_tat_ca_sanpham()
+
+
 def lay_danh_sach_ten_sanpham():
     try:
         rows = execute_query("SELECT ten FROM SanPham", fetch_all=True) or []
@@ -107,6 +148,8 @@ def import_sanpham_from_dataframe(df, user_id=None):
     from datetime import datetime
 
     ngay_import = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Các thay đổi giá đã ghi LichSuGia, áp vào dòng thời gian giá sau khi commit
+    thay_doi_gia = []
 
     try:
         with db_transaction() as (conn, c):
@@ -150,6 +193,9 @@ def import_sanpham_from_dataframe(df, user_id=None):
                                     "Import Excel",
                                 ),
                             )
+                            thay_doi_gia.append(
+                                (sp_id, "le", gia_le_cu, gia_le_moi, ngay_import)
+                            )
 
                         # Giá buôn
                         if abs(float(gia_buon_cu) - gia_buon_moi) > 1e-6:
@@ -170,6 +216,9 @@ def import_sanpham_from_dataframe(df, user_id=None):
                                     "Import Excel",
                                 ),
                             )
+                            thay_doi_gia.append(
+                                (sp_id, "buon", gia_buon_cu, gia_buon_moi, ngay_import)
+                            )
 
                         # Giá VIP
                         if abs(float(gia_vip_cu) - gia_vip_moi) > 1e-6:
@@ -190,6 +239,9 @@ def import_sanpham_from_dataframe(df, user_id=None):
                                     "Import Excel",
                                 ),
                             )
+                            thay_doi_gia.append(
+                                (sp_id, "vip", gia_vip_cu, gia_vip_moi, ngay_import)
+                            )
 
                     # Cập nhật giá và thông tin khác
                     c.execute(
@@ -221,6 +273,13 @@ def import_sanpham_from_dataframe(df, user_id=None):
                             nguong_buon,
                         ),
                     )
+        if user_id:
+            for thay_doi in thay_doi_gia:
+                ghi_nhan_thay_doi_gia(*thay_doi)
+        else:
+            # Giá đổi mà không có lịch sử: nạp lại giá hiện tại ở lần tra cứu sau
+            lam_moi_lich_su_gia()
+        event_bus.phat(SanPhamThayDoi(None, doi_danh_sach=True), TonKhoThayDoi(None))
         return True
     except Exception as e:
         print("Lỗi import từ DataFrame:", e)
@@ -230,7 +289,10 @@ def import_sanpham_from_dataframe(df, user_id=None):
 def xoa_sanpham(ten_sanpham):
     try:
         with db_transaction() as (conn, c):
+            c.execute("SELECT id FROM SanPham WHERE ten LIKE ?", (ten_sanpham,))
+            cac_id = [row[0] for row in c.fetchall()]
             c.execute("DELETE FROM SanPham WHERE ten LIKE ?", (ten_sanpham,))
+        event_bus.phat(SanPhamThayDoi(cac_id, doi_danh_sach=True))
         return True
     except Exception as e:
         print("Lỗi xóa sản phẩm:", e)
@@ -1,29 +1,258 @@
+import functools
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from archive import can_du_lieu_luu_tru, truy_van_lich_su
 from db import ket_noi
+from sales_rollup import doanh_thu, san_luong_theo_sanpham
 from utils.db_helpers import execute_query
+from utils.report_cache import cache_bao_cao
 
 
-def bao_cao_kho():
-    return (
+# Một dòng báo cáo kho (tab Báo cáo > Kho và các bản xuất file)
+DongBaoCaoKho = namedtuple(
+    "DongBaoCaoKho",
+    [
+        "sanpham_id",
+        "ten",
+        "ton_kho",
+        "nguong_buon",
+        "sl_xhd",  # Đã bán và xuất hóa đơn
+        "sl_xuat_bo",  # Đã xuất bổ (LogKho 'xuatbo'/'xuat_bo')
+        "sl_chua_xuat_cthd",  # Đã bán chưa xuất hóa đơn
+        "sl_dau_ky",  # Đầu kỳ còn lại (DauKyXuatBo)
+        "sl_chua_xuat",  # sl_chua_xuat_cthd + sl_dau_ky
+        "sys",  # ton_kho + sl_chua_xuat
+        "duoi_nguong",  # ton_kho < nguong_buon
+    ],
+)
+
+
+def tinh_bao_cao_kho(sap_xep=None):
+    """
+    Báo cáo kho cho mọi sản phẩm (kết quả được cache tới lần ghi DB kế tiếp).
+
+    Args:
+        sap_xep: Hàm key để sắp xếp kết quả (mặc định theo tên)
+
+    Returns:
+        list of DongBaoCaoKho
+    """
+    ket_qua = _tinh_bao_cao_kho()
+    if sap_xep is not None:
+        ket_qua.sort(key=sap_xep)
+    return ket_qua
+
+
+@cache_bao_cao
+def _tinh_bao_cao_kho():
+    """
+    Tính toàn bộ cột báo cáo kho cho mọi sản phẩm trong MỘT truy vấn.
+
+    ChiTietHoaDon, LogKho và DauKyXuatBo mỗi bảng được gom nhóm một lần theo
+    sanpham_id (quét index phủ) rồi LEFT JOIN vào SanPham, thay cho các truy vấn
+    SUM riêng cho từng sản phẩm. Phần đã lưu trữ được cộng từ KetChuyenKho.
+
+    Returns:
+        list of DongBaoCaoKho (theo tên)
+    """
+    rows = (
         execute_query(
             """
-        SELECT s.id, s.ten, s.ton_kho,
-               (SELECT SUM(so_luong) FROM ChiTietHoaDon WHERE sanpham_id=s.id) as da_ban,
-               (SELECT SUM(so_luong) FROM LogKho WHERE sanpham_id=s.id AND hanh_dong='xuat_bo') as xuat_bo
+        SELECT s.id, s.ten, COALESCE(s.ton_kho, 0), COALESCE(s.nguong_buon, 0),
+               COALESCE(ct.sl_xhd, 0) + COALESCE(kc.sl_xhd, 0),
+               COALESCE(lk.sl_xuat_bo, 0) + COALESCE(kc.sl_xuat_bo, 0),
+               COALESCE(ct.sl_chua_xuat, 0), COALESCE(dk.sl_dau_ky, 0)
         FROM SanPham s
+        LEFT JOIN (
+            SELECT sanpham_id,
+                   SUM(CASE WHEN xuat_hoa_don = 1 THEN so_luong ELSE 0 END) AS sl_xhd,
+                   SUM(CASE WHEN xuat_hoa_don = 0 THEN so_luong ELSE 0 END) AS sl_chua_xuat
+            FROM ChiTietHoaDon
+            GROUP BY sanpham_id
+        ) ct ON ct.sanpham_id = s.id
+        LEFT JOIN (
+            SELECT sanpham_id, SUM(so_luong) AS sl_xuat_bo
+            FROM LogKho
+            WHERE hanh_dong IN ('xuatbo', 'xuat_bo')
+            GROUP BY sanpham_id
+        ) lk ON lk.sanpham_id = s.id
+        LEFT JOIN (
+            SELECT sanpham_id, SUM(so_luong) AS sl_dau_ky
+            FROM DauKyXuatBo
+            GROUP BY sanpham_id
+        ) dk ON dk.sanpham_id = s.id
+        LEFT JOIN KetChuyenKho kc ON kc.sanpham_id = s.id
+        ORDER BY s.ten
         """,
             fetch_all=True,
         )
         or []
     )
 
+    ket_qua = []
+    for sp_id, ten, ton_kho, nguong_buon, sl_xhd, sl_xuat_bo, sl_cthd, sl_dk in rows:
+        sl_chua_xuat = sl_cthd + sl_dk
+        ket_qua.append(
+            DongBaoCaoKho(
+                sp_id,
+                ten,
+                ton_kho,
+                nguong_buon,
+                sl_xhd,
+                sl_xuat_bo,
+                sl_cthd,
+                sl_dk,
+                sl_chua_xuat,
+                ton_kho + sl_chua_xuat,
+                ton_kho < nguong_buon,
+            )
+        )
+    return ket_qua
 
-def bao_cao_doanh_thu():
-    result = execute_query(
-        "SELECT SUM(tong) FROM HoaDon WHERE trang_thai='Da_xuat'", fetch_one=True
+
+# Một dòng tab Trang chủ (sản phẩm có xuất trong khoảng ngày)
+DongTrangChu = namedtuple(
+    "DongTrangChu",
+    [
+        "sanpham_id",
+        "ten",
+        "don_vi",
+        "ton_kho",  # Tổng LogKho (kể cả phần đã lưu trữ)
+        "sl_xhd",  # Đã bán và xuất hóa đơn trong khoảng ngày
+        "sl_xuat_bo",  # Đã xuất bổ (ChenhLechXuatBo) trong khoảng ngày
+        "so_lit",  # (sl_xhd + sl_xuat_bo) x số lít mỗi đơn vị
+    ],
+)
+
+
+@functools.lru_cache(maxsize=None)
+def so_lit_moi_don_vi(don_vi):
+    """
+    Parse đơn vị thành số LÍT (cache theo chuỗi đơn vị)
+
+    ⚠️ QUY TẮC ĐặC BIỆT:
+    - Nếu parse ra >= 50 lít → Coi như 1 đơn vị = 1 lít
+    - Nếu parse ra < 50 lít → Giữ nguyên giá trị
+
+    Ví dụ:
+    - "209 lít" → Parse: 209 → Vì 209 >= 50 → Return: 1 lít/đơn vị
+    - "4 lít" → Parse: 4 → Vì 4 < 50 → Return: 4 lít/đơn vị
+    - "1 lít" → 1
+    - "lít" → 1
+    - "chai" / "lon" / khác → 1 (mặc định)
+
+    Returns:
+        float: Số lít per đơn vị
+    """
+    if not don_vi:
+        return 1.0
+
+    text = str(don_vi).lower().strip()
+
+    # Pattern: "209 lít", "4 lít", etc
+    match = re.search(r"(\d+(?:\.\d+)?)\s*l[ií]t", text)
+    if match:
+        parsed_value = float(match.group(1))
+
+        # ⚠️ QUY TẮC ĐẶC BIỆT: Nếu >= 50 → Chỉ tính 1 lít/đơn vị
+        if parsed_value >= 50:
+            return 1.0
+        return parsed_value
+
+    # Mặc định (kể cả chỉ có "lít", không có số): 1 đơn vị = 1 lít
+    return 1.0
+
+
+@cache_bao_cao
+def du_lieu_trang_chu(tu_ngay, den_ngay):
+    """
+    Tồn kho, đã xuất (XHĐ + xuất bổ) và số lít của mọi sản phẩm có xuất
+    trong khoảng ngày, trong MỘT truy vấn.
+
+    LogKho, DoanhSoNgay (XHĐ) và ChenhLechXuatBo mỗi bảng được gom nhóm một
+    lần rồi LEFT JOIN vào SanPham, thay cho 2-3 truy vấn SUM cho từng sản phẩm.
+
+    Args:
+        tu_ngay, den_ngay: 'YYYY-MM-DD' (bao gồm cả hai đầu)
+
+    Returns:
+        tuple (list of DongTrangChu theo tên, tổng số lít)
+    """
+    tu_ngay = str(tu_ngay)[:10]
+    den_ngay = str(den_ngay)[:10]
+    rows = (
+        execute_query(
+            """
+        SELECT s.id, s.ten, s.don_vi,
+               COALESCE(lk.ton_kho, 0) + COALESCE(kc.sl_log_kho, 0),
+               COALESCE(ds.sl_xhd, 0),
+               COALESCE(cl.sl_xuat_bo, 0)
+        FROM SanPham s
+        LEFT JOIN (
+            SELECT sanpham_id, SUM(so_luong) AS sl_xhd
+            FROM DoanhSoNgay
+            WHERE xuat_hoa_don = 1 AND ngay >= ? AND ngay < date(?, '+1 day')
+            GROUP BY sanpham_id
+        ) ds ON ds.sanpham_id = s.id
+        LEFT JOIN (
+            SELECT ten_sanpham, SUM(so_luong) AS sl_xuat_bo
+            FROM ChenhLechXuatBo
+            WHERE ngay >= ? AND ngay < date(?, '+1 day')
+            GROUP BY ten_sanpham
+        ) cl ON cl.ten_sanpham = s.ten
+        LEFT JOIN (
+            SELECT sanpham_id, SUM(so_luong) AS ton_kho
+            FROM LogKho
+            GROUP BY sanpham_id
+        ) lk ON lk.sanpham_id = s.id
+        LEFT JOIN KetChuyenKho kc ON kc.sanpham_id = s.id
+        WHERE COALESCE(ds.sl_xhd, 0) + COALESCE(cl.sl_xuat_bo, 0) > 0
+        ORDER BY s.ten
+        """,
+            (tu_ngay, den_ngay, tu_ngay, den_ngay),
+            fetch_all=True,
+        )
+        or []
     )
-    return result[0] if result and result[0] else 0
+
+    ket_qua = []
+    tong_lit = 0.0
+    for sp_id, ten, don_vi, ton_kho, sl_xhd, sl_xuat_bo in rows:
+        so_lit = (float(sl_xhd) + float(sl_xuat_bo)) * so_lit_moi_don_vi(don_vi)
+        ket_qua.append(
+            DongTrangChu(sp_id, ten, don_vi, ton_kho, sl_xhd, sl_xuat_bo, so_lit)
+        )
+        tong_lit += so_lit
+    return ket_qua, tong_lit
+
+
+def bao_cao_kho():
+    """
+    Báo cáo kho rút gọn (dùng cho script/xuất file cũ).
+
+    Returns:
+        list of (id, ten, ton_kho, da_ban, xuat_bo)
+    """
+    return [
+        (
+            r.sanpham_id,
+            r.ten,
+            r.ton_kho,
+            r.sl_xhd + r.sl_chua_xuat_cthd,
+            r.sl_xuat_bo,
+        )
+        for r in tinh_bao_cao_kho()
+    ]
+
+
+@cache_bao_cao
+def bao_cao_doanh_thu():
+    return doanh_thu(trang_thai="Da_xuat") or 0
 
 
+@cache_bao_cao
 def chi_tiet_log_kho(sanpham_id=None, tu_ngay=None, den_ngay=None):
     sql = "SELECT id, sanpham_id, user_id, ngay, hanh_dong, so_luong, ton_truoc, ton_sau FROM LogKho WHERE 1=1"
     params = []
@@ -37,36 +266,44 @@ def chi_tiet_log_kho(sanpham_id=None, tu_ngay=None, den_ngay=None):
         sql += " AND date(ngay) <= date(?)"
         params.append(den_ngay)
     sql += " ORDER BY ngay DESC"
+    # Khoảng ngày chạm năm đã lưu trữ: đọc qua view gộp với file lưu trữ
+    if can_du_lieu_luu_tru(tu_ngay, den_ngay):
+        return truy_van_lich_su(
+            sql.replace("FROM LogKho", "FROM LogKho_TatCa"),
+            tuple(params),
+            tu_ngay,
+            den_ngay,
+        )
     return execute_query(sql, tuple(params) if params else None, fetch_all=True) or []
 
 
+def _khoang_thang(nam, thang):
+    """Ngày đầu và ngày cuối của tháng dạng 'YYYY-MM-DD'."""
+    tu_ngay = f"{nam:04d}-{thang:02d}-01"
+    nam_sau, thang_sau = (nam + 1, 1) if thang == 12 else (nam, thang + 1)
+    den_ngay = (
+        datetime(nam_sau, thang_sau, 1) - timedelta(days=1)
+    ).strftime("%Y-%m-%d")
+    return tu_ngay, den_ngay
+
+
+@cache_bao_cao
 def doanh_thu_theo_thang(nam, thang):
-    like = f"{nam:04d}-{thang:02d}-%"
-    result = execute_query(
-        "SELECT IFNULL(SUM(tong),0) FROM HoaDon WHERE trang_thai='Da_xuat' AND ngay LIKE ?",
-        (like,),
-        fetch_one=True,
-    )
-    return result[0] if result else 0
+    tu_ngay, den_ngay = _khoang_thang(nam, thang)
+    return doanh_thu(tu_ngay, den_ngay, trang_thai="Da_xuat")
 
 
+@cache_bao_cao
 def bao_cao_xuat_theo_thang(nam, thang):
     like = f"{nam:04d}-{thang:02d}-%"
+    tu_ngay, den_ngay = _khoang_thang(nam, thang)
 
-    res = (
-        execute_query(
-            """
-        SELECT s.ten, SUM(ct.so_luong) as tong_sl
-        FROM ChiTietHoaDon ct JOIN SanPham s ON ct.sanpham_id = s.id
-        JOIN HoaDon hd ON ct.hoadon_id = hd.id
-        WHERE hd.trang_thai = 'Da_xuat' AND hd.ngay LIKE ?
-        GROUP BY s.ten
-        """,
-            (like,),
-            fetch_all=True,
+    res = [
+        (ten, sl)
+        for _, ten, sl, _, _ in san_luong_theo_sanpham(
+            tu_ngay, den_ngay, trang_thai="Da_xuat"
         )
-        or []
-    )
+    ]
 
     xuat_bo = (
         execute_query(
@@ -0,0 +1,362 @@
+"""
+Bảng tổng hợp doanh số theo ngày (daily sales rollups)
+
+Hai bảng được duy trì tăng dần bằng trigger SQLite trên HoaDon/ChiTietHoaDon,
+nên mọi đường ghi (tạo hóa đơn, sửa chi tiết, xuất bổ, xóa hóa đơn...) đều tự
+cập nhật mà không phải sửa từng chỗ:
+
+- DoanhSoNgay: (ngay, sanpham_id, loai_gia, xuat_hoa_don, trang_thai)
+  -> so_luong, thanh_tien (so_luong * gia), giam, so_dong
+- DoanhThuNgay: (ngay, trang_thai) -> so_hoadon, tong, tong_cuoi
+
+trang_thai là trạng thái của hóa đơn cha ('Da_xuat' / 'Chua_xuat') để các báo
+cáo "đã xuất" đọc thẳng từ bảng tổng hợp.
+
+Báo cáo năm chỉ đọc tối đa 365 x số sản phẩm dòng thay vì toàn bộ chi tiết.
+Nếu dữ liệu lệch (sửa DB bằng tay, khôi phục bản sao lưu...), dựng lại bằng:
+    python sales_rollup.py [tu_ngay] [den_ngay]
+"""
+
+import sys
+from datetime import date, timedelta
+
+from archive import ngay_luu_tru_cuoi
+from utils.db_helpers import execute_query, db_transaction
+from utils.report_cache import cache_bao_cao
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+_KHOA_DOANH_SO = "ngay, sanpham_id, loai_gia, xuat_hoa_don, trang_thai"
+
+
+def _cong_chi_tiet(ct, dau):
+    """INSERT ... ON CONFLICT cộng (dau=1) hoặc trừ (dau=-1) một dòng chi tiết."""
+    return f"""
+        INSERT INTO DoanhSoNgay ({_KHOA_DOANH_SO}, so_luong, thanh_tien, giam, so_dong)
+        SELECT COALESCE(substr(hd.ngay, 1, 10), ''), COALESCE({ct}.sanpham_id, 0),
+               COALESCE({ct}.loai_gia, ''), COALESCE({ct}.xuat_hoa_don, 0),
+               COALESCE(hd.trang_thai, ''),
+               {dau} * COALESCE({ct}.so_luong, 0),
+               {dau} * COALESCE({ct}.so_luong, 0) * COALESCE({ct}.gia, 0),
+               {dau} * COALESCE({ct}.giam, 0),
+               {dau}
+        FROM HoaDon hd WHERE hd.id = {ct}.hoadon_id
+        ON CONFLICT({_KHOA_DOANH_SO}) DO UPDATE SET
+            so_luong = so_luong + excluded.so_luong,
+            thanh_tien = thanh_tien + excluded.thanh_tien,
+            giam = giam + excluded.giam,
+            so_dong = so_dong + excluded.so_dong;
+    """
+
+
+def _cong_ca_hoadon(hd, dau):
+    """Cộng/trừ toàn bộ chi tiết của một hóa đơn với ngày/trạng thái của hd."""
+    return f"""
+        INSERT INTO DoanhSoNgay ({_KHOA_DOANH_SO}, so_luong, thanh_tien, giam, so_dong)
+        SELECT COALESCE(substr({hd}.ngay, 1, 10), ''), COALESCE(sanpham_id, 0),
+               COALESCE(loai_gia, ''), COALESCE(xuat_hoa_don, 0),
+               COALESCE({hd}.trang_thai, ''),
+               {dau} * SUM(COALESCE(so_luong, 0)),
+               {dau} * SUM(COALESCE(so_luong, 0) * COALESCE(gia, 0)),
+               {dau} * SUM(COALESCE(giam, 0)),
+               {dau} * COUNT(*)
+        FROM ChiTietHoaDon WHERE hoadon_id = {hd}.id
+        GROUP BY COALESCE(sanpham_id, 0), COALESCE(loai_gia, ''), COALESCE(xuat_hoa_don, 0)
+        ON CONFLICT({_KHOA_DOANH_SO}) DO UPDATE SET
+            so_luong = so_luong + excluded.so_luong,
+            thanh_tien = thanh_tien + excluded.thanh_tien,
+            giam = giam + excluded.giam,
+            so_dong = so_dong + excluded.so_dong;
+    """
+
+
+def _cong_doanh_thu(hd, dau):
+    return f"""
+        INSERT INTO DoanhThuNgay (ngay, trang_thai, so_hoadon, tong, tong_cuoi)
+        VALUES (COALESCE(substr({hd}.ngay, 1, 10), ''), COALESCE({hd}.trang_thai, ''), {dau},
+                {dau} * COALESCE({hd}.tong, 0), {dau} * COALESCE({hd}.tong_cuoi, 0))
+        ON CONFLICT(ngay, trang_thai) DO UPDATE SET
+            so_hoadon = so_hoadon + excluded.so_hoadon,
+            tong = tong + excluded.tong,
+            tong_cuoi = tong_cuoi + excluded.tong_cuoi;
+    """
+
+
+def _don_dong_rong(ngay_expr):
+    """Xóa các nhóm đã về 0 dòng trong một ngày (dùng khóa chính, không quét bảng)."""
+    return f"""
+        DELETE FROM DoanhSoNgay WHERE ngay = {ngay_expr} AND so_dong <= 0;
+    """
+
+
+_TRIGGERS = {
+    "trg_doanhso_ct_insert": (
+        "AFTER INSERT ON ChiTietHoaDon",
+        _cong_chi_tiet("NEW", 1),
+    ),
+    "trg_doanhso_ct_delete": (
+        "AFTER DELETE ON ChiTietHoaDon",
+        _cong_chi_tiet("OLD", -1)
+        + _don_dong_rong(
+            "(SELECT substr(ngay, 1, 10) FROM HoaDon WHERE id = OLD.hoadon_id)"
+        ),
+    ),
+    "trg_doanhso_ct_update": (
+        "AFTER UPDATE OF hoadon_id, sanpham_id, so_luong, gia, loai_gia, giam, "
+        "xuat_hoa_don ON ChiTietHoaDon",
+        _cong_chi_tiet("OLD", -1)
+        + _cong_chi_tiet("NEW", 1)
+        + _don_dong_rong(
+            "(SELECT substr(ngay, 1, 10) FROM HoaDon WHERE id = OLD.hoadon_id)"
+        ),
+    ),
+    "trg_doanhso_hd_update": (
+        "AFTER UPDATE OF ngay, trang_thai ON HoaDon "
+        "WHEN substr(OLD.ngay, 1, 10) IS NOT substr(NEW.ngay, 1, 10) "
+        "OR OLD.trang_thai IS NOT NEW.trang_thai",
+        _cong_ca_hoadon("OLD", -1)
+        + _cong_ca_hoadon("NEW", 1)
+        + _don_dong_rong("substr(OLD.ngay, 1, 10)"),
+    ),
+    "trg_doanhso_hd_delete": (
+        # Chi tiết thường đã bị xóa trước; trừ nốt các dòng mồ côi nếu còn
+        "AFTER DELETE ON HoaDon",
+        _cong_ca_hoadon("OLD", -1)
+        + _don_dong_rong("substr(OLD.ngay, 1, 10)")
+        + _cong_doanh_thu("OLD", -1)
+        + "DELETE FROM DoanhThuNgay WHERE ngay = substr(OLD.ngay, 1, 10) "
+        "AND so_hoadon <= 0;",
+    ),
+    "trg_doanhthu_hd_insert": (
+        "AFTER INSERT ON HoaDon",
+        _cong_doanh_thu("NEW", 1),
+    ),
+    "trg_doanhthu_hd_update": (
+        "AFTER UPDATE OF ngay, trang_thai, tong, tong_cuoi ON HoaDon",
+        _cong_doanh_thu("OLD", -1)
+        + _cong_doanh_thu("NEW", 1)
+        + "DELETE FROM DoanhThuNgay WHERE ngay = substr(OLD.ngay, 1, 10) "
+        "AND so_hoadon <= 0;",
+    ),
+}
+
+
+def tao_bang_tong_hop(c):
+    """
+    Tạo bảng tổng hợp + trigger (gọi từ khoi_tao_db sau khi HoaDon đủ cột).
+
+    Lần đầu tạo trên DB đã có dữ liệu sẽ dựng lại toàn bộ.
+
+    Args:
+        c: Cursor sqlite3
+    """
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS DoanhSoNgay (
+            ngay TEXT NOT NULL,
+            sanpham_id INTEGER NOT NULL,
+            loai_gia TEXT NOT NULL,
+            xuat_hoa_don INTEGER NOT NULL,
+            trang_thai TEXT NOT NULL,
+            so_luong REAL DEFAULT 0,
+            thanh_tien REAL DEFAULT 0,
+            giam REAL DEFAULT 0,
+            so_dong INTEGER DEFAULT 0,
+            PRIMARY KEY (ngay, sanpham_id, loai_gia, xuat_hoa_don, trang_thai)
+        ) WITHOUT ROWID
+        """
+    )
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS DoanhThuNgay (
+            ngay TEXT NOT NULL,
+            trang_thai TEXT NOT NULL,
+            so_hoadon INTEGER DEFAULT 0,
+            tong REAL DEFAULT 0,
+            tong_cuoi REAL DEFAULT 0,
+            PRIMARY KEY (ngay, trang_thai)
+        ) WITHOUT ROWID
+        """
+    )
+    for ten, (su_kien, than) in _TRIGGERS.items():
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {ten} {su_kien} BEGIN {than} END")
+
+    c.execute("SELECT EXISTS (SELECT 1 FROM DoanhThuNgay)")
+    da_co_tong_hop = c.fetchone()[0]
+    c.execute("SELECT EXISTS (SELECT 1 FROM HoaDon)")
+    if not da_co_tong_hop and c.fetchone()[0]:
+        logger.info("Dựng bảng tổng hợp doanh số lần đầu...")
+        _xay_dung_lai(c)
+
+
+def _dieu_kien_ngay(cot, tu_ngay, den_ngay):
+    where = ""
+    params = []
+    if tu_ngay:
+        where += f" AND {cot} >= ?"
+        params.append(str(tu_ngay)[:10])
+    if den_ngay:
+        where += f" AND {cot} < date(?, '+1 day')"
+        params.append(str(den_ngay)[:10])
+    return where, params
+
+
+def _xay_dung_lai(c, tu_ngay=None, den_ngay=None):
+    where, params = _dieu_kien_ngay("ngay", tu_ngay, den_ngay)
+    c.execute("DELETE FROM DoanhSoNgay WHERE 1=1" + where, params)
+    c.execute("DELETE FROM DoanhThuNgay WHERE 1=1" + where, params)
+
+    where_hd, params = _dieu_kien_ngay("hd.ngay", tu_ngay, den_ngay)
+    c.execute(
+        f"""
+        INSERT INTO DoanhSoNgay ({_KHOA_DOANH_SO}, so_luong, thanh_tien, giam, so_dong)
+        SELECT COALESCE(substr(hd.ngay, 1, 10), ''), COALESCE(ct.sanpham_id, 0),
+               COALESCE(ct.loai_gia, ''), COALESCE(ct.xuat_hoa_don, 0),
+               COALESCE(hd.trang_thai, ''),
+               SUM(COALESCE(ct.so_luong, 0)),
+               SUM(COALESCE(ct.so_luong, 0) * COALESCE(ct.gia, 0)),
+               SUM(COALESCE(ct.giam, 0)),
+               COUNT(*)
+        FROM ChiTietHoaDon ct JOIN HoaDon hd ON ct.hoadon_id = hd.id
+        WHERE 1=1 {where_hd}
+        GROUP BY 1, 2, 3, 4, 5
+        """,
+        params,
+    )
+    c.execute(
+        f"""
+        INSERT INTO DoanhThuNgay (ngay, trang_thai, so_hoadon, tong, tong_cuoi)
+        SELECT COALESCE(substr(hd.ngay, 1, 10), ''), COALESCE(hd.trang_thai, ''), COUNT(*),
+               SUM(COALESCE(hd.tong, 0)), SUM(COALESCE(hd.tong_cuoi, 0))
+        FROM HoaDon hd
+        WHERE 1=1 {where_hd}
+        GROUP BY 1, 2
+        """,
+        params,
+    )
+
+
+def xay_dung_lai(tu_ngay=None, den_ngay=None):
+    """
+    Dựng lại bảng tổng hợp từ dữ liệu gốc (toàn bộ hoặc trong khoảng ngày).
+
+    Các ngày đã lưu trữ được bỏ qua: hóa đơn của chúng không còn trong DB chính,
+    dựng lại sẽ làm mất phần doanh số đã chuyển sang file lưu trữ.
+
+    Args:
+        tu_ngay, den_ngay: 'YYYY-MM-DD' (None = không giới hạn)
+
+    Returns:
+        int: Số dòng DoanhSoNgay sau khi dựng lại
+    """
+    ngay_cuoi = ngay_luu_tru_cuoi()
+    if ngay_cuoi and (not tu_ngay or str(tu_ngay)[:10] <= ngay_cuoi):
+        tu_ngay = (date.fromisoformat(ngay_cuoi) + timedelta(days=1)).isoformat()
+        logger.info(f"Bỏ qua các ngày đã lưu trữ, chỉ dựng lại từ {tu_ngay}")
+    with db_transaction() as (conn, c):
+        if not (tu_ngay and den_ngay and str(den_ngay)[:10] < str(tu_ngay)[:10]):
+            _xay_dung_lai(c, tu_ngay, den_ngay)
+        c.execute("SELECT COUNT(*) FROM DoanhSoNgay")
+        so_dong = c.fetchone()[0]
+    logger.info(f"Đã dựng lại bảng tổng hợp doanh số: {so_dong} dòng")
+    return so_dong
+
+
+@cache_bao_cao
+def doanh_thu(tu_ngay=None, den_ngay=None, trang_thai=None, cot="tong"):
+    """
+    Tổng doanh thu hóa đơn trong khoảng ngày.
+
+    Args:
+        tu_ngay, den_ngay: 'YYYY-MM-DD' (bao gồm cả hai đầu)
+        trang_thai: 'Da_xuat' / 'Chua_xuat' hoặc None = tất cả
+        cot: 'tong' (tổng cũ) hoặc 'tong_cuoi'
+
+    Returns:
+        float
+    """
+    if cot not in ("tong", "tong_cuoi"):
+        raise ValueError(f"Cột không hợp lệ: {cot}")
+    where, params = _dieu_kien_ngay("ngay", tu_ngay, den_ngay)
+    if trang_thai:
+        where += " AND trang_thai = ?"
+        params.append(trang_thai)
+    row = execute_query(
+        f"SELECT COALESCE(SUM({cot}), 0) FROM DoanhThuNgay WHERE 1=1" + where,
+        tuple(params),
+        fetch_one=True,
+    )
+    return row[0] if row else 0
+
+
+@cache_bao_cao
+def san_luong_theo_sanpham(
+    tu_ngay=None, den_ngay=None, xuat_hoa_don=None, trang_thai=None
+):
+    """
+    Sản lượng / thành tiền theo sản phẩm trong khoảng ngày.
+
+    Returns:
+        list of (sanpham_id, ten, so_luong, thanh_tien, giam)
+    """
+    where, params = _dieu_kien_ngay("d.ngay", tu_ngay, den_ngay)
+    if xuat_hoa_don is not None:
+        where += " AND d.xuat_hoa_don = ?"
+        params.append(int(xuat_hoa_don))
+    if trang_thai:
+        where += " AND d.trang_thai = ?"
+        params.append(trang_thai)
+    return (
+        execute_query(
+            """
+        SELECT d.sanpham_id, s.ten, SUM(d.so_luong), SUM(d.thanh_tien), SUM(d.giam)
+        FROM DoanhSoNgay d JOIN SanPham s ON d.sanpham_id = s.id
+        WHERE 1=1"""
+            + where
+            + " GROUP BY d.sanpham_id ORDER BY s.ten",
+            tuple(params),
+            fetch_all=True,
+        )
+        or []
+    )
+
+
+@cache_bao_cao
+def san_luong_theo_thang(nam, thang=None):
+    """
+    Sản lượng theo (tên sản phẩm, tháng) trong một năm cho biểu đồ.
+
+    Args:
+        nam: Năm (int)
+        thang: Tháng 1-12 hoặc None = cả năm
+
+    Returns:
+        list of (ten, 'MM', so_luong) sắp theo tên, tháng
+    """
+    if thang:
+        tu_ngay = f"{int(nam):04d}-{int(thang):02d}-01"
+        khoang = "+1 month"
+    else:
+        tu_ngay = f"{int(nam):04d}-01-01"
+        khoang = "+1 year"
+    return (
+        execute_query(
+            """
+        SELECT s.ten, substr(d.ngay, 6, 2) AS thang, SUM(d.so_luong)
+        FROM DoanhSoNgay d JOIN SanPham s ON d.sanpham_id = s.id
+        WHERE d.ngay >= ? AND d.ngay < date(?, ?)
+        GROUP BY s.ten, thang
+        ORDER BY s.ten, thang
+        """,
+            (tu_ngay, tu_ngay, khoang),
+            fetch_all=True,
+        )
+        or []
+    )
+
+
+if __name__ == "__main__":
+    tu = sys.argv[1] if len(sys.argv) > 1 else None
+    den = sys.argv[2] if len(sys.argv) > 2 else None
+    print(f"Da dung lai bang tong hop doanh so: {xay_dung_lai(tu, den)} dong")
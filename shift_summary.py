@@ -0,0 +1,667 @@
+"""
+Tổng kết ca tính dần trong ca (shift summary)
+
+Thay vì đến lúc đóng ca mới quét lại hóa đơn, LogKho và giao dịch quỹ, số liệu
+tổng kết được cộng dồn ngay khi phát sinh:
+
+- mo_ca(): lúc xác nhận nhận hàng, lưu danh sách kiểm đếm + chênh lệch tồn kho
+- ghi_nhan_hoa_don(): sau mỗi hóa đơn, cộng chi tiết theo (tên, loại giá, giá, XHĐ)
+  vào TongKetCaBan và cộng tổng tiền / công đoàn vào TongKetCa
+- tiền nộp theo hóa đơn của ca được trigger trên GiaoDichQuy cộng vào tong_nop,
+  nên mọi đường chuyển tiền (chuyen_tien, chuyen_tien_nhieu) đều được tính
+- hóa đơn của ca ĐANG MỞ bị sửa / xóa sau đó (HoaDonDaSua với sua_ban_hang):
+  phần bán của đúng các hóa đơn đó được chụp lại (TongKetCaHoaDonBan) rồi cộng
+  lại thành tổng của ca (tinh_lai_ca); công đoàn giữ giá trị đã ghi lúc bán như
+  LogKho. Xuất bổ / XHĐ / nộp tiền không phải sửa bán hàng, ca đã đóng không
+  bao giờ tính lại, nên "In lại ca cũ" in đúng số liệu lúc đóng
+
+Đóng ca chỉ đánh dấu ket_thuc; báo cáo in lại được từ số liệu đã lưu:
+    ca = lay_tong_ket_ca(ca_id)
+    html = tao_html_tong_ket(ca)
+"""
+
+import json
+from datetime import datetime
+
+from utils import event_bus
+from utils.db_helpers import execute_query, execute_update, db_transaction
+from utils.event_bus import HoaDonDaSua
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+TRANG_THAI_MO = "mo"
+TRANG_THAI_DONG = "dong"
+
+LOAI_GIA_HIEN_THI = {"le": "Lẻ", "buon": "Buôn", "vip": "VIP"}
+
+# Số hóa đơn mỗi câu lệnh khi tìm ca theo danh sách hóa đơn
+_SO_ID_MOI_LO = 900
+
+# Phần bán gộp theo (tên, loại giá, giá, XHĐ) từ ChiTietHoaDon ct / SanPham sp
+_COT_BAN = """
+    COALESCE(sp.ten, ''), COALESCE(ct.loai_gia, ''),
+    COALESCE(ct.gia, 0), COALESCE(ct.xuat_hoa_don, 0),
+    SUM(COALESCE(ct.so_luong, 0)),
+    SUM(COALESCE(ct.so_luong, 0) * COALESCE(ct.gia, 0) - COALESCE(ct.giam, 0))
+"""
+
+_TRIGGER_NOP_TIEN = """
+    CREATE TRIGGER IF NOT EXISTS trg_tongketca_nop_tien
+    AFTER INSERT ON GiaoDichQuy
+    WHEN NEW.hoadon_id IS NOT NULL
+    BEGIN
+        UPDATE TongKetCa SET tong_nop = tong_nop + COALESCE(NEW.so_tien, 0)
+        WHERE id = (SELECT ca_id FROM TongKetCaHoaDon WHERE hoadon_id = NEW.hoadon_id);
+    END
+"""
+
+
+def tao_bang_tong_ket_ca(c):
+    """
+    Tạo bảng tổng kết ca + trigger tiền nộp (gọi từ khoi_tao_db).
+
+    Args:
+        c: Cursor sqlite3
+    """
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS TongKetCa (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            bat_dau TEXT,
+            ket_thuc TEXT,
+            trang_thai TEXT DEFAULT 'mo',
+            nhan_hang TEXT DEFAULT '[]',
+            tong_tien_ban REAL DEFAULT 0,
+            tong_tien_xhd REAL DEFAULT 0,
+            tong_tien_chua_xhd REAL DEFAULT 0,
+            tong_cong_doan REAL DEFAULT 0,
+            tong_nop REAL DEFAULT 0,
+            so_hoadon INTEGER DEFAULT 0,
+            file_pdf TEXT,
+            FOREIGN KEY(user_id) REFERENCES Users(id)
+        )
+        """
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tongketca_user_batdau ON TongKetCa(user_id, bat_dau)"
+    )
+    # Sản phẩm đã bán trong ca, gộp theo (tên, loại giá, giá, XHĐ)
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS TongKetCaBan (
+            ca_id INTEGER NOT NULL,
+            ten TEXT NOT NULL,
+            loai_gia TEXT NOT NULL,
+            gia REAL NOT NULL,
+            xuat_hoa_don INTEGER NOT NULL,
+            so_luong REAL DEFAULT 0,
+            thanh_tien REAL DEFAULT 0,
+            UNIQUE (ca_id, ten, loai_gia, gia, xuat_hoa_don),
+            FOREIGN KEY(ca_id) REFERENCES TongKetCa(id)
+        )
+        """
+    )
+    # Hóa đơn thuộc ca nào (để trigger cộng tiền nộp đúng ca)
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS TongKetCaHoaDon (
+            hoadon_id INTEGER PRIMARY KEY,
+            ca_id INTEGER NOT NULL,
+            FOREIGN KEY(ca_id) REFERENCES TongKetCa(id)
+        )
+        """
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tongketcahoadon_ca ON TongKetCaHoaDon(ca_id)"
+    )
+    # Phần bán của từng hóa đơn lúc cộng vào ca, để sửa một hóa đơn chỉ thay phần
+    # của hóa đơn đó (các hóa đơn khác giữ số liệu lúc bán dù đã xuất bổ)
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS TongKetCaHoaDonBan (
+            hoadon_id INTEGER NOT NULL,
+            ten TEXT NOT NULL,
+            loai_gia TEXT NOT NULL,
+            gia REAL NOT NULL,
+            xuat_hoa_don INTEGER NOT NULL,
+            so_luong REAL DEFAULT 0,
+            thanh_tien REAL DEFAULT 0,
+            FOREIGN KEY(hoadon_id) REFERENCES TongKetCaHoaDon(hoadon_id)
+        )
+        """
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tongketcahoadonban_hoadon "
+        "ON TongKetCaHoaDonBan(hoadon_id)"
+    )
+    # DB cũ: chụp hóa đơn của các ca đang mở chưa có phần bán riêng
+    c.execute(
+        f"""
+        INSERT INTO TongKetCaHoaDonBan
+            (hoadon_id, ten, loai_gia, gia, xuat_hoa_don, so_luong, thanh_tien)
+        SELECT m.hoadon_id, {_COT_BAN}
+        FROM TongKetCaHoaDon m
+        JOIN TongKetCa t ON t.id = m.ca_id AND t.trang_thai = ?
+        JOIN ChiTietHoaDon ct ON ct.hoadon_id = m.hoadon_id
+        LEFT JOIN SanPham sp ON ct.sanpham_id = sp.id
+        WHERE NOT EXISTS (
+            SELECT 1 FROM TongKetCaHoaDonBan b WHERE b.hoadon_id = m.hoadon_id
+        )
+        GROUP BY 1, 2, 3, 4, 5
+        ORDER BY MIN(ct.id)
+        """,
+        (TRANG_THAI_MO,),
+    )
+    # Đọc lại hóa đơn / tiền nộp của một ca khi tính lại
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chitiethoadon_hoadon ON ChiTietHoaDon(hoadon_id)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_giaodichquy_hoadon ON GiaoDichQuy(hoadon_id)"
+    )
+    c.execute(_TRIGGER_NOP_TIEN)
+
+
+def _bay_gio():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def mo_ca(user_id, nhan_hang):
+    """
+    Mở ca mới sau khi nhận hàng; các ca đang mở của user được đóng lại.
+
+    Args:
+        user_id: ID người bán
+        nhan_hang: list of (ten, sl_dem, ton_db, chenh, ghi_chu)
+
+    Returns:
+        int: ID ca, None nếu lỗi
+    """
+    bay_gio = _bay_gio()
+    du_lieu = json.dumps([list(r[:4]) + [r[4] or ""] for r in nhan_hang], ensure_ascii=False)
+    try:
+        with db_transaction() as (conn, c):
+            c.execute(
+                "UPDATE TongKetCa SET trang_thai = ?, ket_thuc = ? "
+                "WHERE user_id = ? AND trang_thai = ?",
+                (TRANG_THAI_DONG, bay_gio, user_id, TRANG_THAI_MO),
+            )
+            c.execute(
+                "INSERT INTO TongKetCa (user_id, bat_dau, trang_thai, nhan_hang) "
+                "VALUES (?, ?, ?, ?)",
+                (user_id, bay_gio, TRANG_THAI_MO, du_lieu),
+            )
+            return c.lastrowid
+    except Exception as e:
+        logger.error(f"Lỗi mở ca cho user {user_id}: {e}")
+        return None
+
+
+def ghi_nhan_hoa_don(ca_id, hoadon_id):
+    """
+    Cộng chi tiết một hóa đơn vừa tạo vào tổng kết ca (mỗi hóa đơn chỉ cộng một lần).
+
+    Công đoàn tính như khi ghi LogKho: giá lẻ, (gia_le - gia_buon) * SL - giảm.
+
+    Returns:
+        bool: True nếu đã cộng
+    """
+    if not ca_id or not hoadon_id:
+        return False
+    try:
+        with db_transaction() as (conn, c):
+            c.execute(
+                "INSERT OR IGNORE INTO TongKetCaHoaDon (hoadon_id, ca_id) VALUES (?, ?)",
+                (hoadon_id, ca_id),
+            )
+            if c.rowcount == 0:
+                return False
+            _chup_hoa_don(c, hoadon_id)
+            c.execute(
+                """
+                INSERT INTO TongKetCaBan
+                    (ca_id, ten, loai_gia, gia, xuat_hoa_don, so_luong, thanh_tien)
+                SELECT ?, ten, loai_gia, gia, xuat_hoa_don, so_luong, thanh_tien
+                FROM TongKetCaHoaDonBan WHERE hoadon_id = ?
+                ORDER BY rowid
+                ON CONFLICT (ca_id, ten, loai_gia, gia, xuat_hoa_don) DO UPDATE SET
+                    so_luong = so_luong + excluded.so_luong,
+                    thanh_tien = thanh_tien + excluded.thanh_tien
+                """,
+                (ca_id, hoadon_id),
+            )
+            c.execute(
+                """
+                SELECT COALESCE(SUM(tien), 0),
+                       COALESCE(SUM(CASE WHEN xhd = 1 THEN tien END), 0),
+                       COALESCE(SUM(CASE WHEN xhd = 1 THEN 0 ELSE tien END), 0),
+                       COALESCE(SUM(cong_doan), 0)
+                FROM (
+                    SELECT COALESCE(ct.so_luong, 0) * COALESCE(ct.gia, 0)
+                               - COALESCE(ct.giam, 0) AS tien,
+                           ct.xuat_hoa_don AS xhd,
+                           CASE WHEN ct.loai_gia = 'le' AND sp.id IS NOT NULL
+                                THEN (sp.gia_le - sp.gia_buon) * ct.so_luong
+                                     - COALESCE(ct.giam, 0)
+                                ELSE 0 END AS cong_doan
+                    FROM ChiTietHoaDon ct LEFT JOIN SanPham sp ON ct.sanpham_id = sp.id
+                    WHERE ct.hoadon_id = ?
+                )
+                """,
+                (hoadon_id,),
+            )
+            tong, xhd, chua_xhd, cong_doan = c.fetchone()
+            # Tiền nộp ghi trước khi hóa đơn vào ca (cho nợ lúc bán) trigger chưa cộng
+            c.execute(
+                "SELECT COALESCE(SUM(so_tien), 0) FROM GiaoDichQuy WHERE hoadon_id = ?",
+                (hoadon_id,),
+            )
+            nop = c.fetchone()[0]
+            c.execute(
+                "UPDATE TongKetCa SET tong_tien_ban = tong_tien_ban + ?, "
+                "tong_tien_xhd = tong_tien_xhd + ?, "
+                "tong_tien_chua_xhd = tong_tien_chua_xhd + ?, "
+                "tong_cong_doan = tong_cong_doan + ?, tong_nop = tong_nop + ?, "
+                "so_hoadon = so_hoadon + 1 "
+                "WHERE id = ?",
+                (tong, xhd, chua_xhd, cong_doan, nop, ca_id),
+            )
+        return True
+    except Exception as e:
+        logger.error(f"Lỗi ghi nhận hóa đơn {hoadon_id} vào ca {ca_id}: {e}")
+        return False
+
+
+def _chup_hoa_don(c, hoadon_id):
+    """Ghi lại phần bán hiện tại của một hóa đơn (không còn dòng nào nếu đã xóa)."""
+    c.execute("DELETE FROM TongKetCaHoaDonBan WHERE hoadon_id = ?", (hoadon_id,))
+    c.execute(
+        f"""
+        INSERT INTO TongKetCaHoaDonBan
+            (hoadon_id, ten, loai_gia, gia, xuat_hoa_don, so_luong, thanh_tien)
+        SELECT ?, {_COT_BAN}
+        FROM ChiTietHoaDon ct LEFT JOIN SanPham sp ON ct.sanpham_id = sp.id
+        WHERE ct.hoadon_id = ?
+        GROUP BY 2, 3, 4, 5
+        ORDER BY MIN(ct.id)
+        """,
+        (hoadon_id, hoadon_id),
+    )
+
+
+def _tinh_lai(c, ca_id):
+    """Cộng lại TongKetCaBan, tổng tiền, tiền nộp và số hóa đơn của ca từ phần bán đã chụp."""
+    c.execute("DELETE FROM TongKetCaBan WHERE ca_id = ?", (ca_id,))
+    c.execute(
+        """
+        INSERT INTO TongKetCaBan
+            (ca_id, ten, loai_gia, gia, xuat_hoa_don, so_luong, thanh_tien)
+        SELECT ?, b.ten, b.loai_gia, b.gia, b.xuat_hoa_don,
+               SUM(b.so_luong), SUM(b.thanh_tien)
+        FROM TongKetCaHoaDon m
+        JOIN TongKetCaHoaDonBan b ON b.hoadon_id = m.hoadon_id
+        WHERE m.ca_id = ?
+        GROUP BY 2, 3, 4, 5
+        ORDER BY MIN(b.rowid)
+        """,
+        (ca_id, ca_id),
+    )
+    c.execute(
+        """
+        UPDATE TongKetCa SET
+            tong_tien_ban = (SELECT COALESCE(SUM(thanh_tien), 0)
+                             FROM TongKetCaBan WHERE ca_id = :ca),
+            tong_tien_xhd = (SELECT COALESCE(SUM(thanh_tien), 0)
+                             FROM TongKetCaBan WHERE ca_id = :ca AND xuat_hoa_don = 1),
+            tong_tien_chua_xhd = (SELECT COALESCE(SUM(thanh_tien), 0)
+                                  FROM TongKetCaBan WHERE ca_id = :ca AND xuat_hoa_don != 1),
+            tong_nop = (SELECT COALESCE(SUM(g.so_tien), 0)
+                        FROM TongKetCaHoaDon m JOIN GiaoDichQuy g ON g.hoadon_id = m.hoadon_id
+                        WHERE m.ca_id = :ca),
+            so_hoadon = (SELECT COUNT(*)
+                         FROM TongKetCaHoaDon m JOIN HoaDon h ON h.id = m.hoadon_id
+                         WHERE m.ca_id = :ca)
+        WHERE id = :ca
+        """,
+        {"ca": ca_id},
+    )
+
+
+def tinh_lai_ca(ca_id=None, hoadon_ids=None):
+    """
+    Tính lại tổng kết ca ĐANG MỞ sau khi hóa đơn của ca bị sửa / xóa.
+
+    Chỉ chụp lại phần bán của các hóa đơn được chỉ định (hoặc mọi hóa đơn của
+    ca_id); ca đã đóng giữ nguyên số liệu lúc đóng.
+
+    Args:
+        ca_id: ID ca (None = xác định theo hoadon_ids)
+        hoadon_ids: Iterable ID hóa đơn đã thay đổi
+
+    Returns:
+        list ID các ca đã tính lại
+    """
+    try:
+        with db_transaction() as (conn, c):
+            if ca_id is not None:
+                c.execute(
+                    "SELECT id FROM TongKetCa WHERE id = ? AND trang_thai = ?",
+                    (ca_id, TRANG_THAI_MO),
+                )
+                if not c.fetchone():
+                    return []
+                c.execute(
+                    "SELECT hoadon_id, ca_id FROM TongKetCaHoaDon WHERE ca_id = ?",
+                    (ca_id,),
+                )
+                hoa_don_ca = c.fetchall()
+                cac_ca = [ca_id]
+            else:
+                ids = sorted({i for i in (hoadon_ids or ()) if i is not None})
+                hoa_don_ca = []
+                # Chia lô: SQLite cũ giới hạn 999 biến mỗi câu lệnh
+                for dau in range(0, len(ids), _SO_ID_MOI_LO):
+                    lo = ids[dau : dau + _SO_ID_MOI_LO]
+                    c.execute(
+                        "SELECT m.hoadon_id, m.ca_id FROM TongKetCaHoaDon m "
+                        "JOIN TongKetCa t ON t.id = m.ca_id AND t.trang_thai = ? "
+                        f"WHERE m.hoadon_id IN ({','.join('?' * len(lo))})",
+                        [TRANG_THAI_MO] + lo,
+                    )
+                    hoa_don_ca.extend(c.fetchall())
+                cac_ca = sorted({ca for _, ca in hoa_don_ca})
+            for hoadon_id, _ in hoa_don_ca:
+                _chup_hoa_don(c, hoadon_id)
+            for ca in cac_ca:
+                _tinh_lai(c, ca)
+            return cac_ca
+    except Exception as e:
+        logger.error(f"Lỗi tính lại tổng kết ca ({ca_id or hoadon_ids}): {e}")
+        return []
+
+
+def _khi_hoa_don_sua(su_kien):
+    # Xuất bổ / XHĐ / nộp tiền không đổi phần bán hàng đã ghi của ca
+    if not su_kien.sua_ban_hang:
+        return
+    if su_kien.hoadon_ids is None:
+        # Không rõ hóa đơn nào: tính lại các ca đang mở
+        for (ca_id,) in execute_query(
+            "SELECT id FROM TongKetCa WHERE trang_thai = ?",
+            (TRANG_THAI_MO,),
+            fetch_all=True,
+        ) or []:
+            tinh_lai_ca(ca_id)
+    elif su_kien.hoadon_ids:
+        tinh_lai_ca(hoadon_ids=su_kien.hoadon_ids)
+
+
+event_bus.dang_ky(HoaDonDaSua, _khi_hoa_don_sua)
+
+
+def dong_ca(ca_id):
+    """Đánh dấu ca đã đóng (số liệu đã được cộng dồn sẵn)."""
+    execute_update(
+        "UPDATE TongKetCa SET trang_thai = ?, ket_thuc = COALESCE(ket_thuc, ?) WHERE id = ?",
+        (TRANG_THAI_DONG, _bay_gio(), ca_id),
+    )
+
+
+def cap_nhat_file_pdf(ca_id, file_pdf):
+    """Lưu đường dẫn file PDF tổng kết đã xuất của ca."""
+    execute_update("UPDATE TongKetCa SET file_pdf = ? WHERE id = ?", (file_pdf, ca_id))
+
+
+def lay_tong_ket_ca(ca_id):
+    """
+    Số liệu tổng kết đã lưu của một ca.
+
+    Returns:
+        dict hoặc None nếu không có ca
+    """
+    row = execute_query(
+        """
+        SELECT t.id, t.user_id, COALESCE(u.username, ''), t.bat_dau, t.ket_thuc,
+               t.trang_thai, t.nhan_hang, t.tong_tien_ban, t.tong_tien_xhd,
+               t.tong_tien_chua_xhd, t.tong_cong_doan, t.tong_nop, t.so_hoadon, t.file_pdf
+        FROM TongKetCa t LEFT JOIN Users u ON t.user_id = u.id
+        WHERE t.id = ?
+        """,
+        (ca_id,),
+        fetch_one=True,
+    )
+    if not row:
+        return None
+    ca = dict(
+        zip(
+            [
+                "id", "user_id", "username", "bat_dau", "ket_thuc", "trang_thai",
+                "nhan_hang", "tong_tien_ban", "tong_tien_xhd", "tong_tien_chua_xhd",
+                "tong_cong_doan", "tong_nop", "so_hoadon", "file_pdf",
+            ],
+            row,
+        )
+    )
+    try:
+        ca["nhan_hang"] = [tuple(r) for r in json.loads(ca["nhan_hang"] or "[]")]
+    except ValueError:
+        ca["nhan_hang"] = []
+
+    ca["ban_xhd"] = []
+    ca["ban_chua_xhd"] = []
+    for ten, loai_gia, gia, xhd, sl, tong in execute_query(
+        "SELECT ten, loai_gia, gia, xuat_hoa_don, so_luong, thanh_tien "
+        "FROM TongKetCaBan WHERE ca_id = ? ORDER BY rowid",
+        (ca_id,),
+        fetch_all=True,
+    ) or []:
+        dong = (ten, sl, LOAI_GIA_HIEN_THI.get(loai_gia, loai_gia), gia, tong)
+        (ca["ban_xhd"] if xhd == 1 else ca["ban_chua_xhd"]).append(dong)
+    ca["tong_thieu"] = (ca["tong_tien_ban"] or 0) - (ca["tong_nop"] or 0)
+    return ca
+
+
+def danh_sach_ca(user_id=None, limit=100):
+    """
+    Các ca gần nhất (mới nhất trước).
+
+    Returns:
+        list of (id, username, bat_dau, ket_thuc, trang_thai, tong_tien_ban, tong_nop, so_hoadon)
+    """
+    sql = (
+        "SELECT t.id, COALESCE(u.username, ''), t.bat_dau, t.ket_thuc, t.trang_thai, "
+        "t.tong_tien_ban, t.tong_nop, t.so_hoadon "
+        "FROM TongKetCa t LEFT JOIN Users u ON t.user_id = u.id"
+    )
+    params = []
+    if user_id is not None:
+        sql += " WHERE t.user_id = ?"
+        params.append(user_id)
+    sql += " ORDER BY t.id DESC LIMIT ?"
+    params.append(int(limit))
+    return execute_query(sql, tuple(params), fetch_all=True) or []
+
+
+_CSS = """
+    @page { size: A4 portrait; margin: 15mm; }
+    body {
+        font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+        font-size: 10pt;
+        margin: 0;
+        padding: 10px;
+        max-width: 210mm;
+    }
+    h1 {
+        text-align: center;
+        color: #2c3e50;
+        border-bottom: 2px solid #3498db;
+        padding-bottom: 8px;
+        margin: 10px 0 15px 0;
+        font-size: 16pt;
+    }
+    h2 {
+        color: #34495e;
+        margin-top: 15px;
+        margin-bottom: 8px;
+        border-left: 3px solid #3498db;
+        padding-left: 8px;
+        font-size: 12pt;
+    }
+    table { width: 100%; border-collapse: collapse; margin: 5px 0 10px 0; font-size: 9pt; }
+    th {
+        background-color: #3498db;
+        color: white;
+        padding: 6px 8px;
+        text-align: left;
+        font-weight: bold;
+        border: 1px solid #2980b9;
+    }
+    td { padding: 5px 8px; border: 1px solid #ddd; }
+    .info-box {
+        background-color: #e8f5e9;
+        padding: 8px;
+        border-left: 3px solid #4caf50;
+        margin: 10px 0;
+        font-size: 9pt;
+    }
+    .money { text-align: right; font-weight: bold; }
+    .total-row { background-color: #3498db; color: white; font-weight: bold; }
+"""
+
+
+def _bang_ban(ds, tieu_de_tong, tong):
+    html = """
+        <table>
+            <tr>
+                <th>Sản phẩm</th>
+                <th style="text-align: center;">SL</th>
+                <th style="text-align: center;">Loại giá</th>
+                <th style="text-align: right;">Đơn giá</th>
+                <th style="text-align: right;">Thành tiền</th>
+            </tr>
+    """
+    for ten, sl, loai_gia, gia, thanh_tien in ds:
+        html += f"""
+            <tr>
+                <td>{ten}</td>
+                <td style="text-align: center;">{sl:.0f}</td>
+                <td style="text-align: center;">{loai_gia}</td>
+                <td class="money">{gia:,.0f}</td>
+                <td class="money">{thanh_tien:,.0f}</td>
+            </tr>
+        """
+    html += f"""
+            <tr class="total-row">
+                <td colspan="4">{tieu_de_tong}</td>
+                <td class="money">{tong:,.0f}</td>
+            </tr>
+        </table>
+    """
+    return html
+
+
+def tao_html_tong_ket(ca):
+    """
+    HTML báo cáo đóng ca từ số liệu đã lưu (xem trước, in, xuất PDF).
+
+    Args:
+        ca: dict từ lay_tong_ket_ca()
+
+    Returns:
+        str: HTML
+    """
+    thoi_diem = ca["ket_thuc"] or _bay_gio()
+    try:
+        thoi_diem = datetime.strptime(thoi_diem, "%Y-%m-%d %H:%M:%S").strftime(
+            "%d/%m/%Y %H:%M"
+        )
+    except ValueError:
+        pass
+
+    html = f"""
+    <html>
+    <head><style>{_CSS}</style></head>
+    <body>
+        <h1>BÁO CÁO ĐÓNG CA</h1>
+
+        <div class="info-box">
+            <strong>Ngày giờ:</strong> {thoi_diem}<br>
+            <strong>Người bán:</strong> {ca["username"]} (ID: {ca["user_id"]})<br>
+            <strong>Ca số:</strong> {ca["id"]} - {ca["so_hoadon"]} hóa đơn
+        </div>
+
+        <h2>Danh sách nhận hàng</h2>
+    """
+
+    if ca["nhan_hang"]:
+        html += """
+        <table>
+            <tr>
+                <th>Sản phẩm</th>
+                <th style="text-align: right;">SL Đếm</th>
+                <th style="text-align: right;">Tồn HT</th>
+                <th style="text-align: right;">Chênh lệch</th>
+                <th>Lý do</th>
+            </tr>
+        """
+        for ten, sl_dem, ton_db, chenh, ghi_chu in ca["nhan_hang"]:
+            chenh_style = (
+                "color: red;" if chenh < 0 else ("color: green;" if chenh > 0 else "")
+            )
+            html += f"""
+            <tr>
+                <td>{ten}</td>
+                <td class="money">{sl_dem:.0f}</td>
+                <td class="money">{ton_db:.0f}</td>
+                <td class="money" style="{chenh_style}">{chenh:+.0f}</td>
+                <td>{ghi_chu if ghi_chu else '-'}</td>
+            </tr>
+            """
+        html += "</table>"
+    else:
+        html += "<p><i>Không có dữ liệu nhận hàng</i></p>"
+
+    html += "<h2>Danh sách sản phẩm đã bán - ĐÃ XUẤT HÓA ĐƠN</h2>"
+    if ca["ban_xhd"]:
+        html += _bang_ban(ca["ban_xhd"], "TỔNG ĐÃ XUẤT HÓA ĐƠN", ca["tong_tien_xhd"])
+    else:
+        html += "<p><i>Không có sản phẩm đã xuất hóa đơn</i></p>"
+
+    html += "<h2>Danh sách sản phẩm đã bán - CHƯA XUẤT HÓA ĐƠN</h2>"
+    if ca["ban_chua_xhd"]:
+        html += _bang_ban(
+            ca["ban_chua_xhd"], "TỔNG CHƯA XUẤT HÓA ĐƠN", ca["tong_tien_chua_xhd"]
+        )
+    else:
+        html += "<p><i>Không có sản phẩm chưa xuất hóa đơn</i></p>"
+
+    html += f"""
+        <h2>Tổng kết tài chính</h2>
+        <table>
+            <tr>
+                <th>Khoản mục</th>
+                <th style="text-align: right;">Số tiền</th>
+            </tr>
+            <tr>
+                <td>Tổng tiền bán hàng</td>
+                <td class="money">{ca["tong_tien_ban"]:,.0f} VNĐ</td>
+            </tr>
+            <tr>
+                <td>Tổng công đoàn</td>
+                <td class="money">{ca["tong_cong_doan"]:,.0f} VNĐ</td>
+            </tr>
+            <tr>
+                <td>Tổng tiền đã nộp</td>
+                <td class="money">{ca["tong_nop"]:,.0f} VNĐ</td>
+            </tr>
+            <tr class="total-row">
+                <td>Còn thiếu</td>
+                <td class="money">{ca["tong_thieu"]:,.0f} VNĐ</td>
+            </tr>
+        </table>
+    </body>
+    </html>
+    """
+    return html
@@ -1,6 +1,11 @@
+from collections import namedtuple
 from datetime import datetime
 from db import ket_noi
 from utils.db_helpers import execute_query, db_transaction
+from utils.report_cache import cache_bao_cao
+from ledger import cap_nhat_so_du, LY_DO_XUAT_BO
+from utils import event_bus
+from utils.event_bus import HoaDonDaSua, SoDuThayDoi, TonKhoThayDoi
 
 
 def lay_ton_kho(sanpham_id):
@@ -34,6 +39,7 @@ def cap_nhat_ton_kho(sanpham_id, so_luong_moi):
         execute_query(
             "UPDATE SanPham SET ton_kho = ? WHERE id = ?", (so_luong_moi, sanpham_id)
         )
+        event_bus.phat(TonKhoThayDoi([sanpham_id]))
         return True
     except:
         return False
@@ -78,6 +84,7 @@ def cap_nhat_kho_sau_ban(sanpham_id, so_luong, user_id, gia_ap_dung, chenh_lech=
                 ),
             )
 
+        event_bus.phat(TonKhoThayDoi([sanpham_id]))
         return True, "Cập nhật kho thành công"
     except Exception as e:
         return False, f"Lỗi cập nhật kho: {str(e)}"
@@ -136,10 +143,13 @@ def xuat_bo_san_pham(hoadon_id, sanpham_id, user_id, so_luong, gia, chenh_lech):
 
             # Cập nhật số dư user: trừ so_du (giảm khi xuất bổ)
             tong_tien = so_luong * (gia + chenh_lech)
-            c.execute(
-                "UPDATE Users SET so_du = so_du - ? WHERE id = ?", (tong_tien, user_id)
-            )
+            cap_nhat_so_du(c, user_id, -tong_tien, LY_DO_XUAT_BO, hoadon_id)
 
+        event_bus.phat(
+            HoaDonDaSua([hoadon_id], [user_id], [sanpham_id]),
+            TonKhoThayDoi([sanpham_id]),
+            SoDuThayDoi([user_id]),
+        )
         return True, "Xuất bổ thành công"
     except Exception as e:
         return False, f"Lỗi xuất bổ: {str(e)}"
@@ -297,6 +307,9 @@ def xuat_bo_san_pham_theo_ten(
             else chenh_lech
         )
 
+        # Các hóa đơn có dòng được xuất (để báo thay đổi)
+        hoadon_da_xuat = set()
+
         # Xuất từ loại giá chính trước
         for chi_tiet_id, hoadon_id, sl_hien_tai, gia in chi_tiet_list:
             if so_luong_con_lai <= 0:
@@ -332,6 +345,7 @@ def xuat_bo_san_pham_theo_ten(
 
             tong_tien_xuat += sl_xuat * gia
             so_luong_con_lai -= sl_xuat
+            hoadon_da_xuat.add(hoadon_id)
 
         # Nếu còn thiếu và có loại giá phụ, xuất từ loại giá phụ
         if so_luong_con_lai > 0 and loai_gia_phu and so_luong_phu > 0:
@@ -382,6 +396,7 @@ def xuat_bo_san_pham_theo_ten(
 
                 tong_tien_xuat += sl_xuat * gia
                 so_luong_con_lai -= sl_xuat
+                hoadon_da_xuat.add(hoadon_id)
 
         # Nếu còn thiếu và có loại giá phụ thứ 2, xuất từ loại giá phụ thứ 2
         if so_luong_con_lai > 0 and loai_gia_phu2 and so_luong_phu2 > 0:
@@ -432,6 +447,7 @@ def xuat_bo_san_pham_theo_ten(
 
                 tong_tien_xuat += sl_xuat * gia
                 so_luong_con_lai -= sl_xuat
+                hoadon_da_xuat.add(hoadon_id)
 
         # Ghi log công đoàn cho từng phần theo logic mới
         sl_chinh = so_luong_xuat - (so_luong_phu + so_luong_phu2)
@@ -491,8 +507,8 @@ def xuat_bo_san_pham_theo_ten(
 
         # Cập nhật số dư user: trừ so_du
         tong_tien_giam = tong_tien_xuat + (so_luong_xuat * chenh_lech)
-        c.execute(
-            "UPDATE Users SET so_du = so_du - ? WHERE id = ?", (tong_tien_giam, user_id)
+        cap_nhat_so_du(
+            c, user_id, -tong_tien_giam, LY_DO_XUAT_BO, ghi_chu=ten_sanpham
         )
 
         # Kiểm tra và cập nhật trạng thái hóa đơn
@@ -508,11 +524,17 @@ def xuat_bo_san_pham_theo_ten(
                     (hoadon_id,),
                 )
 
+        event_bus.phat(
+            HoaDonDaSua(hoadon_da_xuat, [user_id], [sanpham_id]),
+            TonKhoThayDoi([sanpham_id]),
+            SoDuThayDoi([user_id]),
+        )
         return True, f"Xuất bổ thành công {so_luong_xuat} {ten_sanpham}"
     except Exception as e:
         return False, f"Lỗi xuất bổ: {str(e)}"
 
 
+@cache_bao_cao
 def lay_tong_chua_xuat_theo_sp():
     return (
         execute_query(
@@ -525,22 +547,349 @@ def lay_tong_chua_xuat_theo_sp():
     )
 
 
-def lay_bao_cao_cong_doan(tu_ngay=None, den_ngay=None):
-    sql = "SELECT id, sanpham_id, user_id, ngay, so_luong, chenh_lech FROM CongDoan WHERE 1=1"
+# Chỉ số tab Xuất bổ
+ChiSoXuatBo = namedtuple(
+    "ChiSoXuatBo",
+    [
+        "chua_xuat",  # {(ten_sanpham, loai_gia): số lượng còn chưa xuất > 0}
+        "xuat_du",  # {(ten_sanpham, loai_gia): số lượng đã xuất vượt > 0}
+        "nguong_buon",  # {ten_sanpham: ngưỡng buôn} (chỉ sản phẩm còn tồn tại)
+    ],
+)
+
+
+@cache_bao_cao
+def lay_chi_so_xuat_bo():
+    """
+    Số lượng chưa xuất / xuất dư theo (sản phẩm, loại giá) trong MỘT truy vấn.
+
+    Chưa xuất = (bán chưa XHĐ + nhập đầu kỳ) - đã xuất dư; nếu âm thì phần âm
+    là xuất dư và chưa xuất = 0.
+
+    Returns:
+        ChiSoXuatBo
+    """
+    rows = (
+        execute_query(
+            """
+        SELECT u.ten, u.loai_gia, COALESCE(SUM(u.ban), 0), COALESCE(SUM(u.du), 0),
+               sp.nguong_buon, sp.id IS NOT NULL
+        FROM (
+            SELECT s.ten AS ten, ct.loai_gia AS loai_gia, ct.so_luong AS ban, 0 AS du
+            FROM ChiTietHoaDon ct
+            JOIN SanPham s ON ct.sanpham_id = s.id
+            WHERE ct.xuat_hoa_don = 0 AND ct.so_luong > 0
+            UNION ALL
+            SELECT ten_sanpham, loai_gia, so_luong, 0 FROM DauKyXuatBo
+            UNION ALL
+            SELECT ten_sanpham, loai_gia, 0, so_luong FROM XuatDu
+        ) u
+        LEFT JOIN SanPham sp ON sp.ten = u.ten
+        GROUP BY u.ten, u.loai_gia
+        """,
+            fetch_all=True,
+        )
+        or []
+    )
+
+    chua_xuat = {}
+    xuat_du = {}
+    nguong_buon = {}
+    for ten, loai_gia, ban, du, nguong, co_sp in rows:
+        net = ban - du
+        if net > 0:
+            chua_xuat[(ten, loai_gia)] = net
+        elif net < 0:
+            xuat_du[(ten, loai_gia)] = -net
+        if co_sp:
+            nguong_buon[ten] = nguong or 0
+    return ChiSoXuatBo(chua_xuat, xuat_du, nguong_buon)
+
+
+# Tình trạng sản phẩm để kiểm tra trước khi xuất bổ / lập hóa đơn
+TinhTrangSanPham = namedtuple(
+    "TinhTrangSanPham",
+    [
+        "sanpham_id",
+        "ten",
+        "gia_le",
+        "gia_buon",
+        "gia_vip",
+        "nguong_buon",
+        "ton_kho",
+        "sl_chua_xuat",  # bán chưa XHĐ (ChiTietHoaDon xuat_hoa_don=0)
+        "sl_dau_ky",  # đầu kỳ còn lại (DauKyXuatBo)
+        "chua_xuat_theo_loai",  # {loai_gia: số lượng còn chưa xuất > 0} như tab Xuất bổ
+        "sys",  # tồn kho + chưa xuất + đầu kỳ (công thức tab Báo cáo)
+    ],
+)
+
+# Số tên mỗi lô: truy vấn theo loại giá dùng 3 lần, SQLite cũ giới hạn 999 biến
+_SO_THAM_SO_MOI_LO = 300
+
+
+def lay_tinh_trang_san_pham(ten_list, c=None):
+    """
+    Giá, tồn kho, số lượng chưa xuất/đầu kỳ và SYS của nhiều sản phẩm (theo
+    tên, khớp chính xác) trên MỘT kết nối, hai truy vấn cho cả danh sách.
+
+    Args:
+        ten_list: Các tên sản phẩm
+        c: Cursor đang dùng (None = mở kết nối riêng)
+
+    Returns:
+        dict {ten: TinhTrangSanPham}; tên không tồn tại không có trong dict
+    """
+    return _doc_tinh_trang(c, "ten", ten_list)
+
+
+def lay_tinh_trang_theo_id(sanpham_ids, c=None):
+    """
+    Như lay_tinh_trang_san_pham nhưng theo id sản phẩm.
+
+    Returns:
+        dict {sanpham_id: TinhTrangSanPham}
+    """
+    return _doc_tinh_trang(c, "id", sanpham_ids)
+
+
+def _doc_tinh_trang(c, cot, khoa):
+    khoa = list(dict.fromkeys(k for k in khoa if k is not None and k != ""))
+    if not khoa:
+        return {}
+    if c is None:
+        conn = ket_noi()
+        try:
+            return _doc_tinh_trang(conn.cursor(), cot, khoa)
+        finally:
+            conn.close()
+
+    san_pham = []
+    theo_loai = {}
+    for i in range(0, len(khoa), _SO_THAM_SO_MOI_LO):
+        lo = khoa[i : i + _SO_THAM_SO_MOI_LO]
+        dau_hoi = ",".join("?" * len(lo))
+        c.execute(
+            f"""
+            SELECT s.id, s.ten, s.gia_le, s.gia_buon, s.gia_vip, s.nguong_buon,
+                   COALESCE(s.ton_kho, 0),
+                   COALESCE((SELECT SUM(ct.so_luong) FROM ChiTietHoaDon ct
+                             WHERE ct.sanpham_id = s.id AND ct.xuat_hoa_don = 0), 0),
+                   COALESCE((SELECT SUM(dk.so_luong) FROM DauKyXuatBo dk
+                             WHERE dk.sanpham_id = s.id), 0)
+            FROM SanPham s
+            WHERE s.{cot} IN ({dau_hoi})
+            """,
+            lo,
+        )
+        rows = c.fetchall()
+        san_pham.extend(rows)
+
+        # Chưa xuất theo loại giá: cùng công thức với lay_chi_so_xuat_bo
+        ten_lo = [r[1] for r in rows]
+        if not ten_lo:
+            continue
+        dau_hoi = ",".join("?" * len(ten_lo))
+        c.execute(
+            f"""
+            SELECT u.ten, u.loai_gia, COALESCE(SUM(u.ban), 0) - COALESCE(SUM(u.du), 0)
+            FROM (
+                SELECT s.ten AS ten, ct.loai_gia AS loai_gia, ct.so_luong AS ban, 0 AS du
+                FROM ChiTietHoaDon ct
+                JOIN SanPham s ON ct.sanpham_id = s.id
+                WHERE ct.xuat_hoa_don = 0 AND ct.so_luong > 0 AND s.ten IN ({dau_hoi})
+                UNION ALL
+                SELECT ten_sanpham, loai_gia, so_luong, 0 FROM DauKyXuatBo
+                WHERE ten_sanpham IN ({dau_hoi})
+                UNION ALL
+                SELECT ten_sanpham, loai_gia, 0, so_luong FROM XuatDu
+                WHERE ten_sanpham IN ({dau_hoi})
+            ) u
+            GROUP BY u.ten, u.loai_gia
+            """,
+            ten_lo * 3,
+        )
+        for ten, loai_gia, con in c.fetchall():
+            if con > 0:
+                theo_loai.setdefault(ten, {})[loai_gia] = con
+
+    ket_qua = {}
+    for sp_id, ten, gia_le, gia_buon, gia_vip, nguong, ton, chua_xuat, dau_ky in san_pham:
+        tt = TinhTrangSanPham(
+            sp_id,
+            ten,
+            float(gia_le or 0),
+            float(gia_buon or 0),
+            float(gia_vip or 0),
+            nguong or 0,
+            ton,
+            float(chua_xuat),
+            float(dau_ky),
+            theo_loai.get(ten, {}),
+            float(ton) + float(chua_xuat) + float(dau_ky),
+        )
+        ket_qua[sp_id if cot == "id" else ten] = tt
+    return ket_qua
+
+
+def _dieu_kien_khoang_ngay(cot, tu_ngay, den_ngay):
+    """Điều kiện khoảng ngày dạng range trên cột ngay (dùng được index)."""
+    where = ""
     params = []
     if tu_ngay:
-        sql += " AND ngay >= ?"
-        params.append(tu_ngay)
+        where += f" AND {cot} >= ?"
+        params.append(str(tu_ngay)[:10])
     if den_ngay:
-        sql += " AND ngay <= ?"
-        params.append(den_ngay)
-    data = execute_query(sql, tuple(params) if params else None, fetch_all=True) or []
+        where += f" AND {cot} < date(?, '+1 day')"
+        params.append(str(den_ngay)[:10])
+    return where, params
 
-    sql_tong = "SELECT SUM(chenh_lech * so_luong) FROM CongDoan WHERE 1=1"
-    if tu_ngay:
-        sql_tong += " AND ngay >= ?"
-    if den_ngay:
-        sql_tong += " AND ngay <= ?"
-    result = execute_query(sql_tong, tuple(params) if params else None, fetch_one=True)
-    tong = result[0] if result and result[0] is not None else 0
-    return data, tong
+
+@cache_bao_cao
+def lay_bao_cao_cong_doan(tu_ngay=None, den_ngay=None, user_id=None):
+    """
+    Công đoàn (bảng CongDoan) trong khoảng ngày, kèm tổng, trong MỘT truy vấn.
+
+    Args:
+        tu_ngay, den_ngay: 'YYYY-MM-DD' (bao gồm cả hai đầu)
+        user_id: Lọc theo user (None = tất cả)
+
+    Returns:
+        (data, tong): data là list of (id, sanpham_id, user_id, ngay, so_luong,
+        chenh_lech, ten_sanpham, username, thanh_tien, tong_user)
+    """
+    where, params = _dieu_kien_khoang_ngay("cd.ngay", tu_ngay, den_ngay)
+    if user_id is not None:
+        where += " AND cd.user_id = ?"
+        params.append(user_id)
+    rows = (
+        execute_query(
+            f"""
+            SELECT cd.id, cd.sanpham_id, cd.user_id, cd.ngay, cd.so_luong, cd.chenh_lech,
+                   COALESCE(s.ten, ''), COALESCE(u.username, ''),
+                   COALESCE(cd.chenh_lech * cd.so_luong, 0) AS thanh_tien,
+                   SUM(COALESCE(cd.chenh_lech * cd.so_luong, 0))
+                       OVER (PARTITION BY cd.user_id) AS tong_user,
+                   SUM(COALESCE(cd.chenh_lech * cd.so_luong, 0)) OVER () AS tong
+            FROM CongDoan cd
+            LEFT JOIN SanPham s ON cd.sanpham_id = s.id
+            LEFT JOIN Users u ON cd.user_id = u.id
+            WHERE 1=1{where}
+            ORDER BY cd.ngay, cd.id
+            """,
+            tuple(params),
+            fetch_all=True,
+        )
+        or []
+    )
+    tong = rows[0][-1] if rows else 0
+    return [r[:-1] for r in rows], tong
+
+
+# Một dòng báo cáo chênh lệch xuất bổ (tab Công đoàn)
+DongCongDoan = namedtuple(
+    "DongCongDoan",
+    [
+        "nhom",  # Khóa nhóm: thời điểm xuất bổ / ngày / username / tên sản phẩm
+        "username",
+        "user_id",
+        "ngay",
+        "ten_sanpham",
+        "loai_gia_xuat",
+        "loai_gia_nguon",
+        "is_gia_moi",
+        "gia_ban",
+        "gia_xuat",
+        "so_luong",
+        "tong_gia_ban",
+        "tong_gia_xuat",
+        "chenh_lech",
+        "so_dong",  # Số dòng chi tiết gộp vào (1 khi xem chi tiết)
+        "nhom_so_luong",  # Tổng của cả nhóm (cùng nhom + username)
+        "nhom_gia_ban",
+        "nhom_gia_xuat",
+        "nhom_chenh_lech",
+        "tong_user",  # Tổng chênh lệch của user trong khoảng ngày
+    ],
+)
+
+BaoCaoCongDoan = namedtuple("BaoCaoCongDoan", ["dong", "tong_theo_user", "tong"])
+
+NHOM_CHI_TIET = None
+NHOM_NGAY = "ngay"
+NHOM_USER = "user"
+NHOM_SAN_PHAM = "sanpham"
+
+# Biểu thức khóa nhóm của báo cáo chênh lệch xuất bổ
+_KHOA_NHOM_CONG_DOAN = {
+    NHOM_NGAY: "substr(cl.ngay, 1, 10)",
+    NHOM_USER: "u.username",
+    NHOM_SAN_PHAM: "cl.ten_sanpham",
+}
+
+
+@cache_bao_cao
+def bao_cao_chenh_lech_xuat_bo(tu_ngay=None, den_ngay=None, user_id=None, nhom_theo=None):
+    """
+    Báo cáo công đoàn từ ChenhLechXuatBo trong MỘT truy vấn gom nhóm + window.
+
+    Tên user/sản phẩm, tổng theo nhóm, theo user và tổng chung đều tính trong
+    SQL; lọc ngày bằng range trên cột ngay có index.
+
+    Args:
+        tu_ngay, den_ngay: 'YYYY-MM-DD' (bao gồm cả hai đầu)
+        user_id: Lọc theo user (None = tất cả)
+        nhom_theo: NHOM_CHI_TIET (mỗi lần xuất bổ một nhóm, giữ dòng chi tiết),
+            NHOM_NGAY, NHOM_USER hoặc NHOM_SAN_PHAM (mỗi nhóm + user một dòng)
+
+    Returns:
+        BaoCaoCongDoan(dong, tong_theo_user {username: tổng}, tong)
+    """
+    if nhom_theo is not None and nhom_theo not in _KHOA_NHOM_CONG_DOAN:
+        raise ValueError(f"Nhóm không hợp lệ: {nhom_theo}")
+    where, params = _dieu_kien_khoang_ngay("cl.ngay", tu_ngay, den_ngay)
+    if user_id is not None:
+        where += " AND cl.user_id = ?"
+        params.append(user_id)
+
+    sl = "COALESCE(cl.so_luong, 0)"
+    ban = f"COALESCE(cl.gia_ban, 0) * {sl}"
+    xuat = f"COALESCE(cl.gia_xuat, 0) * {sl}"
+    cl_ = "COALESCE(cl.chenh_lech, 0)"
+    if nhom_theo is None:
+        nhom = "datetime(cl.ngay), cl.ten_sanpham, cl.loai_gia_xuat"
+        sql = f"""
+            SELECT datetime(cl.ngay), u.username, cl.user_id, datetime(cl.ngay),
+                   cl.ten_sanpham, cl.loai_gia_xuat, cl.loai_gia_nguon,
+                   COALESCE(cl.is_gia_moi, 0), COALESCE(cl.gia_ban, 0),
+                   COALESCE(cl.gia_xuat, 0), {sl}, {ban}, {xuat}, {cl_}, 1,
+                   SUM({sl}) OVER w_nhom, SUM({ban}) OVER w_nhom,
+                   SUM({xuat}) OVER w_nhom, SUM({cl_}) OVER w_nhom,
+                   SUM({cl_}) OVER (PARTITION BY cl.user_id),
+                   SUM({cl_}) OVER ()
+            FROM ChenhLechXuatBo cl
+            JOIN Users u ON cl.user_id = u.id
+            WHERE 1=1{where}
+            WINDOW w_nhom AS (PARTITION BY cl.user_id, {nhom})
+            ORDER BY cl.ngay DESC, u.username, cl.ten_sanpham, cl.loai_gia_xuat,
+                     cl.loai_gia_nguon, COALESCE(cl.is_gia_moi, 0)
+        """
+    else:
+        khoa = _KHOA_NHOM_CONG_DOAN[nhom_theo]
+        sql = f"""
+            SELECT {khoa}, u.username, cl.user_id, MIN(cl.ngay), NULL, NULL, NULL,
+                   NULL, NULL, NULL, SUM({sl}), SUM({ban}), SUM({xuat}), SUM({cl_}),
+                   COUNT(*), SUM({sl}), SUM({ban}), SUM({xuat}), SUM({cl_}),
+                   SUM(SUM({cl_})) OVER (PARTITION BY cl.user_id),
+                   SUM(SUM({cl_})) OVER ()
+            FROM ChenhLechXuatBo cl
+            JOIN Users u ON cl.user_id = u.id
+            WHERE 1=1{where}
+            GROUP BY {khoa}, cl.user_id
+            ORDER BY {khoa}{' DESC' if nhom_theo == NHOM_NGAY else ''}, u.username
+        """
+    rows = execute_query(sql, tuple(params), fetch_all=True) or []
+    dong = [DongCongDoan(*r[:-1]) for r in rows]
+    tong_theo_user = {d.username: d.tong_user for d in dong}
+    tong = rows[0][-1] if rows else 0
+    return BaoCaoCongDoan(dong, tong_theo_user, tong)
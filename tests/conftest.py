@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import user_directory  # noqa: E402
+from db import ket_noi, khoi_tao_db  # noqa: E402
+from utils.report_cache import lay_cache  # noqa: E402
+
+
+@pytest.fixture
+def db_tam(tmp_path, monkeypatch):
+    """
+    fapp.db trống trong thư mục tạm, có sẵn một nhân viên và một sản phẩm.
+
+    Returns:
+        (user_id, sanpham_id)
+    """
+    monkeypatch.chdir(tmp_path)
+    khoi_tao_db()
+    lay_cache().xoa()
+    user_directory.lam_moi()
+    conn = ket_noi()
+    c = conn.cursor()
+    c.execute(
+        "INSERT INTO Users (username, password, role, so_du) VALUES ('nv', 'x', 'staff', 0)"
+    )
+    user_id = c.lastrowid
+    c.execute(
+        "INSERT INTO SanPham (ten, gia_le, gia_buon, gia_vip, ton_kho) "
+        "VALUES ('SP A', 120, 100, 90, 1000)"
+    )
+    sanpham_id = c.lastrowid
+    conn.commit()
+    conn.close()
+    return user_id, sanpham_id
@@ -0,0 +1,29 @@
+from archive import danh_sach_nam_luu_tru, luu_tru
+from ledger import (
+    LY_DO_DAU_KY,
+    bien_dong_so_du,
+    cap_nhat_so_du,
+    dem_bien_dong_so_du,
+)
+from utils.db_helpers import db_transaction
+
+
+def test_doc_so_cai_nam_da_luu_tru(db_tam):
+    user_id, _ = db_tam
+    with db_transaction() as (conn, c):
+        for so_tien, ngay in [
+            (500, "2022-03-01 08:00:00"),
+            (-200, "2022-03-02 08:00:00"),
+            (50, "2025-06-01 08:00:00"),
+        ]:
+            cap_nhat_so_du(c, user_id, so_tien, LY_DO_DAU_KY, ngay=ngay)
+
+    luu_tru("2023-01-01", vacuum=False)
+    assert danh_sach_nam_luu_tru() == [2022]
+
+    assert dem_bien_dong_so_du(user_id, "2022-01-01", "2022-12-31") == (2, 300.0)
+    rows = bien_dong_so_du(user_id, "2022-01-01", "2022-12-31", limit=1, offset=0)
+    assert [(r[1], r[4], r[5]) for r in rows] == [("2022-03-02 08:00:00", -200, 300)]
+
+    # Khoảng không chạm năm lưu trữ vẫn đọc thẳng DB chính
+    assert dem_bien_dong_so_du(user_id, "2025-01-01", "2025-12-31") == (1, 50.0)
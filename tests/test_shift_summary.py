@@ -0,0 +1,71 @@
+from invoices import sua_chi_tiet_hoa_don, tao_hoa_don
+from shift_summary import dong_ca, ghi_nhan_hoa_don, lay_tong_ket_ca, mo_ca
+from stock import xuat_bo_san_pham
+from utils.db_helpers import execute_query, execute_update
+
+
+def _ban(user_id, sanpham_id, ca_id, so_luong=10, gia=100):
+    ok, hoadon_id, _ = tao_hoa_don(
+        user_id,
+        "",
+        [
+            {
+                "sanpham_id": sanpham_id,
+                "so_luong": so_luong,
+                "loai_gia": "buon",
+                "gia": gia,
+                "xuat_hoa_don": 0,
+            }
+        ],
+        0,
+        0,
+        0,
+    )
+    assert ok
+    assert ghi_nhan_hoa_don(ca_id, hoadon_id)
+    return hoadon_id
+
+
+def _chi_tiet_id(hoadon_id):
+    return execute_query(
+        "SELECT id FROM ChiTietHoaDon WHERE hoadon_id = ?", (hoadon_id,), fetch_one=True
+    )[0]
+
+
+def test_xuat_bo_sau_dong_ca_khong_doi_tong_ket(db_tam):
+    user_id, sanpham_id = db_tam
+    ca_id = mo_ca(user_id, [])
+    hoadon_id = _ban(user_id, sanpham_id, ca_id)
+    dong_ca(ca_id)
+    luc_dong = lay_tong_ket_ca(ca_id)
+    assert luc_dong["tong_tien_ban"] == 1000
+
+    # Xuất bổ giảm số lượng chưa xuất như tab Xuất bổ, rồi đánh dấu XHĐ
+    assert execute_update(
+        "UPDATE ChiTietHoaDon SET so_luong = 0 WHERE hoadon_id = ?", (hoadon_id,)
+    )
+    ok, _ = xuat_bo_san_pham(hoadon_id, sanpham_id, user_id, 10, 100, 0)
+    assert ok
+    assert lay_tong_ket_ca(ca_id) == luc_dong
+
+    # Ca đã đóng cũng không tính lại khi sửa hóa đơn
+    assert sua_chi_tiet_hoa_don(_chi_tiet_id(hoadon_id), so_luong=3)
+    assert lay_tong_ket_ca(ca_id) == luc_dong
+
+
+def test_sua_hoa_don_ca_mo_chi_tinh_lai_hoa_don_do(db_tam):
+    user_id, sanpham_id = db_tam
+    ca_id = mo_ca(user_id, [])
+    hd_xuat_bo = _ban(user_id, sanpham_id, ca_id)
+    hd_sua = _ban(user_id, sanpham_id, ca_id)
+
+    ok, _ = xuat_bo_san_pham(hd_xuat_bo, sanpham_id, user_id, 10, 100, 0)
+    assert ok
+    assert sua_chi_tiet_hoa_don(_chi_tiet_id(hd_sua), so_luong=5)
+
+    ca = lay_tong_ket_ca(ca_id)
+    # Hóa đơn đã xuất bổ giữ số liệu lúc bán (chưa XHĐ), hóa đơn sửa lấy số mới
+    assert ca["tong_tien_ban"] == 1500
+    assert ca["tong_tien_xhd"] == 0
+    assert ca["tong_tien_chua_xhd"] == 1500
+    assert ca["so_hoadon"] == 2
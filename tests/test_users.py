@@ -0,0 +1,36 @@
+from ledger import LY_DO_CHUYEN_TIEN, LY_DO_DAU_KY, cap_nhat_so_du
+from users import chuyen_tien_nhieu
+from utils.db_helpers import db_transaction, execute_query
+
+
+def test_chuyen_tien_nhieu_so_cai_tro_dung_giao_dich(db_tam):
+    user_id, _ = db_tam
+    with db_transaction() as (conn, c):
+        cap_nhat_so_du(c, user_id, 1000, LY_DO_DAU_KY)
+        # sqlite_sequence lệch với id thật (vd: khôi phục / sửa DB bằng tay)
+        c.execute(
+            "INSERT INTO GiaoDichQuy (id, user_id, user_nhan_id, so_tien, ngay) "
+            "VALUES (50, ?, 1, 1, '2025-01-01')",
+            (user_id,),
+        )
+        c.execute("UPDATE sqlite_sequence SET seq = 7 WHERE name = 'GiaoDichQuy'")
+
+    ok, giaodich_ids = chuyen_tien_nhieu(
+        [(user_id, 1, 300, "Nộp ca", None), (user_id, 1, 200, None, None)]
+    )
+    assert ok
+    so_cai = execute_query(
+        "SELECT nguon_id, user_id, so_tien FROM SoCaiSoDu WHERE ly_do = ? ORDER BY id",
+        (LY_DO_CHUYEN_TIEN,),
+        fetch_all=True,
+    )
+    giao_dich = execute_query(
+        "SELECT id FROM GiaoDichQuy WHERE id != 50 ORDER BY id", fetch_all=True
+    )
+    assert [r[0] for r in giao_dich] == giaodich_ids
+    assert so_cai == [
+        (giaodich_ids[0], user_id, -300),
+        (giaodich_ids[0], 1, 300),
+        (giaodich_ids[1], user_id, -200),
+        (giaodich_ids[1], 1, 200),
+    ]
@@ -0,0 +1,179 @@
+"""
+Danh bạ user dùng chung (cache) cho GUI và hệ thống AI
+
+Thay cho việc gọi lay_tat_ca_user() (quét toàn bảng Users) ở mỗi dialog,
+mỗi dòng giỏ hàng... Danh sách user và số dư ghi kèm phiên bản dữ liệu lúc nạp
+(PRAGMA data_version, dùng chung kết nối theo dõi với utils.report_cache) và
+chỉ nạp lại khi có commit mới - kể cả từ luồng nền hay tiến trình khác - nên
+không bao giờ giữ số dư của một transaction chưa commit.
+- lam_moi() / lam_moi_so_du(): ép nạp lại ngay ở lần đọc sau
+
+Sử dụng:
+    import user_directory
+
+    ten = user_directory.lay_ten(user_id)
+    ke_toan = user_directory.lay_theo_role("accountant", "admin")
+"""
+
+import threading
+
+from utils.db_helpers import execute_query
+from utils.logging_config import get_logger
+from utils.report_cache import lay_cache
+
+logger = get_logger(__name__)
+
+# id -> {"id", "username", "role", "phone"} (giữ thứ tự theo id)
+_users = None
+# id -> so_du
+_so_du = None
+# data_version lúc nạp _users / _so_du
+_pb_users = None
+_pb_so_du = None
+# Tăng mỗi khi danh sách user (không tính số dư) thay đổi, để model Qt biết cần đồng bộ
+_phien_ban = 0
+_lock = threading.RLock()
+
+
+def lam_moi():
+    """Đánh dấu toàn bộ danh bạ cần nạp lại."""
+    global _users, _so_du, _phien_ban
+    with _lock:
+        _users = None
+        _so_du = None
+        _phien_ban += 1
+
+
+def lam_moi_so_du():
+    """Chỉ đánh dấu số dư cần nạp lại (danh sách user không đổi)."""
+    global _so_du
+    with _lock:
+        _so_du = None
+
+
+def phien_ban():
+    """Tăng khi danh sách user (id, username, role, phone) khác lần nạp trước."""
+    with _lock:
+        _dam_bao_users()
+        return _phien_ban
+
+
+def _phien_ban_du_lieu():
+    return lay_cache().phien_ban_du_lieu()
+
+
+def _nap_users():
+    global _users, _phien_ban
+    cot = {
+        r[1] for r in (execute_query("PRAGMA table_info(Users)", fetch_all=True) or [])
+    }
+    # DB cũ có thể chưa có cột phone (xem users.lay_user_phone)
+    cot_phone = "phone" if "phone" in cot else "NULL"
+    rows = (
+        execute_query(
+            f"SELECT id, username, role, {cot_phone} FROM Users ORDER BY id",
+            fetch_all=True,
+        )
+        or []
+    )
+    users = {
+        uid: {"id": uid, "username": username, "role": role, "phone": phone}
+        for uid, username, role, phone in rows
+    }
+    if _users is not None and users != _users:
+        _phien_ban += 1
+    _users = users
+    logger.debug(f"Nạp danh bạ user: {len(_users)} user")
+
+
+def _nap_so_du():
+    global _so_du
+    rows = execute_query("SELECT id, so_du FROM Users", fetch_all=True) or []
+    _so_du = {uid: so_du for uid, so_du in rows}
+
+
+def _dam_bao_users():
+    global _pb_users
+    # Đọc phiên bản TRƯỚC khi nạp: commit xen giữa sẽ làm lần đọc sau nạp lại
+    pb = _phien_ban_du_lieu()
+    if _users is None or pb != _pb_users:
+        _nap_users()
+        _pb_users = pb
+    return _users
+
+
+def _dam_bao_so_du():
+    global _pb_so_du
+    pb = _phien_ban_du_lieu()
+    if _so_du is None or pb != _pb_so_du:
+        _nap_so_du()
+        _pb_so_du = pb
+    return _so_du
+
+
+def lay_tat_ca():
+    """
+    Danh sách user theo định dạng của lay_tat_ca_user().
+
+    Returns:
+        list of (id, username, role, so_du)
+    """
+    with _lock:
+        users = _dam_bao_users()
+        so_du = _dam_bao_so_du()
+        return [
+            (uid, u["username"], u["role"], so_du.get(uid, 0))
+            for uid, u in users.items()
+        ]
+
+
+def lay_user(user_id):
+    """Thông tin một user (dict có thêm so_du) hoặc None."""
+    with _lock:
+        u = _dam_bao_users().get(user_id)
+        if u is None:
+            return None
+        return dict(u, so_du=_dam_bao_so_du().get(user_id, 0))
+
+
+def lay_ten(user_id, mac_dinh=""):
+    """Username của user_id (không truy vấn DB nếu đã nạp)."""
+    with _lock:
+        u = _dam_bao_users().get(user_id)
+        return u["username"] if u else mac_dinh
+
+
+def lay_theo_role(*roles):
+    """
+    Danh sách (id, username) của các user thuộc các role đã cho.
+
+    Không truyền role nào thì trả về tất cả.
+    """
+    with _lock:
+        return [
+            (uid, u["username"])
+            for uid, u in _dam_bao_users().items()
+            if not roles or u["role"] in roles
+        ]
+
+
+def lay_user_co_so_du(dieu_kien):
+    """
+    Các user có số dư thỏa điều kiện, sắp xếp theo số dư giảm dần.
+
+    Args:
+        dieu_kien: Hàm nhận so_du trả về bool, vd: lambda sd: sd > 0
+
+    Returns:
+        list of dict {"id", "username", "role", "phone", "so_du"}
+    """
+    with _lock:
+        users = _dam_bao_users()
+        so_du = _dam_bao_so_du()
+        ket_qua = [
+            dict(u, so_du=so_du.get(uid) or 0)
+            for uid, u in users.items()
+            if dieu_kien(so_du.get(uid) or 0)
+        ]
+    ket_qua.sort(key=lambda u: u["so_du"], reverse=True)
+    return ket_qua
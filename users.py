@@ -1,13 +1,15 @@
 from db import ket_noi
 import hashlib
 from utils.db_helpers import execute_query, execute_update, db_transaction
+from archive import can_du_lieu_luu_tru, truy_van_lich_su
+from ledger import cap_nhat_so_du, ghi_so_cai_nhieu, LY_DO_CHUYEN_TIEN
+import user_directory
+from utils import event_bus
+from utils.event_bus import HoaDonDaSua, SoDuThayDoi
 
 
 def lay_username(user_id):
-    result = execute_query(
-        "SELECT username FROM Users WHERE id=?", (user_id,), fetch_one=True
-    )
-    return result[0] if result else ""
+    return user_directory.lay_ten(user_id)
 
 
 def ma_hoa_mat_khau(pwd):
@@ -21,6 +23,8 @@ def them_user(username, password, role):
     )
     if not success:
         print("Loi them_user")
+    else:
+        user_directory.lam_moi()
     return success
 
 
@@ -39,16 +43,16 @@ def dang_nhap(username, password):
 
 
 def lay_tat_ca_user():
-    return (
-        execute_query("SELECT id, username, role, so_du FROM Users", fetch_all=True)
-        or []
-    )
+    """Danh sách (id, username, role, so_du), đọc từ danh bạ user dùng chung."""
+    return user_directory.lay_tat_ca()
 
 
 def xoa_user(user_id):
     success = execute_update("DELETE FROM Users WHERE id=?", (user_id,))
     if not success:
         print("Loi xoa_user")
+    else:
+        user_directory.lam_moi()
     return success
 
 
@@ -86,12 +90,6 @@ def chuyen_tien(tu_user, den_user, so_tien, hoadon_id=None):
             so_du = r[0] if r else 0
             if so_du < so_tien:
                 return False, "Khong du so du"
-            c.execute(
-                "UPDATE Users SET so_du = so_du - ? WHERE id=?", (so_tien, tu_user)
-            )
-            c.execute(
-                "UPDATE Users SET so_du = so_du + ? WHERE id=?", (so_tien, den_user)
-            )
             # Lưu giao dịch với thời gian local (giờ Việt Nam)
             thoi_gian_hien_tai = datetime.now().isoformat()
             if hoadon_id is not None:
@@ -104,11 +102,135 @@ def chuyen_tien(tu_user, den_user, so_tien, hoadon_id=None):
                     "INSERT INTO GiaoDichQuy (user_id, user_nhan_id, so_tien, ngay) VALUES (?, ?, ?, ?)",
                     (tu_user, den_user, so_tien, thoi_gian_hien_tai),
                 )
+            giaodich_id = c.lastrowid
+            # Cập nhật số dư hai bên và ghi sổ cái, nguồn là giao dịch quỹ
+            cap_nhat_so_du(
+                c, tu_user, -so_tien, LY_DO_CHUYEN_TIEN, giaodich_id, "Chuyển đi"
+            )
+            cap_nhat_so_du(
+                c, den_user, so_tien, LY_DO_CHUYEN_TIEN, giaodich_id, "Nhận vào"
+            )
+        event_bus.phat(SoDuThayDoi([tu_user, den_user]))
+        if hoadon_id is not None:
+            # Số dư còn phải nộp của hóa đơn đổi
+            event_bus.phat(HoaDonDaSua([hoadon_id], [tu_user, den_user]))
         return True, None
     except Exception as e:
         return False, str(e)
 
 
+def chuyen_tien_nhieu(giao_dich):
+    """
+    Chuyển tiền theo lô (chốt ca): kiểm tra tất cả trên cùng một snapshot số dư
+    rồi ghi toàn bộ trong MỘT transaction; sổ cái dùng id thật của từng giao
+    dịch vừa chèn, số dư user cập nhật bằng executemany.
+
+    Args:
+        giao_dich: list of (tu_user, den_user, so_tien, ghi_chu, hoadon_id)
+
+    Returns:
+        (True, [giaodich_id, ...]) nếu thành công,
+        (False, "thông báo lỗi") nếu có dòng không hợp lệ (không ghi gì cả)
+    """
+    from datetime import datetime
+
+    if not giao_dich:
+        return False, "Không có giao dịch nào"
+
+    # ✅ Validate input từng dòng trước khi chạm DB
+    for i, (tu_user, den_user, so_tien, ghi_chu, hoadon_id) in enumerate(giao_dich, 1):
+        if so_tien is None or so_tien <= 0:
+            return False, f"Dòng {i}: Số tiền phải lớn hơn 0"
+        if tu_user == den_user and hoadon_id is None:
+            return False, f"Dòng {i}: Không thể chuyển tiền cho chính mình"
+
+    try:
+        with db_transaction() as (conn, c):
+            # Khóa ghi ngay từ đầu để snapshot số dư không đổi giữa lúc kiểm tra và ghi
+            c.execute("BEGIN IMMEDIATE")
+
+            user_ids = sorted({g[0] for g in giao_dich} | {g[1] for g in giao_dich})
+            placeholders = ",".join("?" * len(user_ids))
+            c.execute(
+                f"SELECT id, username, so_du FROM Users WHERE id IN ({placeholders})",
+                user_ids,
+            )
+            ten = {}
+            so_du = {}
+            for uid, username, sd in c.fetchall():
+                ten[uid] = username
+                so_du[uid] = float(sd or 0)
+
+            # Áp lần lượt trên bản sao số dư để kiểm tra và tính số dư sau mỗi dòng
+            dong_ghi = []
+            for i, (tu_user, den_user, so_tien, ghi_chu, hoadon_id) in enumerate(
+                giao_dich, 1
+            ):
+                if tu_user not in so_du or den_user not in so_du:
+                    return False, f"Dòng {i}: User không tồn tại"
+                if so_du[tu_user] < so_tien:
+                    return (
+                        False,
+                        f"Dòng {i}: {ten[tu_user]} không đủ số dư "
+                        f"(còn {so_du[tu_user]:,.0f}, cần {so_tien:,.0f})",
+                    )
+                so_du[tu_user] -= so_tien
+                so_du[den_user] += so_tien
+                dong_ghi.append(
+                    (tu_user, den_user, so_tien, ghi_chu, hoadon_id)
+                    + (so_du[tu_user], so_du[den_user])
+                )
+
+            # Ghi giao dịch lấy đúng id vừa chèn làm nguồn cho sổ cái
+            so_cai_rows = []
+            ngay = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            thoi_gian = datetime.now().isoformat()
+            giaodich_ids = []
+            for tu_user, den_user, so_tien, ghi_chu, hoadon_id, sd_tu, sd_den in dong_ghi:
+                c.execute(
+                    "INSERT INTO GiaoDichQuy (user_id, user_nhan_id, so_tien, ngay, hoadon_id, ghi_chu) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (tu_user, den_user, so_tien, thoi_gian, hoadon_id, ghi_chu),
+                )
+                giaodich_id = c.lastrowid
+                giaodich_ids.append(giaodich_id)
+                so_cai_rows.append(
+                    (
+                        tu_user,
+                        ngay,
+                        -so_tien,
+                        sd_tu,
+                        LY_DO_CHUYEN_TIEN,
+                        giaodich_id,
+                        ghi_chu or "Chuyển đi",
+                    )
+                )
+                so_cai_rows.append(
+                    (
+                        den_user,
+                        ngay,
+                        so_tien,
+                        sd_den,
+                        LY_DO_CHUYEN_TIEN,
+                        giaodich_id,
+                        ghi_chu or "Nhận vào",
+                    )
+                )
+            ghi_so_cai_nhieu(c, so_cai_rows)
+            # Mỗi user chỉ một UPDATE với số dư cuối cùng
+            c.executemany(
+                "UPDATE Users SET so_du = ? WHERE id = ?",
+                [(so_du[uid], uid) for uid in user_ids],
+            )
+        event_bus.phat(SoDuThayDoi(user_ids))
+        hoadon_ids = [g[4] for g in giao_dich if g[4] is not None]
+        if hoadon_ids:
+            event_bus.phat(HoaDonDaSua(hoadon_ids, user_ids))
+        return True, giaodich_ids
+    except Exception as e:
+        return False, str(e)
+
+
 def lay_tong_nop_theo_hoadon(hoadon_id):
     """Trả về tổng số tiền đã nộp cho một hoadon (theo cột hoadon_id trong GiaoDichQuy)."""
     result = execute_query(
@@ -119,12 +241,40 @@ def lay_tong_nop_theo_hoadon(hoadon_id):
     return result[0] if result and result[0] is not None else 0
 
 
-def lay_lich_su_quy(user_id=None):
-    sql = "SELECT id, user_id, user_nhan_id, so_tien, ngay FROM GiaoDichQuy"
+def lay_lich_su_quy(user_id=None, tu_ngay=None, den_ngay=None, limit=None, offset=0):
+    """
+    Lịch sử giao dịch quỹ, lọc theo user và khoảng ngày, có phân trang.
+
+    Args:
+        user_id: ID user (người chuyển hoặc nhận) hoặc None = tất cả
+        tu_ngay, den_ngay: 'YYYY-MM-DD' (bao gồm cả hai đầu), None = không giới hạn
+        limit: Số dòng mỗi trang (None = lấy hết)
+        offset: Vị trí bắt đầu
+    """
+    sql = "SELECT id, user_id, user_nhan_id, so_tien, ngay FROM GiaoDichQuy WHERE 1=1"
     params = []
     if user_id:
-        sql += " WHERE user_id=? OR user_nhan_id=?"
-        params = [user_id, user_id]
+        sql += " AND (user_id=? OR user_nhan_id=?)"
+        params += [user_id, user_id]
+    # So sánh khoảng trên cột ngay để dùng được index
+    if tu_ngay:
+        sql += " AND ngay >= ?"
+        params.append(str(tu_ngay)[:10])
+    if den_ngay:
+        sql += " AND ngay < date(?, '+1 day')"
+        params.append(str(den_ngay)[:10])
+    sql += " ORDER BY ngay DESC, id DESC"
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params += [int(limit), int(offset)]
+    # Giao dịch của các năm cũ nằm trong file lưu trữ
+    if can_du_lieu_luu_tru(tu_ngay, den_ngay):
+        return truy_van_lich_su(
+            sql.replace("FROM GiaoDichQuy", "FROM GiaoDichQuy_TatCa"),
+            tuple(params),
+            tu_ngay,
+            den_ngay,
+        )
     return execute_query(sql, tuple(params) if params else None, fetch_all=True) or []
 
 
@@ -168,6 +318,7 @@ def cap_nhat_user_phone(user_id, phone):
     success = execute_update("UPDATE Users SET phone=? WHERE id=?", (phone, user_id))
 
     if success:
+        user_directory.lam_moi()
         return True, None
     else:
         return False, "Cập nhật thất bại"
@@ -0,0 +1,165 @@
+"""
+Hỏi AI ở luồng nền, stream token về khung chat
+Background AI request worker with streamed tokens
+
+HybridAI.ask() gọi Groq/Ollama qua mạng (có thể tới 15 giây). BoHoiAI chạy
+ask() trong QThreadPool để luồng GUI (bán hàng, nhập liệu) không bị đứng;
+từng đoạn câu trả lời được gửi về luồng GUI qua tín hiệu co_token ngay khi
+nhận được. Mỗi câu hỏi có một "thế hệ" như BoTaiNen: hỏi câu mới hoặc huy()
+làm câu cũ trở thành cũ, token/kết quả của nó bị bỏ và luồng mạng dừng ở đoạn
+kế tiếp (threading.Event da_huy).
+
+Thao tác widget trong ask() (tự chuyển tab) được đưa về luồng GUI qua
+HybridAI.goi_gui.
+
+Sử dụng:
+    from utils.ai_worker import BoHoiAI
+
+    self.hoi_ai = BoHoiAI(self)
+    self.hoi_ai.co_token.connect(self._them_token_ai)
+    self.hoi_ai.xong.connect(self._khi_ai_tra_loi)
+    self.hoi_ai.hoi(self.ai_agent_right, message)
+"""
+
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class _TinHieu(QObject):
+    token = pyqtSignal(int, str)
+    xong = pyqtSignal(int, object)
+    loi = pyqtSignal(int, str)
+    goi_gui = pyqtSignal(int, object)
+
+
+class _TacVuHoi(QRunnable):
+    def __init__(self, the_he, tro_ly, cau_hoi, da_huy, tin_hieu):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.the_he = the_he
+        self.tro_ly = tro_ly
+        self.cau_hoi = cau_hoi
+        self.da_huy = da_huy
+        self.tin_hieu = tin_hieu
+
+    def run(self):
+        from ai_system.hybrid import CauHoiDaHuy
+
+        try:
+            ket_qua = self.tro_ly.ask(
+                self.cau_hoi, khi_co_token=self._gui_token, da_huy=self.da_huy
+            )
+        except CauHoiDaHuy:
+            self._bao(self.tin_hieu.xong, None)
+            return
+        except Exception as e:
+            logger.error(f"Lỗi hỏi AI: {e}")
+            self._bao(self.tin_hieu.loi, str(e))
+            return
+        self._bao(self.tin_hieu.xong, ket_qua)
+
+    def _gui_token(self, doan):
+        if not self.da_huy.is_set():
+            self._bao(self.tin_hieu.token, doan)
+
+    def _bao(self, tin_hieu, gia_tri):
+        try:
+            tin_hieu.emit(self.the_he, gia_tri)
+        except RuntimeError:
+            # Cửa sổ đã đóng trong lúc đang hỏi
+            pass
+
+
+class BoHoiAI(QObject):
+    """Chạy HybridAI.ask() ở luồng nền; chỉ nhận token/kết quả của câu hỏi mới nhất."""
+
+    co_token = pyqtSignal(str)
+    # (answer, conversation_id)
+    xong = pyqtSignal(str, str)
+    loi = pyqtSignal(str)
+    dang_hoi = pyqtSignal(bool)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._the_he = 0
+        self._da_huy = None
+        # thế hệ -> tác vụ chưa báo kết quả (giữ tham chiếu tới khi chạy xong)
+        self._cac_tac_vu = {}
+
+        self._tin_hieu = _TinHieu(self)
+        self._tin_hieu.token.connect(self._nhan_token)
+        self._tin_hieu.xong.connect(self._nhan_ket_qua)
+        self._tin_hieu.loi.connect(self._nhan_loi)
+        # Phát từ luồng nền -> slot chạy ở luồng GUI (queued connection)
+        self._tin_hieu.goi_gui.connect(self._chay_tren_gui)
+
+    def dang_cho(self):
+        """Có câu hỏi đang chờ trả lời không."""
+        return self._da_huy is not None
+
+    def hoi(self, tro_ly, cau_hoi):
+        """
+        Gửi câu hỏi; câu hỏi trước (nếu còn chờ) bị hủy.
+
+        Args:
+            tro_ly: HybridAI
+            cau_hoi: Nội dung câu hỏi
+        """
+        self.huy()
+        self._the_he += 1
+        the_he = self._the_he
+        tro_ly.goi_gui = lambda ham: self._tin_hieu.goi_gui.emit(the_he, ham)
+        self._da_huy = threading.Event()
+        tac_vu = _TacVuHoi(the_he, tro_ly, cau_hoi, self._da_huy, self._tin_hieu)
+        self._cac_tac_vu[the_he] = tac_vu
+        self.dang_hoi.emit(True)
+        QThreadPool.globalInstance().start(tac_vu)
+
+    def huy(self):
+        """Hủy câu hỏi đang chờ; không làm gì nếu không có."""
+        if self._da_huy is None:
+            return
+        self._da_huy.set()
+        self._da_huy = None
+        self._the_he += 1
+        pool = QThreadPool.globalInstance()
+        for the_he, tac_vu in list(self._cac_tac_vu.items()):
+            if pool.tryTake(tac_vu):
+                del self._cac_tac_vu[the_he]
+        self.dang_hoi.emit(False)
+
+    def _chay_tren_gui(self, the_he, ham):
+        if the_he == self._the_he:
+            ham()
+
+    def _ket_thuc(self):
+        self._da_huy = None
+        self.dang_hoi.emit(False)
+
+    def _nhan_token(self, the_he, doan):
+        if the_he == self._the_he:
+            self.co_token.emit(doan)
+
+    def _nhan_ket_qua(self, the_he, ket_qua):
+        self._cac_tac_vu.pop(the_he, None)
+        if the_he != self._the_he or ket_qua is None:
+            return
+        self._ket_thuc()
+        # Bản cũ có thể trả về chuỗi thay vì (answer, conversation_id)
+        if isinstance(ket_qua, tuple):
+            tra_loi, ma_hoi_thoai = ket_qua
+        else:
+            tra_loi, ma_hoi_thoai = ket_qua, None
+        self.xong.emit(tra_loi or "", ma_hoi_thoai or "")
+
+    def _nhan_loi(self, the_he, thong_bao):
+        self._cac_tac_vu.pop(the_he, None)
+        if the_he != self._the_he:
+            return
+        self._ket_thuc()
+        self.loi.emit(thong_bao)
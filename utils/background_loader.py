@@ -0,0 +1,178 @@
+"""
+Nạp dữ liệu tab ở luồng nền, bỏ kết quả cũ
+Background tab loader with generation tokens
+
+Mỗi tab có một BoTaiNen. Mỗi lần yêu cầu nạp, "thế hệ" của tab tăng lên; hàm
+đọc dữ liệu chạy trong QThreadPool, kết quả quay về luồng GUI kèm thế hệ lúc
+gửi và bị bỏ nếu đã có yêu cầu mới hơn. Tác vụ cũ chưa kịp chạy được rút khỏi
+hàng đợi. Thay đổi bộ lọc dùng tai_tre() để gom các lần đổi liên tiếp
+(debounce) thành một lần nạp.
+
+Hàm đọc dữ liệu chạy ngoài luồng GUI: chỉ truy vấn DB và tính toán, không
+chạm vào widget. Phần hiển thị nằm trong khi_xong (chạy ở luồng GUI).
+
+Sử dụng:
+    from utils.background_loader import BoTaiNen, tao_chi_bao_tai
+
+    self.chi_bao_hd = tao_chi_bao_tai()
+    self.tai_hd = BoTaiNen(lay_chi_tiet_xhd, self._hien_thi_hoadon, chi_bao=self.chi_bao_hd)
+    self.hoadon_tu_ngay.dateChanged.connect(lambda _: self.tai_hd.tai_tre(...))
+    self.tai_hd.tai(user_id, role, tu, den)
+"""
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QProgressBar
+
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Thời gian chờ mặc định sau lần đổi bộ lọc cuối cùng (ms)
+TRE_MAC_DINH_MS = 300
+
+
+def tao_chi_bao_tai(rong=80):
+    """Thanh chạy không xác định (ẩn sẵn) để báo tab đang tải."""
+    chi_bao = QProgressBar()
+    chi_bao.setRange(0, 0)
+    chi_bao.setTextVisible(False)
+    chi_bao.setFixedWidth(rong)
+    chi_bao.setMaximumHeight(12)
+    chi_bao.setVisible(False)
+    return chi_bao
+
+
+class _TinHieu(QObject):
+    xong = pyqtSignal(int, object)
+    loi = pyqtSignal(int, str)
+
+
+class _TacVuTai(QRunnable):
+    def __init__(self, the_he, ham, args, kwargs, tin_hieu):
+        super().__init__()
+        # Giữ quyền sở hữu phía Python để tryTake() an toàn
+        self.setAutoDelete(False)
+        self.the_he = the_he
+        self.ham = ham
+        self.args = args
+        self.kwargs = kwargs
+        self.tin_hieu = tin_hieu
+
+    def run(self):
+        try:
+            ket_qua = self.ham(*self.args, **self.kwargs)
+        except Exception as e:
+            logger.error(f"Lỗi nạp nền {getattr(self.ham, '__name__', self.ham)}: {e}")
+            self._bao(self.tin_hieu.loi, str(e))
+            return
+        self._bao(self.tin_hieu.xong, ket_qua)
+
+    def _bao(self, tin_hieu, gia_tri):
+        try:
+            tin_hieu.emit(self.the_he, gia_tri)
+        except RuntimeError:
+            # Cửa sổ đã đóng trong lúc đang nạp
+            pass
+
+
+class BoTaiNen(QObject):
+    """Nạp dữ liệu của một tab ở luồng nền; chỉ nhận kết quả của yêu cầu mới nhất."""
+
+    dang_tai = pyqtSignal(bool)
+
+    def __init__(
+        self,
+        ham_tai,
+        khi_xong,
+        khi_loi=None,
+        chi_bao=None,
+        tre_ms=TRE_MAC_DINH_MS,
+        parent=None,
+    ):
+        """
+        Args:
+            ham_tai: Hàm đọc dữ liệu (chạy ở luồng nền)
+            khi_xong: Hàm nhận kết quả, chạy ở luồng GUI
+            khi_loi: Hàm nhận thông báo lỗi, chạy ở luồng GUI (None = chỉ ghi log)
+            chi_bao: Widget hiện khi đang tải (vd: tao_chi_bao_tai())
+            tre_ms: Thời gian gom các lần gọi tai_tre()
+        """
+        super().__init__(parent)
+        self._ham_tai = ham_tai
+        self._khi_xong = khi_xong
+        self._khi_loi = khi_loi
+        self._chi_bao = chi_bao
+        self._the_he = 0
+        # thế hệ -> tác vụ chưa báo kết quả (giữ tham chiếu tới khi chạy xong)
+        self._cac_tac_vu = {}
+        self._tham_so_cho = ((), {})
+
+        self._tin_hieu = _TinHieu(self)
+        self._tin_hieu.xong.connect(self._nhan_ket_qua)
+        self._tin_hieu.loi.connect(self._nhan_loi)
+
+        self._hen_gio = QTimer(self)
+        self._hen_gio.setSingleShot(True)
+        self._hen_gio.setInterval(tre_ms)
+        self._hen_gio.timeout.connect(self._tai_tham_so_cho)
+
+    @property
+    def the_he(self):
+        return self._the_he
+
+    def dang_cho(self):
+        """Yêu cầu mới nhất còn đang chờ kết quả không."""
+        return self._the_he in self._cac_tac_vu
+
+    def tai(self, *args, **kwargs):
+        """Nạp ngay; mọi yêu cầu trước đó của tab trở thành cũ."""
+        self._hen_gio.stop()
+        self._the_he += 1
+        self._rut_tac_vu_cho()
+        tac_vu = _TacVuTai(self._the_he, self._ham_tai, args, kwargs, self._tin_hieu)
+        self._cac_tac_vu[self._the_he] = tac_vu
+        self._dat_dang_tai(True)
+        QThreadPool.globalInstance().start(tac_vu)
+
+    def tai_tre(self, *args, **kwargs):
+        """Nạp sau tre_ms kể từ lần gọi cuối (dùng cho thay đổi bộ lọc)."""
+        self._tham_so_cho = (args, kwargs)
+        self._hen_gio.start()
+
+    def huy(self):
+        """Bỏ yêu cầu đang chờ/đang chạy; kết quả của chúng sẽ bị bỏ qua."""
+        self._hen_gio.stop()
+        self._the_he += 1
+        self._rut_tac_vu_cho()
+        self._dat_dang_tai(False)
+
+    def _tai_tham_so_cho(self):
+        args, kwargs = self._tham_so_cho
+        self.tai(*args, **kwargs)
+
+    def _rut_tac_vu_cho(self):
+        """Rút khỏi hàng đợi các tác vụ cũ chưa bắt đầu chạy."""
+        pool = QThreadPool.globalInstance()
+        for the_he, tac_vu in list(self._cac_tac_vu.items()):
+            if pool.tryTake(tac_vu):
+                del self._cac_tac_vu[the_he]
+
+    def _dat_dang_tai(self, dang_tai):
+        if self._chi_bao is not None:
+            self._chi_bao.setVisible(dang_tai)
+        self.dang_tai.emit(dang_tai)
+
+    def _nhan_ket_qua(self, the_he, ket_qua):
+        self._cac_tac_vu.pop(the_he, None)
+        if the_he != self._the_he:
+            return
+        self._dat_dang_tai(False)
+        self._khi_xong(ket_qua)
+
+    def _nhan_loi(self, the_he, thong_bao):
+        self._cac_tac_vu.pop(the_he, None)
+        if the_he != self._the_he:
+            return
+        self._dat_dang_tai(False)
+        if self._khi_loi is not None:
+            self._khi_loi(thong_bao)
@@ -0,0 +1,175 @@
+"""
+Vẽ biểu đồ cột ngoài luồng GUI, cache ảnh đã vẽ
+Offscreen bar-chart renderer with an image cache
+
+VeBieuDoCot giữ một Figure matplotlib (backend Agg, không cần Qt) và vẽ ra
+QImage; gọi được từ luồng nền (BoTaiNen), các lần vẽ được tuần tự hóa bằng lock.
+Khi danh sách chuỗi (sản phẩm) và số kỳ không đổi so với lần vẽ trước, chỉ cập
+nhật chiều cao các cột, nhãn trục và tiêu đề trên BarContainer sẵn có thay vì
+clear() + vẽ lại chú thích + tight_layout.
+
+Ảnh đã vẽ được cache (LRU, luồng GUI) theo khóa do nơi gọi dựng, thường gồm bộ
+lọc, kích thước khung và phiên bản dữ liệu (PRAGMA data_version) - dữ liệu đổi
+thì khóa đổi, ảnh cũ tự bị đẩy ra. Đổi qua lại giữa các tháng đã xem chỉ là một
+lần setPixmap.
+
+Sử dụng:
+    from utils.chart_render import VeBieuDoCot, KhungBieuDo
+
+    self.khung = KhungBieuDo()
+    self.ve = VeBieuDoCot()
+
+    anh = self.ve.lay_anh(khoa)
+    if anh is None:
+        anh = self.ve.ve(ten_chuoi, nhan_cot, ma_tran, "Tiêu đề", "Sản lượng", 800, 500)
+        self.ve.luu_anh(khoa, anh)
+    self.khung.hien_anh(anh)
+"""
+
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QLabel, QSizePolicy
+
+
+# Số ảnh giữ trong cache (~1.5 MB mỗi ảnh 800x500)
+SO_ANH_CACHE = 16
+
+# Số chuỗi tối đa khi không chọn top N; phần còn lại gộp vào "Khác"
+SO_CHUOI_TOI_DA = 10
+
+DPI = 100
+
+
+class VeBieuDoCot:
+    """Vẽ biểu đồ cột nhóm (chuỗi x kỳ) ra QImage, tái sử dụng các cột đã vẽ."""
+
+    def __init__(self, so_anh_cache=SO_ANH_CACHE):
+        self.so_anh_cache = so_anh_cache
+        self._anh = OrderedDict()
+        self._lock = threading.Lock()
+        self._figure = None
+        self._canvas = None
+        self._ax = None
+        self._cac_cot = []
+        # (tên chuỗi, số kỳ, rộng, cao) của lần vẽ trước
+        self._cau_truc = None
+
+    # ---- Cache ảnh (luồng GUI) ----
+
+    def lay_anh(self, khoa):
+        """Ảnh đã vẽ cho khóa, None nếu chưa có."""
+        anh = self._anh.get(khoa)
+        if anh is not None:
+            self._anh.move_to_end(khoa)
+        return anh
+
+    def luu_anh(self, khoa, anh):
+        self._anh[khoa] = anh
+        self._anh.move_to_end(khoa)
+        while len(self._anh) > self.so_anh_cache:
+            self._anh.popitem(last=False)
+
+    def xoa_cache(self):
+        self._anh.clear()
+
+    # ---- Vẽ (luồng bất kỳ) ----
+
+    def ve(self, ten_chuoi, nhan_cot, ma_tran, tieu_de, nhan_truc_y, rong, cao):
+        """
+        Vẽ biểu đồ cột nhóm.
+
+        Args:
+            ten_chuoi: Tên từng chuỗi (hàng của ma_tran)
+            nhan_cot: Nhãn trục x (cột của ma_tran)
+            ma_tran: np.ndarray (số chuỗi x số kỳ)
+            tieu_de: Tiêu đề biểu đồ
+            nhan_truc_y: Nhãn trục y
+            rong, cao: Kích thước ảnh (pixel)
+
+        Returns:
+            QImage (bản sao độc lập, an toàn để chuyển sang luồng GUI)
+        """
+        with self._lock:
+            self._dam_bao_figure()
+            cau_truc = (tuple(ten_chuoi), len(nhan_cot), rong, cao)
+            if cau_truc == self._cau_truc:
+                self._cap_nhat_cot(ma_tran)
+                self._dat_nhan(nhan_cot, tieu_de, nhan_truc_y)
+            else:
+                self._ve_moi(ten_chuoi, nhan_cot, ma_tran, rong, cao)
+                self._dat_nhan(nhan_cot, tieu_de, nhan_truc_y)
+                self._figure.tight_layout()
+                self._cau_truc = cau_truc
+            self._canvas.draw()
+            return self._sang_qimage()
+
+    def _dam_bao_figure(self):
+        if self._figure is not None:
+            return
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self._figure = Figure(dpi=DPI)
+        self._canvas = FigureCanvasAgg(self._figure)
+
+    def _ve_moi(self, ten_chuoi, nhan_cot, ma_tran, rong, cao):
+        import numpy as np
+
+        self._figure.clear()
+        self._figure.set_size_inches(rong / DPI, cao / DPI)
+        self._ax = ax = self._figure.add_subplot(111)
+
+        x = np.arange(len(nhan_cot))
+        width = 0.8 / max(len(ten_chuoi), 1)
+        self._cac_cot = [
+            ax.bar(x + i * width, ma_tran[i], width, label=ten)
+            for i, ten in enumerate(ten_chuoi)
+        ]
+        ax.set_xticks(x + (len(ten_chuoi) - 1) * width / 2)
+        if len(ten_chuoi) > 1:
+            ax.legend(bbox_to_anchor=(1.05, 1), loc="upper left")
+
+    def _cap_nhat_cot(self, ma_tran):
+        """Chỉ đổi chiều cao các cột sẵn có rồi co giãn lại trục y."""
+        for cac_cot, hang in zip(self._cac_cot, ma_tran):
+            for cot, gia_tri in zip(cac_cot.patches, hang):
+                cot.set_height(gia_tri)
+        self._ax.relim()
+        self._ax.autoscale_view(scalex=False)
+
+    def _dat_nhan(self, nhan_cot, tieu_de, nhan_truc_y):
+        self._ax.set_xticklabels(nhan_cot, rotation=45 if len(nhan_cot) > 12 else 0)
+        self._ax.set_ylabel(nhan_truc_y)
+        self._ax.set_title(tieu_de)
+
+    def _sang_qimage(self):
+        rong, cao = self._canvas.get_width_height()
+        du_lieu = bytes(self._canvas.buffer_rgba())
+        return QImage(du_lieu, rong, cao, QImage.Format_RGBA8888).copy()
+
+
+class KhungBieuDo(QLabel):
+    """QLabel hiển thị ảnh biểu đồ; báo khi đổi kích thước để vẽ lại cho vừa."""
+
+    doi_kich_thuoc = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setAlignment(Qt.AlignCenter)
+        self.setMinimumSize(200, 150)
+        self.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+        self._da_co_anh = False
+
+    def hien_anh(self, anh):
+        self.setPixmap(QPixmap.fromImage(anh))
+        self._da_co_anh = True
+
+    def da_co_anh(self):
+        return self._da_co_anh
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.doi_kich_thuoc.emit()
@@ -0,0 +1,117 @@
+"""
+Sự kiện thay đổi dữ liệu dùng chung (event bus)
+Application event bus with typed change events
+
+Các module nghiệp vụ (invoices, stock, products, users) phát sự kiện SAU KHI
+transaction đã commit, kèm đúng các id bị ảnh hưởng; tab giao diện và cache
+đăng ký theo loại sự kiện để chỉ làm mới những dòng / số liệu liên quan thay
+vì nạp lại toàn bộ. Module này không phụ thuộc Qt: hàm đăng ký được gọi ngay
+trên luồng phát; phía GUI dùng utils.view_invalidation để chuyển về luồng GUI,
+gom sự kiện và hoãn việc làm mới các tab đang ẩn.
+
+Mỗi trường id là frozenset, None nghĩa là "không rõ / tất cả" (vd: import Excel
+hàng loạt). Hai sự kiện cùng loại gộp được bằng gop().
+
+Sử dụng:
+    from utils import event_bus
+    from utils.event_bus import TonKhoThayDoi
+
+    event_bus.dang_ky(TonKhoThayDoi, lambda su_kien: print(su_kien.sanpham_ids))
+    event_bus.phat(TonKhoThayDoi(sanpham_ids=[3, 5]))
+"""
+
+import threading
+from collections import namedtuple
+
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Hóa đơn mới (bán hàng)
+HoaDonDaTao = namedtuple("HoaDonDaTao", ["hoadon_ids", "user_ids", "sanpham_ids"])
+# Hóa đơn bị sửa / xóa / xuất / nộp tiền; sua_ban_hang: sửa / xóa phần bán
+# (chi tiết, hóa đơn), khác xuất bổ / XHĐ / nộp tiền
+HoaDonDaSua = namedtuple(
+    "HoaDonDaSua", ["hoadon_ids", "user_ids", "sanpham_ids", "sua_ban_hang"]
+)
+# Tồn kho hoặc số lượng chưa xuất của sản phẩm thay đổi (bán, xuất bổ, nhập kho)
+TonKhoThayDoi = namedtuple("TonKhoThayDoi", ["sanpham_ids"])
+# Users.so_du thay đổi
+SoDuThayDoi = namedtuple("SoDuThayDoi", ["user_ids"])
+# Thông tin sản phẩm (giá, ngưỡng...) đổi; doi_danh_sach: thêm / xóa / đổi tên
+SanPhamThayDoi = namedtuple("SanPhamThayDoi", ["sanpham_ids", "doi_danh_sach"])
+
+HoaDonDaTao.__new__.__defaults__ = (None, None)
+HoaDonDaSua.__new__.__defaults__ = (None, None, False)
+TonKhoThayDoi.__new__.__defaults__ = (None,)
+SoDuThayDoi.__new__.__defaults__ = (None,)
+SanPhamThayDoi.__new__.__defaults__ = (None, False)
+
+# loại sự kiện -> list hàm nhận
+_dang_ky = {}
+_lock = threading.Lock()
+
+
+def _chuan_hoa(su_kien):
+    """Đưa các trường id về frozenset (bỏ None bên trong), giữ None = tất cả."""
+    gia_tri = []
+    for v in su_kien:
+        if v is None or isinstance(v, (bool, frozenset)):
+            gia_tri.append(v)
+        else:
+            gia_tri.append(frozenset(x for x in v if x is not None))
+    return type(su_kien)(*gia_tri)
+
+
+def gop(a, b):
+    """
+    Gộp hai sự kiện cùng loại: hợp các tập id (None thắng), OR các cờ.
+
+    Returns:
+        Sự kiện cùng loại
+    """
+    gia_tri = []
+    for x, y in zip(a, b):
+        if isinstance(x, bool):
+            gia_tri.append(x or y)
+        elif x is None or y is None:
+            gia_tri.append(None)
+        else:
+            gia_tri.append(x | y)
+    return type(a)(*gia_tri)
+
+
+def dang_ky(loai, ham):
+    """
+    Nhận các sự kiện thuộc `loai` (gọi trên luồng phát).
+
+    Returns:
+        ham (để huy_dang_ky)
+    """
+    with _lock:
+        _dang_ky.setdefault(loai, []).append(ham)
+    return ham
+
+
+def huy_dang_ky(loai, ham):
+    with _lock:
+        cac_ham = _dang_ky.get(loai, [])
+        if ham in cac_ham:
+            cac_ham.remove(ham)
+
+
+def phat(*cac_su_kien):
+    """
+    Phát một hoặc nhiều sự kiện; chỉ gọi sau khi dữ liệu đã commit.
+
+    Lỗi trong một hàm nhận được ghi log và không ảnh hưởng hàm khác / nơi phát.
+    """
+    for su_kien in cac_su_kien:
+        su_kien = _chuan_hoa(su_kien)
+        with _lock:
+            cac_ham = list(_dang_ky.get(type(su_kien), ()))
+        for ham in cac_ham:
+            try:
+                ham(su_kien)
+            except Exception as e:
+                logger.error(f"Lỗi xử lý sự kiện {type(su_kien).__name__}: {e}")
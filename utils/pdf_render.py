@@ -0,0 +1,249 @@
+"""
+Xuất PDF / in chứng từ ở luồng nền
+Background PDF and print rendering (HTML reports + receipt templates)
+
+Báo cáo HTML được dựng bằng QTextDocument; phiếu (phiếu thu, phiếu chuyển tiền)
+được vẽ bằng QPainter theo một MauPhieu dựng sẵn - font, logo và lề chỉ tạo một
+lần, logo được thu nhỏ một lần cho mỗi độ phân giải rồi dùng lại cho mọi phiếu.
+Việc vẽ chạy trong QThreadPool: ra file PDF qua QPdfWriter, hoặc ra máy in qua
+QPrinter đã chọn trong QPrintDialog (vẽ lên QPdfWriter/QPrinter ngoài luồng GUI
+được Qt hỗ trợ); kết quả báo về luồng GUI qua signal. Nhiều phiếu có thể vẽ
+trong một lượt, mỗi phiếu một trang (vd: phiếu thu của cả ca).
+
+Sử dụng:
+    from utils.pdf_render import Phieu, xuat_pdf_nen, in_html_nen, in_phieu_nen
+
+    xuat_pdf_nen(html, "tong_ket.pdf", khi_xong=lambda path: ..., khi_loi=print)
+    in_html_nen(html, printer)  # printer đã qua QPrintDialog
+
+    phieu = Phieu("PHIẾU THU", [("Từ", "an"), ("Số tiền", "100.000 đ")])
+    in_phieu_nen([phieu], "phieu_thu.pdf", khi_xong=...)
+"""
+
+import os
+import threading
+from collections import namedtuple
+
+from PyQt5.QtCore import QObject, QRect, QRunnable, Qt, QThreadPool, pyqtSignal
+from PyQt5.QtGui import (
+    QFont,
+    QFontMetrics,
+    QImage,
+    QPageSize,
+    QPainter,
+    QPdfWriter,
+    QTextDocument,
+)
+
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+LOGO_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logo.png"
+)
+
+# Độ phân giải file PDF xuất ra (dpi)
+DPI_PDF = 300
+
+# Giữ tham chiếu tín hiệu đến khi tác vụ xong (QRunnable tự hủy sau run)
+_dang_chay = set()
+
+# Một dòng của phiếu là (nhãn, giá trị); giá trị None = dòng tiêu đề mục
+Phieu = namedtuple("Phieu", ["tieu_de", "cac_dong"])
+
+
+class MauPhieu:
+    """Bố cục phiếu dựng sẵn (khổ giấy, lề, font, logo), dùng chung cho mọi lần in."""
+
+    def __init__(self, logo_path=LOGO_PATH, kho_giay=QPageSize.A5, le_mm=12, logo_mm=15):
+        self.kho_giay = kho_giay
+        self.le_mm = le_mm
+        self.logo_mm = logo_mm
+        self.font_tieu_de = QFont("Arial", 16, QFont.Bold)
+        self.font_muc = QFont("Arial", 11, QFont.Bold)
+        self.font_noi_dung = QFont("Arial", 11)
+        self._logo = QImage(logo_path)
+        # dpi -> logo đã thu nhỏ cho độ phân giải đó
+        self._logo_theo_dpi = {}
+        self._lock = threading.Lock()
+
+    def logo(self, dpi):
+        """Logo đã thu nhỏ theo độ phân giải thiết bị (cache theo dpi)."""
+        with self._lock:
+            anh = self._logo_theo_dpi.get(dpi)
+            if anh is None:
+                if self._logo.isNull():
+                    anh = self._logo
+                else:
+                    anh = self._logo.scaledToHeight(
+                        round(self.logo_mm * dpi / 25.4), Qt.SmoothTransformation
+                    )
+                self._logo_theo_dpi[dpi] = anh
+            return anh
+
+    def ve(self, painter, phieu):
+        """Vẽ một phiếu lên trang hiện tại của painter."""
+        thiet_bi = painter.device()
+        dpi = thiet_bi.logicalDpiY()
+        mm = dpi / 25.4
+        le = round(self.le_mm * mm)
+        rong = thiet_bi.width() - 2 * le
+        y = le
+
+        # Đầu phiếu: logo bên trái, tiêu đề ở giữa
+        logo = self.logo(dpi)
+        cao_dau = max(
+            logo.height(), QFontMetrics(self.font_tieu_de, thiet_bi).height()
+        )
+        if not logo.isNull():
+            painter.drawImage(le, y, logo)
+        painter.setFont(self.font_tieu_de)
+        painter.drawText(QRect(le, y, rong, cao_dau), Qt.AlignCenter, phieu.tieu_de)
+        y += cao_dau + round(4 * mm)
+        painter.drawLine(le, y, le + rong, y)
+        y += round(4 * mm)
+
+        # Nội dung: nhãn bên trái, giá trị căn phải
+        cao_dong = round(QFontMetrics(self.font_noi_dung, thiet_bi).height() * 1.5)
+        for nhan, gia_tri in phieu.cac_dong:
+            if gia_tri is None:
+                painter.setFont(self.font_muc)
+                painter.drawText(QRect(le, y, rong, cao_dong), Qt.AlignVCenter, nhan)
+            else:
+                painter.setFont(self.font_noi_dung)
+                o = QRect(le, y, rong, cao_dong)
+                painter.drawText(o, Qt.AlignLeft | Qt.AlignVCenter, f"{nhan}:")
+                painter.drawText(o, Qt.AlignRight | Qt.AlignVCenter, str(gia_tri))
+            y += cao_dong
+
+
+_mau_phieu = None
+_lock_mau = threading.Lock()
+
+
+def lay_mau_phieu():
+    """MauPhieu dùng chung (tạo ở lần gọi đầu)."""
+    global _mau_phieu
+    with _lock_mau:
+        if _mau_phieu is None:
+            _mau_phieu = MauPhieu()
+        return _mau_phieu
+
+
+class _TinHieu(QObject):
+    xong = pyqtSignal(str)
+    loi = pyqtSignal(str)
+
+
+class InNenTask(QRunnable):
+    """Vẽ nội dung ra file PDF (QPdfWriter) hoặc ra QPrinter đã cấu hình."""
+
+    def __init__(self, ve, dich, kho_giay=QPageSize.A4):
+        """
+        Args:
+            ve: Hàm nhận thiết bị (QPagedPaintDevice) và vẽ toàn bộ nội dung
+            dich: Đường dẫn file .pdf hoặc QPrinter
+            kho_giay: Khổ giấy khi ghi file PDF (máy in dùng khổ đã chọn)
+        """
+        super().__init__()
+        self.ve = ve
+        self.dich = dich
+        self.kho_giay = kho_giay
+        self.tin_hieu = _TinHieu()
+
+    def run(self):
+        try:
+            if isinstance(self.dich, str):
+                thiet_bi = QPdfWriter(self.dich)
+                thiet_bi.setResolution(DPI_PDF)
+                thiet_bi.setPageSize(QPageSize(self.kho_giay))
+                ket_qua = self.dich
+            else:
+                thiet_bi = self.dich
+                ket_qua = self.dich.outputFileName() or self.dich.printerName()
+            self.ve(thiet_bi)
+            del thiet_bi  # QPdfWriter chỉ đóng file khi bị hủy
+            self.tin_hieu.xong.emit(ket_qua)
+        except Exception as e:
+            logger.error(f"Lỗi in/xuất PDF {self.dich}: {e}")
+            self.tin_hieu.loi.emit(str(e))
+
+
+def _ve_html(html):
+    def ve(thiet_bi):
+        doc = QTextDocument()
+        doc.setHtml(html)
+        doc.print_(thiet_bi)
+
+    return ve
+
+
+def _ve_cac_phieu(cac_phieu, mau):
+    def ve(thiet_bi):
+        painter = QPainter()
+        if not painter.begin(thiet_bi):
+            raise RuntimeError("Không mở được thiết bị in")
+        try:
+            for i, phieu in enumerate(cac_phieu):
+                if i:
+                    thiet_bi.newPage()
+                mau.ve(painter, phieu)
+        finally:
+            painter.end()
+
+    return ve
+
+
+def _chay(task, khi_xong, khi_loi):
+    tin_hieu = task.tin_hieu
+    _dang_chay.add(tin_hieu)
+    if khi_xong:
+        tin_hieu.xong.connect(khi_xong)
+    if khi_loi:
+        tin_hieu.loi.connect(khi_loi)
+    tin_hieu.xong.connect(lambda _: _dang_chay.discard(tin_hieu))
+    tin_hieu.loi.connect(lambda _: _dang_chay.discard(tin_hieu))
+    QThreadPool.globalInstance().start(task)
+
+
+def xuat_pdf_nen(html, file_path, khi_xong=None, khi_loi=None):
+    """
+    Xuất HTML ra PDF khổ A4 trong QThreadPool dùng chung.
+
+    Args:
+        html: Nội dung HTML
+        file_path: Đường dẫn file .pdf
+        khi_xong: Hàm nhận file_path, gọi ở luồng GUI khi ghi xong
+        khi_loi: Hàm nhận thông báo lỗi, gọi ở luồng GUI
+    """
+    _chay(InNenTask(_ve_html(html), file_path), khi_xong, khi_loi)
+
+
+def in_html_nen(html, printer, khi_xong=None, khi_loi=None):
+    """
+    In HTML ra máy in đã chọn, ở luồng nền.
+
+    Args:
+        html: Nội dung HTML
+        printer: QPrinter đã cấu hình (qua QPrintDialog); không dùng lại cho tới khi in xong
+        khi_xong: Hàm nhận tên máy in / file, gọi ở luồng GUI
+        khi_loi: Hàm nhận thông báo lỗi, gọi ở luồng GUI
+    """
+    _chay(InNenTask(_ve_html(html), printer), khi_xong, khi_loi)
+
+
+def in_phieu_nen(cac_phieu, dich, khi_xong=None, khi_loi=None, mau=None):
+    """
+    Vẽ một hoặc nhiều phiếu (mỗi phiếu một trang) trong một lượt, ở luồng nền.
+
+    Args:
+        cac_phieu: list Phieu
+        dich: Đường dẫn file .pdf hoặc QPrinter đã cấu hình
+        khi_xong: Hàm nhận đường dẫn / tên máy in, gọi ở luồng GUI
+        khi_loi: Hàm nhận thông báo lỗi, gọi ở luồng GUI
+        mau: MauPhieu (None = mẫu dùng chung)
+    """
+    mau = mau or lay_mau_phieu()
+    task = InNenTask(_ve_cac_phieu(list(cac_phieu), mau), dich, mau.kho_giay)
+    _chay(task, khi_xong, khi_loi)
@@ -0,0 +1,222 @@
+"""
+Model cây lịch sử giá nạp dần (sản phẩm -> các lần đổi giá)
+Lazily populated price-history tree model
+
+Thay cho QTreeWidget dựng toàn bộ cây mỗi lần tải: dòng cấp 1 là sản phẩm kèm
+lần đổi giá gần nhất (tóm tắt tính bằng SQL, xem price_timeline), được đọc
+theo trang khi cuộn tới cuối (canFetchMore/fetchMore trên gốc). Dòng cấp 2 là
+từng lần đổi giá của sản phẩm, chỉ được đọc khi mở rộng dòng đó. Lọc theo tên /
+loại giá chạy trong SQL, đổi bộ lọc chỉ reset model - mở tab chỉ tốn một truy
+vấn một trang, không phụ thuộc lịch sử dài bao nhiêu.
+
+Sử dụng:
+    from utils.price_history_model import LichSuGiaModel
+
+    self.model_lich_su_gia = LichSuGiaModel(dinh_dang_gia=format_price)
+    tree = QTreeView()
+    tree.setModel(self.model_lich_su_gia)
+    self.model_lich_su_gia.dat_bo_loc("2025-01-01", "2025-01-31", tu_khoa="bia")
+"""
+
+from PyQt5.QtCore import Qt, QAbstractItemModel, QModelIndex, pyqtSignal
+from PyQt5.QtGui import QFont
+
+from price_timeline import LOAI_GIA, lay_thay_doi_gia, lay_tom_tat_lich_su_gia
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+TIEU_DE = [
+    "Sản phẩm / Thời điểm",
+    "Lẻ cũ",
+    "Lẻ mới",
+    "Buôn cũ",
+    "Buôn mới",
+    "VIP cũ",
+    "VIP mới",
+    "User",
+    "Số lần đổi",
+]
+
+# Số sản phẩm mỗi lần đọc
+KICH_THUOC_TRANG = 100
+
+# internalId của dòng cấp 1; dòng cấp 2 lưu (chỉ số dòng cha + 1)
+_CAP_MOT = 0
+
+
+class LichSuGiaModel(QAbstractItemModel):
+    """Cây 2 cấp: sản phẩm (tóm tắt) -> các lần đổi giá, đọc từ DB khi cần."""
+
+    # (số sản phẩm đã nạp, tổng số sản phẩm thỏa bộ lọc)
+    da_nap = pyqtSignal(int, int)
+    loi = pyqtSignal(str)
+
+    def __init__(self, dinh_dang_gia=str, kich_thuoc_trang=KICH_THUOC_TRANG, parent=None):
+        super().__init__(parent)
+        self._dinh_dang_gia = dinh_dang_gia
+        self._kich_thuoc_trang = kich_thuoc_trang
+        self._bo_loc = None
+        self._san_pham = []
+        # chỉ số dòng sản phẩm -> list ThayDoiGia (chưa có khóa = chưa đọc)
+        self._thay_doi = {}
+        self._tong = None
+        self._font_dam = QFont()
+        self._font_dam.setBold(True)
+
+    def dat_bo_loc(self, tu_ngay, den_ngay, tu_khoa=None, loai_gia=None):
+        """Đổi bộ lọc, bỏ dữ liệu đã nạp và đọc trang đầu; các trang sau đọc khi cuộn tới."""
+        self.beginResetModel()
+        self._bo_loc = (tu_ngay, den_ngay, (tu_khoa or "").strip() or None, loai_gia)
+        self._san_pham = []
+        self._thay_doi = {}
+        self._tong = None
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def lam_moi(self):
+        if self._bo_loc is not None:
+            self.dat_bo_loc(*self._bo_loc)
+
+    @property
+    def tong(self):
+        return self._tong or 0
+
+    # ---- Cấu trúc cây ----
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column, _CAP_MOT)
+        return self.createIndex(row, column, parent.row() + 1)
+
+    def parent(self, index):
+        if not index.isValid() or index.internalId() == _CAP_MOT:
+            return QModelIndex()
+        return self.createIndex(index.internalId() - 1, 0, _CAP_MOT)
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return len(self._san_pham)
+        if parent.internalId() == _CAP_MOT and parent.column() == 0:
+            return len(self._thay_doi.get(parent.row(), ()))
+        return 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(TIEU_DE)
+
+    def hasChildren(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return True
+        if parent.internalId() == _CAP_MOT and parent.column() == 0:
+            return self._san_pham[parent.row()].so_lan > 0
+        return False
+
+    def canFetchMore(self, parent):
+        if self._bo_loc is None:
+            return False
+        if not parent.isValid():
+            return self._tong is None or len(self._san_pham) < self._tong
+        if parent.internalId() == _CAP_MOT:
+            row = parent.row()
+            return row not in self._thay_doi and self._san_pham[row].so_lan > 0
+        return False
+
+    def fetchMore(self, parent):
+        try:
+            if not parent.isValid():
+                self._nap_trang()
+            elif parent.internalId() == _CAP_MOT:
+                self._nap_thay_doi(parent)
+        except Exception as e:
+            logger.error(f"Lỗi đọc lịch sử giá: {e}")
+            # Dừng đọc tiếp để view không gọi lại liên tục
+            self._tong = len(self._san_pham)
+            self.loi.emit(str(e))
+
+    def _nap_trang(self):
+        tu_ngay, den_ngay, tu_khoa, loai_gia = self._bo_loc
+        trang, tong = lay_tom_tat_lich_su_gia(
+            tu_ngay,
+            den_ngay,
+            tu_khoa,
+            loai_gia,
+            gioi_han=self._kich_thuoc_trang,
+            bo_qua=len(self._san_pham),
+        )
+        self._tong = tong if trang else len(self._san_pham)
+        if trang:
+            dau = len(self._san_pham)
+            self.beginInsertRows(QModelIndex(), dau, dau + len(trang) - 1)
+            self._san_pham.extend(trang)
+            self.endInsertRows()
+        self.da_nap.emit(len(self._san_pham), self._tong)
+
+    def _nap_thay_doi(self, parent):
+        row = parent.row()
+        tu_ngay, den_ngay, _, loai_gia = self._bo_loc
+        cac_thay_doi = lay_thay_doi_gia(
+            self._san_pham[row].sanpham_id, tu_ngay, den_ngay, loai_gia
+        )
+        if cac_thay_doi:
+            self.beginInsertRows(parent, 0, len(cac_thay_doi) - 1)
+            self._thay_doi[row] = cac_thay_doi
+            self.endInsertRows()
+        else:
+            self._thay_doi[row] = []
+
+    # ---- Dữ liệu ----
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return TIEU_DE[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        cot = index.column()
+        cap_mot = index.internalId() == _CAP_MOT
+        if role == Qt.DisplayRole:
+            if cap_mot:
+                return self._o_san_pham(self._san_pham[index.row()], cot)
+            cha = index.internalId() - 1
+            return self._o_thay_doi(self._thay_doi[cha][index.row()], cot)
+        if role == Qt.TextAlignmentRole and 1 <= cot <= 6:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role == Qt.FontRole and cap_mot and cot == 0:
+            return self._font_dam
+        if role == Qt.ToolTipRole:
+            if cap_mot:
+                lan_cuoi = self._san_pham[index.row()].lan_cuoi
+                return f"Đổi giá gần nhất: {lan_cuoi}" if lan_cuoi else None
+            ghi_chu = self._thay_doi[index.internalId() - 1][index.row()].ghi_chu
+            return ghi_chu or None
+        return None
+
+    def _o_san_pham(self, sp, cot):
+        if cot == 0:
+            return sp.ten
+        if cot <= 6:
+            loai = LOAI_GIA[(cot - 1) // 2]
+            if loai in sp.thay_doi:
+                gia = sp.thay_doi[loai][(cot - 1) % 2]
+            else:
+                # Chưa đổi loại giá này trong khoảng: cũ = mới = giá hiện tại
+                gia = sp.gia_hien_tai[loai]
+            return self._dinh_dang_gia(gia)
+        if cot == 7:
+            return sp.username
+        return str(sp.so_lan) if sp.so_lan else ""
+
+    def _o_thay_doi(self, td, cot):
+        if cot == 0:
+            return str(td.ngay_thay_doi)
+        if cot <= 6:
+            if LOAI_GIA[(cot - 1) // 2] != td.loai_gia:
+                return ""
+            return self._dinh_dang_gia(td.gia_moi if (cot - 1) % 2 else td.gia_cu)
+        if cot == 7:
+            return td.username
+        return ""
@@ -0,0 +1,163 @@
+"""
+Model tên sản phẩm dùng chung cho mọi ô nhập tên sản phẩm
+Shared product-name model for all completers in the app
+
+Một model duy nhất cho toàn ứng dụng, cập nhật từng dòng (insert/remove)
+thay vì tạo lại QCompleter mỗi khi sản phẩm thay đổi. Có hai view:
+- "Tất cả": mọi sản phẩm trong DB
+- "Có sẵn": chỉ sản phẩm có số lượng > 0 trong available_products của ca
+
+Sử dụng:
+    from utils.product_completer import lay_bo_goi_y_sanpham
+
+    goi_y = lay_bo_goi_y_sanpham()
+    line_edit.setCompleter(goi_y.completer_tat_ca)
+    goi_y.them_ten("Dầu A")
+    goi_y.cap_nhat_co_san(self.available_products)
+"""
+
+from bisect import bisect_left
+
+from PyQt5.QtCore import (
+    Qt,
+    QAbstractListModel,
+    QModelIndex,
+    QSortFilterProxyModel,
+)
+from PyQt5.QtWidgets import QApplication, QCompleter
+
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class ProductNameModel(QAbstractListModel):
+    """Danh sách tên sản phẩm đã sắp xếp, thêm/xóa theo từng dòng."""
+
+    def __init__(self, names=None, parent=None):
+        super().__init__(parent)
+        self._names = sorted(set(names or []))
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._names)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        return self._names[index.row()]
+
+    def names(self):
+        return self._names
+
+    def them_ten(self, ten):
+        """Chèn một tên vào đúng vị trí sắp xếp. Trả về False nếu đã có."""
+        ten = (ten or "").strip()
+        if not ten:
+            return False
+        i = bisect_left(self._names, ten)
+        if i < len(self._names) and self._names[i] == ten:
+            return False
+        self.beginInsertRows(QModelIndex(), i, i)
+        self._names.insert(i, ten)
+        self.endInsertRows()
+        return True
+
+    def xoa_ten(self, ten):
+        """Xóa một tên nếu có. Trả về False nếu không tìm thấy."""
+        i = bisect_left(self._names, ten)
+        if i >= len(self._names) or self._names[i] != ten:
+            return False
+        self.beginRemoveRows(QModelIndex(), i, i)
+        del self._names[i]
+        self.endRemoveRows()
+        return True
+
+    def dong_bo(self, names):
+        """Đồng bộ với danh sách mới bằng các thao tác thêm/xóa tối thiểu."""
+        moi = set(names or [])
+        cu = set(self._names)
+        for ten in cu - moi:
+            self.xoa_ten(ten)
+        for ten in sorted(moi - cu):
+            self.them_ten(ten)
+
+
+class AvailableProductProxy(QSortFilterProxyModel):
+    """Chỉ giữ lại các tên có số lượng > 0 trong available_products."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._co_san = frozenset()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        index = self.sourceModel().index(source_row, 0, source_parent)
+        return self.sourceModel().data(index) in self._co_san
+
+    def cap_nhat_co_san(self, available_products):
+        """Cập nhật tập sản phẩm có sẵn; chỉ lọc lại khi tập thực sự thay đổi."""
+        co_san = frozenset(
+            ten for ten, qty in (available_products or {}).items() if (qty or 0) > 0
+        )
+        if co_san == self._co_san:
+            return False
+        self._co_san = co_san
+        self.invalidateFilter()
+        return True
+
+
+def _tao_completer(model, parent):
+    comp = QCompleter(parent)
+    comp.setModel(model)
+    comp.setCaseSensitivity(Qt.CaseInsensitive)
+    comp.setFilterMode(Qt.MatchContains)
+    return comp
+
+
+class ProductCompleters:
+    """Bộ model + proxy + completer dùng chung cho toàn ứng dụng."""
+
+    def __init__(self, names=None, parent=None):
+        self.model = ProductNameModel(names, parent)
+
+        # View "Tất cả" dùng trực tiếp model gốc
+        self.completer_tat_ca = _tao_completer(self.model, parent)
+
+        # View "Có sẵn" lọc theo available_products của ca hiện tại
+        self.proxy_co_san = AvailableProductProxy(parent)
+        self.proxy_co_san.setSourceModel(self.model)
+        self.completer_co_san = _tao_completer(self.proxy_co_san, parent)
+
+    def them_ten(self, ten):
+        return self.model.them_ten(ten)
+
+    def xoa_ten(self, ten):
+        return self.model.xoa_ten(ten)
+
+    def dong_bo(self, names):
+        self.model.dong_bo(names)
+
+    def cap_nhat_co_san(self, available_products):
+        return self.proxy_co_san.cap_nhat_co_san(available_products)
+
+
+_shared = None
+
+
+def lay_bo_goi_y_sanpham():
+    """
+    Lấy bộ gợi ý tên sản phẩm dùng chung (tạo và nạp từ DB ở lần gọi đầu).
+
+    Returns:
+        ProductCompleters
+    """
+    global _shared
+    if _shared is None:
+        from products import lay_danh_sach_ten_sanpham
+
+        names = lay_danh_sach_ten_sanpham()
+        # Gắn vào QApplication để sống suốt vòng đời ứng dụng (qua các lần đăng nhập)
+        _shared = ProductCompleters(names, QApplication.instance())
+        logger.debug(f"Khởi tạo model tên sản phẩm dùng chung: {len(names)} tên")
+    return _shared
@@ -0,0 +1,178 @@
+"""
+Cache kết quả báo cáo theo tham số và phiên bản dữ liệu
+Report result cache keyed by parameters and database version
+
+Khóa cache = (hàm báo cáo, tham số đã chuẩn hóa). Mỗi kết quả ghi kèm phiên
+bản dữ liệu lúc tính; phiên bản lấy từ PRAGMA data_version trên MỘT kết nối
+theo dõi riêng. SQLite tăng giá trị này mỗi khi kết nối KHÁC (kể cả tiến trình
+khác) commit thay đổi, nên mọi thao tác ghi đều tự làm cache hết hạn mà không
+cần gọi xóa cache ở từng chỗ ghi.
+
+Bộ nhớ được giới hạn theo tổng kích thước ước lượng, loại bỏ mục ít dùng
+nhất (LRU) khi vượt ngưỡng.
+
+Sử dụng:
+    from utils.report_cache import cache_bao_cao
+
+    @cache_bao_cao
+    def doanh_thu_theo_thang(nam, thang):
+        ...
+
+Lưu ý: kết quả được dùng chung giữa các lần gọi; list/dict trả về là bản sao
+nông, không sửa tại chỗ các phần tử bên trong.
+"""
+
+import functools
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Giới hạn bộ nhớ mặc định cho toàn bộ cache (byte, ước lượng)
+GIOI_HAN_BO_NHO = 64 * 1024 * 1024
+# Kết quả lớn hơn ngưỡng này sẽ không được cache
+KICH_THUOC_TOI_DA_MOT_MUC = 16 * 1024 * 1024
+
+
+class ReportCache:
+    """LRU cache giới hạn theo bộ nhớ, hết hạn theo phiên bản dữ liệu."""
+
+    def __init__(self, gioi_han_bo_nho=GIOI_HAN_BO_NHO):
+        self.gioi_han_bo_nho = gioi_han_bo_nho
+        # khóa -> (phien_ban, ket_qua, kich_thuoc)
+        self._muc = OrderedDict()
+        self._tong_kich_thuoc = 0
+        self._lock = threading.RLock()
+        self._conn_theo_doi = None
+        self.so_lan_trung = 0
+        self.so_lan_truot = 0
+
+    def phien_ban_du_lieu(self):
+        """PRAGMA data_version của kết nối theo dõi (đổi khi có commit từ nơi khác)."""
+        with self._lock:
+            if self._conn_theo_doi is None:
+                from db import DB_NAME
+
+                self._conn_theo_doi = sqlite3.connect(
+                    DB_NAME, timeout=30.0, check_same_thread=False
+                )
+            return self._conn_theo_doi.execute("PRAGMA data_version").fetchone()[0]
+
+    def lay(self, khoa, phien_ban):
+        with self._lock:
+            muc = self._muc.get(khoa)
+            if muc is None or muc[0] != phien_ban:
+                self.so_lan_truot += 1
+                return False, None
+            self._muc.move_to_end(khoa)
+            self.so_lan_trung += 1
+            return True, muc[1]
+
+    def luu(self, khoa, phien_ban, ket_qua):
+        kich_thuoc = _uoc_luong_kich_thuoc(ket_qua)
+        if kich_thuoc > KICH_THUOC_TOI_DA_MOT_MUC:
+            return
+        with self._lock:
+            cu = self._muc.pop(khoa, None)
+            if cu is not None:
+                self._tong_kich_thuoc -= cu[2]
+            self._muc[khoa] = (phien_ban, ket_qua, kich_thuoc)
+            self._tong_kich_thuoc += kich_thuoc
+            while self._tong_kich_thuoc > self.gioi_han_bo_nho and self._muc:
+                _, (_, _, kt) = self._muc.popitem(last=False)
+                self._tong_kich_thuoc -= kt
+
+    def xoa(self):
+        """Xóa toàn bộ cache."""
+        with self._lock:
+            self._muc.clear()
+            self._tong_kich_thuoc = 0
+
+    def thong_ke(self):
+        with self._lock:
+            return {
+                "so_muc": len(self._muc),
+                "kich_thuoc": self._tong_kich_thuoc,
+                "trung": self.so_lan_trung,
+                "truot": self.so_lan_truot,
+            }
+
+
+def _uoc_luong_kich_thuoc(obj, _sau=0):
+    """Ước lượng số byte của kết quả (list/tuple/dict lồng nhau, mảng NumPy)."""
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    kt = sys.getsizeof(obj)
+    if _sau > 3:
+        return kt
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            kt += _uoc_luong_kich_thuoc(k, _sau + 1) + _uoc_luong_kich_thuoc(v, _sau + 1)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for v in obj:
+            kt += _uoc_luong_kich_thuoc(v, _sau + 1)
+    return kt
+
+
+def _chuan_hoa(gia_tri):
+    """Đưa tham số về dạng hashable, ổn định giữa các lần gọi."""
+    if gia_tri is None or isinstance(gia_tri, (str, int, float, bool)):
+        return gia_tri
+    if isinstance(gia_tri, (datetime, date)):
+        return gia_tri.isoformat()
+    if hasattr(gia_tri, "toString") and hasattr(gia_tri, "isValid"):
+        # QDate / QDateTime
+        return gia_tri.toString("yyyy-MM-dd HH:mm:ss")
+    if isinstance(gia_tri, (list, tuple)):
+        return tuple(_chuan_hoa(v) for v in gia_tri)
+    if isinstance(gia_tri, (set, frozenset)):
+        return tuple(sorted(_chuan_hoa(v) for v in gia_tri))
+    if isinstance(gia_tri, dict):
+        return tuple(sorted((k, _chuan_hoa(v)) for k, v in gia_tri.items()))
+    # Đối tượng khác (vd: self của MainWindow): phân biệt theo danh tính
+    return (type(gia_tri).__name__, id(gia_tri))
+
+
+_cache = ReportCache()
+
+
+def lay_cache():
+    """Cache báo cáo dùng chung của ứng dụng."""
+    return _cache
+
+
+def cache_bao_cao(func):
+    """
+    Decorator cache kết quả hàm báo cáo theo tham số + phiên bản dữ liệu.
+
+    Hàm được bọc có thêm func.bo_qua_cache(*args, **kwargs) để gọi trực tiếp.
+    """
+    ten = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            khoa = (ten, _chuan_hoa(args), _chuan_hoa(kwargs))
+            phien_ban = _cache.phien_ban_du_lieu()
+        except Exception as e:
+            logger.debug(f"Bỏ qua cache cho {ten}: {e}")
+            return func(*args, **kwargs)
+
+        trung, ket_qua = _cache.lay(khoa, phien_ban)
+        if not trung:
+            ket_qua = func(*args, **kwargs)
+            _cache.luu(khoa, phien_ban, ket_qua)
+        if isinstance(ket_qua, list):
+            return list(ket_qua)
+        if isinstance(ket_qua, dict):
+            return dict(ket_qua)
+        return ket_qua
+
+    wrapper.bo_qua_cache = func
+    return wrapper
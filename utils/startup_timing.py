@@ -0,0 +1,162 @@
+"""
+Đo thời gian khởi động ứng dụng
+Startup timing report (import breakdown + phase timers)
+
+bat_dau() thay builtins.__import__ bằng một hàm đo: mỗi module được import LẦN
+ĐẦU (trên luồng chính) được ghi thời gian riêng và cộng dồn, lồng theo cấp như
+`python -X importtime`. moc(ten) đánh dấu hết một giai đoạn trên luồng GUI, do(ten)
+đo một bước bất kỳ (kể cả ở luồng nền). ket_thuc() gỡ hook và ghi báo cáo vào log
+(logs/shopflow_*.log), kèm danh sách module nặng đã bị nạp trong lúc khởi động.
+
+Chỉ bật khi chạy main_gui trực tiếp (kể cả bản PyInstaller); import main_gui từ
+nơi khác không đo gì.
+
+Sử dụng:
+    from utils import startup_timing
+
+    startup_timing.bat_dau()
+    ...
+    startup_timing.moc("Import main_gui")
+    with startup_timing.do("khoi_tao_db"):
+        khoi_tao_db()
+    startup_timing.ket_thuc()
+"""
+
+import builtins
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Module nặng phải được import khi dùng lần đầu, không phải lúc khởi động
+MODULE_NANG = ("pandas", "matplotlib", "openpyxl", "langchain", "groq", "requests")
+
+# Chỉ ghi các import có thời gian cộng dồn >= ngưỡng (giây)
+NGUONG_IMPORT = 0.002
+
+_lock = threading.Lock()
+_t0 = None
+_t_moc = None
+_luong_chinh = None
+_import_goc = None
+# [ten, thoi_gian_con] của các import đang chạy (luồng chính)
+_ngan_xep = []
+# (cap, ten, rieng, cong_don) theo thứ tự import xong
+_cac_import = []
+# (ten, giay)
+_cac_moc = []
+_cac_buoc = []
+
+
+def bat_dau():
+    """Bắt đầu đo; gọi càng sớm càng tốt (đầu main_gui)."""
+    global _t0, _t_moc, _luong_chinh, _import_goc
+    if _t0 is not None:
+        return
+    _t0 = _t_moc = time.perf_counter()
+    _luong_chinh = threading.get_ident()
+    _import_goc = builtins.__import__
+    builtins.__import__ = _import_co_do
+
+
+def _import_co_do(name, globals=None, locals=None, fromlist=(), level=0):
+    # Import tương đối / đã nạp / ở luồng khác: không đo
+    if level or name in sys.modules or threading.get_ident() != _luong_chinh:
+        return _import_goc(name, globals, locals, fromlist, level)
+
+    khung = [name, 0.0]
+    _ngan_xep.append(khung)
+    bat_dau_import = time.perf_counter()
+    try:
+        return _import_goc(name, globals, locals, fromlist, level)
+    finally:
+        cong_don = time.perf_counter() - bat_dau_import
+        _ngan_xep.pop()
+        if _ngan_xep:
+            _ngan_xep[-1][1] += cong_don
+        _cac_import.append((len(_ngan_xep), name, cong_don - khung[1], cong_don))
+
+
+def dung_do_import():
+    """Gỡ hook import; gọi trước khi khởi chạy luồng nền (hook chỉ dành cho luồng chính)."""
+    if builtins.__import__ is _import_co_do:
+        builtins.__import__ = _import_goc
+
+
+def moc(ten):
+    """Kết thúc giai đoạn `ten` (tính từ mốc trước)."""
+    global _t_moc
+    if _t0 is None:
+        return
+    bay_gio = time.perf_counter()
+    with _lock:
+        _cac_moc.append((ten, bay_gio - _t_moc))
+        _t_moc = bay_gio
+
+
+@contextmanager
+def do(ten):
+    """Đo một bước (dùng được ở luồng nền)."""
+    if _t0 is None:
+        yield
+        return
+    bat_dau_buoc = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _cac_buoc.append((ten, time.perf_counter() - bat_dau_buoc))
+
+
+def bao_cao():
+    """Báo cáo dạng text (các dòng)."""
+    dong = []
+    tong = time.perf_counter() - _t0
+    dong.append(f"Khởi động: {tong * 1000:.0f} ms")
+
+    dong.append("Giai đoạn:")
+    for ten, giay in _cac_moc:
+        dong.append(f"  {giay * 1000:8.1f} ms  {ten}")
+
+    if _cac_buoc:
+        dong.append("Các bước:")
+        for ten, giay in _cac_buoc:
+            dong.append(f"  {giay * 1000:8.1f} ms  {ten}")
+
+    dong.append(
+        f"Import (>= {NGUONG_IMPORT * 1000:.0f} ms, kiểu -X importtime): "
+        "self [us] | cumulative | module"
+    )
+    for cap, ten, rieng, cong_don in _cac_import:
+        if cong_don >= NGUONG_IMPORT:
+            dong.append(
+                f"  {rieng * 1e6:10.0f} | {cong_don * 1e6:10.0f} | {'  ' * cap}{ten}"
+            )
+
+    nang = sorted(
+        {
+            ten.split(".")[0]
+            for ten in list(sys.modules)
+            if ten.split(".")[0].startswith(MODULE_NANG)
+        }
+    )
+    if nang:
+        dong.append(f"Module nặng đã nạp khi khởi động: {', '.join(nang)}")
+    return dong
+
+
+def ket_thuc():
+    """Gỡ hook import và ghi báo cáo vào log."""
+    global _t0
+    if _t0 is None:
+        return
+    dung_do_import()
+
+    from utils.logging_config import get_logger
+
+    logger = get_logger(__name__)
+    try:
+        logger.info("\n".join(bao_cao()))
+    except Exception as e:
+        logger.warning(f"Không ghi được báo cáo khởi động: {e}")
+    _t0 = None
@@ -0,0 +1,386 @@
+"""
+Bảng dữ liệu model/view dùng chung cho các tab danh sách
+Shared model/view table backed by row lists
+
+Thay cho QTableWidget + setItem(QTableWidgetItem) từng ô: dữ liệu được giữ
+nguyên dạng list các dòng (tuple/list/dict), mỗi lần tải chỉ là một lần
+reset model. Chuỗi hiển thị được định dạng lúc vẽ (chỉ các ô đang hiện trên
+màn hình), nút/link trong ô được vẽ bằng delegate thay vì tạo widget mỗi dòng.
+Sắp xếp và lọc qua QSortFilterProxyModel, sắp theo giá trị gốc (Qt.UserRole).
+
+Sử dụng:
+    from utils.table_model import Cot, BangDuLieu
+
+    self.tbl_hoadon = BangDuLieu(
+        [
+            Cot("Ngày", 2),
+            Cot("Tên SP", 4),
+            Cot("Tổng tiền", 7, dinh_dang=format_price, can_le=Qt.AlignRight),
+            Cot("", 0, kieu=KIEU_NUT, dinh_dang=lambda _: "Chi tiết"),
+        ]
+    )
+    self.tbl_hoadon.bam_o.connect(lambda row, cot: ...)  # row = chỉ số dòng gốc
+    self.tbl_hoadon.dat_du_lieu(rows)
+    self.tbl_hoadon.cap_nhat_theo_khoa([hoadon_id], rows_moi)  # chỉ các dòng đổi
+    row = self.tbl_hoadon.dong_hien_tai()  # -1 nếu chưa chọn
+    hoadon_id = self.tbl_hoadon.gia_tri(row, 0)
+"""
+
+from collections import namedtuple
+
+from PyQt5.QtCore import (
+    Qt,
+    QAbstractTableModel,
+    QEvent,
+    QModelIndex,
+    QSortFilterProxyModel,
+    pyqtSignal,
+)
+from PyQt5.QtGui import QBrush, QColor, QFont
+from PyQt5.QtWidgets import (
+    QAbstractItemView,
+    QApplication,
+    QHeaderView,
+    QStyle,
+    QStyledItemDelegate,
+    QStyleOptionButton,
+    QTableView,
+)
+
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+KIEU_NUT = "nut"  # Vẽ thành nút bấm
+KIEU_LINK = "link"  # Vẽ thành link (chữ xanh đậm)
+KIEU_CHON = "chon"  # Ô checkbox (đánh dấu dòng)
+
+MAU_LINK = QColor("#0A6CBF")
+
+Cot = namedtuple(
+    "Cot",
+    [
+        "tieu_de",  # Tiêu đề cột
+        "chi_so",  # Chỉ số (tuple/list) hoặc khóa (dict) trong dòng
+        "dinh_dang",  # Hàm giá trị -> chuỗi hiển thị (None = str, None -> "")
+        "can_le",  # Qt.Alignment (None = mặc định)
+        "kieu",  # None, KIEU_NUT, KIEU_LINK, KIEU_CHON
+        "mau",  # QColor chữ, hoặc hàm dòng -> QColor/None
+        "dam",  # Chữ đậm
+        "sua",  # Cho phép sửa (double click)
+        "kich_hoat",  # Hàm dòng -> bool: nút/link có bấm được không (None = luôn)
+    ],
+    defaults=(None, None, None, None, False, False, None),
+)
+
+
+class BangModel(QAbstractTableModel):
+    """Model bảng đọc trực tiếp từ list các dòng."""
+
+    # (dòng gốc, cột, giá trị mới đã nhập) khi người dùng sửa một ô
+    da_sua = pyqtSignal(int, int, str)
+
+    def __init__(self, cot, parent=None):
+        super().__init__(parent)
+        self._cot = list(cot)
+        self._rows = []
+        self._da_chon = set()
+        self._font_dam = QFont()
+        self._font_dam.setBold(True)
+
+    # ---- Dữ liệu ----
+    def dat_du_lieu(self, rows):
+        """Thay toàn bộ dữ liệu (một lần reset model)."""
+        self.beginResetModel()
+        self._rows = list(rows)
+        self._da_chon = set()
+        self.endResetModel()
+
+    def dong(self, row):
+        return self._rows[row]
+
+    def cac_dong(self):
+        return self._rows
+
+    def gia_tri(self, row, cot):
+        """Giá trị gốc ở cột `cot` (chỉ số cột hiển thị) của dòng `row`."""
+        return self._rows[row][self._cot[cot].chi_so]
+
+    def cap_nhat_gia_tri(self, row, cot, gia_tri):
+        """Ghi giá trị gốc vào một ô và vẽ lại ô đó."""
+        dong = self._rows[row]
+        if isinstance(dong, tuple):
+            dong = list(dong)
+            self._rows[row] = dong
+        dong[self._cot[cot].chi_so] = gia_tri
+        idx = self.index(row, cot)
+        self.dataChanged.emit(idx, idx)
+
+    def cap_nhat_theo_khoa(self, cac_khoa, cac_dong_moi, chi_so_khoa=0):
+        """
+        Làm mới một số dòng theo khóa thay vì nạp lại cả bảng.
+
+        Dòng có khóa thuộc `cac_khoa`: thay bằng dòng mới cùng khóa, hoặc bị bỏ
+        nếu không còn trong `cac_dong_moi`; dòng mới chưa có trong bảng được
+        thêm vào cuối. Các dòng khác (và lựa chọn của chúng) giữ nguyên.
+
+        Args:
+            cac_khoa: Các khóa đã đọc lại
+            cac_dong_moi: Dữ liệu mới của các khóa đó (thiếu = đã bị xóa / lọc)
+            chi_so_khoa: Chỉ số (hoặc khóa dict) của khóa trong dòng
+        """
+        cac_khoa = set(cac_khoa)
+        moi = {dong[chi_so_khoa]: dong for dong in cac_dong_moi}
+        bo = []
+        for i, dong in enumerate(self._rows):
+            khoa = dong[chi_so_khoa]
+            if khoa not in cac_khoa:
+                continue
+            if khoa in moi:
+                self._rows[i] = moi.pop(khoa)
+                self.dataChanged.emit(
+                    self.index(i, 0), self.index(i, len(self._cot) - 1)
+                )
+            else:
+                bo.append(i)
+        for i in reversed(bo):
+            self.beginRemoveRows(QModelIndex(), i, i)
+            del self._rows[i]
+            self._da_chon = {r - (r > i) for r in self._da_chon if r != i}
+            self.endRemoveRows()
+        if moi:
+            dau = len(self._rows)
+            self.beginInsertRows(QModelIndex(), dau, dau + len(moi) - 1)
+            self._rows.extend(moi.values())
+            self.endInsertRows()
+
+    def dong_da_chon(self):
+        """Các dòng gốc đang được đánh dấu ở cột KIEU_CHON (tăng dần)."""
+        return sorted(self._da_chon)
+
+    # ---- QAbstractTableModel ----
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._cot)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self._cot[section].tieu_de
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        cot = self._cot[index.column()]
+        f = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if cot.kieu == KIEU_CHON:
+            f |= Qt.ItemIsUserCheckable
+        if cot.sua:
+            f |= Qt.ItemIsEditable
+        return f
+
+    def _hien_thi(self, cot, gia_tri):
+        if cot.kieu == KIEU_CHON:
+            return None
+        if cot.dinh_dang is not None:
+            return cot.dinh_dang(gia_tri)
+        return "" if gia_tri is None else str(gia_tri)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        cot = self._cot[index.column()]
+        dong = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return self._hien_thi(cot, dong[cot.chi_so])
+        if role == Qt.EditRole:
+            gia_tri = dong[cot.chi_so]
+            return "" if gia_tri is None else str(gia_tri)
+        if role == Qt.UserRole:
+            return dong[cot.chi_so]
+        if role == Qt.CheckStateRole and cot.kieu == KIEU_CHON:
+            return Qt.Checked if index.row() in self._da_chon else Qt.Unchecked
+        if role == Qt.TextAlignmentRole:
+            if cot.can_le is not None:
+                return int(cot.can_le | Qt.AlignVCenter)
+            if cot.kieu in (KIEU_NUT, KIEU_LINK):
+                return int(Qt.AlignCenter)
+            return None
+        if role == Qt.ForegroundRole:
+            mau = cot.mau(dong) if callable(cot.mau) else cot.mau
+            if mau is None and cot.kieu == KIEU_LINK:
+                mau = MAU_LINK
+            return QBrush(mau) if mau is not None else None
+        if role == Qt.FontRole and (cot.dam or cot.kieu == KIEU_LINK):
+            return self._font_dam
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid():
+            return False
+        row, c = index.row(), index.column()
+        cot = self._cot[c]
+        if role == Qt.CheckStateRole and cot.kieu == KIEU_CHON:
+            if value == Qt.Checked:
+                self._da_chon.add(row)
+            else:
+                self._da_chon.discard(row)
+            self.dataChanged.emit(index, index)
+            return True
+        if role == Qt.EditRole and cot.sua:
+            # Giá trị gốc chỉ đổi khi nơi xử lý da_sua ghi DB thành công
+            # (gọi cap_nhat_gia_tri); ngược lại ô hiện lại giá trị cũ.
+            self.da_sua.emit(row, c, str(value))
+            return True
+        return False
+
+
+class BangLocModel(QSortFilterProxyModel):
+    """Proxy sắp xếp theo giá trị gốc và lọc theo chuỗi trên mọi cột."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setSortRole(Qt.UserRole)
+        self.setFilterKeyColumn(-1)
+        self.setFilterCaseSensitivity(Qt.CaseInsensitive)
+
+    def lessThan(self, left, right):
+        a = left.data(Qt.UserRole)
+        b = right.data(Qt.UserRole)
+        if a is None or b is None:
+            return a is None and b is not None
+        try:
+            return a < b
+        except TypeError:
+            return str(a) < str(b)
+
+
+class NutDelegate(QStyledItemDelegate):
+    """Vẽ ô thành nút bấm hoặc link; bấm chuột phát signal của BangDuLieu."""
+
+    def __init__(self, bang, kieu, kich_hoat=None):
+        super().__init__(bang)
+        self._bang = bang
+        self._kieu = kieu
+        self._kich_hoat = kich_hoat
+
+    def _bam_duoc(self, index):
+        if self._kich_hoat is None:
+            return True
+        row = self._bang.dong_goc(index)
+        return bool(self._kich_hoat(self._bang.model_goc.dong(row)))
+
+    def paint(self, painter, option, index):
+        if self._kieu != KIEU_NUT or not self._bam_duoc(index):
+            super().paint(painter, option, index)
+            return
+        nut = QStyleOptionButton()
+        nut.rect = option.rect.adjusted(2, 2, -2, -2)
+        nut.text = index.data(Qt.DisplayRole) or ""
+        nut.state = QStyle.State_Enabled | QStyle.State_Raised
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawControl(QStyle.CE_PushButton, nut, painter)
+
+    def editorEvent(self, event, model, option, index):
+        if (
+            event.type() == QEvent.MouseButtonRelease
+            and event.button() == Qt.LeftButton
+            and self._bam_duoc(index)
+        ):
+            self._bang.bam_o.emit(self._bang.dong_goc(index), index.column())
+            return True
+        return super().editorEvent(event, model, option, index)
+
+
+class BangDuLieu(QTableView):
+    """QTableView + BangModel + BangLocModel, thay cho QTableWidget."""
+
+    # (dòng gốc, cột) khi bấm vào ô nút/link
+    bam_o = pyqtSignal(int, int)
+
+    def __init__(self, cot, parent=None, sap_xep=True):
+        super().__init__(parent)
+        self._cot = list(cot)
+        self.model_goc = BangModel(self._cot, self)
+        self.proxy = BangLocModel(self)
+        self.proxy.setSourceModel(self.model_goc)
+        self.setModel(self.proxy)
+        self.da_sua = self.model_goc.da_sua
+
+        self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.setEditTriggers(QAbstractItemView.DoubleClicked)
+        # Giữ đúng thứ tự dữ liệu nguồn cho tới khi người dùng bấm tiêu đề
+        self.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.setSortingEnabled(sap_xep)
+        self.verticalHeader().setDefaultSectionSize(26)
+        self.setAlternatingRowColors(False)
+
+        self._delegate = []
+        for i, c in enumerate(self._cot):
+            if c.kieu in (KIEU_NUT, KIEU_LINK):
+                delegate = NutDelegate(self, c.kieu, c.kich_hoat)
+                self._delegate.append(delegate)
+                self.setItemDelegateForColumn(i, delegate)
+
+        self._thiet_lap_cot()
+
+    def _thiet_lap_cot(self):
+        """Giống MainWindow.setup_table: giãn cột tên sản phẩm, cột khác theo nội dung."""
+        header = self.horizontalHeader()
+        header.setStretchLastSection(True)
+        header.setSectionResizeMode(QHeaderView.Interactive)
+        for i, c in enumerate(self._cot):
+            text = (c.tieu_de or "").lower()
+            if "sản phẩm" in text or ("tên" in text and "username" not in text):
+                for j in range(len(self._cot)):
+                    header.setSectionResizeMode(
+                        j, QHeaderView.Stretch if j == i else QHeaderView.ResizeToContents
+                    )
+                break
+
+    # ---- API cho MainWindow ----
+    def dat_du_lieu(self, rows):
+        self.model_goc.dat_du_lieu(rows)
+
+    def so_dong(self):
+        return self.model_goc.rowCount()
+
+    def dong(self, row):
+        return self.model_goc.dong(row)
+
+    def cac_dong(self):
+        return self.model_goc.cac_dong()
+
+    def gia_tri(self, row, cot):
+        return self.model_goc.gia_tri(row, cot)
+
+    def cap_nhat_gia_tri(self, row, cot, gia_tri):
+        self.model_goc.cap_nhat_gia_tri(row, cot, gia_tri)
+
+    def cap_nhat_theo_khoa(self, cac_khoa, cac_dong_moi, chi_so_khoa=0):
+        self.model_goc.cap_nhat_theo_khoa(cac_khoa, cac_dong_moi, chi_so_khoa)
+
+    def dong_goc(self, index):
+        """Chỉ số dòng gốc của một index trên view (đã qua sắp xếp/lọc)."""
+        return self.proxy.mapToSource(index).row()
+
+    def dong_hien_tai(self):
+        """Dòng gốc đang chọn, -1 nếu chưa chọn."""
+        index = self.currentIndex()
+        if not index.isValid():
+            return -1
+        return self.dong_goc(index)
+
+    def dong_da_chon(self):
+        """Các dòng gốc đã đánh dấu ở cột checkbox."""
+        return self.model_goc.dong_da_chon()
+
+    def loc(self, chuoi):
+        """Chỉ hiện các dòng có ô chứa chuỗi (không phân biệt hoa thường)."""
+        self.proxy.setFilterFixedString(chuoi or "")
@@ -0,0 +1,93 @@
+"""
+Model danh sách user dùng chung cho các combo "Người cho nợ"
+Shared user list model for the per-row debtor combos
+
+Mỗi dòng giỏ hàng / dòng sửa hóa đơn có một QComboBox chọn người cho nợ.
+Thay vì mỗi combo tự gọi lay_tat_ca_user() và addItem() từng user, tất cả
+combo dùng chung một model đọc từ user_directory. Model chỉ reset khi danh
+sách user thực sự thay đổi (user_directory.phien_ban() tăng).
+
+Sử dụng:
+    from utils.user_model import lay_model_cho_no
+
+    combo = QComboBox()
+    combo.setModel(lay_model_cho_no(loai_tru=self.user_id))
+    user_id = combo.currentData()  # None = "-- Không --"
+"""
+
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex
+from PyQt5.QtWidgets import QApplication
+
+import user_directory
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+NHAN_KHONG_CHON = "-- Không --"
+
+
+class UserComboModel(QAbstractListModel):
+    """Dòng đầu "-- Không --" (data None), sau đó là các user; Qt.UserRole = user_id."""
+
+    def __init__(self, loai_tru=None, parent=None):
+        super().__init__(parent)
+        self._loai_tru = loai_tru
+        self._users = []
+        self._phien_ban = None
+        self.dong_bo()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._users) + 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return NHAN_KHONG_CHON if row == 0 else self._users[row - 1][1]
+        if role == Qt.UserRole:
+            return None if row == 0 else self._users[row - 1][0]
+        return None
+
+    def dong_bo(self):
+        """Nạp lại từ user_directory nếu danh sách user đã thay đổi."""
+        phien_ban = user_directory.phien_ban()
+        if phien_ban == self._phien_ban:
+            return False
+        users = [
+            (uid, username)
+            for uid, username in user_directory.lay_theo_role()
+            if uid != self._loai_tru
+        ]
+        self._phien_ban = phien_ban
+        if users == self._users:
+            return False
+        self.beginResetModel()
+        self._users = users
+        self.endResetModel()
+        return True
+
+
+_models = {}
+
+
+def lay_model_cho_no(loai_tru=None):
+    """
+    Lấy model combo người cho nợ dùng chung (đồng bộ trước khi trả về).
+
+    Args:
+        loai_tru: user_id không hiển thị (thường là user đang đăng nhập)
+
+    Returns:
+        UserComboModel
+    """
+    model = _models.get(loai_tru)
+    if model is None:
+        model = UserComboModel(loai_tru, QApplication.instance())
+        _models[loai_tru] = model
+        logger.debug(f"Khởi tạo model người cho nợ (loại trừ {loai_tru})")
+    else:
+        model.dong_bo()
+    return model
@@ -0,0 +1,140 @@
+"""
+Làm mới giao diện theo sự kiện thay đổi dữ liệu
+Event-driven, visibility-aware view invalidation
+
+BoLamMoi nhận sự kiện từ utils.event_bus (luồng bất kỳ), chuyển về luồng GUI
+qua signal, gom các sự kiện phát liên tiếp (một lần bán hàng phát nhiều sự
+kiện) rồi mới gọi các hàm làm mới đã đăng ký - mỗi hàm một lần, với các sự
+kiện đã gộp theo loại. Hàm gắn với một widget (tab) chỉ chạy khi widget đang
+hiện; nếu đang ẩn, sự kiện được giữ lại (đã gộp) và chạy khi widget được mở,
+nên tab không ai xem không bị truy vấn lại sau mỗi thao tác.
+
+Sử dụng:
+    from utils.view_invalidation import BoLamMoi, hop_ids
+    from utils.event_bus import HoaDonDaTao, HoaDonDaSua
+
+    self.bo_lam_moi = BoLamMoi(self)
+    self.bo_lam_moi.dang_ky(
+        self.tab_chitietban,
+        (HoaDonDaTao, HoaDonDaSua),
+        lambda cac_su_kien: self.lam_moi_chitietban(hop_ids(cac_su_kien, "hoadon_ids")),
+    )
+"""
+
+from PyQt5.QtCore import QEvent, QObject, QTimer, pyqtSignal
+
+from utils import event_bus
+from utils.event_bus import (
+    HoaDonDaSua,
+    HoaDonDaTao,
+    SanPhamThayDoi,
+    SoDuThayDoi,
+    TonKhoThayDoi,
+)
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+CAC_LOAI_SU_KIEN = (HoaDonDaTao, HoaDonDaSua, TonKhoThayDoi, SoDuThayDoi, SanPhamThayDoi)
+
+
+def hop_ids(cac_su_kien, truong):
+    """
+    Hợp các tập id ở trường `truong` của những sự kiện có trường đó.
+
+    Returns:
+        frozenset, hoặc None nếu có sự kiện không rõ id (= làm mới tất cả)
+    """
+    ket_qua = frozenset()
+    for su_kien in cac_su_kien:
+        if truong not in su_kien._fields:
+            continue
+        ids = getattr(su_kien, truong)
+        if ids is None:
+            return None
+        ket_qua |= ids
+    return ket_qua
+
+
+class _DangKy:
+    __slots__ = ("widget", "cac_loai", "ham", "cho")
+
+    def __init__(self, widget, cac_loai, ham):
+        self.widget = widget
+        self.cac_loai = tuple(cac_loai)
+        self.ham = ham
+        # loại -> sự kiện đã gộp, chưa giao
+        self.cho = {}
+
+
+class BoLamMoi(QObject):
+    """Nhận sự kiện từ event bus, gom lại và gọi hàm làm mới của các view đang hiện."""
+
+    _nhan = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._dang_ky = []
+        self._moi = []
+        self._hen_gio = QTimer(self)
+        self._hen_gio.setSingleShot(True)
+        self._hen_gio.setInterval(0)
+        self._hen_gio.timeout.connect(self._phan_phat)
+        # QueuedConnection khi phát từ luồng nền, gọi trực tiếp trên luồng GUI
+        self._nhan.connect(self._khi_nhan)
+        self._phat_lai = self._nhan.emit
+        for loai in CAC_LOAI_SU_KIEN:
+            event_bus.dang_ky(loai, self._phat_lai)
+
+    def dong(self):
+        """Ngừng nhận sự kiện (gọi khi đóng cửa sổ sở hữu)."""
+        for loai in CAC_LOAI_SU_KIEN:
+            event_bus.huy_dang_ky(loai, self._phat_lai)
+        self._hen_gio.stop()
+        self._moi = []
+
+    def dang_ky(self, widget, cac_loai, ham):
+        """
+        Gọi ham(cac_su_kien) khi có sự kiện thuộc `cac_loai`.
+
+        Args:
+            widget: Chỉ gọi khi widget đang hiện (None = luôn gọi ngay)
+            cac_loai: Các loại sự kiện (class trong utils.event_bus)
+            ham: Nhận list sự kiện, mỗi loại một sự kiện đã gộp
+        """
+        dang_ky = _DangKy(widget, cac_loai, ham)
+        self._dang_ky.append(dang_ky)
+        if widget is not None:
+            widget.installEventFilter(self)
+        return dang_ky
+
+    def _khi_nhan(self, su_kien):
+        self._moi.append(su_kien)
+        self._hen_gio.start()
+
+    def _phan_phat(self):
+        moi, self._moi = self._moi, []
+        for dang_ky in self._dang_ky:
+            for su_kien in moi:
+                loai = type(su_kien)
+                if loai not in dang_ky.cac_loai:
+                    continue
+                cu = dang_ky.cho.get(loai)
+                dang_ky.cho[loai] = su_kien if cu is None else event_bus.gop(cu, su_kien)
+            if dang_ky.cho and (dang_ky.widget is None or dang_ky.widget.isVisible()):
+                self._giao(dang_ky)
+
+    def _giao(self, dang_ky):
+        cac_su_kien = list(dang_ky.cho.values())
+        dang_ky.cho = {}
+        try:
+            dang_ky.ham(cac_su_kien)
+        except Exception as e:
+            logger.error(f"Lỗi làm mới giao diện: {e}")
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Show:
+            for dang_ky in self._dang_ky:
+                if dang_ky.widget is obj and dang_ky.cho:
+                    self._giao(dang_ky)
+        return False